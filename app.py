@@ -1,5 +1,9 @@
 # app.py
 from __future__ import annotations
+import asyncio
+import logging
+import os
+import sys
 from dataclasses import dataclass, field
 from typing import Annotated, Optional, List, Dict, Any, Tuple
 from typing_extensions import TypedDict
@@ -13,17 +17,45 @@ from langchain_ollama import ChatOllama
 from langchain_core.messages import (
     SystemMessage, HumanMessage, AIMessage, BaseMessage
 )
+from llm_cache import LLMResponseCache
+from result_cache import ResultCache
+from speculative import SpeculativeSearch, current_thread_id
+from checkpointer import SQLiteCheckpointer
+from streaming import STREAM_CONFIG, GENERATION_TIMER, TokenPrinter
+from metrics import METRICS, METRICS_COLLECTOR
+from context_window import (
+    bounded_context, search_summaries, summarize_search, summarize_segment,
+    CHATBOT_TOKEN_BUDGET, ROUTER_TOKEN_BUDGET,
+)
+from fast_router import classify_turn, topic_words, ROUTER_STATS
 # Importar los nodos de confirmación
 from confirm_nodes import (
     node_analyze_intent, 
     node_ask_clarification, 
-    node_ask_confirmation
+    node_ask_confirmation,
+    anode_analyze_intent,
+    anode_ask_confirmation
 )
 
 # Importar agente Table-QA y funciones de búsqueda
 #from agents.table_qa_agent import invoke_table_qa_agent
-from search.catalog import search_datasets, extract_schemas
-from search.joiners import rank_by_completeness
+from search.catalog import (
+    search_datasets_scored, extract_schemas, intent_to_query, start_catalog_watcher, get_schema_matcher,
+    get_catalog_index, get_column_counts, score_catalog_schemas, get_available_topics, DEFAULT_TOP_K
+)
+from search.joiners import rank_datasets
+from compute.scheduler import compute_parallel, DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Candidatos BM25 que pasan al ranking combinado (se quedan DEFAULT_TOP_K)
+SEARCH_CANDIDATES = 50
+
+# Aviso al usuario cuando la búsqueda no encuentra nada y se muestran los más completos
+FALLBACK_NOTICE = (
+    "No he encontrado datasets que encajen con tu búsqueda; "
+    "te muestro los más completos del catálogo."
+)
 
 # ---------- 1) Estado del flujo ----------
 class State(TypedDict):
@@ -37,8 +69,9 @@ class State(TypedDict):
     # {
     #   "topic": str,  # Tema principal (empleo, salud, medio ambiente)
     #   "temporal_filters": List[Dict],  # [{"raw": "últimos 3 años", "normalized": {"type": "last_n_years", "n": 3}}]
-    #   "demographic_filters": List[Dict],  # [{"raw": "mayores de 50", "column": "edad", "operator": ">", "value": 50}]
-    #   "spatial_filters": List[Dict],  # [{"raw": "en Madrid", "column": "ciudad", "value": "Madrid"}]
+    #   "demographic_filters": List[Dict],  # [{"raw": "mayores de 50", "normalized": {"type": "age_range", "min": 51, "max": None}}]
+    #   "spatial_filters": List[Dict],  # [{"raw": "en Madrid", "normalized": {"type": "place", "places": [{"name": "Madrid", ...}]}}]
+    #   (filter_normalizer normaliza los filtros que reconoce; los demás quedan en texto)
     #   "required_columns": List[str],  # ["empleo", "edad", "fecha"]
     #   "aggregation_type": str  # "statistics" | "count" | "average" | "row_level"
     # }
@@ -59,6 +92,7 @@ class State(TypedDict):
     max_iterations: int
     clarification_attempts: int  # Número de veces que hemos preguntado por clarificación
     search_boundaries: List[int]  # Índices que marcan finales de búsquedas completadas
+    history_summaries: List[str]  # Resumen de cada búsqueda completada (uno por boundary)
     
     # ===== Dashboard final =====
     dashboard: Optional[str]
@@ -68,83 +102,183 @@ class State(TypedDict):
 class Context:
     llm: ChatOllama
     schema_catalog: Dict[str, Any] = None  # Catálogo de esquemas
+    llm_cache: Optional[LLMResponseCache] = None  # Caché de respuestas del LLM (opcional)
+    combined_analysis: bool = True  # Intent + ambigüedades + confirmación en una sola llamada al LLM
+    incremental_analysis: bool = True  # Tras una aclaración se envían solo el intent actual y la nueva respuesta
+    result_cache: Optional[ResultCache] = None  # Caché de búsquedas y agregados por intent (opcional)
+    speculative_search: Optional[SpeculativeSearch] = None  # Búsqueda durante la confirmación (opcional)
+    compute_workers: int = DEFAULT_WORKERS  # Procesos para el cómputo por dataset (1 = en el propio proceso)
     
     def __post_init__(self):
         if self.schema_catalog is None:
             self.schema_catalog = {}
+        # Todas las llamadas llm.invoke de los nodos pasan por la caché
+        if self.llm_cache is not None:
+            self.llm.cache = self.llm_cache
 
 # ---------- 3) Nodos ----------
 SYSTEM = "Eres un agente de acuerdos/licencias y búsqueda de datos. Responde en español con precisión."
 
-def node_chatbot(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
-    """Genera una respuesta conversacional simple."""
-    print("\n--- Entrando en node_chatbot ---")
+def _chatbot_input(state: State) -> Tuple[int, List[BaseMessage]]:
+    logger.debug("--- Entrando en node_chatbot ---")
     
     iterations = state.get("iterations", 0) + 1
-    print(f"🔄 Iteración {iterations}/{state.get('max_iterations', 15)}")
+    logger.debug("🔄 Iteración %s/%s", iterations, state.get('max_iterations', 15))
     
-    system_message = SystemMessage(content=SYSTEM)
-    msgs = state["messages"]
-    local = [system_message] + msgs
-    reply = runtime.context.llm.invoke(local)
-    print(f"Respuesta del chatbot (LLM): {reply.content}")
+    # Historial acotado: búsquedas anteriores resumidas + mensajes recientes que caben
+    summaries, msgs = bounded_context(state, CHATBOT_TOKEN_BUDGET)
+    system = SYSTEM
+    if summaries:
+        system += "\n\nBúsquedas anteriores de esta sesión:\n" + "\n".join(f"- {s}" for s in summaries)
+    return iterations, [SystemMessage(content=system)] + msgs
+
+def node_chatbot(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
+    """Genera una respuesta conversacional simple."""
+    iterations, local = _chatbot_input(state)
+    # Respuesta para el usuario: sus tokens se emiten con stream_mode "messages"
+    reply = runtime.context.llm.invoke(local, config=STREAM_CONFIG)
+    logger.debug("Respuesta del chatbot (LLM): %s", reply.content)
     return {"messages": [reply], "iterations": iterations}
 
-def node_search(state: State) -> Dict[str, Any]:
+async def anode_chatbot(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
+    """Versión asíncrona de node_chatbot."""
+    iterations, local = _chatbot_input(state)
+    reply = await runtime.context.llm.ainvoke(local, config=STREAM_CONFIG)
+    logger.debug("Respuesta del chatbot (LLM): %s", reply.content)
+    return {"messages": [reply], "iterations": iterations}
+
+def node_search(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
     """Busca datasets en el catálogo del espacio de datos."""
-    print("\n--- Entrando en node_search ---")
+    logger.debug("--- Entrando en node_search ---")
     
     iterations = state.get("iterations", 0) + 1
-    print(f"🔄 Iteración {iterations}/{state.get('max_iterations', 15)}")
+    logger.debug("🔄 Iteración %s/%s", iterations, state.get('max_iterations', 15))
     
     # Validación: Debemos tener user_search_intent para buscar
     search_intent = state.get("user_search_intent")
     if not search_intent:
-        print("⚠️ ADVERTENCIA: No hay user_search_intent. Esto no debería pasar.")
+        logger.warning("⚠️ ADVERTENCIA: No hay user_search_intent. Esto no debería pasar.")
         search_intent = "consulta sin especificar"
     
-    print(f"Buscando datos para: {search_intent}")
-    
-    # 1. Buscar TODOS los datasets disponibles (sin filtros) --> en el futuro solo relacionados con tematica
-    # El agente Table-QA decidirá cuáles usar de los relacionados según user_search_intent
-    results = search_datasets()
-    print(f"Encontrados {len(results)} datasets en total")
+    logger.debug("Buscando datos para: %s", search_intent)
+    intent = state.get("user_search_intent_structured") or {}
+    result_cache = runtime.context.result_cache
+    
+    # Búsqueda lanzada en segundo plano mientras el usuario leía la confirmación
+    speculative = runtime.context.speculative_search
+    found = speculative.take(current_thread_id(), intent) if speculative is not None else None
+    if found is not None:
+        logger.debug("🔮 Búsqueda especulativa aprovechada: %s datasets", len(found[0]))
+    else:
+        # La misma búsqueda ya confirmada antes (en esta u otra sesión) con el mismo catálogo
+        cached = result_cache.get_search(intent) if result_cache is not None else None
+        if cached is not None:
+            useful, schemas = cached
+            logger.debug("♻️ Búsqueda en caché: %s datasets", len(useful))
+            return {"useful_data": useful, "schemas": schemas, "iterations": iterations}
+        found = search_catalog(intent)
+    
+    useful, schemas, fallback = found
+    update = {"useful_data": useful, "schemas": schemas, "iterations": iterations}
+    if fallback:
+        # No se cachea: la caché solo guarda búsquedas que han encontrado algo
+        update["messages"] = [AIMessage(content=FALLBACK_NOTICE)]
+    elif result_cache is not None:
+        result_cache.put_search(intent, useful, schemas)
+    return update
+
+def search_catalog(intent: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]:
+    """
+    Busca en el catálogo los datasets del intent y extrae sus esquemas.
+    La usan node_search y la búsqueda especulativa (no depende del State).
     
-    # 2. Ordenar por completeness (más columnas = más completo)
-    results = rank_by_completeness(results)
-    print(f"Datasets ordenados por completitud")
+    Si BM25 o la poda por esquema no dejan ningún candidato, se ordena todo el catálogo
+    por cobertura del esquema y completitud (el comportamiento anterior a BM25).
     
-    # 3. Por ahora todos los resultados son "useful_data"
+    Returns:
+        (useful_data, schemas, fallback) con fallback=True si no hubo candidatos
+    """
+    # 1. Buscar los datasets más relevantes para el topic y las columnas requeridas (BM25)
+    # El agente Table-QA decidirá cuáles usar de los relacionados según user_search_intent
+    query = intent_to_query(intent)
+    candidates = search_datasets_scored(query, top_k=SEARCH_CANDIDATES)
+    logger.debug("Encontrados %s datasets relevantes para: '%s'", len(candidates), query)
+    
+    # 2. Descartar datasets cuyo esquema no cubre columnas requeridas ni filtros pedidos
+    kept = get_schema_matcher().prune([ds for ds, _ in candidates], intent)
+    logger.debug("Datasets utilizables según su esquema: %s/%s", len(kept), len(candidates))
+    
+    # 3. Ranking combinado: relevancia + cobertura del esquema + completitud
+    results = rank_datasets(
+        [candidates[i][0] for i, _ in kept],
+        k=DEFAULT_TOP_K,
+        relevance=[candidates[i][1] for i, _ in kept],
+        coverage=[match for _, match in kept],
+    )
+    logger.debug("Datasets ordenados por relevancia, cobertura y completitud (top %s)", len(results))
+    
+    # 3b. Sin candidatos: los más completos de todo el catálogo en vez de nada
+    fallback = not results
+    if fallback:
+        # Sobre arrays precalculados (perfiles de esquema y nº de columnas): solo se decodifican los k elegidos
+        index = get_catalog_index()
+        results = rank_datasets(
+            index.datasets,
+            k=DEFAULT_TOP_K,
+            coverage=score_catalog_schemas(intent, index),
+            completeness=get_column_counts(index),
+        )
+        logger.warning("⚠️ Ningún dataset encaja con '%s'; se usan los %s más completos del catálogo",
+                       query, len(results))
+    
+    # 4. Por ahora todos los resultados son "useful_data"
     # El agente Table-QA filtrará los relevantes según el search_intent
     useful = results
-    
-    return {"useful_data": useful, "iterations": iterations}
+    return useful, extract_schemas(useful), fallback
 
 def node_negotiate(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
     """
     🚧 STUB: Punto de integración para el AGENTE NEGOCIADOR (futuro subgrafo).
     """
-    print("\n--- 🚧 Entrando en node_negotiate (futuro subgrafo) ---")
+    logger.debug("--- 🚧 Entrando en node_negotiate (futuro subgrafo) ---")
     
     iterations = state.get("iterations", 0) + 1
-    print(f"🔄 Iteración {iterations}/{state.get('max_iterations', 15)}")
+    logger.debug("🔄 Iteración %s/%s", iterations, state.get('max_iterations', 15))
     
     return {"iterations": iterations}
 
 def node_compute(state: State, runtime: Runtime[Context]) -> Dict[str, Any]:
     """
-    🚧 STUB: Punto de integración para el AGENTE TABLE-QA (subgrafo).
+    Ejecuta el intent estructurado sobre las tablas locales (CSV / Parquet) de useful_data.
+    Los datasets sin tabla local se omiten (ver compute.engine); con varios, se reparten
+    entre un pool de procesos (ver compute.scheduler).
     """
-    print("\n--- Entrando en node_compute (invocando subgrafo Table-QA) ---")
+    logger.debug("--- Entrando en node_compute (invocando subgrafo Table-QA) ---")
     
     iterations = state.get("iterations", 0) + 1
 
-    # Devolver resultados del subgrafo
-    return {"iterations": iterations}
+    datasets = state.get("useful_data", [])
+    intent = state.get("user_search_intent_structured")
+    result_cache = runtime.context.result_cache
+    cached = result_cache.get_aggregates(intent, datasets) if result_cache is not None else None
+    if cached is not None:
+        logger.debug("♻️ Agregados en caché para %s dataset(s)", len(cached[0]))
+        return {"iterations": iterations, "aggregates": cached[0], "query_plan": cached[1]}
+
+    # Filtros del intent → predicados NumPy por bloques, solo sobre las columnas necesarias
+    aggregates, query_plan = compute_parallel(datasets, intent, max_workers=runtime.context.compute_workers)
+    if result_cache is not None:
+        result_cache.put_aggregates(intent, datasets, aggregates, query_plan)
+    if query_plan:
+        logger.info("🧮 Plan de consulta:\n%s", query_plan)
+    logger.debug("Agregados calculados para %s dataset(s)", len(aggregates))
+
+    return {"iterations": iterations, "aggregates": aggregates, "query_plan": query_plan}
 
 def node_dashboard(state: State) -> Dict[str, Any]:
     """🚧 STUB: Construye el dashboard final con todo lo recopilado."""
-    print("\n--- Entrando en node_dashboard ---\nFlujo terminado con éxito\n")
+    logger.debug("--- Entrando en node_dashboard ---")
+    logger.info("Flujo terminado con éxito")
     
     iterations = state.get("iterations", 0) + 1
     
@@ -153,7 +287,15 @@ def node_dashboard(state: State) -> Dict[str, Any]:
     new_boundary = len(state.get("messages", []))
     updated_boundaries = current_boundaries + [new_boundary]
     
-    print(f"📍 Boundary guardado: índice {new_boundary}")
+    logger.debug("📍 Boundary guardado: índice %s", new_boundary)
+    
+    # Resumen de la búsqueda para los prompts de los turnos siguientes
+    summaries = search_summaries(state.get("messages", []), current_boundaries, state.get("history_summaries"))
+    if state.get("user_search_intent"):
+        summaries.append(summarize_search(state["user_search_intent"], state.get("useful_data", [])))
+    else:
+        # Búsqueda cortada antes de confirmarse (p. ej. por max_iterations)
+        summaries.append(summarize_segment(state.get("messages", [])[current_boundaries[-1] if current_boundaries else 0:]))
 
     # REINICIAR variables de búsqueda para la próxima consulta
     return {
@@ -163,31 +305,41 @@ def node_dashboard(state: State) -> Dict[str, Any]:
         "clarification_attempts": 0,
         "useful_data": [],
         "schemas": [],
-        "search_boundaries": updated_boundaries
+        "search_boundaries": updated_boundaries,
+        "history_summaries": summaries,
     }
 
 # ---------- 5) Routers ----------
-def router_route_intent(state: State, runtime: Runtime[Context]) -> str:
-    """
-    Router inteligente que usa LLM para decidir el primer nodo del flujo.
-    
-    Clasifica la intención del usuario y retorna el NOMBRE del nodo destino:
-    - "chatbot": conversación general, saludos, preguntas sobre el sistema
-    - "confirm_search": peticiones de búsqueda/análisis de datos
-    """
-    ###################
-    # A futuro meteremos una opción más de intent:
-    # ("retrieval_data": para recuperar búsquedas de otras sesiones anteriores)
-    ###################
-    print("\n--- Router: Clasificando intención ---")
-    messages = state["messages"]
+def _fast_route(messages: list, search_boundaries: Optional[List[int]] = None) -> Optional[str]:
+    logger.debug("--- Router: Clasificando intención ---")
+    
+    # Fast-path determinista: saludos, agradecimientos y peticiones de búsqueda claras
+    # (solo si el asistente no había dejado una pregunta abierta en su último turno).
+    # Las preguntas de una búsqueda ya terminada no cuentan: solo se mira desde el último boundary
+    start = search_boundaries[-1] if search_boundaries else 0
+    previous_ai = next((m.content for m in reversed(messages[start:-1]) if isinstance(m, AIMessage)), None)
+    fast_route = classify_turn(
+        messages[-1].content if messages else "",
+        topics=topic_words(get_available_topics()),
+        previous_ai=previous_ai,
+    )
+    ROUTER_STATS.record(fast_route)
+    if fast_route:
+        logger.info("Decisión del router (reglas): %s", fast_route)
+    return fast_route
+
+def _router_prompt(state: State) -> str:
+    # Historial acotado: búsquedas anteriores resumidas + mensajes recientes que caben
+    summaries, messages = bounded_context(state, ROUTER_TOKEN_BUDGET)
     
     # Formateamos el historial para el prompt (convierte objetos Message a texto)
-    formatted_messages = "\n".join([f"{type(m).__name__}: {m.content}" for m in messages])
+    formatted_messages = "\n".join(
+        [f"Resumen: {s}" for s in summaries] + [f"{type(m).__name__}: {m.content}" for m in messages]
+    )
     last_message_content = messages[-1].content if messages else ""
     
     # Prompt: pedimos directamente el NOMBRE DEL NODO
-    prompt = f"""Analiza la conversación y decide el siguiente nodo:
+    return f"""Analiza la conversación y decide el siguiente nodo:
 
 Historial:
 {formatted_messages}
@@ -197,30 +349,67 @@ Historial:
 Responde SOLO con el nombre del nodo (sin comillas):
 - "chatbot" si es conversación general (saludo, pregunta sobre el sistema, agradecimiento)
 - "confirm_search" si pide buscar/analizar/consultar datos"""
-    
-    out = runtime.context.llm.invoke(prompt)
-    next_node = out.content.strip().replace('"', '')
 
-    print(f"Decisión del router (LLM): {next_node}")
+def _parse_route(content: str) -> str:
+    next_node = content.strip().replace('"', '')
+
+    logger.info("Decisión del router (LLM): %s", next_node)
     
     # Validación: solo permitimos nodos conocidos
     if next_node not in ["chatbot", "confirm_search"]:
         next_node = "chatbot"  # Opción segura por defecto
-        print(f"ADVERTENCIA: Nodo no reconocido, usando: {next_node}")
+        logger.warning("ADVERTENCIA: Nodo no reconocido, usando: %s", next_node)
 
     return next_node
 
+def router_route_intent(state: State, runtime: Runtime[Context]) -> str:
+    """
+    Router inteligente que usa LLM para decidir el primer nodo del flujo.
+    Los turnos obvios se resuelven antes por reglas (fast_router) sin llamar al LLM.
+    
+    Clasifica la intención del usuario y retorna el NOMBRE del nodo destino:
+    - "chatbot": conversación general, saludos, preguntas sobre el sistema
+    - "confirm_search": peticiones de búsqueda/análisis de datos
+    """
+    ###################
+    # A futuro meteremos una opción más de intent:
+    # ("retrieval_data": para recuperar búsquedas de otras sesiones anteriores)
+    ###################
+    messages = state["messages"]
+    fast_route = _fast_route(messages, state.get("search_boundaries"))
+    if fast_route:
+        return fast_route
+    
+    out = runtime.context.llm.invoke(_router_prompt(state))
+    return _parse_route(out.content)
+
+async def arouter_route_intent(state: State, runtime: Runtime[Context]) -> str:
+    """Versión asíncrona de router_route_intent."""
+    messages = state["messages"]
+    fast_route = _fast_route(messages, state.get("search_boundaries"))
+    if fast_route:
+        return fast_route
+    
+    out = await runtime.context.llm.ainvoke(_router_prompt(state))
+    return _parse_route(out.content)
+
 # ---------- 6) Grafo ----------
-def build_graph() -> StateGraph:
+def build_graph(async_mode: bool = False) -> StateGraph:
+    """
+    Args:
+        async_mode: Usa las versiones asíncronas (llm.ainvoke) de los nodos y del router.
+            El grafo compilado se ejecuta entonces con graph.astream / graph.ainvoke.
+            Los nodos sin LLM son síncronos en ambos modos (LangGraph los ejecuta en su executor).
+    """
     g = StateGraph(State)
     
     # Nodos del grafo
-    g.add_node("chatbot", node_chatbot)
+    g.add_node("chatbot", anode_chatbot if async_mode else node_chatbot)
 
     # --- NUEVOS NODOS (Reemplazan a confirm_search) ---
-    g.add_node("analyze_intent", node_analyze_intent)
+    g.add_node("analyze_intent", anode_analyze_intent if async_mode else node_analyze_intent)
     g.add_node("ask_clarification", node_ask_clarification)
-    g.add_node("ask_confirmation", node_ask_confirmation)
+    g.add_node("ask_confirmation", anode_ask_confirmation if async_mode else node_ask_confirmation)
 
     g.add_node("search", node_search)
     g.add_node("negotiate", node_negotiate)
@@ -231,7 +420,7 @@ def build_graph() -> StateGraph:
     # 1. Router principal desde START: conversacional → chatbot, búsqueda → confirm_search
     g.add_conditional_edges(
         START,                   # ← Inicia directamente con router (sin nodo previo)
-        router_route_intent,     # ← Router que piensa con LLM
+        arouter_route_intent if async_mode else router_route_intent,  # ← Router que piensa con LLM
         {
             # Si el router dice "confirm_search", ahora enviamos a "analyze_intent"
             "confirm_search": "analyze_intent",
@@ -255,15 +444,9 @@ def build_graph() -> StateGraph:
     return g
 
 # ---------- 7) Run ----------
-if __name__ == "__main__":
-    print("Agente Simplificado (Demo Intent + Search). Escribe 'salir' para terminar.")
-    
-    llm = ChatOllama(model="llama3.1", base_url="http://127.0.0.1:11434", temperature=0.0)
-    ctx = Context(llm=llm)
-    memory = MemorySaver()
-    graph = build_graph().compile(checkpointer=memory)
-
-    state = {
+def new_session_state() -> Dict[str, Any]:
+    """Estado inicial de una sesión."""
+    return {
         "messages": [],
         "user_search_intent": None,
         "user_search_intent_structured": None,
@@ -276,55 +459,155 @@ if __name__ == "__main__":
         "max_iterations": 15,
         "clarification_attempts": 0,
         "search_boundaries": [],
+        "history_summaries": [],
         "dashboard": None,
     }
+
+def awaiting_input(snapshot: Any) -> bool:
+    """
+    True si la sesión está parada en un interrupt (aclaración o confirmación) y el siguiente
+    mensaje es su respuesta. Un snapshot con next pero sin interrupts pendientes es una
+    ejecución que se cortó a mitad de nodo: no se reanuda con el mensaje del usuario.
+    """
+    return any(task.interrupts for task in snapshot.tasks)
+
+def turn_input(snapshot: Any, message: str) -> Any:
+    """
+    Entrada del grafo para un mensaje del usuario según el estado guardado de la sesión.
+    
+    Returns:
+        Command(resume=message) si hay un interrupt pendiente, el estado inicial si la sesión
+        es nueva o solo el mensaje nuevo (add_messages lo añade al historial guardado)
+    """
+    if awaiting_input(snapshot):
+        return Command(resume=message)
+    if not snapshot.values:
+        state = new_session_state()
+        state["messages"].append(HumanMessage(content=message))
+        return state
+    return {"messages": [HumanMessage(content=message)]}
+
+def print_new_messages(chunk: Dict[str, Any], printed_messages: set, printer: Optional[TokenPrinter] = None):
+    """Imprime los mensajes del agente que aún no se han mostrado (ni se han streamed token a token)."""
+    msgs = chunk.get("messages", [])
+    for i, msg in enumerate(msgs):
+        msg_key = (i, msg.content[:50])
+        if isinstance(msg, AIMessage) and msg_key not in printed_messages:
+            if printer is None or not printer.was_streamed(msg.content):
+                print(f">>> Agente: {msg.content}")
+            printed_messages.add(msg_key)
+
+def print_stream_event(event: Tuple[str, Any], printed_messages: set, printer: TokenPrinter) -> Optional[Dict[str, Any]]:
+    """
+    Procesa un evento de graph.stream(stream_mode=["messages", "custom", "values"]).
+    Los tokens se imprimen según llegan; devuelve el estado si el evento es de tipo "values".
+    """
+    mode, data = event
+    if mode == "messages":
+        printer.token(*data)
+        return None
+    if mode == "custom":
+        printer.custom(data)
+        return None
+    printer.end()
+    print_new_messages(data, printed_messages, printer)
+    return data
+
+def main(async_mode: bool = False):
+    print("Agente Simplificado (Demo Intent + Search). Escribe 'salir' para terminar.")
+    # LOG_LEVEL=DEBUG muestra la traza de los nodos (por defecto solo decisiones y avisos)
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     
-    config = {"configurable": {"thread_id": "demo_session"}}
+    llm = ChatOllama(model="llama3.1", base_url="http://127.0.0.1:11434", temperature=0.0)
+    # LLM_CACHE_DB=ruta.sqlite activa el nivel en disco de la caché (persiste entre reinicios)
+    llm_cache = LLMResponseCache(sqlite_path=os.environ.get("LLM_CACHE_DB"))
+    ctx = Context(llm=llm, llm_cache=llm_cache, result_cache=ResultCache(),
+                  speculative_search=SpeculativeSearch(search_catalog))
+    # CHECKPOINT_DB=ruta.sqlite guarda las sesiones en disco (sobreviven a reinicios)
+    checkpoint_db = os.environ.get("CHECKPOINT_DB")
+    if checkpoint_db:
+        memory = SQLiteCheckpointer(checkpoint_db)
+        memory.start_compaction()
+    else:
+        memory = MemorySaver()
+    graph = build_graph(async_mode=async_mode).compile(checkpointer=memory)
+
+    # Recarga en caliente: los cambios en search/sources se aplican sin reiniciar
+    start_catalog_watcher()
+
+    # GENERATION_TIMER mide el tiempo hasta el primer token y total de cada llamada al LLM por nodo;
+    # METRICS_COLLECTOR acumula tiempos de nodo, tokens y rondas de aclaración de la sesión
+    config = {"configurable": {"thread_id": "demo_session"},
+              "callbacks": [GENERATION_TIMER, METRICS_COLLECTOR]}
     
     # Control de mensajes impresos para no repetir
     printed_messages = set()
     
-    # Flag para saber si estamos esperando respuesta a un interrupt
-    awaiting_interrupt = False
+    # Tokens de las respuestas del agente (stream_mode "messages" y "custom")
+    printer = TokenPrinter()
+    
+    # Sesión guardada en el checkpointer persistente: se continúa donde se dejó
+    # (turn_input reanuda el interrupt pendiente si lo hay)
+    snapshot = graph.get_state(config)
+    if snapshot.values:
+        print(f"♻️ Sesión restaurada ({len(snapshot.values.get('messages', []))} mensajes)")
+
+    def print_session_stats():
+        print(f"📊 Caché LLM: {llm_cache.stats()}")
+        print(f"📊 Caché de resultados: {ctx.result_cache.stats()}")
+        print(f"📊 Búsqueda especulativa: {ctx.speculative_search.stats()}")
+        print(f"📊 Router sin LLM: {ROUTER_STATS.report()}")
+        print(f"📊 Generación por nodo: {GENERATION_TIMER.report()}")
+        print(f"📊 Métricas de la sesión: {METRICS.snapshot(config['configurable']['thread_id'])}")
+        # METRICS_JSONL=ruta.jsonl añade las métricas de la sesión al fichero
+        if os.environ.get("METRICS_JSONL"):
+            METRICS.write_jsonl(os.environ["METRICS_JSONL"])
+
+    async def arun_turn(input_data):
+        # Turno con graph.astream (los nodos con LLM usan llm.ainvoke)
+        async for event in graph.astream(input_data, context=ctx, config=config, stream_mode=['messages', 'custom', 'values']):
+            print_stream_event(event, printed_messages, printer)
+
+    async def aloop():
+        while True:
+            user_input = await asyncio.to_thread(input, ">>> Tú: ")
+            if user_input.lower() in ["salir", "exit"]:
+                return
+            await arun_turn(turn_input(await graph.aget_state(config), user_input))
+
+    if async_mode:
+        # Un único event loop para toda la sesión (el cliente asíncrono de Ollama se reutiliza)
+        try:
+            asyncio.run(aloop())
+        except Exception as e:
+            print(f"Error: {e}")
+            import traceback
+            traceback.print_exc()
+        print_session_stats()
+        return
 
     while True:
         try:
             user_input = input(">>> Tú: ")
             if user_input.lower() in ["salir", "exit"]:
+                print_session_stats()
                 break
             
-            # Si estamos en pausa por interrupt, reanudamos con Command
-            if awaiting_interrupt:
-                input_data = Command(resume=user_input)
-                awaiting_interrupt = False
-            else:
-                # Flujo normal: añadir mensaje al estado y pasar el estado completo
-                state["messages"].append(HumanMessage(content=user_input))
-                input_data = state
+            # Si estamos en pausa por interrupt, turn_input reanuda con Command;
+            # si no, el mensaje se añade al historial guardado de la sesión
+            input_data = turn_input(graph.get_state(config), user_input)
             
             # Ejecutar grafo
-            final_state = None
-            for chunk in graph.stream(input_data, context=ctx, config=config, stream_mode='values'):
-                final_state = chunk
-                
-                # Imprimir mensajes nuevos
-                msgs = final_state.get("messages", [])
-                for i, msg in enumerate(msgs):
-                    msg_key = (i, msg.content[:50])
-                    if isinstance(msg, AIMessage) and msg_key not in printed_messages:
-                        print(f">>> Agente: {msg.content}")
-                        printed_messages.add(msg_key)
-            
-            # Actualizar estado local con el resultado
-            if final_state:
-                state = final_state
-                
-                # Verificar si el grafo se detuvo por un interrupt
-                if "__interrupt__" in final_state and final_state["__interrupt__"]:
-                    awaiting_interrupt = True
+            for event in graph.stream(input_data, context=ctx, config=config, stream_mode=['messages', 'custom', 'values']):
+                # Imprimir tokens según llegan y mensajes nuevos
+                print_stream_event(event, printed_messages, printer)
 
         except Exception as e:
             print(f"Error: {e}")
             import traceback
             traceback.print_exc()
             break
+
+if __name__ == "__main__":
+    # python app.py --async → grafo asíncrono con graph.astream
+    main(async_mode="--async" in sys.argv)
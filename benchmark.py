@@ -0,0 +1,351 @@
+"""
+Benchmark offline del grafo (sin Ollama).
+
+Ejecuta build_graph() con fake_llm.StubChatModel (latencia configurable) sobre catálogos
+generados de distintos tamaños y reproduce conversaciones de varios turnos: búsqueda
+directa, búsqueda con aclaración y varias búsquedas en la misma sesión (boundaries).
+
+Para cada tamaño de catálogo informa:
+    - Tiempo de carga del catálogo (índices, snapshot y BM25)
+    - Latencia por turno (p50 / p99) y turnos por segundo, por escenario y en total
+    - Memoria retenida por sesión (checkpointer incluido), medida con tracemalloc en
+      una pasada aparte para no distorsionar las latencias
+
+Uso:
+    python benchmark.py
+    python benchmark.py --sizes 10 1000 100000 --sessions 50 --latency 0.02 --concurrency 8
+    python benchmark.py --async --concurrency 32 --json resultados.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import random
+import tempfile
+import time
+import tracemalloc
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from app import Context, build_graph, turn_input
+from fake_llm import StubChatModel
+import search.catalog as catalog
+
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+# Sesiones por escenario y tamaño de catálogo
+DEFAULT_SESSIONS = 20
+
+# Sesiones usadas en la pasada de memoria (tracemalloc ralentiza la ejecución)
+MEMORY_SESSIONS = 10
+
+# Datasets por fichero del catálogo generado
+DATASETS_PER_FILE = 10_000
+
+
+@dataclass
+class Scenario:
+    """Conversación reproducida en cada sesión."""
+    name: str
+    turns: List[str]
+    clarification_rounds: int = 0  # Turnos del usuario en los que el LLM simulado pide aclaración
+    searches: int = 1  # Búsquedas que deben completarse (boundaries al final)
+
+
+SCENARIOS = (
+    Scenario("directa", [
+        "Quiero datos de calidad del aire en Madrid en 2024 para toda la población",
+        "Sí",
+    ]),
+    Scenario("aclaracion", [
+        "Necesito datos de calidad del aire",
+        "De 2024, en Madrid y para toda la población",
+        "Sí, correcto",
+    ], clarification_rounds=1),
+    Scenario("multi_busqueda", [
+        "Hola",
+        "Quiero datos de calidad del aire en Madrid en 2024 para toda la población",
+        "Sí",
+        "Ahora busco ocupación hospitalaria en Madrid en 2024 para toda la población",
+        "Sí",
+    ], searches=2),
+)
+
+
+# ==========================================
+# 1. CATÁLOGOS GENERADOS
+# ==========================================
+_TOPICS = (
+    "calidad del aire", "registros de pacientes", "ocupación hospitalaria", "consumo energético",
+    "tráfico urbano", "emisiones de CO2", "precipitaciones", "temperatura", "desempleo",
+    "vacunación", "ruido ambiental", "calidad del agua", "residuos urbanos", "movilidad",
+)
+_PLACES = ("Madrid", "Barcelona", "Valencia", "Sevilla", "Bilbao", "Zaragoza", "España", "Andalucía")
+_COLUMNS = (
+    ("fecha", "Fecha de la medición (YYYY-MM-DD)", ["2024-01-15", "2024-06-30"]),
+    ("municipio", "Municipio", ["Madrid", "Getafe"]),
+    ("provincia", "Provincia", ["Madrid", "Sevilla"]),
+    ("no2", "Concentración de NO2 (µg/m3)", [41.2, 37.5]),
+    ("pm10", "Partículas PM10 (µg/m3)", [22.1, 30.4]),
+    ("grupo_edad", "Grupo etario", ["0-18", "66+"]),
+    ("sexo", "Sexo", ["M", "F"]),
+    ("valor", "Valor observado", [12.5, 8.0]),
+    ("camas_ocupadas", "Camas ocupadas", [120, 98]),
+    ("consumo_kwh", "Consumo en kWh", [3400, 2900]),
+    ("intensidad", "Vehículos por hora", [850, 1200]),
+    ("poblacion", "Población", [3300000, 1600000]),
+)
+
+
+def generate_dataset(i: int, rng: random.Random) -> Dict[str, Any]:
+    """Dataset sintético con el formato de search/sources."""
+    topic = rng.choice(_TOPICS)
+    place = rng.choice(_PLACES)
+    year = rng.randint(2015, 2024)
+    columns = rng.sample(_COLUMNS, rng.randint(4, 7))
+    return {
+        "dataset_id": f"gen{i}",
+        "nombre": f"{topic.capitalize()} {place} {year} #{i}",
+        "topic": topic,
+        "descripcion": f"Datos de {topic} en {place} durante {year}",
+        "columnas": [{"nombre": n, "descripcion": d, "ejemplo": e} for n, d, e in columns],
+    }
+
+
+def generate_catalog(directory: Path, size: int, seed: int = 0) -> List[Path]:
+    """
+    Escribe un catálogo generado de `size` datasets en ficheros JSON (en streaming).
+
+    Returns:
+        Ficheros escritos
+    """
+    rng = random.Random(seed)
+    paths = []
+    for start in range(0, size, DATASETS_PER_FILE):
+        path = directory / f"generated_{start // DATASETS_PER_FILE:04d}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for i in range(start, min(size, start + DATASETS_PER_FILE)):
+                if i > start:
+                    f.write(",\n")
+                json.dump(generate_dataset(i, rng), f, ensure_ascii=False)
+            f.write("\n]\n")
+        paths.append(path)
+    return paths
+
+
+def use_catalog(directory: Path) -> float:
+    """
+    Apunta search.catalog a un directorio de catálogos y carga sus índices.
+
+    Returns:
+        Segundos de carga (snapshot, índices, BM25 y perfiles de esquema)
+    """
+    catalog.SOURCES_DIR = directory
+    catalog.SNAPSHOT_PATH = directory / ".cache" / "catalog.snapshot"
+    catalog.reload_catalogs()
+    start = time.perf_counter()
+    index = catalog.get_catalog_index()
+    catalog.get_text_index(index)
+    catalog.get_schema_matcher(index)
+    return time.perf_counter() - start
+
+
+# ==========================================
+# 2. REPRODUCCIÓN DE CONVERSACIONES
+# ==========================================
+@dataclass
+class SessionResult:
+    scenario: str
+    latencies: List[float] = field(default_factory=list)
+    searches: int = 0
+
+
+def run_session(graph: Any, ctx: Context, scenario: Scenario, thread_id: str) -> SessionResult:
+    """Reproduce una conversación con el grafo síncrono."""
+    config = {"configurable": {"thread_id": thread_id}}
+    result = SessionResult(scenario.name)
+    for message in scenario.turns:
+        start = time.perf_counter()
+        input_data = turn_input(graph.get_state(config), message)
+        graph.invoke(input_data, context=ctx, config=config)
+        result.latencies.append(time.perf_counter() - start)
+    result.searches = len(graph.get_state(config).values.get("search_boundaries") or [])
+    return result
+
+
+async def arun_session(graph: Any, ctx: Context, scenario: Scenario, thread_id: str) -> SessionResult:
+    """Reproduce una conversación con el grafo asíncrono."""
+    config = {"configurable": {"thread_id": thread_id}}
+    result = SessionResult(scenario.name)
+    for message in scenario.turns:
+        start = time.perf_counter()
+        input_data = turn_input(await graph.aget_state(config), message)
+        await graph.ainvoke(input_data, context=ctx, config=config)
+        result.latencies.append(time.perf_counter() - start)
+    result.searches = len((await graph.aget_state(config)).values.get("search_boundaries") or [])
+    return result
+
+
+def _contexts(latency: float, token_latency: float) -> Dict[str, Context]:
+    # Un LLM simulado por escenario (el número de rondas de aclaración es del modelo)
+    return {
+        s.name: Context(llm=StubChatModel(latency=latency, token_latency=token_latency,
+                                          clarification_rounds=s.clarification_rounds))
+        for s in SCENARIOS
+    }
+
+
+def run_sessions(sessions: int, latency: float, token_latency: float,
+                 concurrency: int = 1, async_mode: bool = False) -> tuple:
+    """
+    Ejecuta `sessions` sesiones de cada escenario.
+
+    Returns:
+        (resultados por sesión, segundos de pared)
+    """
+    graph = build_graph(async_mode=async_mode).compile(checkpointer=MemorySaver())
+    contexts = _contexts(latency, token_latency)
+    jobs = [(scenario, f"{scenario.name}-{i}") for i in range(sessions) for scenario in SCENARIOS]
+
+    start = time.perf_counter()
+    if async_mode:
+        async def run_all():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def one(scenario: Scenario, thread_id: str):
+                async with slots:
+                    return await arun_session(graph, contexts[scenario.name], scenario, thread_id)
+
+            return await asyncio.gather(*(one(s, t) for s, t in jobs))
+
+        results = asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda job: run_session(graph, contexts[job[0].name], *job), jobs))
+    return results, time.perf_counter() - start
+
+
+def memory_per_session(sessions: int = MEMORY_SESSIONS) -> float:
+    """Bytes retenidos por sesión (estado en el checkpointer y cachés) tras reproducir las conversaciones."""
+    graph = build_graph().compile(checkpointer=MemorySaver())
+    contexts = _contexts(0.0, 0.0)
+    # Una sesión de calentamiento para no contar cachés de módulo e imports perezosos
+    for scenario in SCENARIOS:
+        run_session(graph, contexts[scenario.name], scenario, f"warmup-{scenario.name}")
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(sessions):
+            for scenario in SCENARIOS:
+                run_session(graph, contexts[scenario.name], scenario, f"{scenario.name}-{i}")
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / (sessions * len(SCENARIOS))
+
+
+# ==========================================
+# 3. INFORME
+# ==========================================
+def percentile(values: List[float], p: float) -> float:
+    """Percentil por rango más cercano (p entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(results: List[SessionResult], wall: float) -> Dict[str, Dict[str, Any]]:
+    """Latencias p50/p99 (ms), turnos/s y búsquedas completadas por escenario y en total."""
+    expected = {s.name: s.searches for s in SCENARIOS}
+    groups: Dict[str, List[SessionResult]] = {}
+    for r in results:
+        groups.setdefault(r.scenario, []).append(r)
+    groups["total"] = results
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = [t for r in group for t in r.latencies]
+        summary[name] = {
+            "sessions": len(group),
+            "turns": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            # Por escenario: turnos por segundo de tiempo de turno; total: sobre el tiempo de pared
+            "turns_per_s": round(len(latencies) / (wall if name == "total" else sum(latencies) or 1), 2),
+            "incomplete_sessions": sum(1 for r in group if r.searches < expected.get(r.scenario, 0)),
+        }
+    return summary
+
+
+def print_report(size: int, load_s: float, summary: Dict[str, Dict[str, Any]], memory: Optional[float]):
+    print(f"\n📦 Catálogo de {size} datasets (carga {load_s:.2f}s)")
+    print(f"   {'escenario':<16}{'turnos':>8}{'p50 ms':>10}{'p99 ms':>10}{'turnos/s':>10}{'incompletas':>13}")
+    for name, s in summary.items():
+        print(f"   {name:<16}{s['turns']:>8}{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+              f"{s['turns_per_s']:>10.2f}{s['incomplete_sessions']:>13}")
+    if memory is not None:
+        print(f"   memoria por sesión: {memory / 1024:.1f} KiB")
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, sessions: int = DEFAULT_SESSIONS, latency: float = 0.0,
+                  token_latency: float = 0.0, concurrency: int = 1, async_mode: bool = False,
+                  measure_memory: bool = True, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Ejecuta el benchmark para cada tamaño de catálogo e imprime el informe.
+
+    Returns:
+        Un resultado por tamaño (serializable a JSON)
+    """
+    original = (catalog.SOURCES_DIR, catalog.SNAPSHOT_PATH)
+    report = []
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory(prefix="catalog-bench-") as tmp:
+                directory = Path(tmp)
+                generate_catalog(directory, size, seed)
+                load_s = use_catalog(directory)
+                results, wall = run_sessions(sessions, latency, token_latency, concurrency, async_mode)
+                summary = summarize(results, wall)
+                memory = memory_per_session(min(sessions, MEMORY_SESSIONS)) if measure_memory else None
+                print_report(size, load_s, summary, memory)
+                report.append({"catalog_size": size, "catalog_load_s": round(load_s, 3),
+                               "memory_per_session_bytes": round(memory) if memory is not None else None,
+                               "scenarios": summary})
+                catalog.reload_catalogs()
+    finally:
+        catalog.SOURCES_DIR, catalog.SNAPSHOT_PATH = original
+        catalog.reload_catalogs()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline del agente con un LLM simulado")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Tamaños de catálogo (datasets generados)")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="Sesiones por escenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos hasta el primer token del LLM simulado")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Segundos entre tokens del LLM simulado")
+    parser.add_argument("--concurrency", type=int, default=1, help="Sesiones ejecutándose a la vez")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Grafo asíncrono (graph.ainvoke)")
+    parser.add_argument("--no-memory", action="store_true", help="Omite la pasada de memoria (tracemalloc)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los catálogos generados")
+    parser.add_argument("--json", help="Guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    report = run_benchmark(args.sizes, args.sessions, args.latency, args.token_latency,
+                           args.concurrency, args.async_mode, not args.no_memory, args.seed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
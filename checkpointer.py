@@ -0,0 +1,511 @@
+"""
+Checkpointer persistente en SQLite (modo WAL) para sustituir a MemorySaver.
+
+- Estados compactos: cada canal se serializa solo cuando cambia de versión (como
+  MemorySaver) y los valores grandes se comprimen con zlib.
+- Delta de mensajes: el canal "messages" solo crece entre checkpoints, así que cada
+  versión guarda únicamente los mensajes nuevos respecto a la anterior. Cada
+  KEYFRAME_INTERVAL versiones se guarda la lista completa para acotar la reconstrucción.
+- Compactación: se conservan los últimos keep_last checkpoints de cada hilo y se borran
+  los valores de canal que ya nadie referencia.
+- TTL: los hilos sin actividad en ttl segundos se eliminan.
+- compact() puede ejecutarse en segundo plano con start_compaction().
+"""
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Canal que se guarda como delta entre versiones
+MESSAGES_CHANNEL = "messages"
+
+# Cada cuántas versiones delta se guarda la lista completa de mensajes
+KEYFRAME_INTERVAL = 32
+
+# Tamaño mínimo (bytes) a partir del cual se comprime un valor serializado
+COMPRESS_MIN_BYTES = 512
+
+# Checkpoints que se conservan por hilo tras compactar (None = todos)
+KEEP_LAST_CHECKPOINTS = 8
+
+# Segundos sin actividad tras los que se elimina un hilo (None = nunca)
+THREAD_TTL = 7 * 24 * 3600.0
+
+# Segundos entre compactaciones en segundo plano
+COMPACTION_INTERVAL = 300.0
+
+# Listas de mensajes recientes en memoria (por hilo) para calcular deltas sin leer disco
+MESSAGE_CACHE_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    channel_versions TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB,
+    base_version TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE INDEX IF NOT EXISTS checkpoints_by_age ON checkpoints (thread_id, created_at);
+"""
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """Checkpointer de LangGraph sobre SQLite con deltas de mensajes, compactación y TTL."""
+
+    def __init__(self,
+                 path: str,
+                 *,
+                 keep_last: Optional[int] = KEEP_LAST_CHECKPOINTS,
+                 ttl: Optional[float] = THREAD_TTL,
+                 serde: Optional[SerializerProtocol] = None):
+        """
+        Args:
+            path: Fichero SQLite (se crea si no existe)
+            keep_last: Checkpoints que se conservan por hilo al compactar (None = todos)
+            ttl: Segundos sin actividad tras los que se elimina un hilo (None = nunca)
+            serde: Serializador (por defecto el de LangGraph)
+        """
+        super().__init__(serde=serde)
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last debe ser al menos 1")
+        self.keep_last = keep_last
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # auto_vacuum solo tiene efecto si se fija antes de crear las tablas
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        # (thread_id, checkpoint_ns) -> (versión, mensajes, profundidad del delta)
+        self._messages: "OrderedDict[Tuple[str, str], Tuple[str, List[Any], int]]" = OrderedDict()
+        self._compactor: Optional["CheckpointCompactor"] = None
+
+    # ---------- Serialización ----------
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return f"z:{type_}", zlib.compress(data)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.startswith("z:"):
+            return self.serde.loads_typed((type_[2:], zlib.decompress(data)))
+        return self.serde.loads_typed((type_, data))
+
+    # ---------- Valores de canal ----------
+    def _remember_messages(self, key: Tuple[str, str], version: str, messages: List[Any], depth: int):
+        self._messages[key] = (version, list(messages), depth)
+        self._messages.move_to_end(key)
+        while len(self._messages) > MESSAGE_CACHE_SIZE:
+            self._messages.popitem(last=False)
+
+    def _load_value(self, thread_id: str, checkpoint_ns: str, channel: str, version: str) -> Tuple[bool, Any]:
+        """Devuelve (existe, valor) de una versión de canal, reconstruyendo los deltas."""
+        if channel == MESSAGES_CHANNEL:
+            cached = self._messages.get((thread_id, checkpoint_ns))
+            if cached is not None and cached[0] == version:
+                return True, list(cached[1])
+        row = self._db.execute(
+            "SELECT type, data, base_version FROM blobs "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            (thread_id, checkpoint_ns, channel, version),
+        ).fetchone()
+        if row is None or row[0] == "empty":
+            return False, None
+        type_, data, base_version = row
+        if type_.startswith("delta:"):
+            found, base = self._load_value(thread_id, checkpoint_ns, channel, base_version)
+            return True, (base if found else []) + self._load(type_[len("delta:"):], data)
+        return True, self._load(type_, data)
+
+    def _latest_messages(self, thread_id: str, checkpoint_ns: str) -> Optional[Tuple[str, List[Any], int]]:
+        key = (thread_id, checkpoint_ns)
+        if key in self._messages:
+            return self._messages[key]
+        row = self._db.execute(
+            "SELECT version, depth FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? "
+            "AND type != 'empty' ORDER BY version DESC LIMIT 1",
+            (thread_id, checkpoint_ns, MESSAGES_CHANNEL),
+        ).fetchone()
+        if row is None:
+            return None
+        found, messages = self._load_value(thread_id, checkpoint_ns, MESSAGES_CHANNEL, row[0])
+        if not found or not isinstance(messages, list):
+            return None
+        self._remember_messages(key, row[0], messages, row[1])
+        return self._messages[key]
+
+    def _put_messages(self, thread_id: str, checkpoint_ns: str, version: str, messages: List[Any]):
+        """Guarda la lista de mensajes como delta de la versión anterior si solo ha crecido."""
+        previous = self._latest_messages(thread_id, checkpoint_ns)
+        base_version, depth, payload = None, 0, messages
+        if previous is not None:
+            prev_version, prev_messages, prev_depth = previous
+            n = len(prev_messages)
+            if (prev_depth + 1 < KEYFRAME_INTERVAL and n <= len(messages)
+                    and all(a is b or a == b for a, b in zip(prev_messages, messages))):
+                base_version, depth, payload = prev_version, prev_depth + 1, messages[n:]
+
+        type_, data = self._dump(payload)
+        if base_version is not None:
+            type_ = f"delta:{type_}"
+        self._db.execute(
+            "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, checkpoint_ns, MESSAGES_CHANNEL, version, type_, data, base_version, depth),
+        )
+        self._remember_messages((thread_id, checkpoint_ns), version, messages, depth)
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        channel_values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            found, value = self._load_value(thread_id, checkpoint_ns, channel, str(version))
+            if found:
+                channel_values[channel] = value
+        return channel_values
+
+    # ---------- Lectura ----------
+    def _tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, parent_id: Optional[str],
+               type_: str, checkpoint_data: bytes, metadata_type: str, metadata_data: bytes) -> CheckpointTuple:
+        checkpoint: Checkpoint = self._load(type_, checkpoint_data)
+        writes = self._db.execute(
+            "SELECT task_id, channel, type, data FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self._load(metadata_type, metadata_data),
+            pending_writes=[(task_id, channel, self._load(t, d)) for task_id, channel, t, d in writes],
+            parent_config=_thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id: str = config["configurable"]["thread_id"]
+        checkpoint_ns: str = config["configurable"].get("checkpoint_ns", "")
+        query = ("SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                 "WHERE thread_id = ? AND checkpoint_ns = ?")
+        params: Tuple = (thread_id, checkpoint_ns)
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._db.execute(query, params).fetchone()
+            if row is None:
+                return None
+            return self._tuple(thread_id, checkpoint_ns, *row)
+
+    def list(self,
+             config: Optional[RunnableConfig],
+             *,
+             filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None,
+             limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata "
+                 "FROM checkpoints WHERE 1 = 1")
+        params: Tuple = ()
+        if config:
+            query += " AND thread_id = ?"
+            params += (config["configurable"]["thread_id"],)
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params += (checkpoint_ns,)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params += (checkpoint_id,)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params += (before_id,)
+        query += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    meta = self._load(row[6], row[7])
+                    if not all(meta.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._tuple(*row))
+        yield from results
+
+    # ---------- Escritura ----------
+    def put(self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values: Dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+        with self._lock:
+            for channel, version in new_versions.items():
+                version = str(version)
+                if channel == MESSAGES_CHANNEL and isinstance(values.get(channel), list):
+                    self._put_messages(thread_id, checkpoint_ns, version, values[channel])
+                    continue
+                type_, data = self._dump(values[channel]) if channel in values else ("empty", b"")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, NULL, 0)",
+                    (thread_id, checkpoint_ns, channel, version, type_, data),
+                )
+            type_, data = self._dump(c)
+            metadata_type, metadata_data = self._dump(get_checkpoint_metadata(config, metadata))
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, data, metadata_type, metadata_data,
+                 json.dumps({k: str(v) for k, v in checkpoint["channel_versions"].items()}), time.time()),
+            )
+            self._db.commit()
+        return _thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(self,
+                   config: RunnableConfig,
+                   writes: Sequence[Tuple[str, Any]],
+                   task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                type_, data = self._dump(value)
+                # Las escrituras normales no se repiten; las especiales (error, interrupt...) se sustituyen
+                verb = "INSERT OR IGNORE" if write_idx >= 0 else "INSERT OR REPLACE"
+                self._db.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel, type_, data, task_path),
+                )
+            self._db.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._db.commit()
+            for key in [k for k in self._messages if k[0] == thread_id]:
+                del self._messages[key]
+
+    # ---------- Async (SQLite en un hilo del executor) ----------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self,
+                    config: Optional[RunnableConfig],
+                    *,
+                    filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self,
+                   config: RunnableConfig,
+                   checkpoint: Checkpoint,
+                   metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self,
+                          config: RunnableConfig,
+                          writes: Sequence[Tuple[str, Any]],
+                          task_id: str,
+                          task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Mismo formato que MemorySaver: contador con ceros a la izquierda (ordenable como texto)
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---------- Mantenimiento ----------
+    def compact(self) -> Dict[str, int]:
+        """
+        Elimina los hilos caducados (ttl), los checkpoints antiguos de cada hilo (keep_last)
+        y los valores de canal que ya no referencia ningún checkpoint.
+
+        Returns:
+            Contadores de lo eliminado
+        """
+        removed = {"threads": 0, "checkpoints": 0, "blobs": 0}
+        with self._lock:
+            if self.ttl is not None:
+                expired = [row[0] for row in self._db.execute(
+                    "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?",
+                    (time.time() - self.ttl,),
+                )]
+                for thread_id in expired:
+                    self.delete_thread(thread_id)
+                removed["threads"] = len(expired)
+
+            if self.keep_last is not None:
+                stale = self._db.execute(
+                    "SELECT thread_id, checkpoint_ns, checkpoint_id FROM ("
+                    "  SELECT thread_id, checkpoint_ns, checkpoint_id, ROW_NUMBER() OVER ("
+                    "    PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rank"
+                    "  FROM checkpoints) WHERE rank > ?",
+                    (self.keep_last,),
+                ).fetchall()
+                self._db.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+                self._db.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", stale)
+                removed["checkpoints"] = len(stale)
+                for thread_id, checkpoint_ns in {(t, ns) for t, ns, _ in stale}:
+                    removed["blobs"] += self._prune_blobs(thread_id, checkpoint_ns)
+
+            self._db.commit()
+            if any(removed.values()):
+                self._db.execute("PRAGMA incremental_vacuum")
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def _prune_blobs(self, thread_id: str, checkpoint_ns: str) -> int:
+        # Versiones referenciadas por los checkpoints que quedan (más las bases de sus deltas)
+        referenced = set()
+        for (versions,) in self._db.execute(
+                "SELECT channel_versions FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns)):
+            referenced.update(json.loads(versions).items())
+        bases = {}
+        for channel, version, base in self._db.execute(
+                "SELECT channel, version, base_version FROM blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND base_version IS NOT NULL",
+                (thread_id, checkpoint_ns)):
+            bases[(channel, version)] = base
+        for channel, version in list(referenced):
+            while (channel, version) in bases:
+                version = bases[(channel, version)]
+                referenced.add((channel, version))
+        # La última versión de mensajes en memoria puede ser base del próximo delta
+        cached = self._messages.get((thread_id, checkpoint_ns))
+        if cached is not None:
+            referenced.add((MESSAGES_CHANNEL, cached[0]))
+
+        unreferenced = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in self._db.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns))
+            if (channel, version) not in referenced
+        ]
+        self._db.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            unreferenced)
+        return len(unreferenced)
+
+    def start_compaction(self, interval: float = COMPACTION_INTERVAL) -> "CheckpointCompactor":
+        """Ejecuta compact() periódicamente en un hilo en segundo plano."""
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = CheckpointCompactor(self, interval)
+            self._compactor.start()
+        return self._compactor
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.stop()
+        with self._lock:
+            self._db.close()
+
+
+class CheckpointCompactor(threading.Thread):
+    """Hilo que compacta el checkpointer cada `interval` segundos."""
+
+    def __init__(self, saver: SQLiteCheckpointer, interval: float = COMPACTION_INTERVAL):
+        super().__init__(name="checkpoint-compactor", daemon=True)
+        self.saver = saver
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.saver.compact()
+            except Exception as e:
+                logger.warning("Checkpoint compaction failed: %s", e)
+
+    def stop(self):
+        self._stop_event.set()
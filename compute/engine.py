@@ -0,0 +1,427 @@
+"""
+Motor de cómputo local del agente Table-QA.
+
+Ejecuta el intent estructurado sobre las tablas locales (CSV / Parquet) de los datasets
+de useful_data y rellena State.aggregates y State.query_plan:
+
+1. compute.plan traduce los filtros del intent a predicados sobre columnas del dataset
+2. compute.readers lee solo las columnas necesarias, por bloques (y en Parquet se
+   saltan los row groups que las estadísticas descartan)
+3. Cada bloque se filtra con máscaras NumPy: primero se evalúan las columnas de los
+   predicados y las columnas de valor solo se convierten para las filas que pasan
+4. Los agregados parciales de cada bloque (recuento, media y M2 para la desviación,
+   mín, máx) se combinan sin guardar las filas, así la memoria no depende del tamaño
+   de la tabla
+
+Dónde están los datos de un dataset:
+    - Clave DATA_FILE_KEY del catálogo (ruta relativa al fichero del catálogo o absoluta)
+    - Si no, DATA_DIR/<dataset_id>.parquet|.csv
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import csv
+import logging
+import math
+import os
+
+import numpy as np
+
+from compute.plan import FilterClause, Predicate, QueryPlan, build_plan, plans_to_sql, normalize_text, fold_text
+from compute.readers import (
+    CHUNK_ROWS, CSV_SUFFIXES, PARQUET_SUFFIXES, ColumnBounds, ScanStats, is_table_file, iter_table_chunks,
+)
+from search.loader import SOURCE_KEY
+
+logger = logging.getLogger(__name__)
+
+
+# Directorio por defecto de las tablas locales (<dataset_id>.csv / .parquet)
+DATA_DIR = Path(os.environ.get("COMPUTE_DATA_DIR") or Path(__file__).parent / "data")
+
+# Clave opcional del catálogo con la ruta de la tabla de un dataset
+DATA_FILE_KEY = "fichero_datos"
+
+# Filas devueltas como máximo con aggregation_type "row_level"
+ROW_LIMIT = 100
+
+
+# ==========================================
+# 1. CONVERSIONES VECTORIZADAS
+# ==========================================
+def _map_unique(values: np.ndarray, fn: Callable[[str], Any], dtype: Any = bool) -> np.ndarray:
+    """Aplica fn a cada valor distinto (columnas categóricas: pocos valores, muchas filas)."""
+    uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+    return np.fromiter((fn(u) for u in uniques), dtype=dtype, count=len(uniques))[inverse]
+
+
+def _to_float(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def to_numbers(values: np.ndarray) -> np.ndarray:
+    """Valores numéricos de una columna (NaN donde no son números)."""
+    if values.dtype.kind in "iufb":
+        return values.astype(np.float64)
+    if values.dtype.kind in "mM":
+        return np.full(len(values), np.nan)
+    text = np.char.strip(values.astype(str))
+    # Coma decimal ("12,5") cuando no hay punto
+    text = np.where(np.char.find(text, ".") < 0, np.char.replace(text, ",", "."), text)
+    try:
+        return text.astype(np.float64)
+    except ValueError:
+        return _map_unique(text, _to_float, dtype=np.float64)
+
+
+def to_years(values: np.ndarray) -> np.ndarray:
+    """Año de cada valor de una columna temporal (NaN si no se reconoce)."""
+    if values.dtype.kind == "M":
+        years = values.astype("datetime64[Y]").astype(np.int64).astype(np.float64) + 1970
+        years[np.isnat(values)] = np.nan
+        return years
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64)
+    # Fechas ISO ("2024-03-01", "2024-11-10T08:00:00Z") o años: los 4 primeros caracteres
+    head = np.char.strip(values.astype(str)).astype("U4")
+    years = np.full(len(head), np.nan)
+    valid = np.char.isdigit(head) & (np.char.str_len(head) == 4)
+    years[valid] = head[valid].astype(np.float64)
+    return years
+
+
+def _bucket(text: str) -> Tuple[float, float]:
+    # Grupos de edad: "36-50", "66+", "<18", "45"
+    text = text.strip().replace(" ", "")
+    if text.endswith("+"):
+        return _to_float(text[:-1]), math.inf
+    if text.startswith(("<", ">")):
+        value = _to_float(text.lstrip("<>="))
+        return (-math.inf, value) if text[0] == "<" else (value, math.inf)
+    lo, sep, hi = text.partition("-")
+    if sep and lo:
+        return _to_float(lo), _to_float(hi)
+    value = _to_float(text)
+    return value, value
+
+
+def evaluate(predicate: Predicate, values: np.ndarray) -> np.ndarray:
+    """Máscara booleana de las filas de un bloque que cumplen el predicado."""
+    if predicate.op == "year_between":
+        lo, hi = predicate.value
+        years = to_years(values)
+        return (years >= lo) & (years <= hi)
+    if predicate.op == "between":
+        lo, hi = predicate.value
+        lo = -math.inf if lo is None else lo
+        hi = math.inf if hi is None else hi
+        numbers = to_numbers(values)
+        if not np.isnan(numbers).all():
+            return (numbers >= lo) & (numbers <= hi)
+
+        def overlaps(text: str) -> bool:
+            b_lo, b_hi = _bucket(text)
+            return not (math.isnan(b_lo) or math.isnan(b_hi)) and b_lo <= hi and b_hi >= lo
+        return _map_unique(values, overlaps)
+    if predicate.op == "in":
+        accepted = set(predicate.value)
+        return _map_unique(values, lambda text: fold_text(text) in accepted)
+    if predicate.op == "contains":
+        needle = f" {predicate.value} "
+        return _map_unique(values, lambda text: needle in f" {normalize_text(text)} ")
+    if predicate.op == "contains_any":
+        needles = [f" {phrase} " for phrase in predicate.value]
+        return _map_unique(values, lambda text: any(n in f" {normalize_text(text)} " for n in needles))
+    raise ValueError(f"Operador desconocido: {predicate.op}")
+
+
+def _bound_year(value: Any) -> Optional[int]:
+    if hasattr(value, "year"):
+        return value.year
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    text = str(value)[:4]
+    return int(text) if text.isdigit() else None
+
+
+def _may_match(predicate: Predicate, bounds: ColumnBounds) -> bool:
+    # False solo si las estadísticas (mín, máx) garantizan que ninguna fila cumple
+    if predicate.column not in bounds:
+        return True
+    low, high = bounds[predicate.column]
+    if predicate.op == "year_between":
+        lo_year, hi_year = _bound_year(low), _bound_year(high)
+        lo, hi = predicate.value
+        return lo_year is None or hi_year is None or not (hi_year < lo or lo_year > hi)
+    if predicate.op == "between" and isinstance(low, (int, float)) and isinstance(high, (int, float)):
+        lo, hi = predicate.value
+        return not ((lo is not None and high < lo) or (hi is not None and low > hi))
+    return True
+
+
+def row_group_filter(clauses: Sequence[FilterClause]) -> Callable[[ColumnBounds], bool]:
+    """Filtro de row groups de Parquet a partir de las cláusulas del plan (predicate pushdown)."""
+    def keep(bounds: ColumnBounds) -> bool:
+        return all(any(_may_match(p, bounds) for p in clause.predicates) for clause in clauses)
+    return keep
+
+
+# ==========================================
+# 2. AGREGADOS PARCIALES (COMBINABLES)
+# ==========================================
+@dataclass
+class ColumnStats:
+    """Estadísticos de una columna combinables entre bloques (media y M2 de Chan et al.)."""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+    non_numeric: int = 0  # Valores no vacíos que no son números
+
+    def update(self, values: np.ndarray):
+        numbers = to_numbers(values)
+        valid = ~np.isnan(numbers)
+        if values.dtype.kind in "OSU":
+            self.non_numeric += int(np.count_nonzero(~valid & (np.char.str_len(values.astype(str)) > 0)))
+        numbers = numbers[valid]
+        if len(numbers):
+            mean = float(numbers.mean())
+            self.merge(ColumnStats(len(numbers), mean, float(((numbers - mean) ** 2).sum()),
+                                   float(numbers.min()), float(numbers.max())))
+
+    def merge(self, other: "ColumnStats"):
+        self.non_numeric += other.non_numeric
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def result(self, aggregation: str) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0, "non_numeric": self.non_numeric}
+        if aggregation == "average":
+            return {"count": self.count, "mean": round(self.mean, 6)}
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 6),
+            "min": self.min,
+            "max": self.max,
+            "std": round(math.sqrt(self.m2 / (self.count - 1)), 6) if self.count > 1 else 0.0,
+        }
+
+
+@dataclass
+class PartialAggregate:
+    """Resultado parcial de un dataset (de un bloque, de un fichero o de varios combinados)."""
+    dataset_id: str
+    rows_scanned: int = 0
+    rows_matched: int = 0
+    chunks: int = 0
+    row_groups: int = 0
+    row_groups_skipped: int = 0
+    columns: Dict[str, ColumnStats] = field(default_factory=dict)
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    unapplied: List[str] = field(default_factory=list)
+    cancelled: bool = False  # Lectura interrumpida: los agregados cubren solo parte de la tabla
+
+    def merge(self, other: "PartialAggregate"):
+        self.rows_scanned += other.rows_scanned
+        self.rows_matched += other.rows_matched
+        self.chunks += other.chunks
+        self.row_groups += other.row_groups
+        self.row_groups_skipped += other.row_groups_skipped
+        for name, stats in other.columns.items():
+            self.columns.setdefault(name, ColumnStats()).merge(stats)
+        self.rows.extend(other.rows[:max(0, ROW_LIMIT - len(self.rows))])
+        self.unapplied.extend(u for u in other.unapplied if u not in self.unapplied)
+        self.cancelled = self.cancelled or other.cancelled
+
+    def result(self, plan: QueryPlan) -> Dict[str, Any]:
+        """Resultado final para State.aggregates (solo tipos serializables)."""
+        if self.cancelled:
+            # Los agregados de una tabla a medio leer no se muestran
+            return {"status": "cancelled", "rows_scanned": self.rows_scanned, "chunks": self.chunks}
+        result: Dict[str, Any] = {
+            "status": "ok",
+            "aggregation": plan.aggregation,
+            "rows_scanned": self.rows_scanned,
+            "rows_matched": self.rows_matched,
+            "chunks": self.chunks,
+        }
+        if self.row_groups:
+            result["row_groups_skipped"] = f"{self.row_groups_skipped}/{self.row_groups}"
+        if plan.aggregation == "row_level":
+            result["rows"] = self.rows[:ROW_LIMIT]
+        elif plan.aggregation != "count":
+            result["columns"] = {name: s.result(plan.aggregation) for name, s in self.columns.items()}
+        unapplied = plan.unapplied + [u for u in self.unapplied if u not in plan.unapplied]
+        if unapplied:
+            result["unapplied_filters"] = unapplied
+        return result
+
+
+def _plain_value(value: Any) -> Any:
+    # Escalares de NumPy / fechas → tipos serializables por el checkpointer
+    if isinstance(value, np.generic):
+        value = value.item()
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+# ==========================================
+# 3. EJECUCIÓN
+# ==========================================
+def aggregate_chunk(plan: QueryPlan, chunk: Dict[str, np.ndarray], partial: PartialAggregate,
+                    clauses: Sequence[FilterClause]):
+    """Filtra un bloque con las cláusulas y acumula sus agregados en partial."""
+    n = len(next(iter(chunk.values())))
+    partial.rows_scanned += n
+    mask = np.ones(n, dtype=bool)
+    for clause in clauses:
+        clause_mask = np.zeros(n, dtype=bool)
+        for predicate in clause.predicates:
+            clause_mask |= evaluate(predicate, chunk[predicate.column])
+        mask &= clause_mask
+        if not mask.any():
+            return
+    matched = int(mask.sum())
+    partial.rows_matched += matched
+    value_columns = [c for c in plan.value_columns if c in chunk]
+    if plan.aggregation == "count":
+        return
+    if plan.aggregation == "row_level":
+        room = ROW_LIMIT - len(partial.rows)
+        if room > 0:
+            idx = np.flatnonzero(mask)[:room]
+            shown = {}
+            for name in value_columns or list(chunk):
+                values = chunk[name][idx]
+                numbers = to_numbers(values)
+                # Columnas numéricas de un CSV: se devuelven como números, no como texto
+                shown[name] = numbers if len(numbers) and not np.isnan(numbers).any() else values
+            partial.rows.extend({c: _plain_value(v[j]) for c, v in shown.items()} for j in range(len(idx)))
+        return
+    # Las columnas de valor solo se convierten para las filas que cumplen el filtro
+    full = matched == n
+    for name in value_columns:
+        partial.columns.setdefault(name, ColumnStats()).update(chunk[name] if full else chunk[name][mask])
+
+
+def _applicable(clauses: Sequence[FilterClause], available: Sequence[str],
+                partial: PartialAggregate) -> List[FilterClause]:
+    # Predicados sobre columnas que el fichero no tiene (catálogo desactualizado) se ignoran
+    kept = []
+    for clause in clauses:
+        predicates = [p for p in clause.predicates if p.column in available]
+        if predicates:
+            kept.append(FilterClause(clause.source, clause.dimension, predicates))
+        else:
+            partial.unapplied.append(clause.source)
+    return kept
+
+
+def execute_plan(plan: QueryPlan, chunk_rows: int = CHUNK_ROWS,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 on_chunk: Optional[Callable[[PartialAggregate], None]] = None) -> PartialAggregate:
+    """
+    Ejecuta un plan sobre su fichero leyendo por bloques.
+
+    Args:
+        plan: Plan con path a un CSV o Parquet
+        chunk_rows: Filas por bloque
+        should_stop: Se consulta tras cada bloque; si devuelve True la lectura se
+            interrumpe y el resultado queda marcado como cancelled
+        on_chunk: Recibe el agregado acumulado tras cada bloque (progreso)
+
+    Returns:
+        Agregado parcial del fichero completo
+    """
+    partial = PartialAggregate(plan.dataset_id)
+    stats = ScanStats()
+    clauses: Optional[List[FilterClause]] = None
+    chunks = iter_table_chunks(plan.path, plan.columns, chunk_rows, stats, row_group_filter(plan.clauses))
+    try:
+        for chunk in chunks:
+            if clauses is None:
+                clauses = _applicable(plan.clauses, list(chunk), partial)
+            aggregate_chunk(plan, chunk, partial, clauses)
+            partial.chunks = stats.chunks
+            partial.row_groups = stats.row_groups
+            partial.row_groups_skipped = stats.row_groups_skipped
+            if on_chunk is not None:
+                on_chunk(partial)
+            if should_stop is not None and should_stop():
+                partial.cancelled = True
+                break
+    finally:
+        chunks.close()
+    partial.chunks = stats.chunks
+    partial.row_groups = stats.row_groups
+    partial.row_groups_skipped = stats.row_groups_skipped
+    return partial
+
+
+def resolve_data_file(dataset: Dict[str, Any]) -> Optional[Path]:
+    """Tabla local de un dataset (CSV o Parquet), o None si no hay datos."""
+    ref = dataset.get(DATA_FILE_KEY)
+    if ref:
+        path = Path(ref)
+        if not path.is_absolute():
+            source = dataset.get(SOURCE_KEY)
+            path = (Path(source[0]).parent if source else DATA_DIR) / path
+        return path if path.is_file() and is_table_file(path) else None
+    dataset_id = dataset.get("dataset_id")
+    if not dataset_id:
+        return None
+    for suffix in PARQUET_SUFFIXES + CSV_SUFFIXES:
+        path = DATA_DIR / f"{dataset_id}{suffix}"
+        if path.is_file() and is_table_file(path):
+            return path
+    return None
+
+
+def plan_datasets(datasets: Sequence[Dict[str, Any]], intent: Optional[Dict[str, Any]]) -> List[QueryPlan]:
+    """Planes de los datasets que tienen tabla local."""
+    plans = []
+    for ds in datasets:
+        path = resolve_data_file(ds)
+        if path is None:
+            logger.debug("Sin datos locales para %s", ds.get("dataset_id"))
+            continue
+        plans.append(build_plan(ds, intent, path))
+    return plans
+
+
+def compute_aggregates(datasets: Sequence[Dict[str, Any]], intent: Optional[Dict[str, Any]],
+                       chunk_rows: int = CHUNK_ROWS,
+                       plans: Optional[List[QueryPlan]] = None) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Ejecuta el intent sobre las tablas locales de los datasets.
+
+    Args:
+        datasets: useful_data
+        intent: user_search_intent_structured
+        chunk_rows: Filas por bloque
+        plans: Planes ya calculados con plan_datasets (se calculan si no se pasan)
+
+    Returns:
+        (aggregates por dataset_id, query_plan en SQL o None si ningún dataset tiene datos)
+    """
+    if plans is None:
+        plans = plan_datasets(datasets, intent)
+    aggregates: Dict[str, Any] = {}
+    for plan in plans:
+        try:
+            aggregates[plan.dataset_id] = execute_plan(plan, chunk_rows).result(plan)
+        except (OSError, ValueError, RuntimeError, csv.Error) as e:
+            logger.warning("Could not compute %s: %s", plan.dataset_id, e)
+            aggregates[plan.dataset_id] = {"status": "error", "error": str(e)}
+    return aggregates, plans_to_sql(plans) if plans else None
@@ -0,0 +1,374 @@
+"""
+Traducción del intent estructurado a un plan de consulta por dataset.
+
+Cada filtro del intent (temporal, espacial, demográfico) se convierte en una cláusula:
+un conjunto de predicados sobre las columnas del dataset que pueden satisfacerlo (OR
+entre columnas, AND entre cláusulas). Las columnas se eligen con el vocabulario de
+dimensiones de search.schema_matcher. required_columns determina las columnas de
+valor; el plan solo lee esas columnas y las de los predicados (poda de columnas).
+
+Formatos de filtro admitidos (ver State en app.py):
+    - Texto libre: "2024", "2020-2023", "en Madrid", "mayores de 65", "mujeres"
+    - Normalizados: {"normalized": {"type": "year", "year": 2024}},
+      {"normalized": {"type": "last_n_years", "n": 3}},
+      {"normalized": {"type": "range", "start": 2020, "end": 2023}},
+      {"normalized": {"type": "place", "places": [{"name": "Bizkaia", "names": ["Bizkaia", "vizcaya"], ...}]}},
+      {"normalized": {"type": "age_range", "min": 66, "max": None}},
+      {"normalized": {"type": "sex", "value": "female"}}, {"normalized": {"type": "all"}},
+      {"column": "edad", "operator": ">", "value": 50}, {"column": "ciudad", "value": "Madrid"}
+    (filter_normalizer produce los normalizados)
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import re
+import unicodedata
+
+from filter_normalizer import contained_names
+from search.schema_matcher import DIMENSION_VOCABULARY
+from search.text_index import tokenize
+
+
+# Tipos de agregación del intent
+AGGREGATIONS = ("statistics", "count", "average", "row_level")
+DEFAULT_AGGREGATION = "statistics"
+
+# Columnas espaciales numéricas (coordenadas): no sirven para filtrar por nombre de lugar
+_COORDINATE_TERMS = frozenset(tokenize("lat latitud latitude lon longitud longitude altitud altitude"))
+_AGE_TERMS = frozenset(tokenize("edad age etario"))
+_SEX_TERMS = frozenset(tokenize("sexo sex genero gender"))
+_DIMENSION_TERMS = {dim: frozenset(t for w in words for t in tokenize(w)) for dim, words in DIMENSION_VOCABULARY.items()}
+
+# Valores de la columna de sexo para cada filtro
+SEX_VALUES = {
+    "female": ("f", "mujer", "mujeres", "female", "femenino", "w"),
+    "male": ("m", "hombre", "hombres", "male", "masculino", "h"),
+}
+
+# Filtros demográficos que no restringen nada
+_ALL_POPULATION_RE = re.compile(r"\b(toda la poblacion|todos|todas|poblacion general|general|total|sin filtro)\b")
+_YEAR_RE = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_OLDER_RE = re.compile(r"\b(?:mayores de|mas de|por encima de|>=?)\s*(\d+)")
+_YOUNGER_RE = re.compile(r"\b(?:menores de|menos de|por debajo de|<=?)\s*(\d+)")
+_BETWEEN_RE = re.compile(r"\b(?:entre|de)\s*(\d+)\s*(?:y|a|-)\s*(\d+)|\b(\d+)\s*-\s*(\d+)\b")
+_OPERATORS = {">": (1, None), ">=": (0, None), "<": (None, -1), "<=": (None, 0), "=": (0, 0), "==": (0, 0)}
+
+
+def normalize_text(text: Any) -> str:
+    return " ".join(tokenize(text))
+
+
+def fold_text(text: Any) -> str:
+    # Minúsculas y sin tildes, conservando números y conectores (para las expresiones regulares)
+    decomposed = unicodedata.normalize("NFKD", str(text or "").lower())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """
+    Condición sobre una columna, evaluada de forma vectorizada sobre cada bloque.
+
+    Operadores:
+        year_between: año de una fecha (texto ISO, entero o datetime64) en [lo, hi]
+        between: valor numérico en [lo, hi] (None = sin límite); con texto, rangos de edad ("36-50", "66+")
+        in: valor (normalizado) en un conjunto
+        contains: el valor (normalizado) contiene la frase
+        contains_any: el valor (normalizado) contiene alguna de las frases (tupla)
+    """
+    column: str
+    op: str
+    value: Any
+
+    def to_sql(self) -> str:
+        col = f'"{self.column}"'
+        if self.op == "year_between":
+            lo, hi = self.value
+            return f"year({col}) = {lo}" if lo == hi else f"year({col}) BETWEEN {lo} AND {hi}"
+        if self.op == "between":
+            lo, hi = self.value
+            if lo is not None and hi is not None:
+                return f"{col} BETWEEN {lo} AND {hi}"
+            return f"{col} >= {lo}" if lo is not None else f"{col} <= {hi}"
+        if self.op == "in":
+            return f"lower({col}) IN ({', '.join(repr(v) for v in self.value)})"
+        if self.op == "contains_any":
+            return f"{col} ILIKE ANY (ARRAY[{', '.join(repr(f'%{v}%') for v in self.value)}])"
+        return f"{col} ILIKE '%{self.value}%'"
+
+
+@dataclass
+class FilterClause:
+    """Un filtro del intent: se cumple si se cumple alguno de sus predicados."""
+    source: str  # Texto original del filtro
+    dimension: str
+    predicates: List[Predicate]
+
+    def to_sql(self) -> str:
+        parts = [p.to_sql() for p in self.predicates]
+        return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+
+@dataclass
+class QueryPlan:
+    """Plan de ejecución del intent sobre un dataset."""
+    dataset_id: str
+    path: Optional[Path]  # Fichero local (CSV o Parquet); None si no hay datos
+    aggregation: str
+    value_columns: List[str]
+    clauses: List[FilterClause] = field(default_factory=list)
+    unapplied: List[str] = field(default_factory=list)  # Filtros sin columna donde aplicarse
+
+    @property
+    def columns(self) -> List[str]:
+        """Columnas que hay que leer (poda de columnas): las de valor y las de los predicados."""
+        seen: Dict[str, None] = dict.fromkeys(self.value_columns)
+        for clause in self.clauses:
+            seen.update(dict.fromkeys(p.column for p in clause.predicates))
+        return list(seen)
+
+    def to_sql(self) -> str:
+        """El plan como consulta SQL (informativa; se ejecuta con NumPy, no con un motor SQL)."""
+        cols = [f'"{c}"' for c in self.value_columns]
+        if self.aggregation == "count" or not cols:
+            select = "COUNT(*)"
+        elif self.aggregation == "average":
+            select = ", ".join(f"AVG({c})" for c in cols)
+        elif self.aggregation == "row_level":
+            select = ", ".join(cols)
+        else:
+            select = ", ".join(f"COUNT({c}), AVG({c}), MIN({c}), MAX({c}), STDDEV({c})" for c in cols)
+        sql = f'SELECT {select} FROM "{self.dataset_id}"'
+        if self.clauses:
+            sql += " WHERE " + " AND ".join(c.to_sql() for c in self.clauses)
+        if self.unapplied:
+            sql += f"  -- sin columna para: {', '.join(self.unapplied)}"
+        return sql
+
+
+# ==========================================
+# 1. COLUMNAS DEL DATASET POR DIMENSIÓN
+# ==========================================
+def _column_terms(col: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
+    """(términos del nombre, términos del nombre + descripción) de una columna."""
+    name = set(tokenize(col.get("nombre")))
+    return name, name | set(tokenize(col.get("descripcion")))
+
+
+def _columns_with(dataset: Dict[str, Any], terms: frozenset, exclude: frozenset = frozenset()) -> List[str]:
+    # Primero las columnas cuyo nombre contiene los términos; si no hay, por descripción
+    by_name, by_desc = [], []
+    for col in dataset.get("columnas") or []:
+        name, all_terms = _column_terms(col)
+        if all_terms & exclude:
+            continue
+        if name & terms:
+            by_name.append(col["nombre"])
+        elif all_terms & terms:
+            by_desc.append(col["nombre"])
+    return by_name or by_desc
+
+
+def _named_column(dataset: Dict[str, Any], name: Any) -> Optional[str]:
+    wanted = normalize_text(name)
+    for col in dataset.get("columnas") or []:
+        if normalize_text(col.get("nombre")) == wanted:
+            return col["nombre"]
+    return None
+
+
+# ==========================================
+# 2. FILTROS → CLÁUSULAS
+# ==========================================
+def _raw(f: Any) -> str:
+    return str(f.get("raw") or f.get("value") or f) if isinstance(f, dict) else str(f)
+
+
+def _normalized(f: Any, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    norm = f.get("normalized") if isinstance(f, dict) else None
+    if isinstance(norm, dict) and (kind is None or norm.get("type") == kind):
+        return norm
+    return None
+
+
+def _bound(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def year_range(f: Any, today: Optional[date] = None) -> Optional[Tuple[int, int]]:
+    """Rango de años [inicio, fin] de un filtro temporal, o None si no se reconoce."""
+    current = (today or date.today()).year
+    norm = f.get("normalized") if isinstance(f, dict) else None
+    if isinstance(norm, dict):
+        kind = norm.get("type")
+        if kind == "year" and norm.get("year") is not None:
+            return int(norm["year"]), int(norm["year"])
+        if kind == "last_n_years" and norm.get("n"):
+            return current - int(norm["n"]) + 1, current
+        if kind == "range" and norm.get("start") is not None:
+            end = norm.get("end") if norm.get("end") is not None else current
+            return int(str(norm["start"])[:4]), int(str(end)[:4])
+    years = [int(y) for y in _YEAR_RE.findall(_raw(f))]
+    if not years:
+        return None
+    return min(years), max(years)
+
+
+def age_range(text: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Rango de edad [mín, máx] de un filtro demográfico en texto, o None."""
+    text = fold_text(text)
+    if m := _BETWEEN_RE.search(text):
+        lo, hi = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+        return float(lo), float(hi)
+    if m := _OLDER_RE.search(text):
+        return float(m.group(1)) + (0 if "=" in m.group(0) else 1), None
+    if m := _YOUNGER_RE.search(text):
+        return None, float(m.group(1)) - (0 if "=" in m.group(0) else 1)
+    return None
+
+
+def _sex(text: str) -> Optional[str]:
+    words = set(fold_text(text).split())
+    if words & {"mujer", "mujeres", "femenino", "female", "women"}:
+        return "female"
+    if words & {"hombre", "hombres", "masculino", "male", "men", "varones"}:
+        return "male"
+    return None
+
+
+def _temporal_clause(dataset: Dict[str, Any], f: Any) -> Optional[FilterClause]:
+    span = year_range(f)
+    if span is None:
+        return None
+    columns = _columns_with(dataset, _DIMENSION_TERMS["temporal"])
+    if isinstance(f, dict) and f.get("column"):
+        columns = [c for c in [_named_column(dataset, f["column"])] if c] or columns
+    return FilterClause(_raw(f), "temporal", [Predicate(c, "year_between", span) for c in columns]) if columns else None
+
+
+def _spatial_clause(dataset: Dict[str, Any], f: Any) -> Optional[FilterClause]:
+    norm = _normalized(f, "place")
+    if norm is not None:
+        # Cualquiera de los nombres de cualquiera de los lugares ("Bizkaia" / "Vizcaya") o de los
+        # lugares que contienen ("Cataluña" → "Barcelona", "Girona"..., "L'Hospitalet"...)
+        names = [name for place in norm.get("places") or []
+                 for name in (place.get("names") or [place.get("name")]) + contained_names(place)]
+    else:
+        value = (f.get("value") or f.get("raw")) if isinstance(f, dict) else f
+        names = [re.sub(r"^\s*(en|de|del)\s+", "", str(value or ""), flags=re.IGNORECASE)]
+    phrases = list(dict.fromkeys(p for p in map(normalize_text, names) if p))
+    if not phrases:
+        return None
+    columns = _columns_with(dataset, _DIMENSION_TERMS["spatial"], exclude=_COORDINATE_TERMS)
+    if isinstance(f, dict) and f.get("column"):
+        columns = [c for c in [_named_column(dataset, f["column"])] if c] or columns
+    if len(phrases) == 1:
+        predicates = [Predicate(c, "contains", phrases[0]) for c in columns]
+    else:
+        predicates = [Predicate(c, "contains_any", tuple(phrases)) for c in columns]
+    return FilterClause(_raw(f), "spatial", predicates) if columns else None
+
+
+def _demographic_clause(dataset: Dict[str, Any], f: Any) -> Optional[FilterClause]:
+    if isinstance(f, dict) and f.get("operator") in _OPERATORS and f.get("value") is not None:
+        column = _named_column(dataset, f.get("column"))
+        columns = [column] if column else _columns_with(dataset, _AGE_TERMS)
+        value = float(f["value"])
+        lo, hi = _OPERATORS[f["operator"]]
+        span = (None if lo is None else value + lo, None if hi is None else value + hi)
+        return FilterClause(_raw(f), "demographic", [Predicate(c, "between", span) for c in columns]) if columns else None
+    text = _raw(f)
+    norm = _normalized(f)
+    if norm is not None and norm.get("type") in ("sex", "age_range"):
+        sex = norm.get("value") if norm["type"] == "sex" and norm.get("value") in SEX_VALUES else None
+        span = (_bound(norm.get("min")), _bound(norm.get("max"))) if norm["type"] == "age_range" else None
+    else:
+        sex = _sex(text)
+        span = age_range(text) if sex is None else None
+    if sex is not None:
+        columns = _columns_with(dataset, _SEX_TERMS)
+        return FilterClause(text, "demographic", [Predicate(c, "in", SEX_VALUES[sex]) for c in columns]) if columns else None
+    if span is not None:
+        columns = _columns_with(dataset, _AGE_TERMS)
+        return FilterClause(text, "demographic", [Predicate(c, "between", span) for c in columns]) if columns else None
+    return None
+
+
+_CLAUSE_BUILDERS = {
+    "temporal_filters": _temporal_clause,
+    "spatial_filters": _spatial_clause,
+    "demographic_filters": _demographic_clause,
+}
+
+
+def _unrestricted(key: str, f: Any) -> bool:
+    """Filtros que no restringen: "toda la población" o el país entero (el catálogo es de España)."""
+    norm = _normalized(f)
+    if key == "demographic_filters":
+        return (norm or {}).get("type") == "all" or bool(_ALL_POPULATION_RE.search(fold_text(_raw(f))))
+    if key == "spatial_filters" and norm is not None and norm.get("type") == "place":
+        return bool(norm.get("places")) and all(p.get("level") == "country" for p in norm["places"])
+    return False
+
+
+def _as_list(value: Any) -> List[Any]:
+    if not value:
+        return []
+    return [value] if isinstance(value, (str, dict)) else list(value)
+
+
+def _value_columns(dataset: Dict[str, Any], intent: Dict[str, Any], by_dimension: bool) -> List[str]:
+    # Cada columna requerida se empareja por término (nombre y luego descripción) o, si
+    # by_dimension, por dimensión ("fecha" → "timestamp"). Esas columnas solo se muestran
+    # con row_level: no tiene sentido promediar una fecha o un lugar
+    found: Dict[str, None] = {}
+    for required in _as_list(intent.get("required_columns")):
+        terms = frozenset(tokenize(required))
+        if not terms:
+            continue
+        named = _named_column(dataset, required)
+        columns = [named] if named else _columns_with(dataset, terms)
+        if not columns and by_dimension:
+            # Sinónimos concretos (edad, sexo) antes que la dimensión completa
+            groups = [g for g in (_AGE_TERMS, _SEX_TERMS) if terms & g]
+            groups = groups or [vocab for vocab in _DIMENSION_TERMS.values() if terms & vocab]
+            for vocab in groups:
+                columns += _columns_with(dataset, vocab, exclude=_COORDINATE_TERMS)[:1]
+        found.update(dict.fromkeys(columns))
+    return list(found)
+
+
+def build_plan(dataset: Dict[str, Any], intent: Optional[Dict[str, Any]], path: Optional[Path] = None) -> QueryPlan:
+    """
+    Plan de consulta del intent sobre un dataset.
+
+    Args:
+        dataset: Dataset del catálogo (resumen con columnas)
+        intent: user_search_intent_structured
+        path: Fichero local con los datos del dataset
+
+    Returns:
+        QueryPlan con predicados, columnas de valor y filtros no aplicables
+    """
+    intent = intent or {}
+    aggregation = str(intent.get("aggregation_type") or DEFAULT_AGGREGATION).lower()
+    if aggregation not in AGGREGATIONS:
+        aggregation = DEFAULT_AGGREGATION
+    plan = QueryPlan(str(dataset.get("dataset_id")), path, aggregation,
+                     _value_columns(dataset, intent, by_dimension=aggregation == "row_level"))
+    for key, builder in _CLAUSE_BUILDERS.items():
+        for f in _as_list(intent.get(key)):
+            if _unrestricted(key, f):
+                continue
+            clause = builder(dataset, f)
+            if clause is None:
+                plan.unapplied.append(_raw(f))
+            else:
+                plan.clauses.append(clause)
+    return plan
+
+
+def plans_to_sql(plans: Sequence[QueryPlan]) -> str:
+    """Texto del query_plan del State: una consulta por dataset con datos locales."""
+    return ";\n".join(p.to_sql() for p in plans)
@@ -0,0 +1,173 @@
+"""
+Lectura por bloques de tablas locales (CSV y Parquet) con poda de columnas.
+
+Cada lector devuelve bloques {columna: np.ndarray} de como mucho chunk_rows filas, así
+una tabla grande nunca se carga entera en memoria. Solo se materializan las columnas
+pedidas; si no se pide ninguna columna que exista (p. ej. un COUNT sin filtros) se lee
+solo la primera, para poder contar las filas. En Parquet (requiere pyarrow, opcional)
+los row groups cuyas estadísticas min/max descartan el predicado no se llegan a leer
+(predicate pushdown).
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import csv
+import logging
+
+import numpy as np
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional: sin pyarrow solo se leen CSV
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+
+# Filas por bloque
+CHUNK_ROWS = 65_536
+
+# Extensiones reconocidas
+CSV_SUFFIXES = (".csv", ".tsv", ".txt")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+
+# Estadísticas de un row group: columna -> (mín, máx)
+ColumnBounds = Dict[str, Tuple[Any, Any]]
+
+
+@dataclass
+class ScanStats:
+    """Contadores de una lectura."""
+    chunks: int = 0
+    rows: int = 0
+    row_groups: int = 0
+    row_groups_skipped: int = 0
+
+
+def _sniff_delimiter(sample: str) -> str:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def iter_csv_chunks(path: Path, columns: Sequence[str], chunk_rows: int = CHUNK_ROWS,
+                    stats: Optional[ScanStats] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Recorre un CSV por bloques leyendo solo las columnas pedidas.
+
+    Args:
+        path: Fichero CSV (con cabecera; el separador se detecta)
+        columns: Columnas a devolver (las que no existan se omiten; si no queda
+            ninguna se devuelve la primera del fichero para contar filas)
+        chunk_rows: Filas por bloque
+        stats: Contadores a actualizar
+
+    Yields:
+        Bloques {columna: array de texto}
+    """
+    stats = stats if stats is not None else ScanStats()
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        delimiter = _sniff_delimiter(f.readline())
+        f.seek(0)
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        positions = {name.strip(): i for i, name in enumerate(header)}
+        wanted = [(c, positions[c]) for c in columns if c in positions]
+        if not wanted:
+            if not header:
+                return
+            wanted = [(header[0].strip(), 0)]
+        width = len(header)
+        while True:
+            # Solo se copian los campos de las columnas pedidas (poda de columnas)
+            fields: List[List[str]] = [[] for _ in wanted]
+            for row in reader:
+                if len(row) < width:
+                    row = row + [""] * (width - len(row))
+                for values, (_, i) in zip(fields, wanted):
+                    values.append(row[i])
+                if len(fields[0]) >= chunk_rows:
+                    break
+            if not fields[0]:
+                return
+            stats.chunks += 1
+            stats.rows += len(fields[0])
+            yield {name: np.asarray(values, dtype=str) for (name, _), values in zip(wanted, fields)}
+
+
+def _row_group_bounds(metadata: Any, group: int, columns: Sequence[str]) -> ColumnBounds:
+    bounds: ColumnBounds = {}
+    row_group = metadata.row_group(group)
+    for j in range(row_group.num_columns):
+        column = row_group.column(j)
+        name = column.path_in_schema
+        statistics = column.statistics
+        if name in columns and statistics is not None and statistics.has_min_max:
+            bounds[name] = (statistics.min, statistics.max)
+    return bounds
+
+
+def iter_parquet_chunks(path: Path, columns: Sequence[str], chunk_rows: int = CHUNK_ROWS,
+                        stats: Optional[ScanStats] = None,
+                        row_group_filter: Optional[Callable[[ColumnBounds], bool]] = None
+                        ) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Recorre un Parquet por row groups y bloques leyendo solo las columnas pedidas.
+
+    Args:
+        path: Fichero Parquet
+        columns: Columnas a devolver (las que no existan se omiten; si no queda
+            ninguna se devuelve la primera del fichero para contar filas)
+        chunk_rows: Filas máximas por bloque
+        stats: Contadores a actualizar
+        row_group_filter: Recibe las estadísticas (mín, máx) de un row group y devuelve
+            False si ninguna de sus filas puede cumplir el predicado (se salta sin leerlo)
+
+    Yields:
+        Bloques {columna: array}
+
+    Raises:
+        RuntimeError: Si pyarrow no está instalado
+    """
+    if pq is None:
+        raise RuntimeError("Leer Parquet requiere pyarrow (pip install pyarrow)")
+    stats = stats if stats is not None else ScanStats()
+    parquet = pq.ParquetFile(path)
+    names = parquet.schema_arrow.names
+    wanted = [c for c in columns if c in set(names)]
+    if not wanted:
+        if not names:
+            return
+        wanted = names[:1]
+    for group in range(parquet.metadata.num_row_groups):
+        stats.row_groups += 1
+        if row_group_filter is not None and not row_group_filter(_row_group_bounds(parquet.metadata, group, wanted)):
+            stats.row_groups_skipped += 1
+            continue
+        table = parquet.read_row_group(group, columns=wanted)
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            stats.chunks += 1
+            stats.rows += batch.num_rows
+            yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in wanted}
+
+
+def iter_table_chunks(path: Path, columns: Sequence[str], chunk_rows: int = CHUNK_ROWS,
+                      stats: Optional[ScanStats] = None,
+                      row_group_filter: Optional[Callable[[ColumnBounds], bool]] = None
+                      ) -> Iterator[Dict[str, np.ndarray]]:
+    """Recorre un CSV o un Parquet por bloques según su extensión."""
+    suffix = path.suffix.lower()
+    if suffix in PARQUET_SUFFIXES:
+        return iter_parquet_chunks(path, columns, chunk_rows, stats, row_group_filter)
+    if suffix in CSV_SUFFIXES:
+        return iter_csv_chunks(path, columns, chunk_rows, stats)
+    raise ValueError(f"Formato de tabla no soportado: {path.name}")
+
+
+def is_table_file(path: Path) -> bool:
+    """True si el fichero tiene un formato legible (Parquet solo con pyarrow instalado)."""
+    suffix = path.suffix.lower()
+    return suffix in CSV_SUFFIXES or (suffix in PARQUET_SUFFIXES and pq is not None)
@@ -0,0 +1,262 @@
+"""
+Ejecución en paralelo del cómputo por dataset con un pool de procesos.
+
+node_compute reparte un plan por dataset (compute.plan) entre los procesos del pool.
+Resultados intermedios y cancelación comparten un único bloque de memoria compartida
+(ResultBoard) en lugar de viajar por las tuberías del pool:
+
+- Una fila por tarea con su estado y sus agregados numéricos (filas leídas, filas que
+  cumplen, y por columna recuento, media, M2, mín, máx). El proceso la actualiza tras
+  cada bloque, así el padre ve el progreso sin esperar al final.
+- Un byte de cancelación por tarea que el proceso consulta entre bloques.
+
+Cancelación temprana: useful_data viene ordenado por relevancia. En cuanto han
+terminado los MIN_ANSWERS datasets mejor clasificados (o se agota COMPUTE_TIMEOUT),
+las tareas pendientes se cancelan y las que están en marcha paran en el siguiente bloque.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from compute.engine import ColumnStats, PartialAggregate, compute_aggregates, execute_plan, plan_datasets
+from compute.plan import QueryPlan, plans_to_sql
+from compute.readers import CHUNK_ROWS
+
+logger = logging.getLogger(__name__)
+
+
+# Datasets mejor clasificados cuya respuesta basta para cancelar el resto
+MIN_ANSWERS = 3
+
+# Segundos máximos de cómputo por turno (después se cancela lo que quede)
+COMPUTE_TIMEOUT = 30.0
+
+# Segundos que se espera a que las tareas canceladas en marcha paren
+CANCEL_GRACE = 5.0
+
+# Procesos del pool por defecto
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Estado de cada tarea en el ResultBoard
+PENDING, RUNNING, DONE, CANCELLED, FAILED = range(5)
+
+# Cabecera de cada fila: estado, filas leídas, filas que cumplen, bloques, row groups, saltados
+_HEADER = 6
+# Estadísticos por columna: recuento, media, M2, mín, máx, no numéricos
+_COLUMN_FIELDS = 6
+
+
+class ResultBoard:
+    """
+    Bloque de memoria compartida con los resultados numéricos y la cancelación de las tareas.
+
+    Layout: n_tasks bytes de cancelación (alineados a 8) y una matriz float64 de
+    n_tasks × (_HEADER + n_columns × _COLUMN_FIELDS).
+    """
+
+    def __init__(self, n_tasks: int, n_columns: int, name: Optional[str] = None):
+        self.n_tasks = n_tasks
+        self.n_columns = n_columns
+        self.width = _HEADER + n_columns * _COLUMN_FIELDS
+        self._flags_size = (n_tasks + 7) // 8 * 8
+        size = self._flags_size + n_tasks * self.width * 8
+        if name is None:
+            self.shm = SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            # Los hijos comparten el resource tracker del padre, que es quien lo libera
+            self.shm = SharedMemory(name=name)
+            self.owner = False
+        self.cancel = np.ndarray((n_tasks,), dtype=np.uint8, buffer=self.shm.buf)
+        self.rows = np.ndarray((n_tasks, self.width), dtype=np.float64, buffer=self.shm.buf,
+                               offset=self._flags_size)
+        if self.owner:
+            self.cancel[:] = 0
+            self.rows[:] = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def state(self, slot: int) -> int:
+        return int(self.rows[slot, 0])
+
+    def write(self, slot: int, partial: PartialAggregate, columns: Sequence[str], state: int):
+        """Publica el agregado acumulado de una tarea (lo llama el proceso del pool)."""
+        row = self.rows[slot]
+        row[1:_HEADER] = (partial.rows_scanned, partial.rows_matched, partial.chunks,
+                          partial.row_groups, partial.row_groups_skipped)
+        for i, name in enumerate(columns[:self.n_columns]):
+            stats = partial.columns.get(name)
+            if stats is not None:
+                base = _HEADER + i * _COLUMN_FIELDS
+                row[base:base + _COLUMN_FIELDS] = (stats.count, stats.mean, stats.m2,
+                                                   stats.min, stats.max, stats.non_numeric)
+        # El estado se escribe el último: el padre nunca lee una fila a medio publicar como terminada
+        row[0] = state
+
+    def read(self, slot: int, partial: PartialAggregate, columns: Sequence[str]):
+        """Completa partial con los agregados numéricos publicados por una tarea."""
+        row = self.rows[slot].copy()
+        (partial.rows_scanned, partial.rows_matched, partial.chunks,
+         partial.row_groups, partial.row_groups_skipped) = (int(v) for v in row[1:_HEADER])
+        for i, name in enumerate(columns[:self.n_columns]):
+            base = _HEADER + i * _COLUMN_FIELDS
+            count, mean, m2, low, high, non_numeric = row[base:base + _COLUMN_FIELDS]
+            if count or non_numeric:
+                partial.columns[name] = ColumnStats(int(count), float(mean), float(m2),
+                                                    float(low) if count else math.inf,
+                                                    float(high) if count else -math.inf, int(non_numeric))
+
+    def close(self):
+        # Las vistas NumPy deben soltarse antes de cerrar el bloque
+        self.cancel = self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _run_task(plan: QueryPlan, chunk_rows: int, board_name: str, n_tasks: int, n_columns: int,
+              slot: int) -> Tuple[List[Dict[str, Any]], List[str], bool]:
+    """
+    Tarea del pool: ejecuta un plan publicando el progreso en el ResultBoard.
+
+    Returns:
+        (filas de row_level, filtros no aplicados, cancelada); los agregados numéricos
+        van por la memoria compartida
+    """
+    board = ResultBoard(n_tasks, n_columns, name=board_name)
+    try:
+        if board.cancel[slot]:
+            board.rows[slot, 0] = CANCELLED
+            return [], [], True
+        board.rows[slot, 0] = RUNNING
+        partial = execute_plan(plan, chunk_rows,
+                               should_stop=lambda: bool(board.cancel[slot]),
+                               on_chunk=lambda p: board.write(slot, p, plan.value_columns, RUNNING))
+        board.write(slot, partial, plan.value_columns, CANCELLED if partial.cancelled else DONE)
+        return partial.rows, partial.unapplied, partial.cancelled
+    except BaseException:
+        board.rows[slot, 0] = FAILED
+        raise
+    finally:
+        board.close()
+
+
+# Pool compartido por todo el proceso (se crea con el primer cómputo en paralelo)
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(max_workers: int = DEFAULT_WORKERS) -> ProcessPoolExecutor:
+    """Pool de procesos del cómputo (spawn: los hijos no heredan hilos ni locks del grafo)."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != max_workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"))
+            _POOL_WORKERS = max_workers
+        return _POOL
+
+
+def shutdown_pool():
+    """Cierra el pool de procesos del cómputo."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+            _POOL = None
+
+
+def _cancel(futures: Dict[Future, int], board: ResultBoard):
+    for future, slot in futures.items():
+        if not future.done():
+            board.cancel[slot] = 1
+            future.cancel()
+
+
+def compute_parallel(datasets: Sequence[Dict[str, Any]], intent: Optional[Dict[str, Any]],
+                     chunk_rows: int = CHUNK_ROWS, max_workers: int = DEFAULT_WORKERS,
+                     min_answers: int = MIN_ANSWERS,
+                     timeout: float = COMPUTE_TIMEOUT) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Ejecuta el intent sobre las tablas locales de los datasets repartiéndolos en un pool.
+
+    Con un solo dataset con datos (o max_workers <= 1) se ejecuta en el propio proceso.
+
+    Args:
+        datasets: useful_data (ordenado por relevancia)
+        intent: user_search_intent_structured
+        chunk_rows: Filas por bloque
+        max_workers: Procesos del pool
+        min_answers: Datasets mejor clasificados que bastan para cancelar el resto
+        timeout: Segundos máximos antes de cancelar lo que quede
+
+    Returns:
+        (aggregates por dataset_id, query_plan en SQL o None si ningún dataset tiene datos)
+    """
+    plans = plan_datasets(datasets, intent)
+    if len(plans) < 2 or max_workers <= 1:
+        return compute_aggregates(datasets, intent, chunk_rows, plans=plans)
+
+    board = ResultBoard(len(plans), max(len(p.value_columns) for p in plans))
+    try:
+        pool = get_pool(max_workers)
+        futures = {pool.submit(_run_task, plan, chunk_rows, board.name, board.n_tasks, board.n_columns, slot): slot
+                   for slot, plan in enumerate(plans)}
+    except BrokenProcessPool:
+        board.close()
+        shutdown_pool()
+        logger.warning("Compute pool unavailable, running sequentially")
+        return compute_aggregates(datasets, intent, chunk_rows, plans=plans)
+
+    try:
+        deadline = time.monotonic() + timeout
+        top = [f for f, slot in futures.items() if slot < min_answers]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info("⏱️ Cómputo: tiempo agotado, se cancelan %s dataset(s)", len(pending))
+                break
+            if all(f.done() for f in top):
+                if pending:
+                    logger.debug("Cómputo: los %s mejores datasets han respondido, se cancelan %s",
+                                 len(top), len(pending))
+                break
+        if pending:
+            _cancel(futures, board)
+            wait(pending, timeout=CANCEL_GRACE)
+
+        # Se combinan los resultados de la memoria compartida con las filas devueltas
+        aggregates: Dict[str, Any] = {}
+        for future, slot in sorted(futures.items(), key=lambda item: item[1]):
+            plan = plans[slot]
+            partial = PartialAggregate(plan.dataset_id)
+            if future.cancelled() or not future.done():
+                board.read(slot, partial, plan.value_columns)
+                partial.cancelled = True
+            elif future.exception() is not None:
+                logger.warning("Could not compute %s: %s", plan.dataset_id, future.exception())
+                aggregates[plan.dataset_id] = {"status": "error", "error": str(future.exception())}
+                continue
+            else:
+                rows, unapplied, cancelled = future.result()
+                board.read(slot, partial, plan.value_columns)
+                partial.rows, partial.unapplied, partial.cancelled = rows, unapplied, cancelled
+            aggregates[plan.dataset_id] = partial.result(plan)
+    finally:
+        board.close()
+    return aggregates, plans_to_sql(plans)
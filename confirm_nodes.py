@@ -1,35 +1,53 @@
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+import logging
+from typing import Dict, Any, List, Optional, Tuple
 from langgraph.types import interrupt, Command
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_ollama import ChatOllama
 from langgraph.runtime import Runtime
 
+from confirmation_classifier import classify_confirmation, AFFIRMATIVE
+from structured_output import (
+    stream_json, astream_json, validate_intent, merge_intent_delta, INTENT_SCHEMA, INTENT_DELTA_SCHEMA,
+)
+from context_window import fit_messages, INTENT_TOKEN_BUDGET
+from filter_normalizer import local_ambiguity, normalize_intent, raw_filters
+from speculative import current_thread_id
+from streaming import STREAM_CONFIG, stream_user_text
+
+logger = logging.getLogger(__name__)
+
 # NOTA: Usamos Any para runtime/state para evitar importaciones circulares con app.py
 # Si tienes un archivo shared.py o types.py, impórtalos desde ahí.
 
 # ==========================================
 # 1. FUNCIONES AUXILIARES (HELPERS)
 # ==========================================
+# Cada helper con LLM tiene versión síncrona (llm.invoke) y asíncrona (llm.ainvoke, prefijo "a").
+# Los prompts y el tratamiento de las respuestas se comparten entre ambas.
 
-def extract_intent_components(messages: list, llm: ChatOllama, search_boundaries: list = None) -> Dict[str, Any]:
-    """Extrae componentes atómicos del intent del usuario."""
+def _conversation_since_boundary(messages: list, search_boundaries: list = None) -> Optional[str]:
+    """Historial en texto desde el último boundary (None si no hay mensajes del usuario)."""
     # Filtrar mensajes desde el último boundary
     if search_boundaries:
         last_boundary = search_boundaries[-1] if search_boundaries else 0
         messages = messages[last_boundary:]
-        print(f"📍 Analizando mensajes desde índice {last_boundary} ({len(messages)} mensajes)")
+        logger.debug("📍 Analizando mensajes desde índice %s (%s mensajes)", last_boundary, len(messages))
     
     user_messages = [m for m in messages if isinstance(m, HumanMessage)]
     if not user_messages:
         return None
     
-    conversation_history = "\n".join([
+    # Dentro del presupuesto: la petición inicial + los mensajes más recientes
+    messages = fit_messages(messages, INTENT_TOKEN_BUDGET, keep_first=True)
+    return "\n".join([
         f"Usuario: {m.content}" if isinstance(m, HumanMessage) else f"Asistente: {m.content[:100]}"
         for m in messages
     ])
-    
-    prompt = f"""Analiza la solicitud del usuario y divide su intención en componentes estructurados.
+
+def _intent_prompt(conversation_history: str) -> str:
+    return f"""Analiza la solicitud del usuario y divide su intención en componentes estructurados.
 
 MENSAJES:
 {conversation_history}
@@ -53,40 +71,134 @@ Formato requerido con EJEMPLO DE RESPUESTA:
   "required_columns": ["edad", "fecha", "empleo"],
   "aggregation_type": "statistics"
 }}"""
+
+def _checked_intent(parsed: Any) -> Dict[str, Any]:
+    """Valida el intent parseado o devuelve un intent básico por defecto."""
+    intent = validate_intent(parsed)
+    if intent is not None:
+        logger.debug("✅ JSON parseado correctamente")
+        return intent
+    logger.warning("❌ Error parseando JSON: la respuesta no contiene un intent válido")
+    # Retornar un intent básico por defecto
+    return {
+        "topic": "consulta general",
+        "temporal_filters": [],
+        "demographic_filters": [],
+        "spatial_filters": [],
+        "required_columns": [],
+        "aggregation_type": "statistics"
+    }
+
+def extract_intent_components(messages: list, llm: ChatOllama, search_boundaries: list = None) -> Dict[str, Any]:
+    """Extrae componentes atómicos del intent del usuario."""
+    conversation_history = _conversation_since_boundary(messages, search_boundaries)
+    if conversation_history is None:
+        return None
     
     try:
-        response = llm.invoke(prompt).content.strip()
-        print(f"🔍 Respuesta raw del LLM:\n{response[:200]}...")
-        
-        # Limpiar markdown
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-        
-        # Intentar parsear JSON
-        parsed = json.loads(response)
-        print(f"✅ JSON parseado correctamente")
-        return parsed
-        
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parseando JSON: {e}")
-        print(f"Respuesta problemática: {response[:300]}")
-        # Retornar un intent básico por defecto
-        return {
-            "topic": "consulta general",
-            "temporal_filters": [],
-            "demographic_filters": [],
-            "spatial_filters": [],
-            "required_columns": [],
-            "aggregation_type": "statistics"
-        }
+        # JSON restringido al esquema del intent; la generación se corta al cerrar el objeto
+        return _checked_intent(stream_json(llm, _intent_prompt(conversation_history), INTENT_SCHEMA))
     except Exception as e:
-        print(f"❌ Error inesperado extrayendo componentes: {e}")
+        logger.warning("❌ Error inesperado extrayendo componentes: %s", e)
         return None
 
-def detect_ambiguities(intent: Dict[str, Any], llm: ChatOllama, clarification_attempts: int = 0) -> Optional[str]:
-    """Detecta ambigüedades o información faltante crítica."""
+async def aextract_intent_components(messages: list, llm: ChatOllama, search_boundaries: list = None) -> Dict[str, Any]:
+    """Versión asíncrona de extract_intent_components."""
+    conversation_history = _conversation_since_boundary(messages, search_boundaries)
+    if conversation_history is None:
+        return None
+    
+    try:
+        return _checked_intent(await astream_json(llm, _intent_prompt(conversation_history), INTENT_SCHEMA))
+    except Exception as e:
+        logger.warning("❌ Error inesperado extrayendo componentes: %s", e)
+        return None
+
+def _latest_exchange(messages: list) -> Optional[str]:
+    """Última pregunta del asistente y las respuestas del usuario que le siguen (None si no hay respuesta nueva)."""
+    start = len(messages)
+    while start > 0 and isinstance(messages[start - 1], HumanMessage):
+        start -= 1
+    if start == len(messages):
+        return None
+    
+    lines = [f"Usuario: {m.content}" for m in messages[start:]]
+    if start > 0 and isinstance(messages[start - 1], AIMessage):
+        lines.insert(0, f"Asistente: {messages[start - 1].content[:300]}")
+    return "\n".join(lines)
+
+def _intent_update_prompt(intent: Dict[str, Any], exchange: str, clarification_attempts: int) -> str:
+    return f"""Actualiza la intención de búsqueda del usuario con su nueva respuesta.
+
+INTENT ACTUAL:
+{json.dumps(raw_filters(intent), ensure_ascii=False)}
+
+NUEVA RESPUESTA:
+{exchange}
+
+Rondas de aclaración ya hechas: {clarification_attempts}
+
+Devuelve SOLO los campos que la nueva respuesta cambia o completa (omite los demás):
+- topic: Tema principal
+- temporal_filters / demographic_filters / spatial_filters: Filtros EN LENGUAJE NATURAL (la lista sustituye a la actual; [] si el usuario lo quita)
+- required_columns: Columnas nuevas mencionadas ([] si el usuario las quita; si cambia el topic, las del nuevo topic)
+- aggregation_type: Tipo de agregación
+
+IMPORTANTE: Responde ÚNICAMENTE con un objeto JSON válido, sin explicaciones ni texto adicional.
+
+EJEMPLO: si el usuario responde "de los últimos 5 años, en España":
+{{
+  "temporal_filters": ["últimos 5 años"],
+  "spatial_filters": ["en España"]
+}}"""
+
+def _updated_intent(intent: Dict[str, Any], delta: Any) -> Optional[Dict[str, Any]]:
+    merged = merge_intent_delta(intent, delta)
+    if merged is None:
+        logger.warning("❌ Actualización del intent no válida. Re-extrayendo desde el historial.")
+    else:
+        logger.info("✅ Intent actualizado con la nueva respuesta")
+    return merged
+
+def update_intent_components(intent: Dict[str, Any], messages: list, llm: ChatOllama,
+                             clarification_attempts: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Modo incremental: envía solo el intent actual y la nueva respuesta del usuario, y
+    aplica los cambios devueltos (el coste no crece con las rondas de aclaración).
+    
+    Returns:
+        Intent actualizado o None si no hay respuesta nueva o la actualización no es válida
+        (se extrae entonces desde el historial)
+    """
+    exchange = _latest_exchange(messages)
+    if exchange is None:
+        return None
+    
+    try:
+        delta = stream_json(llm, _intent_update_prompt(intent, exchange, clarification_attempts), INTENT_DELTA_SCHEMA)
+    except Exception as e:
+        logger.warning("❌ Error inesperado actualizando el intent: %s", e)
+        return None
+    return _updated_intent(intent, delta)
+
+async def aupdate_intent_components(intent: Dict[str, Any], messages: list, llm: ChatOllama,
+                                    clarification_attempts: int = 0) -> Optional[Dict[str, Any]]:
+    """Versión asíncrona de update_intent_components."""
+    exchange = _latest_exchange(messages)
+    if exchange is None:
+        return None
+    
+    try:
+        delta = await astream_json(llm, _intent_update_prompt(intent, exchange, clarification_attempts),
+                                   INTENT_DELTA_SCHEMA)
+    except Exception as e:
+        logger.warning("❌ Error inesperado actualizando el intent: %s", e)
+        return None
+    return _updated_intent(intent, delta)
+
+def _ambiguity_prompt(intent: Dict[str, Any], clarification_attempts: int = 0) -> Optional[str]:
+    """Prompt de detección de ambigüedades (None si ya no hay que preguntar más)."""
+    intent = raw_filters(intent)
     
     # 1. ANÁLISIS DETERMINISTA: Separar filtros vacíos de llenos
     empty_filters = []
@@ -106,7 +218,7 @@ def detect_ambiguities(intent: Dict[str, Any], llm: ChatOllama, clarification_at
     
     # 3. LÍMITE: Después de 2 intentos, aceptar lo que hay
     if clarification_attempts >= 2:
-        print(f"⚠️ Límite alcanzado (intento #{clarification_attempts}). Aceptando búsqueda.")
+        logger.info("⚠️ Límite alcanzado (intento #%s). Aceptando búsqueda.", clarification_attempts)
         return None
     
     # 4. LÓGICA ADAPTATIVA
@@ -126,7 +238,7 @@ def detect_ambiguities(intent: Dict[str, Any], llm: ChatOllama, clarification_at
         check_vague = True
         mode = "INSISTIR"
     
-    print(f"🔍 Modo: {mode} (intento #{clarification_attempts}, {num_filled}/3 filtros)")
+    logger.debug("🔍 Modo: %s (intento #%s, %s/3 filtros)", mode, clarification_attempts, num_filled)
     
     # 5. CONSTRUCCIÓN MODULAR DEL PROMPT
     prompt_base = f"""Analiza esta búsqueda:
@@ -136,7 +248,7 @@ FILTROS VACÍOS: {', '.join(empty_filters) if empty_filters else 'Ninguno'}
 FILTROS CON VALORES: {json.dumps(filled_filters, indent=2, ensure_ascii=False) if filled_filters else 'Ninguno'}
 
 """
-    
+
     instructions = []
     
     if check_vague and filled_filters:
@@ -146,13 +258,13 @@ FILTROS CON VALORES: {json.dumps(filled_filters, indent=2, ensure_ascii=False) i
 
 IMPORTANTE: Un año específico como "2025" o "2024" es CLARO, no es vago.
 Solo pregunta si encuentras términos VAGOS.""")
-    
+
     if ask_for_empty and empty_filters:
         instructions.append("""HAZ PREGUNTAS para llenar filtros vacíos:
 - Los 3 filtros son igual de importantes
 - Pregunta de forma natural por lo que falta
 - Puedes preguntar por varios a la vez""")
-    
+
     # Criterio de salida
     if num_filled >= 2:
         instructions.append("""
@@ -162,85 +274,369 @@ CRITERIO DE SALIDA:
     else:
         instructions.append("\nSi ya hay 2/3 filtros claros, responde: NO_AMBIGUITIES")
     
-    prompt = prompt_base + "\n".join(instructions) + """
+    return prompt_base + "\n".join(instructions) + """
 
 Genera preguntas amigables y naturales que cubran TODO lo necesario.
 Si TODO está suficientemente claro, responde exactamente "NO_AMBIGUITIES"."""
-    
+
+def _parse_ambiguity(response: str) -> Optional[str]:
+    response = response.strip()
+    if "NO_AMBIGUITIES" in response.upper():
+        return None
+    # Extraer solo la pregunta (eliminar prefijos como "Pregunta:")
+    lines = response.split('\n')
+    for line in lines:
+        if '?' in line:
+            return line.strip()
+    return response.strip()
+
+def _local_ambiguity(intent: Dict[str, Any], clarification_attempts: int) -> Tuple[bool, Optional[str]]:
+    decided, question = local_ambiguity(intent, clarification_attempts)
+    if decided:
+        logger.info("⚡ Ambigüedades resueltas sin LLM: %s", question or "NO_AMBIGUITIES")
+    return decided, question
+
+def detect_ambiguities(intent: Dict[str, Any], llm: ChatOllama, clarification_attempts: int = 0) -> Optional[str]:
+    """
+    Detecta ambigüedades o información faltante crítica.
+    Primero con el normalizador de filtros; el LLM solo si hay valores que no reconoce.
+    """
+    decided, question = _local_ambiguity(intent, clarification_attempts)
+    if decided:
+        return question
+    prompt = _ambiguity_prompt(intent, clarification_attempts)
+    if prompt is None:
+        return None
+    try:
+        return _parse_ambiguity(llm.invoke(prompt).content)
+    except Exception as e:
+        logger.warning("Error en detect_ambiguities: %s", e)
+        return None
+
+async def adetect_ambiguities(intent: Dict[str, Any], llm: ChatOllama, clarification_attempts: int = 0) -> Optional[str]:
+    """Versión asíncrona de detect_ambiguities."""
+    decided, question = _local_ambiguity(intent, clarification_attempts)
+    if decided:
+        return question
+    prompt = _ambiguity_prompt(intent, clarification_attempts)
+    if prompt is None:
+        return None
     try:
-        response = llm.invoke(prompt).content.strip()
-        if "NO_AMBIGUITIES" in response.upper():
-            return None
-        # Extraer solo la pregunta (eliminar prefijos como "Pregunta:")
-        lines = response.split('\n')
-        for line in lines:
-            if '?' in line:
-                return line.strip()
-        return response.strip()
+        return _parse_ambiguity((await llm.ainvoke(prompt)).content)
     except Exception as e:
-        print(f"Error en detect_ambiguities: {e}")
+        logger.warning("Error en detect_ambiguities: %s", e)
         return None
 
-def build_confirmation_message(intent: Dict[str, Any], llm: ChatOllama) -> str:
-    """Construye mensaje de confirmación en primera persona."""
-    prompt = f"""Genera un mensaje de confirmación EN PRIMERA PERSONA recopilando todos los filtros y el topic de este intent:
-{json.dumps(intent, indent=2, ensure_ascii=False)}
+def _confirmation_prompt(intent: Dict[str, Any]) -> str:
+    return f"""Genera un mensaje de confirmación EN PRIMERA PERSONA recopilando todos los filtros y el topic de este intent:
+{json.dumps(raw_filters(intent), indent=2, ensure_ascii=False)}
 
 Ejemplo: "En resumen, busco datos de empleo en España..."
 Termina preguntando si es correcto."""
+
+def _default_confirmation(intent: Dict[str, Any]) -> str:
+    return f"En resumen, busco datos de {intent.get('topic', 'tu consulta')}. ¿Es correcto?"
+
+def build_confirmation_message(intent: Dict[str, Any], llm: ChatOllama, stream: bool = True) -> str:
+    """
+    Construye mensaje de confirmación en primera persona.
+    Con stream=True sus tokens se emiten al usuario (stream_mode "messages") según se generan.
+    """
+    try:
+        return llm.invoke(_confirmation_prompt(intent), config=STREAM_CONFIG if stream else None).content.strip()
+    except Exception:
+        return _default_confirmation(intent)
+
+async def abuild_confirmation_message(intent: Dict[str, Any], llm: ChatOllama, stream: bool = True) -> str:
+    """Versión asíncrona de build_confirmation_message."""
     try:
-        return llm.invoke(prompt).content.strip()
+        return (await llm.ainvoke(_confirmation_prompt(intent), config=STREAM_CONFIG if stream else None)).content.strip()
     except Exception:
-        return f"En resumen, busco datos de {intent.get('topic', 'tu consulta')}. ¿Es correcto?"
+        return _default_confirmation(intent)
+
+# Esquema de la respuesta del análisis combinado (Ollama lo usa como restricción de formato)
+COMBINED_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": INTENT_SCHEMA,
+        "clarification": {"type": ["string", "null"]},
+        "confirmation": {"type": "string"},
+    },
+    "required": ["intent", "clarification", "confirmation"],
+}
+
+# Esquema del análisis combinado incremental (el intent llega como actualización parcial)
+COMBINED_UPDATE_SCHEMA = {
+    **COMBINED_ANALYSIS_SCHEMA,
+    "properties": {**COMBINED_ANALYSIS_SCHEMA["properties"], "intent": INTENT_DELTA_SCHEMA},
+}
+
+def _ambiguity_rules(clarification_attempts: int) -> str:
+    # Misma lógica adaptativa que detect_ambiguities, expresada como instrucciones
+    if clarification_attempts >= 2:
+        ambiguity_rules = "Ya se ha preguntado 2 veces: clarification debe ser null."
+    elif clarification_attempts == 0:
+        ambiguity_rules = """Pregunta por los filtros vacíos (los 3 son igual de importantes) y por valores VAGOS.
+Si ya hay 2/3 filtros con valores CLAROS, clarification debe ser null."""
+    else:
+        ambiguity_rules = """Si hay 2/3 filtros con valores: pregunta SOLO si algún valor es VAGO.
+Si hay menos: pregunta de forma natural por lo que falta.
+Si ya hay 2/3 filtros con valores CLAROS, clarification debe ser null."""
+    return ambiguity_rules
+
+def _combined_prompt(conversation_history: str, clarification_attempts: int = 0) -> str:
+    ambiguity_rules = _ambiguity_rules(clarification_attempts)
+
+    return f"""Analiza la solicitud del usuario.
+
+MENSAJES:
+{conversation_history}
+
+1. intent: divide su intención en componentes estructurados
+   - topic: Tema principal
+   - temporal_filters: Filtros temporales EN LENGUAJE NATURAL
+   - demographic_filters: Filtros demográficos EN LENGUAJE NATURAL
+   - spatial_filters: Filtros geográficos EN LENGUAJE NATURAL
+   - required_columns: Columnas mencionadas
+   - aggregation_type: Tipo de agregación
+
+2. clarification: UNA pregunta amigable para el usuario, o null si todo está claro.
+- VAGOS: "últimos años", "reciente", "actual", "cerca", "personas mayores", "últimamente"
+- CLAROS: "España", "2025", "2020-2024", "últimos 5 años", "mayores de 65 años"
+Un año específico como "2025" o "2024" es CLARO, no es vago.
+{ambiguity_rules}
+
+3. confirmation: mensaje EN PRIMERA PERSONA que recopile el topic y todos los filtros
+   y termine preguntando si es correcto. Ejemplo: "En resumen, busco datos de empleo en España... ¿Es correcto?"
+
+IMPORTANTE: Responde ÚNICAMENTE con un objeto JSON válido, sin explicaciones ni texto adicional.
+
+Formato requerido con EJEMPLO DE RESPUESTA:
+{{
+  "intent": {{
+    "topic": "empleo",
+    "temporal_filters": ["últimos 5 años"],
+    "demographic_filters": ["mayores de 50 años"],
+    "spatial_filters": ["en España"],
+    "required_columns": ["edad", "fecha", "empleo"],
+    "aggregation_type": "statistics"
+  }},
+  "clarification": null,
+  "confirmation": "En resumen, busco datos de empleo en España de los últimos 5 años para mayores de 50 años. ¿Es correcto?"
+}}"""
+
+def _combined_update_prompt(intent: Dict[str, Any], exchange: str, clarification_attempts: int) -> str:
+    return f"""Actualiza la solicitud del usuario con su nueva respuesta.
+
+INTENT ACTUAL:
+{json.dumps(raw_filters(intent), ensure_ascii=False)}
+
+NUEVA RESPUESTA:
+{exchange}
+
+Rondas de aclaración ya hechas: {clarification_attempts}
+
+1. intent: SOLO los campos que la nueva respuesta cambia o completa (omite los demás)
+   - topic: Tema principal
+   - temporal_filters / demographic_filters / spatial_filters: Filtros EN LENGUAJE NATURAL (la lista sustituye a la actual; [] si el usuario lo quita)
+   - required_columns: Columnas nuevas mencionadas ([] si el usuario las quita; si cambia el topic, las del nuevo topic)
+   - aggregation_type: Tipo de agregación
+
+2. clarification: UNA pregunta amigable sobre el intent ya actualizado, o null si todo está claro.
+- VAGOS: "últimos años", "reciente", "actual", "cerca", "personas mayores", "últimamente"
+- CLAROS: "España", "2025", "2020-2024", "últimos 5 años", "mayores de 65 años"
+Un año específico como "2025" o "2024" es CLARO, no es vago.
+{_ambiguity_rules(clarification_attempts)}
+
+3. confirmation: mensaje EN PRIMERA PERSONA que recopile el topic y todos los filtros del intent ya actualizado
+   y termine preguntando si es correcto. Ejemplo: "En resumen, busco datos de empleo en España... ¿Es correcto?"
+
+IMPORTANTE: Responde ÚNICAMENTE con un objeto JSON válido, sin explicaciones ni texto adicional.
+
+Formato requerido con EJEMPLO DE RESPUESTA (el usuario responde "de los últimos 5 años"):
+{{
+  "intent": {{
+    "temporal_filters": ["últimos 5 años"]
+  }},
+  "clarification": null,
+  "confirmation": "En resumen, busco datos de empleo en España de los últimos 5 años para mayores de 50 años. ¿Es correcto?"
+}}"""
+
+def _combined_decision(fields: Dict[str, Any], clarification_attempts: int = 0,
+                       current_intent: Optional[Dict[str, Any]] = None) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+    """(intent, pregunta de aclaración o None) a partir de los campos intent y clarification."""
+    raw_intent = fields.get("intent")
+    if current_intent is not None:
+        intent = merge_intent_delta(current_intent, raw_intent)
+    else:
+        intent = validate_intent(raw_intent)
+    if intent is None:
+        return None
+    
+    clarification = fields.get("clarification")
+    if not isinstance(clarification, str) or not clarification.strip() \
+            or "NO_AMBIGUITIES" in clarification.upper() or clarification_attempts >= 2:
+        clarification = None
+    # El normalizador de filtros tiene la última palabra cuando reconoce todos los valores
+    decided, question = _local_ambiguity(intent, clarification_attempts)
+    if decided:
+        clarification = question
+    return intent, clarification
+
+def _parse_combined(parsed: Any, clarification_attempts: int = 0,
+                    current_intent: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    decision = _combined_decision(parsed, clarification_attempts, current_intent) if isinstance(parsed, dict) else None
+    confirmation = parsed.get("confirmation") if isinstance(parsed, dict) else None
+    if decision is None or not isinstance(confirmation, str):
+        logger.warning("❌ Análisis combinado no válido. Usando análisis en 3 pasos.")
+        return None
+    intent, clarification = decision
+    logger.info("✅ Análisis combinado en una llamada")
+    return {"intent": intent, "clarification": clarification, "confirmation": confirmation.strip()}
+
+def _confirmation_streamer(clarification_attempts: int, current_intent: Optional[Dict[str, Any]]):
+    """
+    Callback de stream_json que emite al usuario el campo confirmation según se genera.
+    Solo se emite si intent y clarification ya se han cerrado y el análisis va a terminar
+    en confirmación (sin pregunta de aclaración); si no, el texto se descarta como antes.
+    """
+    show: List[bool] = []
+
+    def on_text(text: str, fields: Dict[str, Any]):
+        if not show:
+            decision = None
+            if "intent" in fields and "clarification" in fields:
+                decision = _combined_decision(fields, clarification_attempts, current_intent)
+            show.append(decision is not None and decision[1] is None)
+        if show[0]:
+            stream_user_text(text)
+    return on_text
+
+def _combined_request(messages: list, search_boundaries: list, clarification_attempts: int,
+                      current_intent: Optional[Dict[str, Any]]) -> Optional[Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]]:
+    """(prompt, esquema, intent de partida) del análisis combinado: incremental si hay intent y respuesta nueva."""
+    if current_intent is not None:
+        exchange = _latest_exchange(messages)
+        if exchange is not None:
+            logger.debug("📍 Análisis incremental: intent actual + nueva respuesta")
+            return (_combined_update_prompt(current_intent, exchange, clarification_attempts),
+                    COMBINED_UPDATE_SCHEMA, current_intent)
+    
+    conversation_history = _conversation_since_boundary(messages, search_boundaries)
+    if conversation_history is None:
+        return None
+    return _combined_prompt(conversation_history, clarification_attempts), COMBINED_ANALYSIS_SCHEMA, None
+
+def analyze_intent_combined(messages: list, llm: ChatOllama, search_boundaries: list = None,
+                            clarification_attempts: int = 0,
+                            current_intent: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Extrae el intent, detecta ambigüedades y redacta la confirmación en UNA sola llamada al LLM
+    (en lugar de extract_intent_components + detect_ambiguities + build_confirmation_message).
+    
+    Con current_intent (modo incremental) solo se envían el intent actual y la nueva respuesta
+    del usuario, y el intent devuelto se aplica como actualización parcial.
+    
+    El campo confirmation se emite al usuario según se genera (stream "custom") cuando el
+    análisis va a terminar en confirmación.
+    
+    Returns:
+        {"intent": {...}, "clarification": str | None, "confirmation": str}
+        o None si la respuesta no es válida (se usa entonces el camino de 3 llamadas)
+    """
+    request = _combined_request(messages, search_boundaries, clarification_attempts, current_intent)
+    if request is None:
+        return None
+    prompt, schema, base_intent = request
+    
+    try:
+        parsed = stream_json(llm, prompt, schema, "confirmation",
+                             _confirmation_streamer(clarification_attempts, base_intent))
+    except Exception as e:
+        logger.warning("❌ Análisis combinado no válido (%s). Usando análisis en 3 pasos.", e)
+        return None
+    return _parse_combined(parsed, clarification_attempts, base_intent)
+
+async def aanalyze_intent_combined(messages: list, llm: ChatOllama, search_boundaries: list = None,
+                                   clarification_attempts: int = 0,
+                                   current_intent: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Versión asíncrona de analyze_intent_combined."""
+    request = _combined_request(messages, search_boundaries, clarification_attempts, current_intent)
+    if request is None:
+        return None
+    prompt, schema, base_intent = request
+    
+    try:
+        parsed = await astream_json(llm, prompt, schema, "confirmation",
+                                    _confirmation_streamer(clarification_attempts, base_intent))
+    except Exception as e:
+        logger.warning("❌ Análisis combinado no válido (%s). Usando análisis en 3 pasos.", e)
+        return None
+    return _parse_combined(parsed, clarification_attempts, base_intent)
+
+def _confirmation_check_prompt(user_response: str) -> str:
+    return f"""Analiza la respuesta del usuario a una pregunta de confirmación.
+    
+    Respuesta del usuario: "{user_response}"
+    
+    CRITERIOS:
+    - AFIRMATIVA: Solo si acepta explícitamente (sí, claro, vale, ok, correcto).
+    - NEGATIVA: Si dice "no", si pide cambios, si añade información nueva, o si dice algo diferente a confirmar.
+    
+    Responde SOLO una palabra: "AFIRMATIVA" o "NEGATIVA"."""
 
 # ==========================================
 # 2. NODOS DEL PROCESO DE CONFIRMACIÓN
 # ==========================================
+# Los nodos con LLM tienen versión asíncrona (prefijo "anode_") para build_graph(async_mode=True).
 
-def node_analyze_intent(state: Dict, runtime: Runtime) -> Command:
-    """
-    NODO 1: LÓGICA PURA. Analiza y decide el siguiente paso.
-    NO contiene interrupt(), por lo que si se re-ejecuta es seguro.
-    """
-    print("\n--- Entrando en node_analyze_intent ---")
+def _start_analysis(state: Dict) -> Tuple[int, Optional[Command]]:
+    """Cuenta la iteración y corta el flujo si se alcanza el límite de pasos."""
+    logger.debug("--- Entrando en node_analyze_intent ---")
     iterations = state.get("iterations", 0) + 1
     max_iterations = state.get("max_iterations", 15)
     
     if iterations >= max_iterations:
-        return Command(
+        return iterations, Command(
             update={"messages": [AIMessage(content="Límite de pasos alcanzado.")], "iterations": iterations},
             goto="dashboard" # O salida de error
         )
+    return iterations, None
 
-    # 1. Extraer componentes
-    print("🔍 Analizando intent...")
-    search_boundaries = state.get("search_boundaries", [])
-    intent_components = extract_intent_components(state["messages"], runtime.context.llm, search_boundaries)
-    
-    if not intent_components:
-         return Command(
-            update={"messages": [AIMessage(content="No entendí tu solicitud. ¿Reformulamos?")], "iterations": iterations},
-            goto="chatbot" # O terminar
-        )
+def _current_intent(state: Dict, runtime: Runtime) -> Optional[Dict[str, Any]]:
+    """Intent de la búsqueda en curso para el modo incremental (None = extraer desde el historial)."""
+    if not getattr(runtime.context, "incremental_analysis", False):
+        return None
+    return state.get("user_search_intent_structured") or None
 
-    # 2. Detectar ambigüedades
-    attempts = state.get("clarification_attempts", 0)
-    clarification = detect_ambiguities(intent_components, runtime.context.llm, attempts)
-    
+def _not_understood(iterations: int) -> Command:
+    # Se olvida el intent: al reformular no debe mezclarse con el anterior
+    return Command(
+        update={
+            "messages": [AIMessage(content="No entendí tu solicitud. ¿Reformulamos?")],
+            "iterations": iterations,
+            "user_search_intent_structured": None,
+        },
+        goto="chatbot" # O terminar
+    )
+
+def _analysis_command(iterations: int, intent_components: Dict[str, Any],
+                      clarification: Optional[str], confirmation_msg: Optional[str]) -> Command:
+    """Pide aclaración si hay ambigüedad; si no, pide confirmación del intent."""
+    # Los filtros reconocidos se guardan ya normalizados (forma que usa compute.plan)
+    intent_components = normalize_intent(intent_components)
     if clarification:
-        print("⚠️ Ambigüedad detectada. Derivando a pregunta.")
+        logger.info("⚠️ Ambigüedad detectada. Derivando a pregunta.")
         return Command(
             update={
                 "messages": [AIMessage(content=clarification)],
+                # Se guarda para que la siguiente pasada solo procese la respuesta (modo incremental)
+                "user_search_intent_structured": intent_components,
                 "iterations": iterations
             },
             goto="ask_clarification"  # Salta al nodo de pregunta
         )
     
-    # 3. Preparar confirmación
-    print("✅ Intent claro. Preparando confirmación.")
-    confirmation_msg = build_confirmation_message(intent_components, runtime.context.llm)
-    
     return Command(
         update={
             "messages": [AIMessage(content=confirmation_msg)],
@@ -250,12 +646,93 @@ def node_analyze_intent(state: Dict, runtime: Runtime) -> Command:
         goto="ask_confirmation"  # Salta al nodo de confirmación
     )
 
+def node_analyze_intent(state: Dict, runtime: Runtime) -> Command:
+    """
+    NODO 1: LÓGICA PURA. Analiza y decide el siguiente paso.
+    NO contiene interrupt(), por lo que si se re-ejecuta es seguro.
+    """
+    iterations, stop = _start_analysis(state)
+    if stop:
+        return stop
+    
+    search_boundaries = state.get("search_boundaries", [])
+    attempts = state.get("clarification_attempts", 0)
+    current_intent = _current_intent(state, runtime)
+    
+    # Modo combinado: intent + ambigüedades + confirmación en una sola llamada
+    if getattr(runtime.context, "combined_analysis", False):
+        logger.debug("🔍 Analizando intent (llamada única)...")
+        analysis = analyze_intent_combined(state["messages"], runtime.context.llm, search_boundaries, attempts,
+                                           current_intent)
+        if analysis:
+            return _analysis_command(iterations, analysis["intent"], analysis["clarification"], analysis["confirmation"])
+    
+    # 1. Extraer componentes (o actualizar el intent actual solo con la nueva respuesta)
+    logger.debug("🔍 Analizando intent...")
+    intent_components = None
+    if current_intent:
+        intent_components = update_intent_components(current_intent, state["messages"], runtime.context.llm, attempts)
+    if not intent_components:
+        intent_components = extract_intent_components(state["messages"], runtime.context.llm, search_boundaries)
+    if not intent_components:
+        return _not_understood(iterations)
+    
+    # 2. Detectar ambigüedades
+    clarification = detect_ambiguities(intent_components, runtime.context.llm, attempts)
+    if clarification:
+        return _analysis_command(iterations, intent_components, clarification, None)
+    
+    # 3. Preparar confirmación
+    logger.info("✅ Intent claro. Preparando confirmación.")
+    confirmation_msg = build_confirmation_message(intent_components, runtime.context.llm)
+    return _analysis_command(iterations, intent_components, None, confirmation_msg)
+
+async def anode_analyze_intent(state: Dict, runtime: Runtime) -> Command:
+    """
+    Versión asíncrona de node_analyze_intent.
+    En el camino de 3 pasos, la detección de ambigüedades y el mensaje de confirmación se
+    generan a la vez (asyncio.gather); la confirmación se descarta si hay que preguntar.
+    """
+    iterations, stop = _start_analysis(state)
+    if stop:
+        return stop
+    
+    search_boundaries = state.get("search_boundaries", [])
+    attempts = state.get("clarification_attempts", 0)
+    current_intent = _current_intent(state, runtime)
+    
+    if getattr(runtime.context, "combined_analysis", False):
+        logger.debug("🔍 Analizando intent (llamada única)...")
+        analysis = await aanalyze_intent_combined(state["messages"], runtime.context.llm, search_boundaries, attempts,
+                                                  current_intent)
+        if analysis:
+            return _analysis_command(iterations, analysis["intent"], analysis["clarification"], analysis["confirmation"])
+    
+    logger.debug("🔍 Analizando intent...")
+    intent_components = None
+    if current_intent:
+        intent_components = await aupdate_intent_components(current_intent, state["messages"], runtime.context.llm,
+                                                            attempts)
+    if not intent_components:
+        intent_components = await aextract_intent_components(state["messages"], runtime.context.llm, search_boundaries)
+    if not intent_components:
+        return _not_understood(iterations)
+    
+    clarification, confirmation_msg = await asyncio.gather(
+        adetect_ambiguities(intent_components, runtime.context.llm, attempts),
+        # Sin streaming: se genera a la vez que la detección de ambigüedades y puede descartarse
+        abuild_confirmation_message(intent_components, runtime.context.llm, stream=False),
+    )
+    if not clarification:
+        logger.info("✅ Intent claro. Preparando confirmación.")
+    return _analysis_command(iterations, intent_components, clarification, confirmation_msg)
+
 def node_ask_clarification(state: Dict) -> Command:
     """
     NODO 2: PREGUNTA (Ambigüedad).
     Tiene el interrupt al inicio. Al reanudar, no repite lógica pesada.
     """
-    print("\n--- Entrando en node_ask_clarification ---")
+    logger.debug("--- Entrando en node_ask_clarification ---")
     
     # Recuperar la última pregunta (generada por node_analyze_intent)
     last_msg = state["messages"][-1]
@@ -263,7 +740,7 @@ def node_ask_clarification(state: Dict) -> Command:
     # --- PAUSA ---
     user_response = interrupt(last_msg)
     
-    print(f"✅ Respuesta recibida: {user_response}")
+    logger.debug("✅ Respuesta recibida: %s", user_response)
     
     # Incrementar contador de intentos
     new_attempts = state.get("clarification_attempts", 0) + 1
@@ -277,49 +754,81 @@ def node_ask_clarification(state: Dict) -> Command:
         goto="analyze_intent"
     )
 
+def _confirmation_command(state: Dict, user_response: str, decision: str) -> Command:
+    """Avanza a la búsqueda si la respuesta es afirmativa; si no, vuelve a analizar."""
+    if AFFIRMATIVE in decision:
+        logger.info("🚀 Confirmado. Pasando a búsqueda.")
+        intent_struct = state.get("user_search_intent_structured", {})
+        topic = intent_struct.get("topic", "consulta")
+    
+        return Command(
+            update={
+                "messages": [HumanMessage(content=user_response)],
+                "user_search_intent": f"Datos de {topic} con filtros confirmados"
+            },
+            goto="search"  # AVANZA al siguiente paso lógico del grafo
+        )
+    else:
+        logger.info("🔄 Corrección detectada. Volviendo a analizar.")
+        return Command(
+            update={
+                "messages": [HumanMessage(content=user_response)]
+            },
+            goto="analyze_intent"  # RETROCEDE para re-analizar
+        )
+
+def _speculate(state: Dict, runtime: Runtime):
+    """Lanza la búsqueda en el catálogo mientras el usuario lee la confirmación (ver speculative.py)."""
+    speculative = getattr(runtime.context, "speculative_search", None)
+    if speculative is not None:
+        speculative.start(current_thread_id(), state.get("user_search_intent_structured"))
+
+def _discard_speculation(runtime: Runtime, decision: str):
+    # Si no confirma, el intent va a cambiar: la búsqueda especulativa ya no sirve
+    speculative = getattr(runtime.context, "speculative_search", None)
+    if speculative is not None and AFFIRMATIVE not in decision:
+        speculative.discard(current_thread_id())
+
 def node_ask_confirmation(state: Dict, runtime: Runtime) -> Command:
     """
     NODO 3: PREGUNTA (Confirmación).
     Tiene el interrupt al inicio.
     """
-    print("\n--- Entrando en node_ask_confirmation ---")
+    logger.debug("--- Entrando en node_ask_confirmation ---")
     
     last_msg = state["messages"][-1]
+    _speculate(state, runtime)
     
     # --- PAUSA ---
     user_response = interrupt(last_msg)
     
-    # Analizar respuesta (Si/No) - Esto es rápido y barato
-    check_prompt = f"""Analiza la respuesta del usuario a una pregunta de confirmación.
-    
-    Respuesta del usuario: "{user_response}"
+    # Analizar respuesta (Si/No) - Primero el clasificador local, el LLM solo si duda
+    decision, confidence = classify_confirmation(user_response)
+    if decision:
+        logger.info("⚡ Decisión local sobre la confirmación: %s (%.2f)", decision, confidence)
+    else:
+        decision = runtime.context.llm.invoke(_confirmation_check_prompt(user_response)).content.strip().upper()
+        logger.info("🤔 Decisión del LLM sobre la confirmación: %s", decision)
     
-    CRITERIOS:
-    - AFIRMATIVA: Solo si acepta explícitamente (sí, claro, vale, ok, correcto).
-    - NEGATIVA: Si dice "no", si pide cambios, si añade información nueva, o si dice algo diferente a confirmar.
+    _discard_speculation(runtime, decision)
+    return _confirmation_command(state, user_response, decision)
+
+async def anode_ask_confirmation(state: Dict, runtime: Runtime) -> Command:
+    """Versión asíncrona de node_ask_confirmation."""
+    logger.debug("--- Entrando en node_ask_confirmation ---")
     
-    Responde SOLO una palabra: "AFIRMATIVA" o "NEGATIVA"."""
+    last_msg = state["messages"][-1]
+    _speculate(state, runtime)
     
-    decision = runtime.context.llm.invoke(check_prompt).content.strip().upper()
-    print(f"🤔 Decisión del LLM sobre la confirmación: {decision}")
+    # --- PAUSA ---
+    user_response = interrupt(last_msg)
     
-    if "AFIRMATIVA" in decision:
-        print("🚀 Confirmado. Pasando a búsqueda.")
-        intent_struct = state.get("user_search_intent_structured", {})
-        topic = intent_struct.get("topic", "consulta")
-        
-        return Command(
-            update={
-                "messages": [HumanMessage(content=user_response)],
-                "user_search_intent": f"Datos de {topic} con filtros confirmados"
-            },
-            goto="search"  # AVANZA al siguiente paso lógico del grafo
-        )
+    decision, confidence = classify_confirmation(user_response)
+    if decision:
+        logger.info("⚡ Decisión local sobre la confirmación: %s (%.2f)", decision, confidence)
     else:
-        print("🔄 Corrección detectada. Volviendo a analizar.")
-        return Command(
-            update={
-                "messages": [HumanMessage(content=user_response)]
-            },
-            goto="analyze_intent"  # RETROCEDE para re-analizar
-        )
\ No newline at end of file
+        decision = (await runtime.context.llm.ainvoke(_confirmation_check_prompt(user_response))).content.strip().upper()
+        logger.info("🤔 Decisión del LLM sobre la confirmación: %s", decision)
+    
+    _discard_speculation(runtime, decision)
+    return _confirmation_command(state, user_response, decision)
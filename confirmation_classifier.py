@@ -0,0 +1,241 @@
+"""
+Clasificador local de respuestas de confirmación (AFIRMATIVA / NEGATIVA).
+
+Sustituye la llamada al LLM de node_ask_confirmation para las respuestas habituales
+("sí", "vale", "ok", "no"...). Combina un léxico de respuestas exactas con un modelo
+Naive Bayes de n-gramas de palabras entrenado offline con respuestas registradas.
+Solo decide respuestas cerradas: si la respuesta trae algo más que un sí/no (lugares,
+años, "pero", "y añade"...) o mezcla negación y afirmación, devuelve None y la decisión
+vuelve al LLM. También devuelve None si la confianza es baja.
+
+Entrenamiento offline (JSONL con {"text": ..., "label": "AFIRMATIVA"|"NEGATIVA"}):
+    python confirmation_classifier.py respuestas.jsonl
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import sys
+
+from fast_router import normalize_text
+
+
+AFFIRMATIVE = "AFIRMATIVA"
+NEGATIVE = "NEGATIVA"
+
+# Modelo entrenado offline (si no existe se entrena con SEED_REPLIES al importar)
+MODEL_PATH = Path(__file__).parent / "models" / "confirmation_ngram.json"
+
+# Confianza mínima para decidir sin LLM
+MIN_CONFIDENCE = 0.9
+
+# Respuestas exactas (tras normalizar) con etiqueta segura
+AFFIRMATIVE_LEXICON = {
+    "si", "s", "sip", "claro", "claro que si", "vale", "ok", "okay", "okey", "correcto",
+    "exacto", "exactamente", "perfecto", "de acuerdo", "adelante", "eso es", "confirmo",
+    "confirmado", "afirmativo", "si por favor", "si gracias", "si correcto", "si es correcto",
+    "si perfecto", "si adelante", "vale perfecto", "ok perfecto", "todo correcto", "yes", "yep",
+    "dale", "venga", "bien", "esta bien", "me parece bien", "si eso es", "asi es",
+}
+NEGATIVE_LEXICON = {
+    "no", "nop", "nope", "no gracias", "incorrecto", "negativo", "no es correcto", "no es eso",
+    "para nada", "no exactamente", "no del todo", "tampoco", "mal", "esta mal", "cancelar",
+    "cancela", "no quiero eso",
+}
+
+# Vocabulario de una respuesta cerrada (tras normalizar): si aparece cualquier otra palabra
+# la respuesta añade o corrige información y la decide el LLM
+AFFIRMATIVE_WORDS = {
+    "si", "s", "sip", "claro", "vale", "ok", "okay", "okey", "correcto", "exacto", "exactamente",
+    "perfecto", "acuerdo", "adelante", "confirmo", "confirmado", "afirmativo", "yes", "yep", "dale",
+    "venga", "bien", "busca", "buscar",
+}
+NEGATIVE_WORDS = {
+    "no", "nop", "nope", "incorrecto", "negativo", "tampoco", "mal", "cancelar", "cancela", "nada",
+}
+NEUTRAL_WORDS = {
+    "por", "favor", "gracias", "señor", "es", "eso", "esta", "asi", "todo", "lo", "que", "me",
+    "parece", "de", "mismo", "la", "los", "datos", "busqueda", "con", "puedes", "quiero", "para",
+}
+
+# Respuestas de ejemplo para el modelo por defecto
+SEED_REPLIES: List[Tuple[str, str]] = [
+    (text, AFFIRMATIVE) for text in [
+        "sí, eso es", "sí, está bien así", "vale, adelante", "ok, busca", "correcto, gracias",
+        "sí, perfecto", "claro, adelante con la búsqueda", "sí, es correcto", "perfecto, eso busco",
+        "exacto, eso es lo que quiero", "sí, confirmo", "de acuerdo, busca", "vale, está bien",
+        "sí, todo bien", "ok, correcto", "así es, adelante", "sí, eso mismo", "sí señor",
+        "venga, sí", "bien, busca eso", "me vale", "está perfecto", "sí, busca los datos",
+        "correcto, puedes buscar", "sí por favor, adelante",
+    ]
+] + [
+    (text, NEGATIVE) for text in [
+        "no, quiero datos de Valencia", "no, mejor del 2023", "no, cambia el año a 2022",
+        "no exactamente, también quiero la edad", "añade los datos de Barcelona",
+        "mejor solo mujeres", "en realidad quiero datos de empleo", "falta el rango de edad",
+        "no, es en Madrid", "pero solo del último año", "quita el filtro de edad",
+        "cambia la ubicación a Sevilla", "no, eso no", "también quiero la columna de sexo",
+        "prefiero datos mensuales", "no es eso, busco contaminación acústica",
+        "sí, pero añade 2021", "vale, pero solo en Andalucía", "ok pero cambia el año",
+        "en lugar de Madrid pon Bilbao", "no, mayores de 65", "incluye también Portugal",
+        "no del todo, falta el periodo", "espera, quiero cambiar el tema", "no, otra cosa",
+    ]
+]
+
+
+def _features(text: str) -> List[str]:
+    """Unigramas y bigramas de palabras (con marcas de inicio y fin)."""
+    words = ["<s>"] + normalize_text(text).split() + ["</s>"]
+    return words[1:-1] + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NgramNaiveBayes:
+    """Naive Bayes multinomial sobre n-gramas de palabras con suavizado de Laplace."""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.class_counts: Counter = Counter()
+        self.feature_counts: Dict[str, Counter] = {AFFIRMATIVE: Counter(), NEGATIVE: Counter()}
+        self._log_priors: Dict[str, float] = {}
+        self._log_denominators: Dict[str, float] = {}
+
+    def _prepare(self):
+        # Priors y denominadores precalculados para que predict() solo sume log-probs
+        vocab_size = len(set(self.feature_counts[AFFIRMATIVE]) | set(self.feature_counts[NEGATIVE]))
+        total_docs = sum(self.class_counts.values())
+        for label, counts in self.feature_counts.items():
+            self._log_priors[label] = math.log((self.class_counts[label] + 1) / (total_docs + len(self.feature_counts)))
+            self._log_denominators[label] = math.log(sum(counts.values()) + self.alpha * (vocab_size + 1))
+
+    def train(self, samples: Iterable[Tuple[str, str]]) -> "NgramNaiveBayes":
+        for text, label in samples:
+            if label not in self.feature_counts:
+                continue
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(_features(text))
+        self._prepare()
+        return self
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Args:
+            text: Respuesta del usuario
+
+        Returns:
+            Tupla (etiqueta más probable, probabilidad a posteriori)
+        """
+        features = _features(text)
+        log_probs = {}
+        for label, counts in self.feature_counts.items():
+            log_probs[label] = self._log_priors[label] + sum(
+                math.log(counts[f] + self.alpha) - self._log_denominators[label] for f in features
+            )
+        best = max(log_probs, key=log_probs.get)
+        peak = log_probs[best]
+        norm = sum(math.exp(lp - peak) for lp in log_probs.values())
+        return best, 1.0 / norm
+
+    def to_dict(self) -> Dict:
+        return {
+            "alpha": self.alpha,
+            "class_counts": dict(self.class_counts),
+            "feature_counts": {label: dict(c) for label, c in self.feature_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "NgramNaiveBayes":
+        model = cls(alpha=data.get("alpha", 1.0))
+        model.class_counts = Counter(data["class_counts"])
+        for label, counts in data["feature_counts"].items():
+            model.feature_counts[label] = Counter(counts)
+        model._prepare()
+        return model
+
+
+def load_model(path: Path = MODEL_PATH) -> NgramNaiveBayes:
+    """Carga el modelo entrenado offline o, si no existe, lo entrena con SEED_REPLIES."""
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return NgramNaiveBayes.from_dict(json.load(f))
+    return NgramNaiveBayes().train(SEED_REPLIES)
+
+
+def train_from_log(log_path: Path, model_path: Path = MODEL_PATH) -> NgramNaiveBayes:
+    """
+    Entrena el modelo con respuestas registradas (más las semillas) y lo guarda.
+
+    Args:
+        log_path: JSONL con objetos {"text": ..., "label": "AFIRMATIVA"|"NEGATIVA"}
+        model_path: Ruta donde guardar el modelo
+
+    Returns:
+        Modelo entrenado
+    """
+    samples = list(SEED_REPLIES)
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.append((record["text"], record["label"].upper()))
+    model = NgramNaiveBayes().train(samples)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(model_path, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f, ensure_ascii=False)
+    return model
+
+
+_MODEL = load_model()
+
+
+def _closed_polarity(normalized: str) -> Optional[str]:
+    """
+    Polaridad de una respuesta cerrada.
+
+    Returns:
+        AFIRMATIVA | NEGATIVA, o None si hay palabras fuera del vocabulario de sí/no o si
+        mezcla negación y afirmación ("no, está bien así")
+    """
+    words = set(normalized.split())
+    if words - AFFIRMATIVE_WORDS - NEGATIVE_WORDS - NEUTRAL_WORDS:
+        return None
+    affirmative, negative = bool(words & AFFIRMATIVE_WORDS), bool(words & NEGATIVE_WORDS)
+    if affirmative == negative:
+        return None
+    return AFFIRMATIVE if affirmative else NEGATIVE
+
+
+def classify_confirmation(reply: str, min_confidence: float = MIN_CONFIDENCE) -> Tuple[Optional[str], float]:
+    """
+    Clasifica la respuesta del usuario a la pregunta de confirmación.
+
+    Fuera del léxico solo decide si la respuesta es cerrada (todas sus palabras son de sí/no)
+    y el modelo coincide con su polaridad.
+
+    Args:
+        reply: Respuesta del usuario
+        min_confidence: Confianza mínima para decidir sin LLM
+
+    Returns:
+        Tupla (AFIRMATIVA | NEGATIVA | None, confianza). None = consultar al LLM
+    """
+    normalized = normalize_text(reply)
+    if normalized in AFFIRMATIVE_LEXICON:
+        return AFFIRMATIVE, 1.0
+    if normalized in NEGATIVE_LEXICON:
+        return NEGATIVE, 1.0
+    if not normalized:
+        return None, 0.0
+
+    label, confidence = _MODEL.predict(reply)
+    if label != _closed_polarity(normalized):
+        return None, confidence
+    return (label if confidence >= min_confidence else None), confidence
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python confirmation_classifier.py respuestas.jsonl")
+        sys.exit(1)
+    trained = train_from_log(Path(sys.argv[1]))
+    print(f"✅ Modelo guardado en {MODEL_PATH} ({sum(trained.class_counts.values())} ejemplos)")
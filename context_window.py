@@ -0,0 +1,143 @@
+"""
+Contexto acotado para los prompts del LLM en sesiones largas.
+
+- Cada nodo tiene un presupuesto de tokens (estimados por caracteres, sin tokenizador).
+- Las búsquedas completadas (antes del último boundary) no se reenvían mensaje a
+  mensaje: se resumen en una línea. node_dashboard guarda el resumen en el State
+  (history_summaries) al cerrar cada búsqueda, así que se reutiliza en todos los
+  turnos siguientes (y persiste con el checkpointer) sin reconstruirlo.
+- Los mensajes desde el último boundary se incluyen empezando por los más recientes
+  hasta agotar el presupuesto.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+
+# Caracteres por token (aproximación para español con llama3.1)
+CHARS_PER_TOKEN = 4
+
+# Tokens extra por mensaje (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Presupuesto de tokens del historial en cada prompt
+ROUTER_TOKEN_BUDGET = 512
+CHATBOT_TOKEN_BUDGET = 3072
+INTENT_TOKEN_BUDGET = 2048
+
+# Fracción máxima del presupuesto que pueden ocupar los resúmenes de búsquedas anteriores
+SUMMARY_SHARE = 0.25
+
+# Longitud máxima de cada resumen
+MAX_SUMMARY_CHARS = 240
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados de un texto."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """Tokens aproximados de un mensaje (contenido + rol)."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _clip(text: str, limit: int = MAX_SUMMARY_CHARS) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def summarize_search(search_intent: str, datasets: Sequence[Dict[str, Any]] = ()) -> str:
+    """
+    Resumen de una búsqueda completada (lo genera node_dashboard, sin LLM).
+
+    Args:
+        search_intent: Intención confirmada por el usuario
+        datasets: Datasets encontrados (useful_data)
+    """
+    names = [ds.get("nombre") or ds.get("dataset_id") for ds in datasets or [] if isinstance(ds, dict)]
+    summary = f"Búsqueda: {search_intent}"
+    if names:
+        summary += f" → datasets: {', '.join(str(n) for n in names[:3])}"
+    return _clip(summary)
+
+
+def summarize_segment(messages: Sequence[BaseMessage]) -> str:
+    """Resumen de una búsqueda a partir de sus mensajes (sesiones sin history_summaries o búsquedas sin confirmar)."""
+    asked = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+    answered = next((m.content for m in reversed(messages) if isinstance(m, AIMessage)), "")
+    summary = f"Búsqueda: {_clip(asked, MAX_SUMMARY_CHARS // 2)}"
+    if answered:
+        summary += f" → {answered}"
+    return _clip(summary)
+
+
+def search_summaries(messages: Sequence[BaseMessage],
+                     search_boundaries: Sequence[int],
+                     summaries: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Un resumen por búsqueda completada. Se reutilizan los guardados en el State y solo
+    se generan (a partir de los mensajes) los que falten.
+    """
+    result = list(summaries or [])[:len(search_boundaries)]
+    starts = [0] + list(search_boundaries)
+    for i in range(len(result), len(search_boundaries)):
+        result.append(summarize_segment(messages[starts[i]:starts[i + 1]]))
+    return result
+
+
+def fit_messages(messages: Sequence[BaseMessage], budget: int, keep_first: bool = False) -> List[BaseMessage]:
+    """
+    Mensajes más recientes que caben en el presupuesto (siempre al menos el último).
+
+    Args:
+        messages: Mensajes en orden cronológico
+        budget: Tokens disponibles
+        keep_first: Conserva también el primer mensaje (la petición original de la búsqueda)
+    """
+    if not messages:
+        return []
+    first = messages[0] if keep_first and len(messages) > 1 else None
+    used = message_tokens(first) if first is not None else 0
+    kept: List[BaseMessage] = []
+    for message in reversed(messages[1:] if first is not None else messages):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return [first] + kept if first is not None else kept
+
+
+def fit_summaries(summaries: Sequence[str], budget: int) -> List[str]:
+    """Resúmenes más recientes que caben en el presupuesto."""
+    kept: List[str] = []
+    used = 0
+    for summary in reversed(summaries):
+        cost = estimate_tokens(summary) + 1
+        if used + cost > budget:
+            break
+        kept.append(summary)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def bounded_context(state: Dict[str, Any], budget: int) -> Tuple[List[str], List[BaseMessage]]:
+    """
+    Contexto de un prompt dentro del presupuesto de tokens.
+
+    Returns:
+        (resúmenes de las búsquedas anteriores, mensajes desde el último boundary que caben)
+    """
+    messages = state.get("messages", [])
+    boundaries = state.get("search_boundaries") or []
+    summaries = fit_summaries(
+        search_summaries(messages, boundaries, state.get("history_summaries")),
+        int(budget * SUMMARY_SHARE),
+    )
+    remaining = budget - sum(estimate_tokens(s) + 1 for s in summaries)
+    recent = fit_messages(messages[boundaries[-1] if boundaries else 0:], remaining)
+    return summaries, recent
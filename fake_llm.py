@@ -0,0 +1,140 @@
+"""
+LLM de pruebas (sin Ollama) para pruebas de carga y benchmarks.
+
+StubChatModel reconoce cada prompt de los nodos (router, intent, análisis combinado,
+ambigüedades, confirmación, sí/no, chatbot) y devuelve una respuesta válida con una
+latencia configurable, tanto con invoke/ainvoke como con stream/astream (token a token).
+"""
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import json
+import re
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# Intent que devuelve por defecto (todos los filtros claros)
+DEFAULT_INTENT = {
+    "topic": "calidad del aire",
+    "temporal_filters": ["2024"],
+    "demographic_filters": ["toda la población"],
+    "spatial_filters": ["Madrid"],
+    "required_columns": ["fecha", "no2"],
+    "aggregation_type": "average",
+}
+
+_FILTERS = ("temporal_filters", "demographic_filters", "spatial_filters")
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+_ROUNDS_RE = re.compile(r"Rondas de aclaración ya hechas: (\d+)")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Modelo de chat determinista con latencia simulada.
+
+    Atributos:
+        latency: Segundos hasta el primer token de cada llamada
+        token_latency: Segundos entre tokens (también se suma en invoke)
+        intent: Intent que se extrae de cualquier conversación
+        clarification_rounds: Turnos del usuario en los que aún se pide aclaración
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    intent: Dict[str, Any] = DEFAULT_INTENT
+    clarification_rounds: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"latency": self.latency, "token_latency": self.token_latency}
+
+    def respond(self, prompt: str) -> str:
+        """Respuesta para un prompt (según qué nodo lo ha generado)."""
+        rounds = _ROUNDS_RE.search(prompt)
+        # Prompts incrementales: solo llevan la última respuesta y el número de rondas
+        user_turns = int(rounds.group(1)) + 1 if rounds else prompt.count("Usuario:")
+        needs_clarification = 0 < user_turns <= self.clarification_rounds
+
+        if "decide el siguiente nodo" in prompt:
+            return "confirm_search"
+        if "INTENT ACTUAL:" in prompt:
+            delta = {} if needs_clarification else {name: self.intent.get(name, []) for name in _FILTERS}
+            if "1. intent:" not in prompt:
+                return json.dumps(delta, ensure_ascii=False)
+            return json.dumps({
+                "intent": delta,
+                "clarification": "¿De qué periodo y zona necesitas los datos?" if needs_clarification else None,
+                "confirmation": self._confirmation(),
+            }, ensure_ascii=False)
+        if "1. intent:" in prompt:
+            return json.dumps({
+                "intent": self._intent(needs_clarification),
+                "clarification": "¿De qué periodo y zona necesitas los datos?" if needs_clarification else None,
+                "confirmation": self._confirmation(),
+            }, ensure_ascii=False)
+        if "divide su intención" in prompt:
+            return json.dumps(self._intent(needs_clarification), ensure_ascii=False)
+        if "Analiza esta búsqueda" in prompt:
+            if "FILTROS VACÍOS: Ninguno" in prompt:
+                return "NO_AMBIGUITIES"
+            return "¿De qué periodo y zona necesitas los datos?"
+        if "mensaje de confirmación" in prompt:
+            return self._confirmation()
+        if "pregunta de confirmación" in prompt:
+            return "AFIRMATIVA"
+        return "Hola, soy el asistente de búsqueda de datos. ¿Qué datos necesitas?"
+
+    def _intent(self, needs_clarification: bool) -> Dict[str, Any]:
+        if not needs_clarification:
+            return self.intent
+        return {**self.intent, **{name: [] for name in _FILTERS}}
+
+    def _confirmation(self) -> str:
+        return f"En resumen, busco datos de {self.intent.get('topic', 'tu consulta')}. ¿Es correcto?"
+
+    def _text(self, messages: List[BaseMessage]) -> str:
+        self.calls += 1
+        return self.respond(str(messages[-1].content) if messages else "")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages)
+        time.sleep(self.latency + self.token_latency * len(_TOKEN_RE.findall(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(_TOKEN_RE.findall(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._text(messages)
+        time.sleep(self.latency)
+        for token in _TOKEN_RE.findall(text):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._text(messages)
+        await asyncio.sleep(self.latency)
+        for token in _TOKEN_RE.findall(text):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
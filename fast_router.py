@@ -0,0 +1,151 @@
+"""
+Router determinista (reglas + léxico) previo al router LLM.
+
+Resuelve sin LLM los turnos obvios ("hola", "gracias", "busca datos de...") y devuelve
+None cuando no está seguro, para que decida el LLM. Una búsqueda solo es clara si la
+petición (verbo o expresión) va acompañada de un sustantivo de datos o de un topic del
+catálogo ("dame un chiste" no lo es).
+"""
+from typing import Iterable, Optional, Dict, Any
+import re
+import threading
+import unicodedata
+
+
+# Mensajes conversacionales completos (tras normalizar)
+CHAT_PHRASES = {
+    "hola", "buenas", "buenos dias", "buenas tardes", "buenas noches", "hey", "hi", "hello",
+    "gracias", "muchas gracias", "mil gracias", "ok gracias", "vale gracias", "perfecto gracias",
+    "adios", "hasta luego", "hasta pronto", "chao", "nos vemos", "bye",
+    "que tal", "como estas", "quien eres", "que eres", "que puedes hacer", "que sabes hacer",
+    "como funcionas", "ayuda", "help",
+}
+
+# Palabras que por sí solas indican conversación
+CHAT_WORDS = {
+    "hola", "gracias", "adios", "saludos", "buenas", "genial", "perfecto", "quien", "eres",
+    "funcionas", "ayuda",
+}
+
+# Verbos/expresiones que indican petición de búsqueda o análisis de datos
+SEARCH_PATTERNS = [
+    r"\b(busca|buscar|buscame|busco|buscamos|encuentra|encuentrame|encontrar)\b",
+    r"\b(consulta|consultar|analiza|analizar|muestrame|mostrar|dame|obten|obtener|descarga|descargar)\b",
+    r"\b(necesito|quiero|quisiera|me interesan?)\b",
+    r"\b(datos|datasets?|estadisticas|cifras|registros|indicadores) (de|del|sobre|acerca)\b",
+    r"\b(cuantos|cuantas|evolucion|tasa|promedio|media) (de|del)\b",
+]
+
+# Sustantivos de datos: la petición solo es búsqueda si nombra datos o un topic del catálogo
+DATA_NOUNS_PATTERN = r"\b(datos|datasets?|estadisticas?|cifras|registros|indicadores|series?|tablas?)\b"
+
+# Preguntas de cortesía con las que el asistente cierra su turno ("¿En qué puedo ayudarte?"):
+# no esperan una respuesta concreta, así que no cuentan como pregunta abierta
+CLOSING_QUESTION_PATTERNS = [
+    r"\ben que (mas )?(te |le |os )?puedo ayudar(te|le|os)?( hoy)?$",
+    r"\ben (lo )?que (mas )?(te |le |os )?pueda ayudar(te|le|os)?( hoy)?$",
+    r"\bpuedo ayudar(te|le|os)? (en|con) (algo|alguna otra cosa)( mas)?$",
+    r"\b(necesitas|necesita|quieres|quiere|deseas|desea) (algo|alguna otra cosa)( mas)?$",
+    r"\balgo mas$",
+    r"\bque (datos|informacion) (necesitas|necesita|buscas|busca|quieres|quiere)( hoy)?$",
+]
+
+# Máximo de palabras para resolver un turno conversacional sin LLM
+MAX_CHAT_WORDS = 6
+
+_SEARCH_RES = [re.compile(p) for p in SEARCH_PATTERNS]
+_DATA_NOUNS_RE = re.compile(DATA_NOUNS_PATTERN)
+_WORD_RE = re.compile(r"[a-z0-9ñ]+")
+_CLOSING_RES = [re.compile(p) for p in CLOSING_QUESTION_PATTERNS]
+_QUESTION_RE = re.compile(r"[^.!?¿\n]*\?")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes (conserva la ñ) y sin signos de puntuación."""
+    text = (text or "").lower().replace("ñ", "\0")
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    text = text.replace("\0", "ñ")
+    return " ".join(_WORD_RE.findall(text))
+
+
+def topic_words(topics: Iterable[str]) -> frozenset:
+    """Palabras significativas (4+ letras) de los topics del catálogo, normalizadas."""
+    return frozenset(w for topic in topics for w in normalize_text(topic).split() if len(w) >= 4)
+
+
+def is_closing_question(question: str) -> bool:
+    """True si la pregunta es una fórmula de cierre ("¿En qué más puedo ayudarte?")."""
+    normalized = normalize_text(question)
+    return any(regex.search(normalized) for regex in _CLOSING_RES)
+
+
+def is_closed_answer(text: Optional[str]) -> bool:
+    """True si el mensaje del asistente no deja una pregunta abierta al usuario."""
+    return all(is_closing_question(q) for q in _QUESTION_RE.findall(text or ""))
+
+
+def classify_turn(text: str, topics: Iterable[str] = (), previous_ai: Optional[str] = None) -> Optional[str]:
+    """
+    Clasifica un mensaje del usuario por reglas.
+
+    Args:
+        text: Último mensaje del usuario
+        topics: Palabras de los topics del catálogo (ver topic_words)
+        previous_ai: Último mensaje del asistente antes de text (None si no hay)
+
+    Returns:
+        "chatbot", "confirm_search" o None si no hay certeza (decide el LLM)
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return None
+    # Si el asistente acaba de preguntar algo, el mensaje es una respuesta y la interpreta el LLM
+    if previous_ai is not None and not is_closed_answer(previous_ai):
+        return None
+
+    words = normalized.split()
+    mentions_data = bool(_DATA_NOUNS_RE.search(normalized)) or any(w in topics for w in words)
+    is_search = mentions_data and any(regex.search(normalized) for regex in _SEARCH_RES)
+    is_chat = normalized in CHAT_PHRASES or (
+        len(words) <= MAX_CHAT_WORDS and any(w in CHAT_WORDS for w in words)
+    )
+
+    # Solo se decide si las señales no se contradicen
+    if is_search and not is_chat:
+        return "confirm_search"
+    if is_chat and not is_search:
+        return "chatbot"
+    return None
+
+
+class RouterStats:
+    """Contadores de turnos resueltos por reglas frente a los que necesitan el LLM."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_path: Dict[str, int] = {"chatbot": 0, "confirm_search": 0}
+        self.llm = 0
+
+    def record(self, route: Optional[str]):
+        """Registra un turno: route es el destino del fast-path o None si se usó el LLM."""
+        with self._lock:
+            if route is None:
+                self.llm += 1
+            else:
+                self.fast_path[route] = self.fast_path.get(route, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        """Resumen con la proporción de turnos resueltos sin LLM."""
+        with self._lock:
+            fast = sum(self.fast_path.values())
+            total = fast + self.llm
+            return {
+                "turns": total,
+                "fast_path": dict(self.fast_path),
+                "llm": self.llm,
+                "fast_path_share": fast / total if total else 0.0,
+            }
+
+
+# Contadores del proceso
+ROUTER_STATS = RouterStats()
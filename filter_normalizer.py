@@ -0,0 +1,637 @@
+"""
+Normalizador determinista de filtros del intent (sin LLM).
+
+Convierte los filtros en lenguaje natural de user_search_intent_structured a la forma
+normalizada que documenta State (app.py) y que entiende compute.plan:
+
+    temporal:    "últimos 3 años"      → {"type": "last_n_years", "n": 3}
+                 "2020-2023"           → {"type": "range", "start": 2020, "end": 2023}
+    espacial:    "en Bizkaia"          → {"type": "place", "places": [{"name": "Bizkaia", "level": "province", ...}]}
+    demográfico: "mayores de 65 años"  → {"type": "age_range", "min": 66, "max": None}
+                 "mujeres"             → {"type": "sex", "value": "female"}
+                 "toda la población"   → {"type": "all"}
+
+Las tablas (nomenclátor de municipios, provincias y comunidades; expresiones temporales;
+grupos de edad) se precompilan al importar: normalizar un filtro son unas pocas búsquedas
+en diccionarios y expresiones regulares ya compiladas.
+
+Los valores VAGOS ("últimos años", "cerca de aquí", "personas mayores") se marcan como
+tales. local_ambiguity decide con ello si hay que pedir aclaración sin consultar al LLM;
+solo los valores que no reconoce ninguna tabla vuelven al LLM.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple
+import re
+import unicodedata
+
+
+# Campos de filtro del intent y su dimensión
+FILTER_FIELDS = {
+    "temporal_filters": "temporal",
+    "spatial_filters": "spatial",
+    "demographic_filters": "demographic",
+}
+
+# Años admitidos como filtro
+MIN_YEAR, MAX_YEAR = 1900, 2100
+MAX_AGE = 120
+
+
+def fold(text: Any) -> str:
+    """Minúsculas, sin tildes (ñ → n) y sin puntuación, conservando - + < > =."""
+    decomposed = unicodedata.normalize("NFKD", str(text or "").lower())
+    text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9\-+<>=]+", " ", text).split())
+
+
+def _place_key(text: Any) -> str:
+    return " ".join(fold(text).replace("-", " ").split())
+
+
+# ==========================================
+# 1. NOMENCLÁTOR (municipios, provincias, comunidades)
+# ==========================================
+# Comunidades autónomas: clave → (nombre, código NUTS 2, alias)
+COMMUNITIES: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "andalucia": ("Andalucía", "ES61", ()),
+    "aragon": ("Aragón", "ES24", ()),
+    "asturias": ("Principado de Asturias", "ES12", ("asturias",)),
+    "baleares": ("Illes Balears", "ES53", ("islas baleares", "baleares", "balears")),
+    "canarias": ("Canarias", "ES70", ("islas canarias",)),
+    "cantabria": ("Cantabria", "ES13", ()),
+    "castilla_leon": ("Castilla y León", "ES41", ("castilla leon",)),
+    "castilla_mancha": ("Castilla-La Mancha", "ES42", ()),
+    "cataluna": ("Cataluña", "ES51", ("catalunya",)),
+    "valenciana": ("Comunitat Valenciana", "ES52", ("comunidad valenciana", "pais valenciano")),
+    "extremadura": ("Extremadura", "ES43", ()),
+    "galicia": ("Galicia", "ES11", ()),
+    "madrid": ("Comunidad de Madrid", "ES30", ("madrid",)),
+    "murcia": ("Región de Murcia", "ES62", ("murcia",)),
+    "navarra": ("Comunidad Foral de Navarra", "ES22", ("navarra",)),
+    "pais_vasco": ("País Vasco", "ES21", ("euskadi",)),
+    "rioja": ("La Rioja", "ES23", ("rioja",)),
+    "ceuta": ("Ceuta", "ES63", ()),
+    "melilla": ("Melilla", "ES64", ()),
+}
+
+# Provincias: código INE → (nombre, comunidad, alias)
+PROVINCES: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "01": ("Araba/Álava", "pais_vasco", ("alava", "araba")),
+    "02": ("Albacete", "castilla_mancha", ()),
+    "03": ("Alicante", "valenciana", ("alacant",)),
+    "04": ("Almería", "andalucia", ()),
+    "05": ("Ávila", "castilla_leon", ()),
+    "06": ("Badajoz", "extremadura", ()),
+    "07": ("Illes Balears", "baleares", ("islas baleares", "baleares", "balears")),
+    "08": ("Barcelona", "cataluna", ()),
+    "09": ("Burgos", "castilla_leon", ()),
+    "10": ("Cáceres", "extremadura", ()),
+    "11": ("Cádiz", "andalucia", ()),
+    "12": ("Castellón", "valenciana", ("castello",)),
+    "13": ("Ciudad Real", "castilla_mancha", ()),
+    "14": ("Córdoba", "andalucia", ()),
+    "15": ("A Coruña", "galicia", ("la coruna", "coruna")),
+    "16": ("Cuenca", "castilla_mancha", ()),
+    "17": ("Girona", "cataluna", ("gerona",)),
+    "18": ("Granada", "andalucia", ()),
+    "19": ("Guadalajara", "castilla_mancha", ()),
+    "20": ("Gipuzkoa", "pais_vasco", ("guipuzcoa",)),
+    "21": ("Huelva", "andalucia", ()),
+    "22": ("Huesca", "aragon", ()),
+    "23": ("Jaén", "andalucia", ()),
+    "24": ("León", "castilla_leon", ()),
+    "25": ("Lleida", "cataluna", ("lerida",)),
+    "26": ("La Rioja", "rioja", ("rioja",)),
+    "27": ("Lugo", "galicia", ()),
+    "28": ("Madrid", "madrid", ()),
+    "29": ("Málaga", "andalucia", ()),
+    "30": ("Murcia", "murcia", ()),
+    "31": ("Navarra", "navarra", ("nafarroa",)),
+    "32": ("Ourense", "galicia", ("orense",)),
+    "33": ("Asturias", "asturias", ()),
+    "34": ("Palencia", "castilla_leon", ()),
+    "35": ("Las Palmas", "canarias", ()),
+    "36": ("Pontevedra", "galicia", ()),
+    "37": ("Salamanca", "castilla_leon", ()),
+    "38": ("Santa Cruz de Tenerife", "canarias", ()),
+    "39": ("Cantabria", "cantabria", ()),
+    "40": ("Segovia", "castilla_leon", ()),
+    "41": ("Sevilla", "andalucia", ()),
+    "42": ("Soria", "castilla_leon", ()),
+    "43": ("Tarragona", "cataluna", ()),
+    "44": ("Teruel", "aragon", ()),
+    "45": ("Toledo", "castilla_mancha", ()),
+    "46": ("Valencia", "valenciana", ()),
+    "47": ("Valladolid", "castilla_leon", ()),
+    "48": ("Bizkaia", "pais_vasco", ("vizcaya",)),
+    "49": ("Zamora", "castilla_leon", ()),
+    "50": ("Zaragoza", "aragon", ()),
+    "51": ("Ceuta", "ceuta", ()),
+    "52": ("Melilla", "melilla", ()),
+}
+
+# Municipios: capitales de provincia y ciudades grandes → (código INE de la provincia, alias)
+MUNICIPALITIES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    # Capitales con el nombre de su provincia
+    **{PROVINCES[code][0]: (code, PROVINCES[code][2]) for code in (
+        "02", "03", "04", "05", "06", "08", "09", "10", "11", "13", "14", "15", "16", "17", "18",
+        "19", "21", "22", "23", "24", "25", "27", "28", "29", "30", "32", "34", "36", "37", "38",
+        "40", "41", "42", "43", "44", "45", "46", "47", "49", "50", "51", "52")},
+    "Castellón de la Plana": ("12", ("castellon", "castello de la plana", "castello")),
+    # Capitales con otro nombre
+    "Vitoria-Gasteiz": ("01", ("vitoria", "gasteiz")),
+    "Donostia-San Sebastián": ("20", ("san sebastian", "donostia")),
+    "Bilbao": ("48", ("bilbo",)),
+    "Pamplona": ("31", ("iruna", "pamplona iruna")),
+    "Oviedo": ("33", ()),
+    "Santander": ("39", ()),
+    "Logroño": ("26", ()),
+    "Palma": ("07", ("palma de mallorca",)),
+    "Las Palmas de Gran Canaria": ("35", ()),
+    "Mérida": ("06", ()),
+    "Santiago de Compostela": ("15", ("santiago",)),
+    # Otras ciudades grandes
+    "Vigo": ("36", ()), "Gijón": ("33", ("xixon",)), "Avilés": ("33", ()), "Siero": ("33", ()),
+    "L'Hospitalet de Llobregat": ("08", ("hospitalet", "l hospitalet")), "Badalona": ("08", ()),
+    "Terrassa": ("08", ("tarrasa",)), "Sabadell": ("08", ()), "Mataró": ("08", ()),
+    "Sant Cugat del Vallès": ("08", ("sant cugat",)), "Cornellà de Llobregat": ("08", ("cornella",)),
+    "Granollers": ("08", ()), "Manresa": ("08", ()), "Rubí": ("08", ()), "Castelldefels": ("08", ()),
+    "El Prat de Llobregat": ("08", ()), "Viladecans": ("08", ()), "Sant Boi de Llobregat": ("08", ()),
+    "Reus": ("43", ()),
+    "Elche": ("03", ("elx",)), "Torrevieja": ("03", ()), "Benidorm": ("03", ()), "Orihuela": ("03", ()),
+    "Elda": ("03", ()), "Alcoy": ("03", ("alcoi",)), "San Vicente del Raspeig": ("03", ()),
+    "Torrent": ("46", ()), "Gandia": ("46", ()), "Sagunto": ("46", ("sagunt",)), "Paterna": ("46", ()),
+    "Cartagena": ("30", ()), "Lorca": ("30", ()), "Molina de Segura": ("30", ()),
+    "Móstoles": ("28", ()), "Alcalá de Henares": ("28", ()), "Fuenlabrada": ("28", ()),
+    "Leganés": ("28", ()), "Getafe": ("28", ()), "Alcorcón": ("28", ()), "Torrejón de Ardoz": ("28", ()),
+    "Parla": ("28", ()), "Alcobendas": ("28", ()), "Las Rozas de Madrid": ("28", ("las rozas",)),
+    "Pozuelo de Alarcón": ("28", ()), "San Sebastián de los Reyes": ("28", ()),
+    "Rivas-Vaciamadrid": ("28", ()), "Majadahonda": ("28", ()), "Coslada": ("28", ()),
+    "Valdemoro": ("28", ()), "Collado Villalba": ("28", ()), "Aranjuez": ("28", ()),
+    "Arganda del Rey": ("28", ()), "Boadilla del Monte": ("28", ()),
+    "Jerez de la Frontera": ("11", ("jerez",)), "Algeciras": ("11", ()), "San Fernando": ("11", ()),
+    "Chiclana de la Frontera": ("11", ()), "El Puerto de Santa María": ("11", ()),
+    "Sanlúcar de Barrameda": ("11", ()),
+    "Marbella": ("29", ()), "Estepona": ("29", ()), "Fuengirola": ("29", ()), "Mijas": ("29", ()),
+    "Vélez-Málaga": ("29", ()), "Benalmádena": ("29", ()), "Torremolinos": ("29", ()),
+    "Dos Hermanas": ("41", ()), "Alcalá de Guadaíra": ("41", ()), "Utrera": ("41", ()),
+    "Roquetas de Mar": ("04", ()), "El Ejido": ("04", ()), "Motril": ("18", ()), "Linares": ("23", ()),
+    "Ponferrada": ("24", ()), "Ferrol": ("15", ()), "Talavera de la Reina": ("45", ()),
+    "Puertollano": ("13", ()), "Plasencia": ("10", ()), "Don Benito": ("06", ()),
+    "Almendralejo": ("06", ()), "Torrelavega": ("39", ()), "Irun": ("20", ()),
+    "Getxo": ("48", ()), "Barakaldo": ("48", ("baracaldo",)),
+    "San Cristóbal de La Laguna": ("38", ("la laguna",)), "Arona": ("38", ()), "Telde": ("35", ()),
+}
+
+# El país entero
+COUNTRY = ("España", "ES", ("espana", "spain", "todo el pais", "territorio nacional", "nivel nacional", "nacional"))
+
+# Palabras que fijan el nivel del lugar que les sigue ("provincia de Valencia")
+LEVEL_WORDS = {
+    "provincia": "province", "provincias": "province",
+    "comunidad": "community", "comunidades": "community", "autonoma": "community",
+    "region": "community", "ccaa": "community",
+    "ciudad": "municipality", "ciudades": "municipality", "municipio": "municipality",
+    "municipios": "municipality", "ayuntamiento": "municipality", "localidad": "municipality",
+}
+# Nivel preferido cuando un nombre es a la vez municipio, provincia y comunidad ("Murcia")
+LEVEL_ORDER = ("municipality", "province", "community", "country")
+
+# Palabras de enlace que no cambian el lugar
+PLACE_CONNECTORS = frozenset("y e o en de del el la las los a al toda todo".split())
+
+# Referencias espaciales vagas
+VAGUE_PLACE_WORDS = frozenset(
+    "cerca cercanias alrededor alrededores aqui alli zona entorno local mi mis nuestra nuestro "
+    "barrio pueblo".split()
+)
+
+
+def _place(name: str, level: str, names: Sequence[str], province_code: Optional[str] = None,
+           community: Optional[str] = None) -> Dict[str, Any]:
+    place: Dict[str, Any] = {"name": name, "level": level, "names": list(dict.fromkeys([name, *names]))}
+    if province_code is not None:
+        place["province"] = PROVINCES[province_code][0]
+        place["province_code"] = province_code
+    if community is not None:
+        place["community"] = COMMUNITIES[community][0]
+        place["nuts"] = COMMUNITIES[community][1]
+    return place
+
+
+def _build_gazetteer() -> Dict[str, List[Dict[str, Any]]]:
+    """Clave normalizada → lugares con ese nombre (uno por nivel)."""
+    gazetteer: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add(place: Dict[str, Any], aliases: Sequence[str]):
+        for alias in (place["name"], *aliases):
+            entries = gazetteer.setdefault(_place_key(alias), [])
+            if not any(e["level"] == place["level"] for e in entries):
+                entries.append(place)
+
+    for key, (name, nuts, aliases) in COMMUNITIES.items():
+        add(_place(name, "community", aliases, community=key), aliases)
+    for code, (name, community, aliases) in PROVINCES.items():
+        add(_place(name, "province", aliases, code, community), aliases)
+    for name, (code, aliases) in MUNICIPALITIES.items():
+        add(_place(name, "municipality", aliases, code, PROVINCES[code][1]), aliases)
+    name, nuts, aliases = COUNTRY
+    add({"name": name, "level": "country", "names": [name], "nuts": nuts}, aliases)
+    return gazetteer
+
+
+GAZETTEER = _build_gazetteer()
+_MAX_PLACE_WORDS = max(len(key.split()) for key in GAZETTEER)
+
+
+def _build_members() -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """Nombres (y alias) de lo que contiene cada provincia (municipios) y comunidad (provincias y municipios)."""
+    by_province: Dict[str, List[str]] = {code: [] for code in PROVINCES}
+    for name, (code, aliases) in MUNICIPALITIES.items():
+        by_province[code].extend((name, *aliases))
+    by_community: Dict[str, List[str]] = {key: [] for key in COMMUNITIES}
+    for code, (name, community, aliases) in PROVINCES.items():
+        by_community[community].extend((name, *aliases, *by_province[code]))
+    return by_province, by_community
+
+
+PROVINCE_MEMBERS, COMMUNITY_MEMBERS = _build_members()
+_COMMUNITY_BY_NUTS = {nuts: key for key, (_, nuts, _) in COMMUNITIES.items()}
+
+
+def contained_names(place: Dict[str, Any]) -> List[str]:
+    """
+    Nombres de los lugares que contiene un lugar normalizado: municipios de una provincia;
+    provincias y municipios de una comunidad. Vacío para municipios y para el país.
+    """
+    if place.get("level") == "province":
+        return PROVINCE_MEMBERS.get(place.get("province_code"), [])
+    if place.get("level") == "community":
+        return COMMUNITY_MEMBERS.get(_COMMUNITY_BY_NUTS.get(place.get("nuts")), [])
+    return []
+
+
+def _pick(candidates: List[Dict[str, Any]], hint: Optional[str]) -> Dict[str, Any]:
+    for candidate in candidates:
+        if candidate["level"] == hint:
+            return candidate
+    return min(candidates, key=lambda c: LEVEL_ORDER.index(c["level"]))
+
+
+def _parse_places(text: str) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """(lugares reconocidos, hay palabras sin reconocer, hay referencias vagas)."""
+    words = _place_key(text).split()
+    places: List[Dict[str, Any]] = []
+    unknown = vague = False
+    hint: Optional[str] = None
+    i = 0
+    while i < len(words):
+        # Coincidencia más larga primero ("castilla y leon" antes que "castilla")
+        for n in range(min(_MAX_PLACE_WORDS, len(words) - i), 0, -1):
+            candidates = GAZETTEER.get(" ".join(words[i:i + n]))
+            if candidates:
+                place = _pick(candidates, hint)
+                if place not in places:
+                    places.append(place)
+                i += n
+                break
+        else:
+            word = words[i]
+            if word in LEVEL_WORDS:
+                hint = LEVEL_WORDS[word]
+            elif word in VAGUE_PLACE_WORDS:
+                vague = True
+            elif word not in PLACE_CONNECTORS:
+                unknown = True
+            i += 1
+    return places, unknown, vague
+
+
+# ==========================================
+# 2. EXPRESIONES TEMPORALES
+# ==========================================
+# Números escritos con letra
+NUMBER_WORDS = {
+    "un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12, "quince": 15, "veinte": 20,
+}
+
+# Periodos con nombre → años
+PERIOD_WORDS = {"bienio": 2, "trienio": 3, "lustro": 5, "quinquenio": 5, "decada": 10}
+
+# Expresiones temporales vagas
+VAGUE_TEMPORAL = (
+    "ultimos anos", "ultimas decadas", "ultimos tiempos", "ultimamente", "reciente", "recientes",
+    "recientemente", "actual", "actuales", "actualmente", "actualidad", "hoy en dia", "estos anos",
+    "hace unos anos", "hace algunos anos", "hace poco", "antes", "antiguo", "antiguos", "historico",
+    "historicos", "ultimos datos", "datos recientes", "mas recientes", "ultimo periodo",
+)
+
+_TEMPORAL_PREFIX_RE = re.compile(r"^(?:(?:en|el|la|los|las|del|de|durante|para|datos|periodo)\s+)+(?=\S)")
+_VAGUE_TEMPORAL_RE = re.compile(r"\b(?:" + "|".join(sorted(VAGUE_TEMPORAL, key=len, reverse=True)) + r")\b")
+
+
+def _years(lo: int, hi: int) -> Optional[Dict[str, Any]]:
+    lo, hi = sorted((lo, hi))
+    if not (MIN_YEAR <= lo <= hi <= MAX_YEAR):
+        return None
+    return {"type": "year", "year": lo} if lo == hi else {"type": "range", "start": lo, "end": hi}
+
+
+# (patrón sobre el texto completo, constructor(match, año actual))
+_TEMPORAL_RULES: List[Tuple[Pattern, Callable[[re.Match, int], Optional[Dict[str, Any]]]]] = [
+    (re.compile(r"(?:ano\s+)?(\d{4})"), lambda m, y: _years(int(m[1]), int(m[1]))),
+    (re.compile(r"(?:(?:entre|anos)\s+)?(\d{4})\s*(?:-|\ba\b|\bal\b|\by\b|\bhasta\b)\s*(\d{4})"),
+     lambda m, y: _years(int(m[1]), int(m[2]))),
+    (re.compile(r"(?:desde|a partir de|despues de)\s+(?:el\s+)?(?:ano\s+)?(\d{4})"),
+     lambda m, y: {"type": "range", "start": int(m[1]), "end": None} if MIN_YEAR <= int(m[1]) <= y else None),
+    (re.compile(r"(?:(?:los|las)\s+)?(?:ultimos|pasados)\s+(\d+)\s+anos|(\d+)\s+ultimos\s+anos"),
+     lambda m, y: {"type": "last_n_years", "n": int(m[1] or m[2])} if 0 < int(m[1] or m[2]) <= y - MIN_YEAR else None),
+    (re.compile(r"(?:ultimo|ultima|pasado|pasada)\s+(bienio|trienio|lustro|quinquenio|decada)"),
+     lambda m, y: {"type": "last_n_years", "n": PERIOD_WORDS[m[1]]}),
+    (re.compile(r"ultimo\s+ano|ultimos\s+12\s+meses"), lambda m, y: {"type": "last_n_years", "n": 1}),
+    (re.compile(r"(?:este|esta|presente)\s+ano|ano\s+(?:actual|en\s+curso|corriente)"),
+     lambda m, y: {"type": "year", "year": y}),
+    (re.compile(r"ano\s+(?:pasado|anterior)|pasado\s+ano"), lambda m, y: {"type": "year", "year": y - 1}),
+    (re.compile(r"hace\s+(\d+)\s+anos?"), lambda m, y: _years(y - int(m[1]), y - int(m[1]))),
+    (re.compile(r"(?:decada\s+de|anos)\s+(?:los\s+)?(\d{3})0"),
+     lambda m, y: _years(int(m[1]) * 10, int(m[1]) * 10 + 9)),
+]
+
+
+def _with_numbers(text: str) -> str:
+    return " ".join(str(NUMBER_WORDS.get(w, w)) for w in text.split())
+
+
+def _parse_temporal(text: str, current_year: int) -> Tuple[List[Dict[str, Any]], bool]:
+    """(formas normalizadas, es vago) de un filtro temporal."""
+    text = _TEMPORAL_PREFIX_RE.sub("", _with_numbers(fold(text)))
+    for pattern, build in _TEMPORAL_RULES:
+        m = pattern.fullmatch(text)
+        if m:
+            normalized = build(m, current_year)
+            return ([normalized] if normalized else []), False
+    return [], bool(_VAGUE_TEMPORAL_RE.search(text))
+
+
+# ==========================================
+# 3. GRUPOS DE POBLACIÓN
+# ==========================================
+# Grupos de edad con nombre → (edad mínima, edad máxima) según las convenciones del INE
+AGE_GROUPS = {
+    "ninos": (0, 14), "ninas": (0, 14), "infancia": (0, 14), "poblacion infantil": (0, 14),
+    "menores de edad": (0, 17), "menores": (0, 17),
+    "adolescentes": (12, 17), "adolescencia": (12, 17),
+    "jovenes": (15, 29), "juventud": (15, 29), "gente joven": (15, 29), "poblacion joven": (15, 29),
+    "mayores de edad": (18, None), "adultos": (18, 64),
+    "edad de trabajar": (16, 64), "edad laboral": (16, 64), "poblacion activa": (16, 64),
+    "tercera edad": (65, None), "jubilados": (65, None), "pensionistas": (65, None),
+}
+
+# Grupos demasiado imprecisos para filtrar
+VAGUE_DEMOGRAPHIC = (
+    "personas mayores", "gente mayor", "mayores", "ancianos", "viejos", "mediana edad",
+    "gente de mediana edad", "edad avanzada", "edad media",
+)
+
+# Filtros que no restringen la población
+ALL_POPULATION = (
+    "toda la poblacion", "poblacion general", "poblacion total", "total", "general", "todos",
+    "todas", "todo", "sin filtro", "ninguno", "todas las edades", "cualquier edad", "ambos sexos",
+)
+
+SEX_WORDS = {
+    "female": frozenset("mujer mujeres femenino femenina female women".split()),
+    "male": frozenset("hombre hombres varon varones masculino masculina male men".split()),
+}
+
+# Palabras de relleno de un filtro demográfico ("personas de entre 18 y 30 años")
+DEMOGRAPHIC_FILLER = frozenset(
+    "personas persona poblacion gente de del la las los el en con y e a anos ano edad edades "
+    "grupo rango entre que tienen tengan solo solamente sexo".split()
+)
+
+_AGE = r"(\d{1,3})"
+# (patrón, constructor de (mín, máx)); mismo criterio que compute.plan.age_range
+_AGE_RULES: List[Tuple[Pattern, Callable[[re.Match], Tuple[Optional[int], Optional[int]]]]] = [
+    (re.compile(rf"\b(?:entre|de)\s+{_AGE}\s*(?:y|a|-)\s*{_AGE}(?:\s+anos)?\b"), lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b{_AGE}\s*(?:-|a)\s*{_AGE}(?:\s+anos)?\b"), lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b(?:mayores|mas|por encima)\s+de\s+{_AGE}(?:\s+anos)?\b"), lambda m: (int(m[1]) + 1, None)),
+    (re.compile(rf"\b(?:menores|menos|por debajo)\s+de\s+{_AGE}(?:\s+anos)?\b"), lambda m: (None, int(m[1]) - 1)),
+    (re.compile(rf"\b{_AGE}\s*(?:\+|(?:anos\s+)?(?:o|y)\s+mas(?:\s+anos)?)"), lambda m: (int(m[1]), None)),
+    (re.compile(rf"(?:\+|>=)\s*{_AGE}\b|\ba partir de (?:los\s+)?{_AGE}(?:\s+anos)?\b"),
+     lambda m: (int(m[1] or m[2]), None)),
+    (re.compile(rf">\s*{_AGE}\b"), lambda m: (int(m[1]) + 1, None)),
+    (re.compile(rf"<=\s*{_AGE}\b|\bhasta (?:los\s+)?{_AGE}(?:\s+anos)?\b"), lambda m: (None, int(m[1] or m[2]))),
+    (re.compile(rf"<\s*{_AGE}\b"), lambda m: (None, int(m[1]) - 1)),
+]
+
+
+def _phrases_re(phrases) -> Pattern:
+    return re.compile(r"\b(?:" + "|".join(sorted(phrases, key=len, reverse=True)) + r")\b")
+
+
+_AGE_GROUPS_RE = _phrases_re(AGE_GROUPS)
+_VAGUE_DEMOGRAPHIC_RE = _phrases_re(VAGUE_DEMOGRAPHIC)
+_ALL_POPULATION_RE = re.compile(r"(?:(?:para|de|en)\s+)?(?:" + "|".join(ALL_POPULATION) + r")")
+
+
+def _age_range(lo: Optional[int], hi: Optional[int]) -> Optional[Dict[str, Any]]:
+    if (lo is not None and not 0 <= lo <= MAX_AGE) or (hi is not None and not 0 <= hi <= MAX_AGE):
+        return None
+    if lo is not None and hi is not None and lo > hi:
+        lo, hi = hi, lo
+    return {"type": "age_range", "min": lo, "max": hi}
+
+
+def _parse_demographic(text: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """(formas normalizadas, es vago) de un filtro demográfico."""
+    text = _with_numbers(fold(text))
+    if _ALL_POPULATION_RE.fullmatch(text):
+        return [{"type": "all"}], False
+
+    normalized: List[Dict[str, Any]] = []
+    # Edad: expresiones numéricas y después grupos con nombre ("mayores de edad" antes que "mayores")
+    age = None
+    for pattern, build in _AGE_RULES:
+        if m := pattern.search(text):
+            age = _age_range(*build(m))
+            # La edad explícita manda sobre el grupo con nombre ("niños de 0 a 12 años")
+            text = _AGE_GROUPS_RE.sub(" ", text[:m.start()] + " " + text[m.end():])
+            break
+    if age is None and (m := _AGE_GROUPS_RE.search(text)):
+        age = _age_range(*AGE_GROUPS[m[0]])
+        text = text[:m.start()] + " " + text[m.end():]
+    vague = age is None and bool(_VAGUE_DEMOGRAPHIC_RE.search(text))
+    text = _VAGUE_DEMOGRAPHIC_RE.sub(" ", text)
+
+    words = set(text.split())
+    for sex, sex_words in SEX_WORDS.items():
+        if words & sex_words:
+            normalized.append({"type": "sex", "value": sex})
+            words -= sex_words
+    if age is not None:
+        normalized.append(age)
+    if words - DEMOGRAPHIC_FILLER:
+        # Queda algo sin reconocer ("mujeres extranjeras"): mejor no normalizar a medias
+        return [], vague
+    return normalized, vague
+
+
+# ==========================================
+# 4. API
+# ==========================================
+@dataclass
+class NormalizedFilter:
+    """Resultado de normalizar un filtro."""
+    raw: str
+    dimension: str  # "temporal" | "spatial" | "demographic"
+    normalized: List[Dict[str, Any]] = field(default_factory=list)  # Vacío si no se reconoce
+    vague: bool = False
+
+    @property
+    def recognized(self) -> bool:
+        return bool(self.normalized)
+
+
+def _raw(f: Any) -> str:
+    return str(f.get("raw") or f.get("value") or "") if isinstance(f, dict) else str(f)
+
+
+def normalize_filter(field_name: str, value: Any, today: Optional[date] = None) -> NormalizedFilter:
+    """
+    Normaliza un filtro del intent.
+
+    Args:
+        field_name: "temporal_filters", "spatial_filters" o "demographic_filters"
+        value: Filtro en texto o ya normalizado ({"raw": ..., "normalized": {...}})
+        today: Fecha de referencia para expresiones relativas ("este año")
+
+    Returns:
+        NormalizedFilter (sin formas normalizadas si ninguna tabla lo reconoce)
+    """
+    dimension = FILTER_FIELDS[field_name]
+    raw = _raw(value)
+    if isinstance(value, dict) and isinstance(value.get("normalized"), dict):
+        return NormalizedFilter(raw, dimension, [value["normalized"]])
+    if isinstance(value, dict) and value.get("operator"):
+        # Forma operador/valor ({"column": "edad", "operator": ">", "value": 50}): ya es utilizable
+        return NormalizedFilter(raw, dimension, [dict(value)])
+
+    vague = False
+    if dimension == "temporal":
+        normalized, vague = _parse_temporal(raw, (today or date.today()).year)
+    elif dimension == "spatial":
+        places, unknown, vague = _parse_places(raw)
+        normalized = [{"type": "place", "places": places}] if places and not unknown and not vague else []
+    else:
+        normalized, vague = _parse_demographic(raw)
+    return NormalizedFilter(raw, dimension, normalized, vague)
+
+
+def normalize_intent(intent: Optional[Dict[str, Any]], today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Añade la forma normalizada a los filtros reconocidos del intent.
+
+    Cada filtro reconocido pasa a {"raw": texto, "normalized": {...}} (uno por restricción:
+    "mujeres mayores de 65" da dos). Los vagos o no reconocidos se quedan como texto.
+    """
+    if not intent:
+        return intent
+    result = dict(intent)
+    for name in FILTER_FIELDS:
+        values = intent.get(name)
+        if not values:
+            continue
+        filters: List[Any] = []
+        for value in values if isinstance(values, list) else [values]:
+            if isinstance(value, dict):
+                filters.append(value)
+                continue
+            nf = normalize_filter(name, value, today)
+            filters.extend([{"raw": nf.raw, "normalized": n} for n in nf.normalized] or [value])
+        result[name] = filters
+    return result
+
+
+def raw_filters(intent: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """El intent con los filtros en su texto original (para los prompts del LLM)."""
+    if not intent:
+        return intent
+    result = dict(intent)
+    for name in FILTER_FIELDS:
+        values = intent.get(name)
+        if isinstance(values, list):
+            result[name] = list(dict.fromkeys(_raw(v) for v in values))
+    return result
+
+
+# Cómo preguntar por cada filtro (vacío o vago)
+MISSING_QUESTIONS = {
+    "temporal_filters": "el periodo (un año o un rango de años)",
+    "spatial_filters": "la zona geográfica (municipio, provincia o comunidad)",
+    "demographic_filters": "el grupo de población (edad, sexo o toda la población)",
+}
+VAGUE_EXAMPLES = {
+    "temporal_filters": "por ejemplo «2024», «2020-2024» o «últimos 5 años»",
+    "spatial_filters": "por ejemplo «Madrid» o «provincia de Sevilla»",
+    "demographic_filters": "por ejemplo «mayores de 65 años» o «entre 18 y 30 años»",
+}
+
+
+def _join(parts: List[str]) -> str:
+    return parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + " y " + parts[-1]
+
+
+def _question(vague: List[Tuple[str, str]], missing: List[str]) -> str:
+    question = ""
+    if vague:
+        question = "¿Podrías concretar " + _join([f"«{raw}» ({VAGUE_EXAMPLES[name]})" for name, raw in vague])
+    if missing:
+        asked = _join([MISSING_QUESTIONS[name] for name in missing])
+        question = f"{question} e indicarme {asked}" if question else f"¿Me indicas {asked}"
+    return question + " de los datos que buscas?" if missing else question + "?"
+
+
+def local_ambiguity(intent: Dict[str, Any], clarification_attempts: int = 0) -> Tuple[bool, Optional[str]]:
+    """
+    Detección de ambigüedades sin LLM (misma lógica adaptativa que detect_ambiguities).
+
+    - Hay valores vagos → se pregunta por ellos (y por los filtros vacíos si toca)
+    - 2/3 filtros con valores claros → no hay ambigüedad
+    - Menos de 2 filtros con valor, todos claros → se pregunta por los vacíos
+    - Hay valores que ninguna tabla reconoce → decide el LLM
+
+    Returns:
+        (decidido, pregunta): si decidido es False hay que consultar al LLM
+    """
+    if clarification_attempts >= 2:
+        return True, None
+
+    empty: List[str] = []
+    vague: List[Tuple[str, str]] = []
+    clear = 0
+    unknown = False
+    for name in FILTER_FIELDS:
+        values = intent.get(name) or []
+        values = values if isinstance(values, list) else [values]
+        if not values:
+            empty.append(name)
+            continue
+        results = [normalize_filter(name, v) for v in values]
+        vague += [(name, r.raw) for r in results if r.vague]
+        if all(r.recognized for r in results):
+            clear += 1
+        elif not any(r.vague for r in results):
+            unknown = True
+
+    filled = len(FILTER_FIELDS) - len(empty)
+    ask_for_empty = clarification_attempts == 0 or filled < 2
+    if vague:
+        return True, _question(list(dict.fromkeys(vague)), empty if ask_for_empty else [])
+    if clear >= 2:
+        return True, None
+    if unknown:
+        return False, None
+    return True, _question([], empty)
@@ -0,0 +1,146 @@
+"""
+Caché de respuestas del LLM.
+
+El LLM se ejecuta con temperature=0.0, así que el mismo prompt con el mismo modelo y
+parámetros produce la misma respuesta. Esta caché se engancha en el punto de extensión
+de LangChain (BaseCache) y sirve para todas las llamadas llm.invoke de los nodos.
+
+Dos niveles:
+- Memoria: LRU con TTL.
+- Disco (opcional): SQLite, compartido entre reinicios y procesos.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+
+# Campos de los mensajes que no forman parte del prompt real (ids, tiempos de Ollama...)
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Quita del prompt serializado los campos que cambian entre llamadas idénticas."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if isinstance(messages, list):
+        for msg in messages:
+            kwargs = msg.get("kwargs") if isinstance(msg, dict) else None
+            if isinstance(kwargs, dict):
+                for field in _VOLATILE_MESSAGE_FIELDS:
+                    kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True, ensure_ascii=False)
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Clave de caché: hash del modelo + parámetros y del prompt normalizado."""
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(_normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Caché de respuestas en dos niveles (LRU en memoria con TTL + SQLite opcional)
+    con contadores de aciertos y fallos.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0, sqlite_path: Optional[str] = None):
+        """
+        Args:
+            max_entries: Máximo de respuestas en memoria (se descartan las menos usadas)
+            ttl: Segundos de validez de cada respuesta (None = sin caducidad)
+            sqlite_path: Fichero SQLite para el nivel en disco (None = solo memoria)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, RETURN_VAL_TYPE]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, value: RETURN_VAL_TYPE):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    value = loads(row[1])
+                    self._remember(key, row[0], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, return_val)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, created_at, value) VALUES (?, ?, ?)",
+                    (key, now, dumps(list(return_val))),
+                )
+                self._db.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,266 @@
+"""
+Instrumentación del grafo por sesión (thread_id).
+
+MetricsCollector es un callback de LangChain que se pasa en config["callbacks"] al
+ejecutar el grafo. Con la metadata que LangGraph añade a cada ejecución (thread_id,
+langgraph_node) registra, por sesión:
+
+- Tiempo de pared y ejecuciones de cada nodo (y del router)
+- Llamadas al LLM, tokens de prompt y de respuesta, aciertos de caché
+- Rondas de aclaración
+
+Los tokens salen de usage_metadata (Ollama los devuelve). Si el modelo no los da, se
+estiman por caracteres. Exportación: texto de Prometheus (GET /metrics del servidor)
+o JSONL (una línea por sesión).
+"""
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+import copy
+import json
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+
+from context_window import estimate_tokens
+from structured_output import CACHE_HIT_EVENT
+
+
+# Sesiones con métricas en memoria (las más antiguas se descartan; los totales se conservan)
+MAX_TRACKED_THREADS = 1000
+
+# Nombre con el que se registra el router (arista condicional desde START)
+ROUTER_NODE = "router"
+
+
+@dataclass
+class NodeMetrics:
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+@dataclass
+class SessionMetrics:
+    nodes: Dict[str, NodeMetrics] = field(default_factory=dict)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hits: int = 0
+    clarification_rounds: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    def record_node(self, node: str, seconds: float):
+        stats = self.nodes.setdefault(node, NodeMetrics())
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def record_llm(self, prompt_tokens: int, completion_tokens: int, cached: bool):
+        self.llm_calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cache_hits += int(cached)
+
+
+class MetricsRegistry:
+    """Métricas por thread_id (LRU de MAX_TRACKED_THREADS sesiones) y totales del proceso."""
+
+    def __init__(self, max_threads: int = MAX_TRACKED_THREADS):
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._threads: "OrderedDict[str, SessionMetrics]" = OrderedDict()
+        self.totals = SessionMetrics()
+
+    def _session(self, thread_id: str) -> SessionMetrics:
+        session = self._threads.get(thread_id)
+        if session is None:
+            session = self._threads[thread_id] = SessionMetrics()
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        self._threads.move_to_end(thread_id)
+        session.updated_at = time.time()
+        return session
+
+    def record_node(self, thread_id: str, node: str, seconds: float):
+        with self._lock:
+            self._session(thread_id).record_node(node, seconds)
+            self.totals.record_node(node, seconds)
+
+    def record_llm(self, thread_id: str, prompt_tokens: int, completion_tokens: int, cached: bool = False):
+        with self._lock:
+            self._session(thread_id).record_llm(prompt_tokens, completion_tokens, cached)
+            self.totals.record_llm(prompt_tokens, completion_tokens, cached)
+
+    def record_clarification(self, thread_id: str):
+        with self._lock:
+            self._session(thread_id).clarification_rounds += 1
+            self.totals.clarification_rounds += 1
+
+    def forget(self, thread_id: str):
+        """Descarta las métricas de una sesión (siguen contando en los totales)."""
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def snapshot(self, thread_id: Optional[str] = None) -> Dict[str, Any]:
+        """Métricas de una sesión, o de todas más los totales si thread_id es None."""
+        with self._lock:
+            if thread_id is not None:
+                session = self._threads.get(thread_id)
+                return asdict(session) if session else {}
+            return {
+                "threads": {tid: asdict(s) for tid, s in self._threads.items()},
+                "totals": asdict(self.totals),
+            }
+
+    def to_prometheus(self) -> str:
+        """Métricas por sesión en formato de texto de Prometheus."""
+        with self._lock:
+            sessions = [(_escape_label(tid), copy.deepcopy(s)) for tid, s in self._threads.items()]
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family("agent_node_seconds_total", "counter", "Tiempo de pared acumulado en cada nodo")
+        for tid, s in sessions:
+            for node, n in s.nodes.items():
+                lines.append(f'agent_node_seconds_total{{thread_id="{tid}",node="{node}"}} {n.seconds:.6f}')
+        family("agent_node_runs_total", "counter", "Ejecuciones de cada nodo")
+        for tid, s in sessions:
+            for node, n in s.nodes.items():
+                lines.append(f'agent_node_runs_total{{thread_id="{tid}",node="{node}"}} {n.calls}')
+        for name, attr, help_text in (
+            ("agent_llm_calls_total", "llm_calls", "Llamadas al LLM"),
+            ("agent_llm_prompt_tokens_total", "prompt_tokens", "Tokens de prompt enviados al LLM"),
+            ("agent_llm_completion_tokens_total", "completion_tokens", "Tokens generados por el LLM"),
+            ("agent_llm_cache_hits_total", "cache_hits", "Llamadas al LLM respondidas desde la caché"),
+            ("agent_clarification_rounds_total", "clarification_rounds", "Rondas de aclaración"),
+        ):
+            family(name, "counter", help_text)
+            for tid, s in sessions:
+                lines.append(f'{name}{{thread_id="{tid}"}} {getattr(s, attr)}')
+        family("agent_tracked_threads", "gauge", "Sesiones con métricas en memoria")
+        lines.append(f"agent_tracked_threads {len(sessions)}")
+        return "\n".join(lines) + "\n"
+
+    def write_jsonl(self, path: str):
+        """Añade una línea por sesión (y una con los totales) a un fichero JSONL."""
+        snap = self.snapshot()
+        now = time.time()
+        with open(path, "a", encoding="utf-8") as f:
+            for thread_id, session in snap["threads"].items():
+                f.write(json.dumps({"ts": now, "thread_id": thread_id, **session}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"ts": now, "thread_id": None, **snap["totals"]}, ensure_ascii=False) + "\n")
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _thread_id(metadata: Optional[Dict[str, Any]]) -> str:
+    return str((metadata or {}).get("thread_id", "unknown"))
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+class MetricsCollector(BaseCallbackHandler):
+    """Callback que alimenta un MetricsRegistry con los eventos del grafo y del LLM."""
+
+    # Se ejecuta en el propio hilo / event loop para no desplazar las marcas de tiempo
+    run_inline = True
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._nodes: Dict[UUID, tuple] = {}  # run_id -> (thread_id, nodo, inicio)
+        self._llm: Dict[UUID, List[Any]] = {}  # run_id -> [thread_id, tokens de prompt, tokens streamed]
+
+    # ---------- Nodos ----------
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None,
+                       **kwargs: Any) -> None:
+        name = kwargs.get("name") or ""
+        node = (metadata or {}).get("langgraph_node")
+        if name.endswith("route_intent"):
+            label = ROUTER_NODE
+        elif node and name == node and "langsmith:hidden" not in (tags or []):
+            label = node
+        else:
+            return
+        with self._lock:
+            self._nodes[run_id] = (_thread_id(metadata), label, time.perf_counter())
+
+    def _end_node(self, run_id: UUID, completed: bool):
+        with self._lock:
+            run = self._nodes.pop(run_id, None)
+        if run is None:
+            return
+        thread_id, node, start = run
+        self.registry.record_node(thread_id, node, time.perf_counter() - start)
+        # ask_clarification termina (sin interrupt) cuando llega la respuesta del usuario
+        if completed and node == "ask_clarification":
+            self.registry.record_clarification(thread_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id, completed=True)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Un interrupt también llega como error: el nodo ha corrido hasta la pausa
+        self._end_node(run_id, completed=False)
+
+    # ---------- LLM ----------
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                            run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        prompt_tokens = sum(estimate_tokens(_message_text(m)) for batch in messages for m in batch)
+        with self._lock:
+            self._llm[run_id] = [_thread_id(metadata), prompt_tokens, 0]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._llm.get(run_id)
+            if run is not None:
+                run[2] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._llm.pop(run_id, None)
+        if run is None:
+            return
+        thread_id, prompt_tokens, streamed = run
+        generation = response.generations[0][0] if response is not None and response.generations else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None) or {}
+        # LangChain marca las respuestas de la caché con total_cost = 0
+        if "total_cost" in usage:
+            self.registry.record_llm(thread_id, 0, 0, cached=True)
+            return
+        completion = estimate_tokens(generation.text) if generation is not None else streamed
+        self.registry.record_llm(thread_id,
+                                 usage.get("input_tokens") or prompt_tokens,
+                                 usage.get("output_tokens") or completion)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # stream_json cierra el stream al completarse el JSON: cuenta como llamada terminada
+        if isinstance(error, GeneratorExit):
+            self.on_llm_end(None, run_id=run_id)
+            return
+        with self._lock:
+            self._llm.pop(run_id, None)
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID,
+                        metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        if name == CACHE_HIT_EVENT:
+            self.registry.record_llm(_thread_id(metadata), 0, 0, cached=True)
+
+
+# Métricas del proceso (REPL y servidor)
+METRICS = MetricsRegistry()
+METRICS_COLLECTOR = MetricsCollector(METRICS)
@@ -0,0 +1,182 @@
+"""
+Caché de resultados de búsqueda y cómputo por intent normalizado.
+
+Si se confirma otra vez la misma búsqueda ("calidad del aire en Madrid 2024"), en la
+misma sesión o en otra, node_search y node_compute devuelven el resultado guardado en
+lugar de repetir búsqueda, ranking y cómputo.
+
+- Clave: forma canónica de user_search_intent_structured (sin tildes ni mayúsculas,
+  listas sin orden ni duplicados) + versión del catálogo; en el cómputo, también los
+  dataset_id de useful_data.
+- LRU acotada por número de entradas.
+- Al recargarse el catálogo (search.catalog.get_catalog_version cambia) se vacía.
+- Los agregados guardan además el tamaño y mtime de las tablas locales: si una tabla
+  cambia, la entrada deja de valer aunque el catálogo no haya cambiado.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import copy
+import hashlib
+import json
+import threading
+
+from compute.engine import resolve_data_file
+from compute.plan import fold_text
+from search.catalog import get_catalog_version
+
+
+# Campos del intent que determinan el resultado (topic y listas de filtros/columnas)
+_LIST_FIELDS = ("temporal_filters", "demographic_filters", "spatial_filters", "required_columns")
+
+
+def _canonical_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return fold_text(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical_value(v) for k, v in sorted(value.items()) if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(v) for v in value]
+    return value
+
+
+def canonical_intent(intent: Optional[Dict[str, Any]]) -> str:
+    """
+    Forma canónica de un intent estructurado (JSON estable).
+
+    "Madrid" y "madrid", o ["2024", "Madrid"] y ["Madrid", "2024"], dan la misma forma.
+    """
+    intent = intent or {}
+    canonical: Dict[str, Any] = {
+        "topic": fold_text(intent.get("topic") or ""),
+        "aggregation_type": fold_text(intent.get("aggregation_type") or ""),
+    }
+    for name in _LIST_FIELDS:
+        values = intent.get(name) or []
+        if isinstance(values, (str, dict)):
+            values = [values]
+        items = {json.dumps(_canonical_value(v), sort_keys=True, ensure_ascii=False) for v in values}
+        items.discard('""')
+        canonical[name] = sorted(items)
+    return json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+
+
+def _dataset_ids(datasets: Sequence[Dict[str, Any]]) -> List[str]:
+    return [str(ds.get("dataset_id")) for ds in datasets]
+
+
+def _data_fingerprint(datasets: Sequence[Dict[str, Any]]) -> List[Tuple[str, int, int]]:
+    # Tamaño y mtime de las tablas locales de los datasets (las que existan)
+    fingerprint = []
+    for ds in datasets:
+        path = resolve_data_file(ds)
+        if path is not None:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            fingerprint.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+
+class ResultCache:
+    """LRU de resultados de node_search (useful_data, schemas) y node_compute (aggregates, query_plan)."""
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries: Máximo de resultados guardados (se descartan los menos usados)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self.hits = {"search": 0, "aggregates": 0}
+        self.misses = {"search": 0, "aggregates": 0}
+        self.invalidations = 0
+
+    def _key(self, kind: str, intent: Optional[Dict[str, Any]], dataset_ids: Sequence[str] = ()) -> str:
+        # Se llama con el lock tomado: si el catálogo ha cambiado, todo lo guardado se descarta
+        version = get_catalog_version()
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+        digest = hashlib.sha256()
+        for part in (kind, str(version), canonical_intent(intent), "\0".join(dataset_ids)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _get(self, key: str) -> Any:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ---------- node_search ----------
+    def get_search(self, intent: Optional[Dict[str, Any]]) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """(useful_data, schemas) guardados para el intent, o None."""
+        with self._lock:
+            entry = self._get(self._key("search", intent))
+            if entry is None:
+                self.misses["search"] += 1
+                return None
+            self.hits["search"] += 1
+            datasets, schemas = entry
+            return list(datasets), list(schemas)
+
+    def put_search(self, intent: Optional[Dict[str, Any]], datasets: Sequence[Dict[str, Any]],
+                   schemas: Sequence[Dict[str, Any]]):
+        """Guarda useful_data junto con sus esquemas (un acierto no vuelve a leer los ejemplos del disco)."""
+        with self._lock:
+            self._put(self._key("search", intent), (list(datasets), list(schemas)))
+
+    # ---------- node_compute ----------
+    def get_aggregates(self, intent: Optional[Dict[str, Any]],
+                       datasets: Sequence[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """(aggregates, query_plan) guardados para el intent y los datasets, o None."""
+        fingerprint = _data_fingerprint(datasets)
+        with self._lock:
+            key = self._key("aggregates", intent, _dataset_ids(datasets))
+            entry = self._get(key)
+            if entry is not None and entry[0] != fingerprint:
+                # Alguna tabla local ha cambiado desde que se calculó
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses["aggregates"] += 1
+                return None
+            self.hits["aggregates"] += 1
+            _, aggregates, query_plan = entry
+            return copy.deepcopy(aggregates), query_plan
+
+    def put_aggregates(self, intent: Optional[Dict[str, Any]], datasets: Sequence[Dict[str, Any]],
+                       aggregates: Dict[str, Any], query_plan: Optional[str]):
+        """Guarda un cómputo completo (los que tienen datasets cancelados o con error no se guardan)."""
+        if any(result.get("status") != "ok" for result in aggregates.values()):
+            return
+        fingerprint = _data_fingerprint(datasets)
+        with self._lock:
+            key = self._key("aggregates", intent, _dataset_ids(datasets))
+            self._put(key, (fingerprint, copy.deepcopy(aggregates), query_plan))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché."""
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+            }
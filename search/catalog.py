@@ -2,35 +2,57 @@
 Funciones de búsqueda, filtrado y selección de datasets.
 Capa de abstracción sobre los catálogos de fuentes (JSON).
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union, Sequence
 import json
+import logging
 import os
+import threading
 from pathlib import Path
 
+import numpy as np
+
+from search.index import CatalogIndex, build_catalog_index, patch_catalog_index, normalize_key
+from search.text_index import BM25Index, PatchedBM25Index
+from search.schema_matcher import SchemaMatcher
+from search.loader import iter_catalog_summaries, load_full_dataset, clear_dataset_cache, SOURCE_KEY
+from search.snapshot import SnapshotIndex, SnapshotOverlay, open_snapshot, patch_snapshot, source_stats
+
+logger = logging.getLogger(__name__)
+
 
 # Ruta al directorio de catálogos
 SOURCES_DIR = Path(__file__).parent / "sources"
 
+# Snapshot binario compilado a partir de los catálogos (compartido vía mmap entre procesos)
+SNAPSHOT_PATH = Path(__file__).parent / ".cache" / "catalog.snapshot"
+# Poner a "0" para cargar siempre los JSON en memoria sin snapshot
+USE_SNAPSHOT = os.environ.get("CATALOG_SNAPSHOT", "1") != "0"
+
+# Número de datasets devueltos por defecto en búsquedas con consulta
+DEFAULT_TOP_K = 10
+
+# Intervalo (segundos) del sondeo de cambios en SOURCES_DIR para la recarga en caliente
+WATCH_INTERVAL = 5.0
+
 def _load_all_catalogs() -> List[Dict[str, Any]]:
-    """Carga dinámicamente todos los catálogos JSON en el directorio sources."""
+    """
+    Carga dinámicamente todos los catálogos JSON en el directorio sources.
+    Los ficheros se leen en streaming y solo se guarda un resumen compacto de cada
+    dataset (sin los ejemplos de columnas, que se cargan bajo demanda).
+    """
     all_datasets = []
     
     # Buscar todos los archivos .json en el directorio sources
     if not SOURCES_DIR.exists():
         return all_datasets
     
-    for json_file in SOURCES_DIR.glob("*.json"):
+    for json_file in sorted(SOURCES_DIR.glob("*.json")):
         try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                datasets = json.load(f)
-                if isinstance(datasets, list):
-                    all_datasets.extend(datasets)
-                else:
-                    # Si es un solo dataset (dict), añádelo como lista
-                    all_datasets.append(datasets)
-        except (json.JSONDecodeError, IOError) as e:
+            # Solo se añaden los datasets si el fichero completo es válido
+            all_datasets.extend(list(iter_catalog_summaries(json_file)))
+        except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
             # Ignorar archivos JSON inválidos o con errores de lectura
-            print(f"Warning: Could not load {json_file.name}: {e}")
+            logger.warning("Could not load %s: %s", json_file.name, e)
             continue
     
     return all_datasets
@@ -38,36 +60,340 @@ def _load_all_catalogs() -> List[Dict[str, Any]]:
 
 # Cache de catálogos (evita releer JSON en cada llamada)
 _CATALOG_CACHE = None
+# Índices sobre la caché (se construyen una sola vez junto con la carga).
+# Se sustituye siempre como una única referencia: las búsquedas en curso conservan
+# el índice que obtuvieron y nunca ven un catálogo a medio construir.
+_CATALOG_INDEX: Optional[Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]] = None
+# Tamaño y mtime de cada fichero fuente en el momento de cargarlo
+_FILE_STATS: Dict[str, Tuple[int, int]] = {}
+# Ficheros que fallaron al recargar (no se reintentan hasta que vuelvan a cambiar)
+_FAILED_STATS: Dict[str, Tuple[int, int]] = {}
+# Versión del catálogo publicado: aumenta con cada carga o recarga (invalida cachés de resultados)
+_CATALOG_VERSION = 0
+# Serializa cargas y recargas (las lecturas no se bloquean)
+_RELOAD_LOCK = threading.RLock()
+# Hilo de sondeo de cambios (recarga en caliente)
+_WATCHER: Optional["CatalogWatcher"] = None
+
+def _open_catalog_index() -> Union[CatalogIndex, SnapshotIndex]:
+    """
+    Abre el catálogo desde el snapshot binario (reconstruyéndolo si los JSON han cambiado)
+    o, si no es posible, carga los JSON en memoria.
+    """
+    if USE_SNAPSHOT:
+        try:
+            snap = open_snapshot(SNAPSHOT_PATH, SOURCES_DIR)
+            _FILE_STATS.clear()
+            _FILE_STATS.update({e["name"]: (e["size"], e["mtime_ns"]) for e in snap.manifest})
+            return snap
+        except OSError as e:
+            # p.ej. directorio de solo lectura: se sigue con la carga en memoria
+            logger.warning("Could not use catalog snapshot: %s", e)
+    # Los stats se toman antes de leer: si un fichero cambia durante la carga se recargará
+    stats = source_stats(SOURCES_DIR)
+    index = build_catalog_index(_load_all_catalogs())
+    _FILE_STATS.clear()
+    _FILE_STATS.update(stats)
+    return index
+
+def get_catalog_index() -> Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]:
+    """
+    Obtiene el índice del catálogo, cargándolo la primera vez.
+    Usa caché para eficiencia.
+    """
+    global _CATALOG_CACHE, _CATALOG_INDEX, _CATALOG_VERSION
+    index = _CATALOG_INDEX
+    if index is None:
+        with _RELOAD_LOCK:
+            if _CATALOG_INDEX is None:
+                _CATALOG_INDEX = _open_catalog_index()
+                _CATALOG_CACHE = _CATALOG_INDEX.datasets
+                _CATALOG_VERSION += 1
+            index = _CATALOG_INDEX
+    return index
 
-def get_all_datasets() -> List[Dict[str, Any]]:
+def get_catalog_version() -> int:
+    """
+    Versión del catálogo publicado (cargándolo si hace falta).
+    Cambia con cada carga o recarga: los resultados calculados con otra versión no valen.
+    """
+    get_catalog_index()
+    return _CATALOG_VERSION
+
+def get_all_datasets() -> Sequence[Dict[str, Any]]:
     """
     Obtiene todos los datasets de todos los catálogos.
     Usa caché para eficiencia.
     """
-    global _CATALOG_CACHE
-    if _CATALOG_CACHE is None:
-        _CATALOG_CACHE = _load_all_catalogs()
-    return _CATALOG_CACHE
+    return get_catalog_index().datasets
+
+def get_text_index(index: Optional[Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]] = None
+                   ) -> Union[BM25Index, PatchedBM25Index]:
+    """
+    Obtiene el índice invertido de texto de un catálogo, construyéndolo la primera vez.
+    
+    Args:
+        index: Índice del catálogo (por defecto el actual)
+        
+    Returns:
+        BM25Index (o PatchedBM25Index tras una recarga) alineado con index.datasets
+    """
+    if index is None:
+        index = get_catalog_index()
+    if index.text_index is None:
+        index.text_index = BM25Index(index.datasets)
+    return index.text_index
+
+def get_schema_matcher(index: Optional[Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]] = None) -> SchemaMatcher:
+    """
+    Obtiene los perfiles de esquema precalculados de un catálogo, construyéndolos la primera vez.
+    
+    Args:
+        index: Índice del catálogo (por defecto el actual)
+        
+    Returns:
+        SchemaMatcher con los términos de columnas de todos los datasets
+    """
+    if index is None:
+        index = get_catalog_index()
+    if index.schema_matcher is None:
+        index.schema_matcher = SchemaMatcher(index.datasets)
+    return index.schema_matcher
+
+def get_column_counts(index: Optional[Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]] = None) -> np.ndarray:
+    """
+    Obtiene el número de columnas de cada dataset de un catálogo (completitud), calculándolo la primera vez.
+    
+    Args:
+        index: Índice del catálogo (por defecto el actual)
+        
+    Returns:
+        Array alineado con index.datasets (en un snapshot, vista sobre el mmap)
+    """
+    if index is None:
+        index = get_catalog_index()
+    if index.column_counts is None:
+        index.column_counts = np.fromiter((len(ds.get("columnas") or []) for ds in index.datasets),
+                                          dtype=np.uint32, count=len(index.datasets))
+    return index.column_counts
+
+def score_catalog_schemas(intent: Optional[Dict[str, Any]],
+                          index: Optional[Union[CatalogIndex, SnapshotIndex, SnapshotOverlay]] = None) -> np.ndarray:
+    """
+    Puntúa con los perfiles de esquema precalculados qué parte del intent cubre cada dataset
+    del catálogo (SchemaMatcher.score), sin volver a tokenizar columnas. Un snapshot se puntúa
+    sobre sus arrays sin decodificar los datasets.
+    
+    Args:
+        intent: user_search_intent_structured
+        index: Índice del catálogo (por defecto el actual)
+        
+    Returns:
+        Array con puntuaciones 0..1 alineado con index.datasets
+    """
+    if index is None:
+        index = get_catalog_index()
+    if isinstance(index, (SnapshotIndex, SnapshotOverlay)):
+        return index.schema_scores(intent)
+    return get_schema_matcher(index).score(index.datasets, intent)
 
 def reload_catalogs():
     """Fuerza recarga de catálogos desde disco (útil para testing)."""
-    global _CATALOG_CACHE
-    _CATALOG_CACHE = None
+    global _CATALOG_CACHE, _CATALOG_INDEX
+    # La versión aumenta al cargar el catálogo de nuevo (get_catalog_index)
+    with _RELOAD_LOCK:
+        _CATALOG_CACHE = None
+        _CATALOG_INDEX = None
+        _FILE_STATS.clear()
+        _FAILED_STATS.clear()
+        clear_dataset_cache()
+
+def _datasets_by_file(index: CatalogIndex) -> Dict[str, List[Dict[str, Any]]]:
+    """Agrupa los datasets del índice por el nombre de su fichero fuente."""
+    by_file: Dict[str, List[Dict[str, Any]]] = {}
+    for ds in index.datasets:
+        by_file.setdefault(Path(ds[SOURCE_KEY][0]).name, []).append(ds)
+    return by_file
+
+def refresh_catalogs() -> bool:
+    """
+    Recarga en caliente solo los ficheros de SOURCES_DIR que han cambiado.
+    
+    Vuelve a parsear los ficheros nuevos o modificados, aplica los cambios sobre una
+    copia de los índices y la publica de forma atómica. El BM25 y los perfiles de esquema
+    se parchean (solo se indexan los datasets nuevos) y un snapshot mapeado no se
+    decodifica: sus datasets cambiados se marcan como eliminados en un SnapshotOverlay.
+    Las búsquedas en curso siguen usando el índice anterior hasta que terminan.
+    
+    Returns:
+        True si se ha publicado un catálogo nuevo
+    """
+    global _CATALOG_CACHE, _CATALOG_INDEX, _CATALOG_VERSION
+    if _CATALOG_INDEX is None:
+        # Nada cargado todavía: la primera búsqueda cargará el estado actual
+        return False
+
+    with _RELOAD_LOCK:
+        current = _CATALOG_INDEX
+        stats = source_stats(SOURCES_DIR)
+        changed = sorted(name for name in stats
+                         if _FILE_STATS.get(name) != stats[name] and _FAILED_STATS.get(name) != stats[name])
+        removed_files = sorted(name for name in _FILE_STATS if name not in stats)
+        if not changed and not removed_files:
+            return False
+
+        on_snapshot = isinstance(current, (SnapshotIndex, SnapshotOverlay))
+        by_file = {} if on_snapshot else _datasets_by_file(current)
 
-# Simula el buscador real de catalogos, en producción solo devolveria los relevantes (ahora todos)
-def search_datasets() -> List[Dict[str, Any]]:
+        patched_files: List[str] = []
+        removed: List[Dict[str, Any]] = []
+        added: List[Dict[str, Any]] = []
+        new_stats = dict(_FILE_STATS)
+        reloaded = 0
+        for name in removed_files:
+            patched_files.append(name)
+            removed.extend(by_file.get(name, []))
+            new_stats.pop(name, None)
+        for name in changed:
+            try:
+                file_datasets = list(iter_catalog_summaries(SOURCES_DIR / name))
+            except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
+                # Puede estar a medio escribir: se conserva la versión anterior y se reintenta
+                logger.warning("Could not reload %s: %s", name, e)
+                _FAILED_STATS[name] = stats[name]
+                continue
+            _FAILED_STATS.pop(name, None)
+            patched_files.append(name)
+            removed.extend(by_file.get(name, []))
+            added.extend(file_datasets)
+            new_stats[name] = stats[name]
+            reloaded += 1
+
+        if new_stats == _FILE_STATS:
+            return False
+
+        # Los índices derivados se parchean antes de publicar para no penalizar la siguiente búsqueda
+        if on_snapshot:
+            new_index = patch_snapshot(current, patched_files, added)
+        else:
+            removed_objects = {id(ds) for ds in removed}
+            positions = [i for i, ds in enumerate(current.datasets) if id(ds) in removed_objects]
+            new_index = patch_catalog_index(current, removed, added)
+            new_index.text_index = get_text_index(current).patch(positions, added)
+            new_index.schema_matcher = get_schema_matcher(current).patch(
+                [ds.get("dataset_id") for ds in removed], added)
+
+        # Publicación atómica (una sola asignación de referencia)
+        _CATALOG_INDEX = new_index
+        _CATALOG_CACHE = new_index.datasets
+        _CATALOG_VERSION += 1
+        _FILE_STATS.clear()
+        _FILE_STATS.update(new_stats)
+        clear_dataset_cache()
+
+    logger.info("🔄 Catálogo recargado: %s fichero(s) modificado(s), %s eliminado(s)", reloaded, len(removed_files))
+    return True
+
+class CatalogWatcher(threading.Thread):
+    """Hilo que sondea SOURCES_DIR y aplica refresh_catalogs() cuando hay cambios."""
+
+    def __init__(self, interval: float = WATCH_INTERVAL):
+        super().__init__(name="catalog-watcher", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                refresh_catalogs()
+            except Exception as e:
+                logger.warning("Catalog refresh failed: %s", e)
+
+    def stop(self):
+        self._stop_event.set()
+
+def start_catalog_watcher(interval: float = WATCH_INTERVAL) -> CatalogWatcher:
+    """
+    Activa la recarga en caliente de catálogos (sondeo periódico de SOURCES_DIR).
+    
+    Args:
+        interval: Segundos entre comprobaciones
+        
+    Returns:
+        El hilo de sondeo (uno por proceso)
+    """
+    global _WATCHER
+    if _WATCHER is None or not _WATCHER.is_alive():
+        _WATCHER = CatalogWatcher(interval)
+        _WATCHER.start()
+    return _WATCHER
+
+def stop_catalog_watcher():
+    """Detiene la recarga en caliente si está activa."""
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+        _WATCHER = None
+
+def intent_to_query(intent: Optional[Dict[str, Any]]) -> str:
+    """
+    Construye el texto de búsqueda a partir del intent estructurado.
+    
+    Args:
+        intent: user_search_intent_structured (topic + required_columns)
+        
+    Returns:
+        Consulta en texto plano (vacía si no hay intent)
+    """
+    if not intent:
+        return ""
+    parts = [str(intent.get("topic") or "")]
+    columns = intent.get("required_columns") or []
+    if isinstance(columns, str):
+        columns = [columns]
+    parts.extend(str(col) for col in columns)
+    return " ".join(p for p in parts if p).strip()
+
+def search_datasets_scored(query: str, top_k: int = DEFAULT_TOP_K) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Busca datasets relevantes para una consulta con ranking BM25.
+    
+    Args:
+        query: Texto de la consulta (topic, columnas, palabras clave)
+        top_k: Número máximo de datasets a devolver
+        
+    Returns:
+        Lista de tuplas (dataset, puntuación) ordenada por relevancia
+    """
+    # Datasets e índice de texto salen del mismo índice (coherentes aunque haya recarga)
+    index = get_catalog_index()
+    datasets = index.datasets
+    return [(datasets[i], score) for i, score in get_text_index(index).top_k(query, top_k)]
+
+def search_datasets(query: Optional[str] = None, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
     """
-    Devuelve todos los datasets disponibles en el catálogo.
-    El LLM será responsable de filtrar y seleccionar los relevantes.
+    Busca datasets en el catálogo.
+    
+    Sin consulta devuelve todos los datasets disponibles (comportamiento original).
+    Con consulta devuelve los top_k más relevantes según el índice invertido (BM25)
+    sobre nombre, descripción, topic y columnas.
     
+    Args:
+        query: Texto de la consulta (opcional)
+        top_k: Número máximo de datasets a devolver (por defecto DEFAULT_TOP_K con consulta)
+        
     Returns:
-        Lista completa de todos los datasets
+        Lista de datasets ordenada por relevancia
     """
-    return get_all_datasets()
+    if not query or not query.strip():
+        datasets = get_all_datasets()
+        return list(datasets[:top_k] if top_k is not None else datasets)
+    k = DEFAULT_TOP_K if top_k is None else top_k
+    return [ds for ds, _ in search_datasets_scored(query, k)]
 
 def get_dataset_by_id(dataset_id: str) -> Optional[Dict[str, Any]]:
     """
-    Obtiene un dataset específico por su ID.
+    Obtiene un dataset específico por su ID (resumen sin ejemplos de columnas).
     
     Args:
         dataset_id: ID del dataset
@@ -75,11 +401,20 @@ def get_dataset_by_id(dataset_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Dataset o None si no existe
     """
-    all_datasets = get_all_datasets()
-    for dataset in all_datasets:
-        if dataset.get("dataset_id") == dataset_id:
-            return dataset
-    return None
+    return get_catalog_index().by_id.get(dataset_id)
+
+def get_full_dataset(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Obtiene un dataset completo por su ID, incluidos los ejemplos de columnas.
+    
+    Args:
+        dataset_id: ID del dataset
+        
+    Returns:
+        Dataset completo o None si no existe
+    """
+    dataset = get_dataset_by_id(dataset_id)
+    return load_full_dataset(dataset) if dataset else None
 
 def get_datasets_by_ids(dataset_ids: List[str]) -> List[Dict[str, Any]]:
     """
@@ -91,25 +426,52 @@ def get_datasets_by_ids(dataset_ids: List[str]) -> List[Dict[str, Any]]:
     Returns:
         Lista de datasets encontrados
     """
+    by_id = get_catalog_index().by_id
     result = []
     for ds_id in dataset_ids:
-        dataset = get_dataset_by_id(ds_id)
+        dataset = by_id.get(ds_id)
         if dataset:
             result.append(dataset)
     return result
 
+def get_datasets_by_topic(topic: str) -> List[Dict[str, Any]]:
+    """
+    Obtiene los datasets de un topic (sin distinguir mayúsculas).
+    
+    Args:
+        topic: Topic a buscar
+        
+    Returns:
+        Lista de datasets con ese topic
+    """
+    return list(get_catalog_index().by_topic.get(normalize_key(topic), []))
+
+def get_datasets_by_column(column_name: str) -> List[Dict[str, Any]]:
+    """
+    Obtiene los datasets que contienen una columna con ese nombre.
+    
+    Args:
+        column_name: Nombre de la columna (sin distinguir mayúsculas)
+        
+    Returns:
+        Lista de datasets que tienen la columna
+    """
+    return list(get_catalog_index().by_column.get(normalize_key(column_name), []))
+
 def extract_schemas(datasets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Extrae solo los schemas de una lista de datasets.
+    Los ejemplos de columnas se cargan de disco bajo demanda.
     
     Args:
-        datasets: Lista de datasets completos
+        datasets: Lista de datasets (completos o resumidos)
         
     Returns:
         Lista de schemas
     """
     schemas = []
     for ds in datasets:
+        ds = load_full_dataset(ds)
         columnas = ds.get("columnas")
         if columnas:
             schema = {
@@ -128,10 +490,4 @@ def get_available_topics() -> List[str]:
     Returns:
         Lista de topics únicos
     """
-    all_datasets = get_all_datasets()
-    topics = set()
-    for ds in all_datasets:
-        topic = ds.get("topic")
-        if topic:
-            topics.add(topic)
-    return sorted(list(topics))
\ No newline at end of file
+    return list(get_catalog_index().topics)
\ No newline at end of file
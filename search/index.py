@@ -0,0 +1,133 @@
+"""
+Índices en memoria sobre el catálogo de datasets.
+Se construyen una sola vez al cargar los catálogos y evitan recorrer la lista completa
+en cada consulta por ID, topic o nombre de columna.
+"""
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+
+def normalize_key(value: Any) -> str:
+    """Normaliza topics y nombres de columna para usarlos como clave de índice."""
+    return str(value).strip().lower() if value is not None else ""
+
+
+@dataclass
+class CatalogIndex:
+    datasets: List[Dict[str, Any]] = field(default_factory=list)  # Lista original (orden de carga)
+    by_id: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # dataset_id -> dataset
+    by_topic: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # topic normalizado -> datasets
+    by_column: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # columna normalizada -> datasets
+    topics: List[str] = field(default_factory=list)  # Topics únicos ordenados (precalculado)
+    topic_counts: Dict[str, int] = field(default_factory=dict)  # Nº de datasets por topic (para parches)
+    text_index: Optional[Any] = None  # Índice BM25 asociado (se construye bajo demanda)
+    schema_matcher: Optional[Any] = None  # Perfiles de esquema asociados (se construyen bajo demanda)
+    column_counts: Optional[Any] = None  # Nº de columnas por dataset (np.ndarray, se calcula bajo demanda)
+
+
+def build_catalog_index(datasets: List[Dict[str, Any]]) -> CatalogIndex:
+    """
+    Construye los índices hash sobre una lista de datasets.
+
+    Args:
+        datasets: Lista de datasets tal y como se cargan de los catálogos
+
+    Returns:
+        CatalogIndex con los índices por ID, topic y columna
+    """
+    index = CatalogIndex(datasets=datasets)
+    for ds in datasets:
+        _add_to_index(index, ds)
+    index.topics = sorted(index.topic_counts)
+    return index
+
+
+def _column_keys(ds: Dict[str, Any]) -> List[str]:
+    # Una columna repetida en el mismo dataset solo lo indexa una vez
+    keys = []
+    for col in ds.get("columnas") or []:
+        col_key = normalize_key(col.get("nombre"))
+        if col_key and col_key not in keys:
+            keys.append(col_key)
+    return keys
+
+
+def _add_to_index(index: CatalogIndex, ds: Dict[str, Any]):
+    ds_id = ds.get("dataset_id")
+    # Si hay IDs repetidos, gana el primero (mismo comportamiento que la búsqueda lineal)
+    if ds_id is not None and ds_id not in index.by_id:
+        index.by_id[ds_id] = ds
+
+    topic = ds.get("topic")
+    if topic:
+        index.topic_counts[topic] = index.topic_counts.get(topic, 0) + 1
+        index.by_topic.setdefault(normalize_key(topic), []).append(ds)
+
+    for col_key in _column_keys(ds):
+        index.by_column.setdefault(col_key, []).append(ds)
+
+
+def patch_catalog_index(index: CatalogIndex,
+                        removed: List[Dict[str, Any]],
+                        added: List[Dict[str, Any]]) -> CatalogIndex:
+    """
+    Crea un índice nuevo aplicando cambios sobre uno existente (copy-on-write).
+    Solo se recalculan las entradas afectadas; el índice original no se modifica,
+    así las búsquedas en curso siguen viendo un catálogo completo y coherente.
+
+    Args:
+        index: Índice actual
+        removed: Datasets que desaparecen (mismos objetos que en el índice)
+        added: Datasets nuevos
+
+    Returns:
+        Nuevo CatalogIndex (sin índice de texto ni perfiles de esquema, que se construyen aparte)
+    """
+    removed_ids = {id(ds) for ds in removed}
+    patched = CatalogIndex(
+        datasets=[ds for ds in index.datasets if id(ds) not in removed_ids],
+        by_id=dict(index.by_id),
+        by_topic=dict(index.by_topic),
+        by_column=dict(index.by_column),
+        topic_counts=dict(index.topic_counts),
+    )
+
+    # Quitar los datasets eliminados solo de las claves que les afectan
+    orphan_ids = set()
+    for ds in removed:
+        ds_id = ds.get("dataset_id")
+        if ds_id is not None and patched.by_id.get(ds_id) is ds:
+            del patched.by_id[ds_id]
+            orphan_ids.add(ds_id)
+        topic = ds.get("topic")
+        if topic:
+            patched.topic_counts[topic] -= 1
+            if not patched.topic_counts[topic]:
+                del patched.topic_counts[topic]
+    for mapping, keys in ((patched.by_topic, {normalize_key(ds.get("topic")) for ds in removed if ds.get("topic")}),
+                          (patched.by_column, {k for ds in removed for k in _column_keys(ds)})):
+        for key in keys:
+            remaining = [d for d in mapping.get(key, []) if id(d) not in removed_ids]
+            if remaining:
+                mapping[key] = remaining
+            else:
+                mapping.pop(key, None)
+
+    # IDs duplicados: si se eliminó el que ganaba, pasa al siguiente que quede
+    if orphan_ids:
+        for ds in patched.datasets:
+            ds_id = ds.get("dataset_id")
+            if ds_id in orphan_ids and ds_id not in patched.by_id:
+                patched.by_id[ds_id] = ds
+
+    # Las listas se copian antes de añadir para no tocar las del índice original
+    for mapping, keys in ((patched.by_topic, {normalize_key(ds.get("topic")) for ds in added if ds.get("topic")}),
+                          (patched.by_column, {k for ds in added for k in _column_keys(ds)})):
+        for key in keys:
+            mapping[key] = list(mapping.get(key, []))
+    patched.datasets.extend(added)
+    for ds in added:
+        _add_to_index(patched, ds)
+
+    patched.topics = sorted(patched.topic_counts)
+    return patched
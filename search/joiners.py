@@ -1,7 +1,18 @@
 """
 Funciones auxiliares para ordenar y limitar resultados de datasets.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
+import heapq
+
+import numpy as np
+
+
+# Pesos por defecto del ranking combinado (relevancia, cobertura de columnas y completitud)
+DEFAULT_WEIGHTS = {
+    "relevance": 0.6,
+    "coverage": 0.3,
+    "completeness": 0.1,
+}
 
 
 def rank_by_completeness(
@@ -19,6 +30,23 @@ def rank_by_completeness(
     return sorted(datasets, key=lambda ds: len(ds.get("columnas", [])), reverse=True)
 
 
+def top_n_by_completeness(
+    datasets: Sequence[Dict[str, Any]],
+    n: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Devuelve los N datasets con más columnas sin ordenar la lista completa (heap).
+    
+    Args:
+        datasets: Lista de datasets
+        n: Número máximo de datasets a devolver
+        
+    Returns:
+        Lista con máximo N elementos, ordenada por número de columnas descendente
+    """
+    return heapq.nlargest(n, datasets, key=lambda ds: len(ds.get("columnas", [])))
+
+
 def get_top_n(
     datasets: List[Dict[str, Any]],
     n: int = 10
@@ -34,3 +62,54 @@ def get_top_n(
         Lista con máximo N elementos
     """
     return datasets[:n]
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    # Escala a 0..1 dividiendo por el máximo (sin efecto si todo es 0)
+    peak = values.max() if values.size else 0.0
+    return values / peak if peak > 0 else values
+
+
+def rank_datasets(
+    datasets: Sequence[Dict[str, Any]],
+    k: int = 10,
+    relevance: Optional[Sequence[float]] = None,
+    coverage: Optional[Sequence[float]] = None,
+    completeness: Optional[Sequence[float]] = None,
+    weights: Optional[Dict[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Ranking combinado: fusiona relevancia, cobertura de columnas requeridas y completitud
+    en un único array de puntuaciones y selecciona los k mejores con argpartition
+    (coste proporcional a k, no al tamaño del catálogo).
+    
+    Args:
+        datasets: Lista de datasets candidatos
+        k: Número máximo de datasets a devolver
+        relevance: Puntuación de relevancia de cada dataset (p.ej. BM25)
+        coverage: Cobertura precalculada de cada dataset (0..1)
+        completeness: Nº de columnas precalculado de cada dataset (si no se da, se cuenta)
+        weights: Pesos de cada criterio (por defecto DEFAULT_WEIGHTS)
+        
+    Returns:
+        Lista con máximo k datasets ordenada por puntuación descendente
+    """
+    n = len(datasets)
+    if n == 0 or k <= 0:
+        return []
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+
+    if completeness is None:
+        completeness = np.fromiter((len(ds.get("columnas") or []) for ds in datasets), dtype=np.float64, count=n)
+    scores = weights["completeness"] * _normalize(np.asarray(completeness, dtype=np.float64))
+    if relevance is not None:
+        scores += weights["relevance"] * _normalize(np.asarray(relevance, dtype=np.float64))
+    if coverage is not None:
+        scores += weights["coverage"] * np.asarray(coverage, dtype=np.float64)
+
+    top = np.arange(n)
+    if n > k:
+        top = np.argpartition(scores, -k)[-k:]
+    # Orden final solo de los k seleccionados (empates por orden de entrada)
+    top = top[np.lexsort((top, -scores[top]))]
+    return [datasets[i] for i in top]
@@ -0,0 +1,173 @@
+"""
+Carga incremental (streaming) de catálogos JSON.
+Recorre cada fichero elemento a elemento sin cargarlo entero en memoria y guarda solo
+un resumen compacto de cada dataset; los ejemplos de columnas se leen bajo demanda
+usando el desplazamiento en bytes del dataset dentro de su fichero.
+"""
+from typing import Iterator, Tuple, Dict, Any
+from functools import lru_cache
+from pathlib import Path
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Tamaño de bloque de lectura (caracteres)
+CHUNK_SIZE = 1 << 20
+
+# Clave interna con la referencia al dataset completo en disco
+SOURCE_KEY = "_source"
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_catalog_file(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+    """
+    Recorre un catálogo JSON (lista de datasets o un único dataset) de forma incremental.
+
+    Args:
+        path: Ruta del fichero JSON
+        chunk_size: Caracteres leídos en cada bloque
+
+    Yields:
+        Tuplas (offset en bytes, longitud en bytes, dataset)
+
+    Raises:
+        json.JSONDecodeError: Si el fichero no es un catálogo JSON válido
+    """
+    decoder = json.JSONDecoder()
+    # newline="" evita traducir \r\n, así los desplazamientos en bytes son exactos
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        buf = f.read(chunk_size)
+        eof = not buf
+        pos = 0
+        # Posición de buf[mark] en bytes dentro del fichero (se avanza por segmentos)
+        mark = 0
+        mark_bytes = 0
+
+        def byte_offset(index: int) -> int:
+            nonlocal mark, mark_bytes
+            mark_bytes += len(buf[mark:index].encode("utf-8"))
+            mark = index
+            return mark_bytes
+
+        def read_more() -> bool:
+            # Descarta lo ya consumido y añade otro bloque al buffer
+            nonlocal buf, pos, mark, eof
+            byte_offset(pos)
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            mark = 0
+            return True
+
+        def skip(chars: str) -> bool:
+            # Avanza sobre los caracteres indicados; False si se llega al final del fichero
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf):
+                    return True
+                if eof or not read_more():
+                    return False
+
+        if not skip(_WHITESPACE):
+            return
+
+        # Un único dataset (dict) en lugar de una lista
+        if buf[pos] == "{":
+            while not eof:
+                read_more()
+            start = byte_offset(pos)
+            obj, end = decoder.raw_decode(buf, pos)
+            yield start, byte_offset(end) - start, obj
+            return
+
+        if buf[pos] != "[":
+            raise json.JSONDecodeError("Se esperaba una lista de datasets", buf, pos)
+        pos += 1
+
+        while skip(_WHITESPACE + ","):
+            if buf[pos] == "]":
+                return
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError:
+                    # Elemento cortado al final del bloque: leer más y reintentar
+                    if eof or not read_more():
+                        raise
+            start = byte_offset(pos)
+            length = byte_offset(end) - start
+            pos = end
+            if isinstance(obj, dict):
+                yield start, length, obj
+
+        raise json.JSONDecodeError("Lista de datasets sin cerrar", buf, pos)
+
+
+def summarize_dataset(ds: Dict[str, Any], source: Path, offset: int, length: int) -> Dict[str, Any]:
+    """
+    Resume un dataset quitando los ejemplos de las columnas.
+
+    Args:
+        ds: Dataset completo
+        source: Fichero del que procede
+        offset: Desplazamiento en bytes del dataset en el fichero
+        length: Longitud en bytes del dataset en el fichero
+
+    Returns:
+        Dataset compacto con referencia para cargar el original bajo demanda
+    """
+    summary = {k: v for k, v in ds.items() if k != "columnas"}
+    summary["columnas"] = [
+        {k: v for k, v in col.items() if k != "ejemplo"}
+        for col in ds.get("columnas") or []
+    ]
+    summary[SOURCE_KEY] = (str(source), offset, length)
+    return summary
+
+
+def iter_catalog_summaries(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Genera los resúmenes compactos de todos los datasets de un fichero."""
+    for offset, length, ds in iter_catalog_file(path, chunk_size):
+        yield summarize_dataset(ds, path, offset, length)
+
+
+@lru_cache(maxsize=256)
+def _read_dataset(source: str, offset: int, length: int) -> Dict[str, Any]:
+    with open(source, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length).decode("utf-8"))
+
+
+def load_full_dataset(ds: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Devuelve el dataset completo (con ejemplos) a partir de su resumen.
+
+    Args:
+        ds: Dataset resumido (o completo)
+
+    Returns:
+        Dataset completo; si no es un resumen se devuelve tal cual
+    """
+    ref = ds.get(SOURCE_KEY)
+    if not ref:
+        return ds
+    try:
+        return _read_dataset(*ref)
+    except (OSError, ValueError) as e:
+        # El fichero ha cambiado o desaparecido (recarga en curso): se usa el resumen
+        logger.warning("Could not load full dataset %s: %s", ds.get('dataset_id'), e)
+        return ds
+
+
+def clear_dataset_cache():
+    """Vacía la caché de datasets completos leídos de disco."""
+    _read_dataset.cache_clear()
@@ -0,0 +1,248 @@
+"""
+Emparejamiento entre el intent estructurado y los esquemas del catálogo.
+Precalcula los términos normalizados de nombres y descripciones de columnas de cada
+dataset y puntúa cuántas columnas requeridas y dimensiones de filtro (espacial,
+temporal, demográfica) puede satisfacer, para descartar datasets inservibles antes
+de que lleguen a useful_data.
+"""
+from dataclasses import dataclass
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Set, FrozenSet, Tuple
+
+import numpy as np
+
+from search.text_index import tokenize
+
+
+# Vocabulario que identifica columnas de cada dimensión de filtro (español e inglés)
+DIMENSION_VOCABULARY = {
+    "temporal": [
+        "fecha", "date", "timestamp", "time", "hora", "año", "anio", "year", "mes", "month",
+        "dia", "day", "periodo", "period", "trimestre", "quarter", "semana", "week",
+    ],
+    "spatial": [
+        "region", "provincia", "province", "ciudad", "city", "municipio", "municipality",
+        "pais", "country", "comunidad", "location", "ubicacion", "localizacion", "lat",
+        "latitud", "latitude", "lon", "longitud", "longitude", "station", "estacion",
+        "codigo postal", "postal", "zona", "area", "distrito", "district", "address",
+    ],
+    "demographic": [
+        "edad", "age", "etario", "genero", "gender", "sexo", "sex", "nacionalidad",
+        "nationality", "poblacion", "population", "renta", "income", "estudios", "education",
+    ],
+}
+
+# Orden fijo de las dimensiones (máscara de bits de los perfiles en el snapshot)
+DIMENSIONS = tuple(DIMENSION_VOCABULARY)
+
+# Sinónimos de nombres de columna: una columna requerida se satisface con cualquier término
+# de su grupo ("fecha" con "timestamp"), nunca con otra columna de la misma dimensión
+COLUMN_SYNONYMS = [
+    ["fecha", "date", "timestamp", "datetime", "time", "hora", "dia", "day"],
+    ["año", "anio", "year", "ejercicio"],
+    ["mes", "month"],
+    ["trimestre", "quarter"],
+    ["semana", "week"],
+    ["periodo", "period"],
+    ["edad", "age", "etario"],
+    ["sexo", "sex", "genero", "gender"],
+    ["nacionalidad", "nationality"],
+    ["poblacion", "population", "habitantes"],
+    ["renta", "income", "ingresos"],
+    ["estudios", "education"],
+    ["provincia", "province"],
+    ["ciudad", "city", "municipio", "municipality", "localidad"],
+    ["pais", "country"],
+    ["comunidad", "region"],
+    ["ubicacion", "location", "localizacion", "address", "direccion"],
+    ["estacion", "station"],
+    ["distrito", "district"],
+    ["latitud", "latitude", "lat"],
+    ["longitud", "longitude", "lon"],
+    ["codigo postal", "postal", "zip"],
+]
+
+# Filtro del intent -> dimensión que exige
+FILTER_DIMENSIONS = {
+    "temporal_filters": "temporal",
+    "spatial_filters": "spatial",
+    "demographic_filters": "demographic",
+}
+
+# Puntuación mínima para que un dataset se considere utilizable
+MIN_MATCH_SCORE = 0.5
+
+_DIMENSION_TERMS = {
+    dim: frozenset(t for word in words for t in tokenize(word))
+    for dim, words in DIMENSION_VOCABULARY.items()
+}
+
+
+_SYNONYMS: Dict[str, FrozenSet[str]] = {}
+for _group in COLUMN_SYNONYMS:
+    _terms = frozenset(t for word in _group for t in tokenize(word))
+    for _term in _terms:
+        _SYNONYMS[_term] = _SYNONYMS.get(_term, frozenset()) | _terms
+
+
+def _with_synonyms(terms: Set[str]) -> FrozenSet[str]:
+    return frozenset(terms).union(*(_SYNONYMS.get(t, ()) for t in terms))
+
+
+def _dimensions_of(terms: Set[str]) -> FrozenSet[str]:
+    return frozenset(dim for dim, vocab in _DIMENSION_TERMS.items() if terms & vocab)
+
+
+@dataclass(frozen=True)
+class SchemaProfile:
+    column_terms: FrozenSet[str]  # Términos de nombres y descripciones de columnas
+    dimensions: FrozenSet[str]  # Dimensiones de filtro que el dataset puede satisfacer
+
+
+def build_schema_profile(ds: Dict[str, Any]) -> SchemaProfile:
+    """Precalcula los términos normalizados y las dimensiones de un dataset."""
+    terms: Set[str] = set()
+    dimensions: Set[str] = set()
+    for col in ds.get("columnas") or []:
+        # Las dimensiones se deducen de cada columna (nombre + descripción) por separado
+        col_terms = set(tokenize(col.get("nombre"))) | set(tokenize(col.get("descripcion")))
+        terms |= col_terms
+        dimensions |= _dimensions_of(col_terms)
+    return SchemaProfile(frozenset(terms), frozenset(dimensions))
+
+
+def _as_list(value: Any) -> List[Any]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def intent_requirements(intent: Optional[Dict[str, Any]]) -> Tuple[List[FrozenSet[str]], List[str]]:
+    """
+    Lo que el intent pide a un esquema.
+
+    Returns:
+        (términos de cada columna requerida con sus sinónimos, dimensiones de filtro con valor)
+    """
+    intent = intent or {}
+    required = [set(tokenize(col)) for col in _as_list(intent.get("required_columns"))]
+    required = [_with_synonyms(terms) for terms in required if terms]
+    wanted_dims = [dim for key, dim in FILTER_DIMENSIONS.items() if _as_list(intent.get(key))]
+    return required, wanted_dims
+
+
+class _PatchedProfiles(Mapping):
+    """Perfiles de un catálogo base con ids ocultos (eliminados) y perfiles nuevos encima."""
+    def __init__(self, base: Mapping[Any, SchemaProfile], hidden: FrozenSet[Any], overrides: Dict[Any, SchemaProfile]):
+        self.base = base
+        self.hidden = hidden
+        self.overrides = overrides
+
+    def __getitem__(self, ds_id: Any) -> SchemaProfile:
+        if ds_id in self.overrides:
+            return self.overrides[ds_id]
+        if ds_id in self.hidden:
+            raise KeyError(ds_id)
+        return self.base[ds_id]
+
+    def __iter__(self):
+        for ds_id in self.base:
+            if ds_id not in self.hidden and ds_id not in self.overrides:
+                yield ds_id
+        yield from self.overrides
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SchemaMatcher:
+    """Perfiles de esquema precalculados para todo el catálogo (por dataset_id)."""
+
+    def __init__(self, datasets: Sequence[Dict[str, Any]] = (), profiles: Optional[Mapping[Any, SchemaProfile]] = None):
+        """
+        Args:
+            datasets: Datasets cuyos perfiles se calculan (gana el primero con cada dataset_id)
+            profiles: Perfiles ya calculados (p. ej. los del snapshot); si se dan, datasets se ignora
+        """
+        self.profiles: Mapping[Any, SchemaProfile] = profiles if profiles is not None else {}
+        if profiles is not None:
+            return
+        for ds in datasets:
+            ds_id = ds.get("dataset_id")
+            if ds_id is not None and ds_id not in self.profiles:
+                self.profiles[ds_id] = build_schema_profile(ds)
+
+    def patch(self, removed_ids: Sequence[Any], added: Sequence[Dict[str, Any]]) -> "SchemaMatcher":
+        """
+        Perfiles tras una recarga en caliente sin recalcular (ni decodificar) los que no cambian.
+
+        Args:
+            removed_ids: dataset_id de los datasets que desaparecen
+            added: Datasets nuevos (solo se calculan sus perfiles)
+
+        Returns:
+            Nuevo SchemaMatcher (este no se modifica)
+        """
+        base, hidden, overrides = self.profiles, set(), {}
+        if isinstance(base, _PatchedProfiles):
+            base, hidden, overrides = base.base, set(base.hidden), dict(base.overrides)
+        for ds_id in removed_ids:
+            # Si el id sigue en otro dataset, su perfil se calcula al vuelo en profile()
+            hidden.add(ds_id)
+            overrides.pop(ds_id, None)
+        for ds in added:
+            ds_id = ds.get("dataset_id")
+            # Gana el primero con cada dataset_id: los que siguen en el base tienen prioridad
+            if ds_id is None or ds_id in overrides or (ds_id in base and ds_id not in hidden):
+                continue
+            overrides[ds_id] = build_schema_profile(ds)
+        return SchemaMatcher(profiles=_PatchedProfiles(base, frozenset(hidden), overrides))
+
+    def profile(self, ds: Dict[str, Any]) -> SchemaProfile:
+        """Perfil de un dataset (se calcula al vuelo si no estaba en el catálogo)."""
+        cached = self.profiles.get(ds.get("dataset_id"))
+        return cached if cached is not None else build_schema_profile(ds)
+
+    def score(self, datasets: Sequence[Dict[str, Any]], intent: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        Puntúa qué fracción de lo pedido en el intent puede satisfacer cada dataset.
+
+        Cuenta las columnas requeridas (por término o sinónimo, p.ej. "fecha" se satisface
+        con una columna "timestamp", pero "edad" no con "gender") y las dimensiones de
+        filtro con valor (cualquier columna de la dimensión sirve para filtrar).
+
+        Args:
+            datasets: Datasets candidatos
+            intent: user_search_intent_structured
+
+        Returns:
+            Array con puntuaciones 0..1 (1 si el intent no pide nada)
+        """
+        required, wanted_dims = intent_requirements(intent)
+        total = len(required) + len(wanted_dims)
+        scores = np.ones(len(datasets), dtype=np.float64)
+        if total == 0:
+            return scores
+        for i, ds in enumerate(datasets):
+            profile = self.profile(ds)
+            satisfied = sum(1 for terms in required if terms & profile.column_terms)
+            satisfied += sum(1 for dim in wanted_dims if dim in profile.dimensions)
+            scores[i] = satisfied / total
+        return scores
+
+    def prune(self,
+              datasets: Sequence[Dict[str, Any]],
+              intent: Optional[Dict[str, Any]],
+              min_score: float = MIN_MATCH_SCORE) -> List[Tuple[int, float]]:
+        """
+        Descarta los datasets que no cubren lo suficiente del intent.
+
+        Args:
+            datasets: Datasets candidatos
+            intent: user_search_intent_structured
+            min_score: Puntuación mínima para conservar un dataset
+
+        Returns:
+            Lista de tuplas (posición en datasets, puntuación) de los que se conservan
+        """
+        scores = self.score(datasets, intent)
+        return [(int(i), float(scores[i])) for i in np.flatnonzero(scores >= min_score)]
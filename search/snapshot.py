@@ -0,0 +1,777 @@
+"""
+Snapshot binario del catálogo con acceso mediante mmap.
+
+Compila search/sources/*.json en un único fichero con tabla de strings, tabla de
+datasets (con su desplazamiento en el JSON original), tabla de columnas e índices
+precalculados por ID, topic y columna. También guarda los arrays CSR del índice
+BM25 y los perfiles de esquema, que se leen con np.frombuffer directamente del
+mmap. Al abrirlo con mmap varios procesos comparten las mismas páginas sin copiar,
+volver a parsear los JSON ni reconstruir el BM25.
+
+El snapshot guarda un manifiesto de los ficheros fuente (tamaño, mtime y hash):
+si alguno cambia se reconstruye automáticamente.
+
+Uso como paso de build:
+    python -m search.snapshot
+"""
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from collections.abc import Mapping, Sequence
+from bisect import bisect_left
+from pathlib import Path
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from search.index import build_catalog_index, normalize_key
+from search.loader import iter_catalog_summaries, SOURCE_KEY
+from search.schema_matcher import DIMENSIONS, SchemaMatcher, SchemaProfile, build_schema_profile, intent_requirements
+from search.text_index import BM25Index, TEXT_INDEX_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"CATSNAP1"
+FORMAT_VERSION = 3
+
+# Índice de string "ausente" (la clave no existe en el dataset)
+NONE = 0xFFFFFFFF
+
+# Cabecera: magic, versión, nº de secciones y tabla (offset, tamaño) de cada sección
+_HEADER = struct.Struct("<8sII")
+_SECTION = struct.Struct("<QQ")
+# Dataset: id, nombre, topic, descripcion, extra, fichero, offset, longitud, 1ª columna, nº columnas
+_DATASET = struct.Struct("<IIIIIIQQII")
+# Columna: nombre, descripcion, extra
+_COLUMN = struct.Struct("<III")
+# Entrada de índice invertido: clave, inicio en postings, nº de postings
+_KEY_ENTRY = struct.Struct("<III")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+# Parámetros del BM25: k1, b y versión del tokenizador
+_BM25_PARAMS = struct.Struct("<ddI")
+
+(SEC_MANIFEST, SEC_STR_OFFSETS, SEC_STR_DATA, SEC_DATASETS, SEC_COLUMNS, SEC_ID_INDEX,
+ SEC_TOPIC_KEYS, SEC_TOPIC_POSTINGS, SEC_COLUMN_KEYS, SEC_COLUMN_POSTINGS, SEC_TOPICS,
+ # BM25 (CSR, términos en orden de bytes) y perfiles de esquema (CSR de ids de término por ordinal)
+ SEC_BM25_PARAMS, SEC_BM25_TERMS, SEC_BM25_INDPTR, SEC_BM25_DOC_IDS, SEC_BM25_TFS, SEC_BM25_IDF,
+ SEC_BM25_DOC_LENGTHS, SEC_BM25_LENGTH_NORM, SEC_PROFILE_INDPTR, SEC_PROFILE_TERMS, SEC_PROFILE_DIMS) = range(22)
+_NUM_SECTIONS = 22
+
+_STANDARD_KEYS = ("dataset_id", "nombre", "topic", "descripcion")
+_STANDARD_COLUMN_KEYS = ("nombre", "descripcion")
+
+
+# ==========================================
+# 1. MANIFIESTO DE FICHEROS FUENTE
+# ==========================================
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_files(sources_dir: Path) -> List[Path]:
+    return sorted(sources_dir.glob("*.json")) if sources_dir.exists() else []
+
+
+def source_stats(sources_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """Tamaño y mtime (ns) de cada fichero fuente."""
+    stats = {}
+    for path in _source_files(sources_dir):
+        st = path.stat()
+        stats[path.name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+def is_snapshot_current(manifest: List[Dict[str, Any]], sources_dir: Path) -> bool:
+    """
+    Comprueba si el manifiesto de un snapshot coincide con los ficheros fuente.
+    Si solo cambia el mtime (p.ej. un checkout) se compara el hash del contenido.
+    """
+    stats = source_stats(sources_dir)
+    if set(stats) != {entry["name"] for entry in manifest}:
+        return False
+    for entry in manifest:
+        size, mtime_ns = stats[entry["name"]]
+        if size != entry["size"]:
+            return False
+        if mtime_ns != entry["mtime_ns"] and _file_hash(sources_dir / entry["name"]) != entry["sha256"]:
+            return False
+    return True
+
+
+# ==========================================
+# 2. CONSTRUCCIÓN DEL SNAPSHOT
+# ==========================================
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.strings)
+            self.strings.append(value.encode("utf-8"))
+        return idx
+
+    def add_extra(self, obj: Dict[str, Any], standard_keys: Tuple[str, ...]) -> int:
+        # Claves no estándar (o con valores no string) se guardan como JSON
+        extra = {k: v for k, v in obj.items()
+                 if k not in standard_keys or not isinstance(v, str)}
+        return self.add(json.dumps(extra, ensure_ascii=False)) if extra else NONE
+
+
+def _pack_inverted(keys_to_ordinals: Dict[str, List[int]], strings: _StringTable) -> Tuple[bytes, bytes]:
+    """Serializa un índice clave -> ordinales (claves ordenadas por bytes)."""
+    entries = sorted(keys_to_ordinals.items(), key=lambda item: item[0].encode("utf-8"))
+    keys = bytearray()
+    postings = bytearray()
+    start = 0
+    for key, ordinals in entries:
+        keys += _KEY_ENTRY.pack(strings.add(key), start, len(ordinals))
+        for ordinal in ordinals:
+            postings += _U32.pack(ordinal)
+        start += len(ordinals)
+    return bytes(keys), bytes(postings)
+
+
+def build_snapshot(sources_dir: Path, snapshot_path: Path) -> Path:
+    """
+    Compila los catálogos JSON de un directorio en un snapshot binario.
+
+    Args:
+        sources_dir: Directorio con los catálogos *.json
+        snapshot_path: Ruta del snapshot a generar
+
+    Returns:
+        Ruta del snapshot generado
+    """
+    manifest = []
+    summaries: List[Dict[str, Any]] = []
+    for path in _source_files(sources_dir):
+        st = path.stat()
+        try:
+            file_summaries = list(iter_catalog_summaries(path))
+        except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
+            # Mismo criterio que la carga en memoria: el fichero se ignora
+            logger.warning("Could not load %s: %s", path.name, e)
+            file_summaries = []
+        summaries.extend(file_summaries)
+        # Los datasets de cada fichero son ordinales consecutivos (recarga en caliente por fichero)
+        manifest.append({"name": path.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                         "sha256": _file_hash(path), "datasets": len(file_summaries)})
+
+    index = build_catalog_index(summaries)
+    strings = _StringTable()
+    ordinal_of = {id(ds): i for i, ds in enumerate(summaries)}
+
+    datasets = bytearray()
+    columns = bytearray()
+    column_count = 0
+    for ds in summaries:
+        source, offset, length = ds[SOURCE_KEY]
+        cols = ds.get("columnas") or []
+        fields = [strings.add(ds[k]) if isinstance(ds.get(k), str) else NONE for k in _STANDARD_KEYS]
+        meta = {k: v for k, v in ds.items() if k not in ("columnas", SOURCE_KEY)}
+        datasets += _DATASET.pack(*fields, strings.add_extra(meta, _STANDARD_KEYS),
+                                  strings.add(Path(source).name), offset, length, column_count, len(cols))
+        for col in cols:
+            col_fields = [strings.add(col[k]) if isinstance(col.get(k), str) else NONE
+                          for k in _STANDARD_COLUMN_KEYS]
+            columns += _COLUMN.pack(*col_fields, strings.add_extra(col, _STANDARD_COLUMN_KEYS))
+        column_count += len(cols)
+
+    # Índice por ID: ordinales ordenados por ID (y por orden de carga ante duplicados)
+    with_id = [i for i, ds in enumerate(summaries) if isinstance(ds.get("dataset_id"), str)]
+    with_id.sort(key=lambda i: (summaries[i]["dataset_id"].encode("utf-8"), i))
+    id_index = b"".join(_U32.pack(i) for i in with_id)
+
+    topic_keys, topic_postings = _pack_inverted(
+        {k: [ordinal_of[id(ds)] for ds in v] for k, v in index.by_topic.items()}, strings)
+    column_keys, column_postings = _pack_inverted(
+        {k: [ordinal_of[id(ds)] for ds in v] for k, v in index.by_column.items()}, strings)
+    topics = b"".join(_U32.pack(strings.add(t)) for t in index.topics)
+
+    # Índice BM25 y perfiles de esquema: al abrir el snapshot se mapean, no se reconstruyen
+    text_index = BM25Index(summaries).sorted_by_term()
+    bm25_terms = b"".join(_U32.pack(strings.add(t)) for t in text_index.vocab)
+    profile_indptr = np.zeros(len(summaries) + 1, dtype=np.int64)
+    profile_terms: List[int] = []
+    profile_dims = np.zeros(len(summaries), dtype=np.uint8)
+    for i, ds in enumerate(summaries):
+        profile = build_schema_profile(ds)
+        profile_terms.extend(sorted(text_index.vocab[t] for t in profile.column_terms))
+        profile_indptr[i + 1] = len(profile_terms)
+        profile_dims[i] = sum(1 << bit for bit, dim in enumerate(DIMENSIONS) if dim in profile.dimensions)
+
+    str_offsets = bytearray(_U64.pack(0))
+    str_data = bytearray()
+    for raw in strings.strings:
+        str_data += raw
+        str_offsets += _U64.pack(len(str_data))
+
+    sections = [
+        json.dumps(manifest).encode("utf-8"), bytes(str_offsets), bytes(str_data),
+        bytes(datasets), bytes(columns), id_index,
+        topic_keys, topic_postings, column_keys, column_postings, topics,
+        _BM25_PARAMS.pack(text_index.k1, text_index.b, TEXT_INDEX_VERSION), bm25_terms,
+        text_index.indptr.astype(np.int64).tobytes(), text_index.doc_ids.astype(np.int64).tobytes(),
+        text_index.tfs.astype(np.float64).tobytes(), text_index.idf.astype(np.float64).tobytes(),
+        text_index.doc_lengths.astype(np.float64).tobytes(), text_index.length_norm.astype(np.float64).tobytes(),
+        profile_indptr.tobytes(), np.asarray(profile_terms, dtype=np.uint32).tobytes(), profile_dims.tobytes(),
+    ]
+
+    # Escritura atómica: los procesos con el snapshot anterior mapeado no se ven afectados
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=snapshot_path.parent, prefix=".catalog-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _NUM_SECTIONS))
+            position = _HEADER.size + _SECTION.size * _NUM_SECTIONS
+            for data in sections:
+                # Secciones alineadas a 8 bytes
+                position += -position % 8
+                f.write(_SECTION.pack(position, len(data)))
+                position += len(data)
+            for data in sections:
+                f.write(b"\0" * (-f.tell() % 8))
+                f.write(data)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, snapshot_path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return snapshot_path
+
+
+# ==========================================
+# 3. LECTURA (MMAP)
+# ==========================================
+
+class SnapshotIndex:
+    """
+    Catálogo respaldado por un snapshot mapeado en memoria.
+    Expone la misma interfaz que CatalogIndex (datasets, by_id, by_topic, by_column,
+    topics, text_index, schema_matcher, column_counts) pero los datasets se decodifican
+    bajo demanda y los arrays del BM25 son vistas de solo lectura sobre el mmap.
+    """
+
+    def __init__(self, snapshot_path: Path, sources_dir: Path):
+        self.path = snapshot_path
+        self.sources_dir = sources_dir
+        with open(snapshot_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_sections = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or num_sections != _NUM_SECTIONS:
+            self._mm.close()
+            raise ValueError(f"Snapshot incompatible: {snapshot_path}")
+        self._sections = [
+            _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size) for i in range(num_sections)
+        ]
+        self.manifest = json.loads(self._section(SEC_MANIFEST).decode("utf-8"))
+        self.num_datasets = self._sections[SEC_DATASETS][1] // _DATASET.size
+        self.file_ranges: Dict[str, Tuple[int, int]] = {}
+        start = 0
+        for entry in self.manifest:
+            self.file_ranges[entry["name"]] = (start, start + entry["datasets"])
+            start += entry["datasets"]
+
+        self.datasets = _DatasetSequence(self)
+        self.by_id = _IdMapping(self)
+        self.by_topic = _InvertedMapping(self, SEC_TOPIC_KEYS, SEC_TOPIC_POSTINGS)
+        self.by_column = _InvertedMapping(self, SEC_COLUMN_KEYS, SEC_COLUMN_POSTINGS)
+        k1, b, text_version = _BM25_PARAMS.unpack_from(self._mm, self._sections[SEC_BM25_PARAMS][0])
+        if text_version != TEXT_INDEX_VERSION:
+            self._mm.close()
+            raise ValueError(f"Snapshot con otro tokenizador: {snapshot_path}")
+        self.text_index = BM25Index.from_arrays(
+            _TermMapping(self), self._array(SEC_BM25_INDPTR, np.int64), self._array(SEC_BM25_DOC_IDS, np.int64),
+            self._array(SEC_BM25_TFS, np.float64), self._array(SEC_BM25_IDF, np.float64),
+            self._array(SEC_BM25_DOC_LENGTHS, np.float64), self._array(SEC_BM25_LENGTH_NORM, np.float64), k1, b,
+        )
+        self.schema_matcher = SchemaMatcher(profiles=_ProfileMapping(self))
+        # Nº de columnas de cada dataset: vista con paso _DATASET.size sobre la tabla de datasets
+        self.column_counts = np.zeros(0, dtype=np.uint32) if not self.num_datasets else np.ndarray(
+            (self.num_datasets,), dtype="<u4", buffer=self._mm, strides=(_DATASET.size,),
+            offset=self._sections[SEC_DATASETS][0] + _DATASET.size - _U32.size)
+        topics_offset, topics_size = self._sections[SEC_TOPICS]
+        self.topics = [self.string(_U32.unpack_from(self._mm, topics_offset + i)[0])
+                       for i in range(0, topics_size, _U32.size)]
+
+    def _section(self, sec: int) -> bytes:
+        offset, size = self._sections[sec]
+        return self._mm[offset:offset + size]
+
+    def _array(self, sec: int, dtype: Any) -> np.ndarray:
+        # Vista de solo lectura sobre el mmap (sin copia)
+        offset, size = self._sections[sec]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mm, dtype=dtype, count=size // dtype.itemsize, offset=offset)
+
+    def _u32(self, sec: int, i: int) -> int:
+        return _U32.unpack_from(self._mm, self._sections[sec][0] + i * _U32.size)[0]
+
+    def string_bytes(self, idx: int) -> bytes:
+        base = self._sections[SEC_STR_OFFSETS][0] + idx * _U64.size
+        start, end = struct.unpack_from("<QQ", self._mm, base)
+        data_offset = self._sections[SEC_STR_DATA][0]
+        return self._mm[data_offset + start:data_offset + end]
+
+    def string(self, idx: int) -> Optional[str]:
+        return None if idx == NONE else self.string_bytes(idx).decode("utf-8")
+
+    def _record(self, standard_keys: Tuple[str, ...], values: Tuple[int, ...], extra: int) -> Dict[str, Any]:
+        record = {k: self.string(v) for k, v in zip(standard_keys, values) if v != NONE}
+        if extra != NONE:
+            record.update(json.loads(self.string(extra)))
+        return record
+
+    def dataset(self, ordinal: int) -> Dict[str, Any]:
+        """Decodifica el resumen de un dataset a partir de su ordinal."""
+        offset = self._sections[SEC_DATASETS][0] + ordinal * _DATASET.size
+        *fields, extra, source, ds_offset, length, col_start, col_count = _DATASET.unpack_from(self._mm, offset)
+        ds = self._record(_STANDARD_KEYS, tuple(fields), extra)
+        col_base = self._sections[SEC_COLUMNS][0]
+        columnas = []
+        for c in range(col_start, col_start + col_count):
+            name, desc, col_extra = _COLUMN.unpack_from(self._mm, col_base + c * _COLUMN.size)
+            columnas.append(self._record(_STANDARD_COLUMN_KEYS, (name, desc), col_extra))
+        ds["columnas"] = columnas
+        ds[SOURCE_KEY] = (str(self.sources_dir / self.string(source)), ds_offset, length)
+        return ds
+
+    def topic(self, ordinal: int) -> Optional[str]:
+        """Topic de un dataset sin decodificar el resto del registro."""
+        offset = self._sections[SEC_DATASETS][0] + ordinal * _DATASET.size
+        return self.string(_U32.unpack_from(self._mm, offset + 2 * _U32.size)[0])
+
+    def dataset_id(self, ordinal: int) -> Optional[str]:
+        """dataset_id de un dataset sin decodificar el resto del registro."""
+        offset = self._sections[SEC_DATASETS][0] + ordinal * _DATASET.size
+        return self.string(_U32.unpack_from(self._mm, offset)[0])
+
+    def dataset_id_bytes(self, ordinal: int) -> bytes:
+        offset = self._sections[SEC_DATASETS][0] + ordinal * _DATASET.size
+        return self.string_bytes(_U32.unpack_from(self._mm, offset)[0])
+
+    def term(self, term_id: int) -> str:
+        """Término del BM25 con ese id."""
+        return self.string(self._u32(SEC_BM25_TERMS, term_id))
+
+    def profile(self, ordinal: int) -> SchemaProfile:
+        """Perfil de esquema de un dataset a partir de su ordinal."""
+        offset = self._sections[SEC_PROFILE_INDPTR][0] + ordinal * _U64.size
+        start, end = struct.unpack_from("<QQ", self._mm, offset)
+        terms = frozenset(self.term(self._u32(SEC_PROFILE_TERMS, j)) for j in range(start, end))
+        mask = self._mm[self._sections[SEC_PROFILE_DIMS][0] + ordinal]
+        return SchemaProfile(terms, frozenset(dim for bit, dim in enumerate(DIMENSIONS) if mask >> bit & 1))
+
+    def schema_scores(self, intent: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        SchemaMatcher.score() de todos los datasets (por ordinal) calculado sobre los arrays
+        de perfiles del snapshot, sin decodificar datasets ni términos.
+        """
+        required, wanted_dims = intent_requirements(intent)
+        total = len(required) + len(wanted_dims)
+        if total == 0:
+            return np.ones(self.num_datasets, dtype=np.float64)
+        satisfied = np.zeros(self.num_datasets, dtype=np.float64)
+        if required:
+            vocab = _TermMapping(self)
+            indptr = self._array(SEC_PROFILE_INDPTR, np.int64)
+            terms = self._array(SEC_PROFILE_TERMS, np.uint32)
+            for group in required:
+                term_ids = [vocab[t] for t in group if t in vocab]
+                if not term_ids:
+                    continue
+                # Posición en la CSR -> ordinal del dataset dueño de ese término
+                owners = np.searchsorted(indptr, np.flatnonzero(np.isin(terms, term_ids)), side="right") - 1
+                covered = np.zeros(self.num_datasets, dtype=bool)
+                covered[owners] = True
+                satisfied += covered
+        if wanted_dims:
+            masks = self._array(SEC_PROFILE_DIMS, np.uint8)
+            for dim in wanted_dims:
+                satisfied += (masks >> DIMENSIONS.index(dim)) & 1
+        return satisfied / total
+
+    def close(self):
+        # Los arrays del BM25 exportan el buffer del mmap: se sueltan antes de cerrarlo
+        self.text_index = None
+        self.schema_matcher = None
+        self.column_counts = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # Aún hay una búsqueda usando los arrays: el mapeo se libera cuando termine
+            pass
+
+
+class _DatasetSequence(Sequence):
+    def __init__(self, snap: SnapshotIndex):
+        self._snap = snap
+
+    def __len__(self) -> int:
+        return self._snap.num_datasets
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._snap.dataset(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._snap.dataset(i)
+
+
+class _SortedKeys(Sequence):
+    """Vista ordenada de claves en bytes para búsqueda binaria sobre el mmap."""
+    def __init__(self, length: int, key_at):
+        self._length = length
+        self._key_at = key_at
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._key_at(i)
+
+
+class _IdMapping(Mapping):
+    def __init__(self, snap: SnapshotIndex):
+        self._snap = snap
+        self._length = snap._sections[SEC_ID_INDEX][1] // _U32.size
+        self._keys = _SortedKeys(self._length, lambda i: snap.dataset_id_bytes(snap._u32(SEC_ID_INDEX, i)))
+
+    def _find(self, key: Any) -> Optional[int]:
+        if not isinstance(key, str):
+            return None
+        target = key.encode("utf-8")
+        pos = bisect_left(self._keys, target)
+        if pos < self._length and self._keys[pos] == target:
+            return self._snap._u32(SEC_ID_INDEX, pos)
+        return None
+
+    def ordinals(self, key: Any) -> List[int]:
+        """Todos los ordinales con ese ID (en orden de carga)."""
+        if not isinstance(key, str):
+            return []
+        target = key.encode("utf-8")
+        pos = bisect_left(self._keys, target)
+        result = []
+        while pos < self._length and self._keys[pos] == target:
+            result.append(self._snap._u32(SEC_ID_INDEX, pos))
+            pos += 1
+        return result
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        ordinal = self._find(key)
+        if ordinal is None:
+            raise KeyError(key)
+        return self._snap.dataset(ordinal)
+
+    def __contains__(self, key: Any) -> bool:
+        return self._find(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        last = None
+        for i in range(self._length):
+            key = self._keys[i]
+            if key != last:
+                last = key
+                yield key.decode("utf-8")
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class _InvertedMapping(Mapping):
+    def __init__(self, snap: SnapshotIndex, keys_section: int, postings_section: int):
+        self._snap = snap
+        self._keys_offset, keys_size = snap._sections[keys_section]
+        self._postings_section = postings_section
+        self._length = keys_size // _KEY_ENTRY.size
+        self._keys = _SortedKeys(self._length, lambda i: snap.string_bytes(self._entry(i)[0]))
+
+    def _entry(self, i: int) -> Tuple[int, int, int]:
+        return _KEY_ENTRY.unpack_from(self._snap._mm, self._keys_offset + i * _KEY_ENTRY.size)
+
+    def ordinals(self, key: str) -> List[int]:
+        """Ordinales de la clave (lista vacía si no existe)."""
+        target = key.encode("utf-8")
+        pos = bisect_left(self._keys, target)
+        if pos >= self._length or self._keys[pos] != target:
+            return []
+        _, start, count = self._entry(pos)
+        return [self._snap._u32(self._postings_section, start + j) for j in range(count)]
+
+    def __getitem__(self, key: str) -> List[Dict[str, Any]]:
+        ordinals = self.ordinals(key)
+        if not ordinals:
+            raise KeyError(key)
+        return [self._snap.dataset(o) for o in ordinals]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._length):
+            yield self._keys[i].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class _TermMapping(Mapping):
+    """Vocabulario del BM25 (término -> id) con búsqueda binaria sobre el mmap."""
+    def __init__(self, snap: SnapshotIndex):
+        self._length = snap._sections[SEC_BM25_TERMS][1] // _U32.size
+        self._snap = snap
+        self._keys = _SortedKeys(self._length, lambda i: snap.string_bytes(snap._u32(SEC_BM25_TERMS, i)))
+
+    def __getitem__(self, term: str) -> int:
+        target = term.encode("utf-8")
+        pos = bisect_left(self._keys, target)
+        if pos >= self._length or self._keys[pos] != target:
+            raise KeyError(term)
+        return pos
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._length):
+            yield self._keys[i].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class _ProfileMapping(Mapping):
+    """Perfiles de esquema por dataset_id (gana el primero, como en SchemaMatcher), decodificados bajo demanda."""
+    def __init__(self, snap: SnapshotIndex):
+        self._snap = snap
+
+    def __getitem__(self, ds_id: Any) -> SchemaProfile:
+        ordinal = self._snap.by_id._find(ds_id)
+        if ordinal is None:
+            raise KeyError(ds_id)
+        return self._snap.profile(ordinal)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snap.by_id)
+
+    def __len__(self) -> int:
+        return len(self._snap.by_id)
+
+
+# ==========================================
+# 4. RECARGA EN CALIENTE SOBRE EL SNAPSHOT
+# ==========================================
+
+class SnapshotOverlay:
+    """
+    Catálogo = snapshot mapeado + cambios de la recarga en caliente.
+
+    Los datasets del snapshot que desaparecen o cambian se marcan como eliminados (tombstones)
+    y los nuevos se guardan en memoria junto con sus índices; el snapshot no se decodifica ni
+    se copia. Expone la misma interfaz que CatalogIndex. Orden de los datasets: los vivos del
+    snapshot en su orden y después los añadidos (el mismo que usa PatchedBM25Index).
+    """
+
+    def __init__(self, base: SnapshotIndex, alive: np.ndarray, added: List[Dict[str, Any]],
+                 text_index: Any, schema_matcher: SchemaMatcher):
+        self.base = base
+        self.alive = alive
+        self.added = added
+        self.added_index = build_catalog_index(added)
+        self.base_ordinals = np.flatnonzero(alive)
+        self.datasets = _OverlaySequence(self)
+        self.by_id = _OverlayIdMapping(self)
+        self.by_topic = _OverlayInvertedMapping(self, base.by_topic, self.added_index.by_topic)
+        self.by_column = _OverlayInvertedMapping(self, base.by_column, self.added_index.by_column)
+        self.text_index = text_index
+        self.schema_matcher = schema_matcher
+        self.column_counts = np.concatenate([
+            base.column_counts[self.base_ordinals],
+            np.fromiter((len(ds.get("columnas") or []) for ds in added), dtype=np.uint32, count=len(added)),
+        ])
+
+        # Solo se revisan los topics de los datasets eliminados
+        topics = set(base.topics)
+        for topic in {base.topic(o) for o in np.flatnonzero(~alive).tolist()}:
+            if topic and not any(alive[o] and base.topic(o) == topic
+                                 for o in base.by_topic.ordinals(normalize_key(topic))):
+                topics.discard(topic)
+        self.topics = sorted(topics | set(self.added_index.topics))
+
+    def alive_ordinals(self, ordinals: List[int]) -> List[int]:
+        return [o for o in ordinals if self.alive[o]]
+
+    def schema_scores(self, intent: Optional[Dict[str, Any]]) -> np.ndarray:
+        """SchemaMatcher.score() de todos los datasets (en el orden de datasets)."""
+        return np.concatenate([self.base.schema_scores(intent)[self.base_ordinals],
+                               self.schema_matcher.score(self.added, intent)])
+
+
+class _OverlaySequence(Sequence):
+    def __init__(self, overlay: SnapshotOverlay):
+        self._overlay = overlay
+        self._num_base = len(overlay.base_ordinals)
+
+    def __len__(self) -> int:
+        return self._num_base + len(self._overlay.added)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i < self._num_base:
+            return self._overlay.base.dataset(int(self._overlay.base_ordinals[i]))
+        return self._overlay.added[i - self._num_base]
+
+
+class _OverlayIdMapping(Mapping):
+    def __init__(self, overlay: SnapshotOverlay):
+        self._overlay = overlay
+
+    def _find(self, key: Any) -> Optional[int]:
+        ordinals = self._overlay.alive_ordinals(self._overlay.base.by_id.ordinals(key))
+        return ordinals[0] if ordinals else None
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        ordinal = self._find(key)
+        if ordinal is not None:
+            return self._overlay.base.dataset(ordinal)
+        return self._overlay.added_index.by_id[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return self._find(key) is not None or key in self._overlay.added_index.by_id
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for key in self._overlay.base.by_id:
+            if self._find(key) is not None:
+                seen.add(key)
+                yield key
+        for key in self._overlay.added_index.by_id:
+            if key not in seen:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class _OverlayInvertedMapping(Mapping):
+    def __init__(self, overlay: SnapshotOverlay, base: "_InvertedMapping", added: Dict[str, List[Dict[str, Any]]]):
+        self._overlay = overlay
+        self._base = base
+        self._added = added
+
+    def __getitem__(self, key: str) -> List[Dict[str, Any]]:
+        datasets = [self._overlay.base.dataset(o) for o in self._overlay.alive_ordinals(self._base.ordinals(key))]
+        datasets.extend(self._added.get(key, []))
+        if not datasets:
+            raise KeyError(key)
+        return datasets
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._base:
+            if key in self._added or self._overlay.alive_ordinals(self._base.ordinals(key)):
+                yield key
+        for key in self._added:
+            if not self._base.ordinals(key):
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def patch_snapshot(index: Any, files: Sequence[str], added: List[Dict[str, Any]]) -> SnapshotOverlay:
+    """
+    Aplica una recarga en caliente sobre un snapshot (o sobre un overlay anterior).
+
+    Los datasets de los ficheros indicados se marcan como eliminados y los añadidos se indexan
+    en memoria; el BM25 y los perfiles de esquema se parchean sin reconstruir los del snapshot.
+    El índice original no se modifica.
+
+    Args:
+        index: SnapshotIndex o SnapshotOverlay actual
+        files: Nombres de los ficheros fuente eliminados o recargados
+        added: Datasets nuevos de los ficheros recargados
+
+    Returns:
+        Nuevo SnapshotOverlay
+    """
+    if isinstance(index, SnapshotOverlay):
+        base, alive, previous = index.base, index.alive.copy(), index.added
+    else:
+        base, alive, previous = index, np.ones(index.num_datasets, dtype=bool), []
+    positions = np.cumsum(alive) - 1
+    num_base = int(alive.sum())
+    files = set(files)
+
+    removed_positions: List[int] = []
+    removed_ids: List[Any] = []
+    for name in files:
+        start, end = base.file_ranges.get(name, (0, 0))
+        ordinals = np.arange(start, end)
+        ordinals = ordinals[alive[ordinals]]
+        removed_positions.extend(positions[ordinals].tolist())
+        removed_ids.extend(base.dataset_id(o) for o in ordinals.tolist())
+        alive[ordinals] = False
+    kept = []
+    for j, ds in enumerate(previous):
+        if Path(ds[SOURCE_KEY][0]).name in files:
+            removed_positions.append(num_base + j)
+            removed_ids.append(ds.get("dataset_id"))
+        else:
+            kept.append(ds)
+
+    return SnapshotOverlay(base, alive, kept + added,
+                           index.text_index.patch(removed_positions, added),
+                           index.schema_matcher.patch(removed_ids, added))
+
+
+def open_snapshot(snapshot_path: Path, sources_dir: Path, rebuild: bool = True) -> Optional[SnapshotIndex]:
+    """
+    Abre el snapshot del catálogo, reconstruyéndolo si falta o está desactualizado.
+
+    Args:
+        snapshot_path: Ruta del snapshot
+        sources_dir: Directorio con los catálogos *.json
+        rebuild: Si es False, devuelve None en lugar de reconstruir
+
+    Returns:
+        SnapshotIndex listo para consultas, o None si no hay snapshot válido
+    """
+    if snapshot_path.exists():
+        try:
+            snap = SnapshotIndex(snapshot_path, sources_dir)
+            if is_snapshot_current(snap.manifest, sources_dir):
+                return snap
+            snap.close()
+            logger.info("🔄 Snapshot del catálogo desactualizado, reconstruyendo...")
+        except (ValueError, OSError, struct.error, json.JSONDecodeError) as e:
+            logger.warning("Snapshot inválido (%s), reconstruyendo...", e)
+    if not rebuild:
+        return None
+    build_snapshot(sources_dir, snapshot_path)
+    return SnapshotIndex(snapshot_path, sources_dir)
+
+
+if __name__ == "__main__":
+    from search.catalog import SOURCES_DIR, SNAPSHOT_PATH
+    path = build_snapshot(SOURCES_DIR, SNAPSHOT_PATH)
+    print(f"✅ Snapshot generado: {path} ({path.stat().st_size} bytes)")
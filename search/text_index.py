@@ -0,0 +1,315 @@
+"""
+Índice invertido de texto sobre el catálogo con ranking BM25.
+Las listas de postings se guardan en formato CSR (arrays NumPy) y la puntuación
+se calcula de forma vectorizada sobre los postings de los términos de la consulta.
+El snapshot del catálogo (search.snapshot) guarda estos arrays y los mapea sin copiarlos.
+"""
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Tuple
+from collections import Counter
+import re
+import unicodedata
+
+import numpy as np
+
+
+# Pesos por campo (BM25F simplificado: se multiplican las frecuencias del término)
+FIELD_WEIGHTS = {
+    "topic": 3.0,
+    "nombre": 2.0,
+    "columna_nombre": 2.0,
+    "descripcion": 1.0,
+    "columna_descripcion": 1.0,
+}
+
+# Palabras vacías (español e inglés) que no aportan relevancia
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "en", "y", "o", "a", "al", "un", "una", "unos", "unas",
+    "por", "para", "con", "sin", "se", "su", "sus", "que", "es", "lo", "como", "entre", "sobre",
+    "datos", "dato", "busca", "buscar", "the", "of", "and", "or", "in", "for", "to", "on", "data",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Versión del tokenizador: los snapshots con índices de otra versión se reconstruyen
+TEXT_INDEX_VERSION = 2
+
+
+def _strip_accents(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Normaliza y divide un texto en términos (minúsculas, sin tildes, sin palabras vacías).
+    Los nombres de columna tipo snake_case se separan en sus partes.
+    """
+    if not text:
+        return []
+    text = _strip_accents(str(text).lower())
+    tokens = []
+    for tok in _TOKEN_RE.findall(text):
+        if tok in STOPWORDS or len(tok) < 2:
+            continue
+        tokens.append(_singular(tok))
+    return tokens
+
+
+_VOWELS = set("aeiou")
+# Consonantes finales de singulares que hacen el plural en -es ("estacion", "ciudad", "valor")
+_ES_PLURAL_ENDINGS = set("lnrdzy")
+
+
+def _singular(tok: str) -> str:
+    """
+    Plurales simples: "estaciones" -> "estacion", "pacientes" -> "paciente", "records" -> "record".
+
+    Solo se quita "-es" si el singular acaba en consonante (vocal + l, n, r, d, z, y); si no,
+    se quita solo la "s" para que singular y plural den el mismo término.
+    """
+    if len(tok) > 4 and tok.endswith("es") and not tok.endswith("ses"):
+        stem = tok[:-2]
+        if stem[-1] in _ES_PLURAL_ENDINGS and stem[-2] in _VOWELS:
+            return stem
+        return tok[:-1]
+    if len(tok) > 3 and tok.endswith("s"):
+        return tok[:-1]
+    return tok
+
+
+def _dataset_term_frequencies(ds: Dict[str, Any]) -> Counter:
+    """Frecuencias ponderadas de los términos de un dataset en todos sus campos."""
+    tf = Counter()
+    for token in tokenize(ds.get("topic")):
+        tf[token] += FIELD_WEIGHTS["topic"]
+    for token in tokenize(ds.get("nombre")):
+        tf[token] += FIELD_WEIGHTS["nombre"]
+    for token in tokenize(ds.get("descripcion")):
+        tf[token] += FIELD_WEIGHTS["descripcion"]
+    for col in ds.get("columnas") or []:
+        for token in tokenize(col.get("nombre")):
+            tf[token] += FIELD_WEIGHTS["columna_nombre"]
+        for token in tokenize(col.get("descripcion")):
+            tf[token] += FIELD_WEIGHTS["columna_descripcion"]
+    return tf
+
+
+def _idf(num_docs: int, doc_freq: np.ndarray) -> np.ndarray:
+    # IDF de BM25 (variante con +1 para que nunca sea negativo)
+    return np.log(1.0 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def _length_norm(doc_lengths: np.ndarray, k1: float, b: float, avg_len: Optional[float] = None) -> np.ndarray:
+    # Normalización por longitud precalculada por documento
+    if avg_len is None:
+        avg_len = doc_lengths.mean() if len(doc_lengths) else 0.0
+    return k1 * (1.0 - b + b * doc_lengths / avg_len) if avg_len else doc_lengths
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 sobre una lista de datasets.
+
+    Postings en CSR: para el término t, sus documentos son
+    doc_ids[indptr[t]:indptr[t + 1]] con frecuencias tfs[indptr[t]:indptr[t + 1]].
+    """
+
+    def __init__(self, datasets: Sequence[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[float] = []
+        doc_lengths = np.zeros(len(datasets), dtype=np.float64)
+
+        for doc_id, ds in enumerate(datasets):
+            tf = _dataset_term_frequencies(ds)
+            doc_lengths[doc_id] = sum(tf.values())
+            for term, freq in tf.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(freq)
+
+        # Agrupar postings por término (orden estable para mantener doc_ids crecientes)
+        term_ids_arr = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids_arr, kind="stable")
+        doc_freq = np.bincount(term_ids_arr, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=indptr[1:])
+        self._assign(vocab, indptr, np.asarray(doc_ids, dtype=np.int64)[order],
+                     np.asarray(tfs, dtype=np.float64)[order], _idf(len(datasets), doc_freq),
+                     doc_lengths, _length_norm(doc_lengths, k1, b), k1, b)
+
+    def _assign(self, vocab: Mapping[str, int], indptr: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                idf: np.ndarray, doc_lengths: np.ndarray, length_norm: np.ndarray, k1: float, b: float):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(doc_lengths)
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.idf = idf
+        self.doc_lengths = doc_lengths
+        self.length_norm = length_norm
+
+    @classmethod
+    def from_arrays(cls, vocab: Mapping[str, int], indptr: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                    idf: np.ndarray, doc_lengths: np.ndarray, length_norm: np.ndarray,
+                    k1: float, b: float) -> "BM25Index":
+        """Índice a partir de arrays ya calculados (p. ej. mapeados desde el snapshot, sin copiarlos)."""
+        index = cls.__new__(cls)
+        index._assign(vocab, indptr, doc_ids, tfs, idf, doc_lengths, length_norm, k1, b)
+        return index
+
+    def sorted_by_term(self) -> "BM25Index":
+        """Mismo índice con los ids de término en orden de bytes UTF-8 (búsqueda binaria en el snapshot)."""
+        terms = sorted(self.vocab, key=lambda t: t.encode("utf-8"))
+        old = np.fromiter((self.vocab[t] for t in terms), dtype=np.int64, count=len(terms))
+        starts = self.indptr[old]
+        counts = self.indptr[old + 1] - starts
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        offsets = np.repeat(starts - indptr[:-1], counts) + np.arange(int(indptr[-1]))
+        return BM25Index.from_arrays({t: i for i, t in enumerate(terms)}, indptr, self.doc_ids[offsets],
+                                     self.tfs[offsets], self.idf[old], self.doc_lengths, self.length_norm,
+                                     self.k1, self.b)
+
+    def score(self, query: str) -> np.ndarray:
+        """
+        Calcula la puntuación BM25 de todos los documentos para una consulta.
+
+        Args:
+            query: Texto de la consulta
+
+        Returns:
+            Array con una puntuación por documento (0 si no comparte términos)
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        query_tf = Counter(self.vocab[t] for t in tokenize(query) if t in self.vocab)
+        if not query_tf:
+            return scores
+
+        terms = np.fromiter(query_tf.keys(), dtype=np.int64, count=len(query_tf))
+        weights = np.fromiter(query_tf.values(), dtype=np.float64, count=len(query_tf))
+        starts = self.indptr[terms]
+        counts = self.indptr[terms + 1] - starts
+
+        # Posiciones de todos los postings de la consulta sin bucles por documento
+        total = int(counts.sum())
+        if total == 0:
+            return scores
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        posting_docs = self.doc_ids[offsets]
+        posting_tfs = self.tfs[offsets]
+        posting_weights = np.repeat(self.idf[terms] * weights, counts)
+
+        contrib = posting_weights * posting_tfs * (self.k1 + 1.0) / (posting_tfs + self.length_norm[posting_docs])
+        scores += np.bincount(posting_docs, weights=contrib, minlength=self.num_docs)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Devuelve los k documentos más relevantes con puntuación positiva.
+
+        Args:
+            query: Texto de la consulta
+            k: Número máximo de resultados
+
+        Returns:
+            Lista de tuplas (posición del dataset, puntuación) ordenada de mayor a menor
+        """
+        return _top_k(self.score(query), k)
+
+    def patch(self, removed: Sequence[int], added: Sequence[Dict[str, Any]]) -> "PatchedBM25Index":
+        """
+        Índice con documentos eliminados y añadidos sin reconstruir los postings existentes.
+
+        Args:
+            removed: Posiciones de los documentos que desaparecen
+            added: Datasets nuevos (quedan al final, en orden)
+
+        Returns:
+            PatchedBM25Index sobre este índice
+        """
+        alive = np.ones(self.num_docs, dtype=bool)
+        alive[np.asarray(removed, dtype=np.int64)] = False
+        return PatchedBM25Index(self, alive, list(added))
+
+
+def _top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    candidates = np.flatnonzero(scores > 0)
+    if k <= 0 or candidates.size == 0:
+        return []
+    if candidates.size > k:
+        top = np.argpartition(scores[candidates], -k)[-k:]
+        candidates = candidates[top]
+    # Orden final solo sobre los k candidatos (empates por orden de carga)
+    ordered = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return [(int(i), float(scores[i])) for i in ordered]
+
+
+class PatchedBM25Index:
+    """
+    BM25 de un índice base (p. ej. el del snapshot mapeado) con documentos marcados como
+    eliminados más un índice pequeño con los documentos añadidos en la recarga en caliente.
+
+    Los postings del base no se copian: al puntuar se descartan los de documentos eliminados
+    y se suman los del índice de añadidos. IDF, número de documentos y longitud media se
+    calculan sobre el catálogo resultante, así que las puntuaciones son las mismas que las
+    de un BM25Index reconstruido desde cero. Documentos: los vivos del base en su orden y
+    después los añadidos.
+    """
+
+    def __init__(self, base: BM25Index, alive: np.ndarray, added: List[Dict[str, Any]]):
+        self.base = base
+        self.alive = alive
+        self.added = added
+        self.k1 = base.k1
+        self.b = base.b
+        self.delta = BM25Index(added, k1=base.k1, b=base.b)
+        # Posición en el índice resultante de cada documento del base (-1 si está eliminado)
+        self.positions = np.where(alive, np.cumsum(alive) - 1, -1)
+        self.num_base = int(alive.sum())
+        self.num_docs = self.num_base + self.delta.num_docs
+        total_len = float(base.doc_lengths[alive].sum()) + float(self.delta.doc_lengths.sum())
+        self.avg_len = total_len / self.num_docs if self.num_docs else 0.0
+
+    def _postings(self, index: BM25Index, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        term_id = index.vocab.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        start, end = index.indptr[term_id], index.indptr[term_id + 1]
+        return index.doc_ids[start:end], index.tfs[start:end]
+
+    def score(self, query: str) -> np.ndarray:
+        """Igual que BM25Index.score sobre el catálogo parcheado."""
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        for term, weight in Counter(tokenize(query)).items():
+            base_docs, base_tfs = self._postings(self.base, term)
+            keep = self.alive[base_docs]
+            base_docs, base_tfs = base_docs[keep], base_tfs[keep]
+            delta_docs, delta_tfs = self._postings(self.delta, term)
+            doc_freq = len(base_docs) + len(delta_docs)
+            if not doc_freq:
+                continue
+            docs = np.concatenate([self.positions[base_docs], self.num_base + delta_docs])
+            tfs = np.concatenate([base_tfs, delta_tfs])
+            lengths = np.concatenate([self.base.doc_lengths[base_docs], self.delta.doc_lengths[delta_docs]])
+            norm = _length_norm(lengths, self.k1, self.b, self.avg_len)
+            idf = _idf(self.num_docs, doc_freq)
+            scores += np.bincount(docs, weights=weight * idf * tfs * (self.k1 + 1.0) / (tfs + norm),
+                                  minlength=self.num_docs)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Igual que BM25Index.top_k sobre el catálogo parcheado."""
+        return _top_k(self.score(query), k)
+
+    def patch(self, removed: Sequence[int], added: Sequence[Dict[str, Any]]) -> "PatchedBM25Index":
+        """Aplica otra recarga sobre el mismo índice base (ver BM25Index.patch)."""
+        removed = np.asarray(removed, dtype=np.int64)
+        alive = self.alive.copy()
+        alive[np.flatnonzero(self.alive)[removed[removed < self.num_base]]] = False
+        dropped = set((removed[removed >= self.num_base] - self.num_base).tolist())
+        kept = [ds for j, ds in enumerate(self.added) if j not in dropped]
+        return PatchedBM25Index(self.base, alive, kept + list(added))
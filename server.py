@@ -0,0 +1,366 @@
+"""
+Servidor HTTP multi-sesión alrededor del grafo compilado (asyncio, sin dependencias extra).
+
+Un único grafo asíncrono (build_graph(async_mode=True)) atiende muchas sesiones, cada una
+con su thread_id en el checkpointer. Si la sesión está parada en un interrupt (aclaración
+o confirmación), el mensaje se envía como Command(resume=...).
+
+Endpoints:
+    POST /sessions/{thread_id}/messages   {"message": "..."}
+        → respuesta en streaming (NDJSON, chunked), una línea por evento:
+          {"type": "token", "node": ..., "content": ...}     fragmento de una respuesta según se genera
+          {"type": "message", "node": ..., "content": ...}   mensaje del agente
+          {"type": "interrupt"}                              el último mensaje espera respuesta
+          {"type": "done", "awaiting_input": bool}           fin del turno
+          {"type": "error", "error": ...}
+    GET /stats                             → contadores del servidor y tiempos de generación por nodo (JSON)
+    GET /metrics                           → métricas por sesión en formato de texto de Prometheus
+
+Control de carga:
+    - max_concurrent_turns: turnos ejecutándose a la vez en todo el servidor. Los demás
+      esperan hasta queue_timeout segundos y si no → 503 (Retry-After).
+    - max_pending_per_session: turnos de una misma sesión en cola detrás del que se está
+      ejecutando (los turnos de una sesión se ejecutan de uno en uno). Si se supera → 429.
+    - Backpressure de red: cada evento espera a writer.drain(), así un cliente lento
+      frena su propio turno y no acumula memoria en el servidor.
+
+Uso:
+    python server.py --port 8000
+    python server.py --port 8000 --stub-llm --stub-latency 0.05   # pruebas de carga sin Ollama
+    python server.py --log-level DEBUG --metrics-jsonl metrics.jsonl
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import traceback
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage
+from langchain_ollama import ChatOllama
+
+from app import Context, build_graph, search_catalog, turn_input
+from llm_cache import LLMResponseCache
+from result_cache import ResultCache
+from speculative import SpeculativeSearch
+from streaming import GENERATION_TIMER, is_user_facing, is_user_text, token_text
+from metrics import METRICS, METRICS_COLLECTOR
+from search.catalog import start_catalog_watcher
+
+
+# Límites por defecto
+MAX_CONCURRENT_TURNS = 32
+MAX_PENDING_PER_SESSION = 1
+QUEUE_TIMEOUT = 10.0
+MAX_BODY_BYTES = 64 * 1024
+SESSION_IDLE_TTL = 3600.0
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class Session:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pending: int = 0  # Turnos esperando detrás del que se ejecuta
+    turns: int = 0
+    last_used: float = field(default_factory=time.time)
+
+
+class GraphServer:
+    """Sirve un grafo compilado a muchas sesiones concurrentes."""
+
+    def __init__(self,
+                 ctx: Context,
+                 checkpointer: Any = None,
+                 max_concurrent_turns: int = MAX_CONCURRENT_TURNS,
+                 max_pending_per_session: int = MAX_PENDING_PER_SESSION,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.ctx = ctx
+        self.graph = build_graph(async_mode=True).compile(checkpointer=checkpointer or MemorySaver())
+        self.max_pending_per_session = max_pending_per_session
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent_turns)
+        self.sessions: Dict[str, Session] = {}
+        self.stats: Dict[str, int] = {
+            "turns": 0, "active_turns": 0, "rejected_busy": 0, "rejected_session": 0, "errors": 0,
+        }
+
+    # ---------- Sesiones ----------
+    def _session(self, thread_id: str) -> Session:
+        session = self.sessions.get(thread_id)
+        if session is None:
+            session = self.sessions[thread_id] = Session()
+        session.last_used = time.time()
+        return session
+
+    def evict_idle_sessions(self, ttl: float = SESSION_IDLE_TTL):
+        """Olvida los candados de sesiones inactivas (el estado sigue en el checkpointer)."""
+        cutoff = time.time() - ttl
+        for thread_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked() and not session.pending:
+                del self.sessions[thread_id]
+
+    # ---------- Turnos ----------
+    async def run_turn(self, thread_id: str, message: str, emit) -> None:
+        """
+        Ejecuta un turno de la sesión y emite los eventos según se producen.
+
+        Args:
+            thread_id: Sesión
+            message: Mensaje del usuario (o respuesta a un interrupt)
+            emit: Corrutina que envía un evento (dict) al cliente
+        """
+        session = self._session(thread_id)
+        if session.lock.locked() and session.pending >= self.max_pending_per_session:
+            self.stats["rejected_session"] += 1
+            raise HTTPError(429, "La sesión ya tiene un turno en curso", {"Retry-After": "1"})
+
+        session.pending += 1
+        try:
+            await session.lock.acquire()
+        finally:
+            session.pending -= 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected_busy"] += 1
+                raise HTTPError(503, "Servidor ocupado", {"Retry-After": str(max(1, int(self.queue_timeout)))})
+            try:
+                await self._stream_turn(thread_id, message, emit)
+                session.turns += 1
+            finally:
+                self._slots.release()
+        finally:
+            session.last_used = time.time()
+            session.lock.release()
+
+    async def _stream_turn(self, thread_id: str, message: str, emit) -> None:
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": [GENERATION_TIMER, METRICS_COLLECTOR]}
+        self.stats["turns"] += 1
+        self.stats["active_turns"] += 1
+        waiting = False
+        try:
+            input_data = turn_input(await self.graph.aget_state(config), message)
+            async for mode, data in self.graph.astream(input_data, context=self.ctx, config=config,
+                                                       stream_mode=["messages", "custom", "updates"]):
+                if mode == "messages":
+                    # Tokens de las respuestas para el usuario en cuanto se generan
+                    chunk, metadata = data
+                    if is_user_facing(metadata) and (text := token_text(chunk)):
+                        await emit({"type": "token", "node": metadata.get("langgraph_node"), "content": text})
+                    continue
+                if mode == "custom":
+                    # Texto para el usuario dentro de una respuesta JSON (confirmación del análisis combinado)
+                    if is_user_text(data):
+                        await emit(data)
+                    continue
+                for node, values in data.items():
+                    if node == "__interrupt__":
+                        # La pregunta ya se envió como mensaje del nodo que la generó
+                        waiting = True
+                        await emit({"type": "interrupt"})
+                        continue
+                    if not isinstance(values, dict):
+                        continue
+                    # Mensajes del agente en cuanto el nodo termina
+                    for msg in values.get("messages", []):
+                        if isinstance(msg, AIMessage):
+                            await emit({"type": "message", "node": node, "content": msg.content})
+            await emit({"type": "done", "awaiting_input": waiting})
+        finally:
+            self.stats["active_turns"] -= 1
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "sessions": len(self.sessions),
+            "llm_cache": self.ctx.llm_cache.stats() if self.ctx.llm_cache else None,
+            "result_cache": self.ctx.result_cache.stats() if self.ctx.result_cache else None,
+            "speculative_search": self.ctx.speculative_search.stats() if self.ctx.speculative_search else None,
+            "generation": GENERATION_TIMER.report(),
+        }
+
+    # ---------- HTTP ----------
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, body = await _read_request(reader)
+            if method == "GET" and path == "/stats":
+                await _send_json(writer, 200, self.report())
+                return
+            if method == "GET" and path == "/metrics":
+                await _send_text(writer, 200, METRICS.to_prometheus(),
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                return
+
+            parts = path.strip("/").split("/")
+            if len(parts) != 3 or parts[0] != "sessions" or parts[2] != "messages":
+                raise HTTPError(404, "Ruta no encontrada")
+            if method != "POST":
+                raise HTTPError(405, "Usa POST")
+            thread_id = parts[1]
+            try:
+                message = json.loads(body or b"{}").get("message")
+            except (ValueError, AttributeError):
+                message = None
+            if not isinstance(message, str) or not message.strip():
+                raise HTTPError(400, 'Falta "message"')
+
+            started = False
+
+            async def emit(event: Dict[str, Any]):
+                nonlocal started
+                if not started:
+                    started = True
+                    writer.write(_head(200, {"Content-Type": "application/x-ndjson",
+                                             "Transfer-Encoding": "chunked"}))
+                data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()  # Backpressure: espera a que el cliente lea
+
+            try:
+                await self.run_turn(thread_id, message.strip(), emit)
+            except HTTPError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                traceback.print_exc()
+                if not started:
+                    raise HTTPError(500, str(e))
+                await emit({"type": "error", "error": str(e)})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except HTTPError as e:
+            await _send_json(writer, e.status, {"error": str(e)}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Connection: close"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Any,
+                     headers: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(_head(status, {"Content-Type": "application/json", "Content-Length": str(len(body)),
+                                **(headers or {})}) + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+async def _send_text(writer: asyncio.StreamWriter, status: int, text: str, content_type: str):
+    body = text.encode("utf-8")
+    writer.write(_head(status, {"Content-Type": content_type, "Content-Length": str(len(body))}) + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("conexión cerrada")
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Petición mal formada")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Mensaje demasiado grande")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path.split("?", 1)[0], body
+
+
+async def serve(server: GraphServer, host: str = "127.0.0.1", port: int = 8000,
+                metrics_jsonl: Optional[str] = None):
+    """
+    Arranca el servidor HTTP y limpia periódicamente las sesiones inactivas.
+    Con metrics_jsonl, cada minuto se añaden al fichero las métricas de las sesiones.
+    """
+    tcp = await asyncio.start_server(server.handle, host, port, limit=MAX_BODY_BYTES * 2)
+    print(f"🌐 Servidor escuchando en http://{host}:{port}")
+    async with tcp:
+        while True:
+            await asyncio.sleep(60)
+            server.evict_idle_sessions()
+            if metrics_jsonl:
+                METRICS.write_jsonl(metrics_jsonl)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP multi-sesión del agente")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_TURNS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_PER_SESSION)
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT)
+    parser.add_argument("--checkpoint-db", default=os.environ.get("CHECKPOINT_DB"),
+                        help="SQLite donde se guardan las sesiones (por defecto en memoria)")
+    parser.add_argument("--stub-llm", action="store_true", help="LLM simulado (pruebas de carga)")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Segundos por llamada del LLM simulado")
+    parser.add_argument("--metrics-jsonl", default=os.environ.get("METRICS_JSONL"),
+                        help="Fichero JSONL donde se vuelcan las métricas por sesión cada minuto")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "WARNING"),
+                        help="Nivel de logging de los nodos (DEBUG, INFO, WARNING...)")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.stub_llm:
+        from fake_llm import StubChatModel
+        llm = StubChatModel(latency=args.stub_latency)
+    else:
+        llm = ChatOllama(model="llama3.1", base_url="http://127.0.0.1:11434", temperature=0.0)
+    ctx = Context(llm=llm, llm_cache=LLMResponseCache(sqlite_path=os.environ.get("LLM_CACHE_DB")),
+                  result_cache=ResultCache(), speculative_search=SpeculativeSearch(search_catalog))
+    start_catalog_watcher()
+
+    checkpointer = None
+    if args.checkpoint_db:
+        from checkpointer import SQLiteCheckpointer
+        checkpointer = SQLiteCheckpointer(args.checkpoint_db)
+        checkpointer.start_compaction()
+
+    graph_server = GraphServer(ctx,
+                               checkpointer=checkpointer,
+                               max_concurrent_turns=args.max_concurrent,
+                               max_pending_per_session=args.max_pending,
+                               queue_timeout=args.queue_timeout)
+    try:
+        asyncio.run(serve(graph_server, args.host, args.port, metrics_jsonl=args.metrics_jsonl))
+    except KeyboardInterrupt:
+        print(f"📊 Servidor: {graph_server.report()}")
@@ -0,0 +1,162 @@
+"""
+Búsqueda especulativa en el catálogo mientras el usuario lee la confirmación.
+
+node_ask_confirmation se queda parado en el interrupt hasta que el usuario responde. En
+cuanto hay user_search_intent_structured, la búsqueda (BM25 + poda por esquema + ranking)
+y la extracción de esquemas se lanzan en segundo plano para esa sesión:
+
+- Si el usuario confirma, node_search recoge el resultado (useful_data, schemas, fallback) en vez
+  de buscar; si aún no ha terminado, espera solo lo que falte.
+- Si el intent cambia (corrección o aclaración) o se recarga el catálogo, el resultado
+  especulativo se descarta y node_search busca como siempre.
+
+Hay como mucho una búsqueda especulativa por sesión (thread_id).
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from langgraph.config import get_config
+
+from result_cache import canonical_intent
+from search.catalog import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+
+# (useful_data, schemas, fallback) como lo devuelve app.search_catalog
+SearchResult = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]
+
+# Segundos máximos que node_search espera a una búsqueda especulativa sin terminar
+TAKE_TIMEOUT = 30.0
+
+# Sesiones con búsqueda especulativa pendiente (se descartan las más antiguas)
+MAX_SESSIONS = 1024
+
+
+def current_thread_id() -> str:
+    """thread_id de la ejecución del grafo en curso ("default" fuera del grafo)."""
+    try:
+        return str((get_config().get("configurable") or {}).get("thread_id", "default"))
+    except RuntimeError:
+        return "default"
+
+
+@dataclass
+class _Speculation:
+    key: str  # Intent canónico
+    version: int  # Versión del catálogo al lanzarla
+    future: Future
+
+
+class SpeculativeSearch:
+    """Búsquedas especulativas por sesión en un pool de hilos."""
+
+    def __init__(self, search: Callable[[Dict[str, Any]], SearchResult], max_workers: int = 2,
+                 max_sessions: int = MAX_SESSIONS):
+        """
+        Args:
+            search: Función intent → (useful_data, schemas, fallback) (la misma que usa node_search)
+            max_workers: Búsquedas especulativas simultáneas
+            max_sessions: Máximo de sesiones con búsqueda pendiente
+        """
+        self._search = search
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-search")
+        self._pending: "OrderedDict[str, _Speculation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.failed = 0
+        self.hidden_seconds = 0.0  # Tiempo de búsqueda que el usuario no ha tenido que esperar
+
+    def _run(self, intent: Dict[str, Any]) -> Tuple[SearchResult, float]:
+        start = time.perf_counter()
+        result = self._search(intent)
+        return result, time.perf_counter() - start
+
+    def _drop(self, speculation: _Speculation):
+        # Se llama con el lock tomado
+        speculation.future.cancel()
+        self.discarded += 1
+
+    def start(self, thread_id: str, intent: Optional[Dict[str, Any]]):
+        """
+        Lanza la búsqueda del intent para la sesión (descarta la anterior si era de otro intent).
+
+        Es idempotente: al reanudarse el interrupt el nodo se re-ejecuta y vuelve a llamarla.
+        """
+        if not intent:
+            return
+        key, version = canonical_intent(intent), get_catalog_version()
+        with self._lock:
+            current = self._pending.get(thread_id)
+            if current is not None:
+                if current.key == key and current.version == version:
+                    return
+                self._drop(current)
+            self._pending[thread_id] = _Speculation(key, version, self._executor.submit(self._run, dict(intent)))
+            self._pending.move_to_end(thread_id)
+            self.started += 1
+            while len(self._pending) > self.max_sessions:
+                self._drop(self._pending.popitem(last=False)[1])
+        logger.debug("🔮 Búsqueda especulativa lanzada para la sesión %s", thread_id)
+
+    def take(self, thread_id: str, intent: Optional[Dict[str, Any]],
+             timeout: float = TAKE_TIMEOUT) -> Optional[SearchResult]:
+        """
+        Resultado especulativo de la sesión si es del intent confirmado y del catálogo actual.
+
+        Returns:
+            (useful_data, schemas, fallback) o None (no hay, es de otro intent o ha fallado)
+        """
+        with self._lock:
+            speculation = self._pending.pop(thread_id, None)
+            if speculation is None:
+                return None
+            if speculation.key != canonical_intent(intent) or speculation.version != get_catalog_version():
+                self._drop(speculation)
+                logger.debug("🔮 Búsqueda especulativa descartada (el intent o el catálogo han cambiado)")
+                return None
+
+        waited = time.perf_counter()
+        try:
+            result, duration = speculation.future.result(timeout=timeout)
+        except Exception as e:
+            speculation.future.cancel()
+            with self._lock:
+                self.failed += 1
+            logger.warning("Speculative search failed (%s), searching again", e)
+            return None
+        waited = time.perf_counter() - waited
+        with self._lock:
+            self.used += 1
+            self.hidden_seconds += max(0.0, duration - waited)
+        return result
+
+    def discard(self, thread_id: str):
+        """Descarta la búsqueda especulativa de la sesión."""
+        with self._lock:
+            speculation = self._pending.pop(thread_id, None)
+            if speculation is not None:
+                self._drop(speculation)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores: lanzadas, aprovechadas, descartadas, fallidas y tiempo de búsqueda ahorrado."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "discarded": self.discarded,
+                "failed": self.failed,
+                "pending": len(self._pending),
+                "hidden_ms": round(self.hidden_seconds * 1000, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,184 @@
+"""
+Streaming de tokens de las respuestas del agente y tiempos de generación por nodo.
+
+- Las llamadas al LLM cuya respuesta ve el usuario (chatbot, mensaje de confirmación) se
+  etiquetan con STREAM_TAG. Con stream_mode "messages" LangGraph emite sus tokens según
+  se generan; el resto (router, intent JSON, sí/no) no se muestra.
+- El texto para el usuario que va dentro de una respuesta JSON (la confirmación del análisis
+  combinado) se emite con stream_user_text() por el stream "custom", con el mismo formato
+  que usa el servidor para los tokens.
+- GenerationTimer es un callback de LangChain que mide, por nodo del grafo, el tiempo
+  hasta el primer token y el tiempo total de cada generación.
+"""
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langgraph.config import get_config, get_stream_writer
+
+
+# Etiqueta de las llamadas al LLM cuya respuesta se muestra al usuario token a token
+STREAM_TAG = "user_facing"
+
+# Config para llm.invoke / llm.ainvoke de esas llamadas
+STREAM_CONFIG = {"tags": [STREAM_TAG]}
+
+
+def is_user_facing(metadata: Dict[str, Any]) -> bool:
+    """True si un evento del stream "messages" pertenece a una respuesta para el usuario."""
+    return STREAM_TAG in (metadata.get("tags") or [])
+
+
+def stream_user_text(text: str):
+    """
+    Emite un fragmento de respuesta para el usuario por el stream "custom":
+    {"type": "token", "node": ..., "content": ...}. Fuera del grafo no hace nada.
+    """
+    try:
+        node = (get_config().get("metadata") or {}).get("langgraph_node")
+    except RuntimeError:
+        return
+    get_stream_writer()({"type": "token", "node": node, "content": text})
+
+
+def is_user_text(data: Any) -> bool:
+    """True si un evento del stream "custom" es un fragmento de stream_user_text()."""
+    return isinstance(data, dict) and data.get("type") == "token" and bool(data.get("content"))
+
+
+def token_text(chunk: BaseMessage) -> str:
+    """Texto de un fragmento del stream "messages"."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class GenerationTimer(BaseCallbackHandler):
+    """
+    Tiempos de generación del LLM por nodo: tiempo hasta el primer token (TTFT) y total.
+
+    Se pasa en config["callbacks"] al ejecutar el grafo; el nodo se obtiene de la metadata
+    que LangGraph añade a cada llamada (langgraph_node). Sin streaming (respuesta de la
+    caché o llm.invoke fuera del modo "messages") el TTFT coincide con el tiempo total.
+    """
+
+    # Se ejecuta en el propio hilo / event loop para no desplazar las marcas de tiempo
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs: Dict[UUID, List[Any]] = {}  # run_id -> [nodo, inicio, primer token, tokens]
+        self.nodes: Dict[str, Dict[str, float]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                            run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node", "unknown")
+        with self._lock:
+            self._runs[run_id] = [node, time.perf_counter(), None, 0]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None:
+                if run[2] is None:
+                    run[2] = time.perf_counter()
+                run[3] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        end = time.perf_counter()
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            node, start, first_token, tokens = run
+            self._record(node, (first_token or end) - start, end - start, tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # stream_json cierra el stream al completarse el JSON: cuenta como generación terminada
+        if isinstance(error, GeneratorExit):
+            self.on_llm_end(None, run_id=run_id)
+            return
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def _record(self, node: str, ttft: float, total: float, tokens: int):
+        stats = self.nodes.setdefault(node, {
+            "calls": 0, "ttft_sum": 0.0, "ttft_max": 0.0, "total_sum": 0.0, "total_max": 0.0, "tokens": 0,
+        })
+        stats["calls"] += 1
+        stats["ttft_sum"] += ttft
+        stats["ttft_max"] = max(stats["ttft_max"], ttft)
+        stats["total_sum"] += total
+        stats["total_max"] = max(stats["total_max"], total)
+        stats["tokens"] += tokens
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Por nodo: llamadas, TTFT y tiempo total (medio y máximo, en segundos) y tokens streamed."""
+        with self._lock:
+            return {
+                node: {
+                    "calls": s["calls"],
+                    "ttft_avg": round(s["ttft_sum"] / s["calls"], 4),
+                    "ttft_max": round(s["ttft_max"], 4),
+                    "total_avg": round(s["total_sum"] / s["calls"], 4),
+                    "total_max": round(s["total_max"], 4),
+                    "tokens": s["tokens"],
+                }
+                for node, s in self.nodes.items()
+            }
+
+
+# Tiempos del proceso (REPL y servidor)
+GENERATION_TIMER = GenerationTimer()
+
+
+
+class TokenPrinter:
+    """Imprime en la consola los tokens de las respuestas del agente según llegan."""
+
+    def __init__(self, prefix: str = ">>> Agente: "):
+        self.prefix = prefix
+        self.current: Optional[str] = None  # id del mensaje que se está imprimiendo
+        self.parts: List[str] = []
+        self.streamed: set = set()  # Textos ya mostrados token a token
+
+    def token(self, chunk: BaseMessage, metadata: Dict[str, Any]):
+        """Procesa un evento del stream "messages"."""
+        if not is_user_facing(metadata):
+            return
+        self._print(chunk.id, token_text(chunk))
+
+    def custom(self, data: Any):
+        """Procesa un evento del stream "custom" (fragmentos de stream_user_text)."""
+        if is_user_text(data):
+            self._print(f"custom:{data.get('node')}", data["content"])
+
+    def _print(self, message_id: Optional[str], text: str):
+        if not text:
+            return
+        if message_id != self.current:
+            self.end()
+            self.current = message_id
+            print(self.prefix, end="", flush=True)
+        print(text, end="", flush=True)
+        self.parts.append(text)
+
+    def end(self):
+        """Cierra la línea del mensaje en curso."""
+        if self.parts:
+            print()
+            self.streamed.add("".join(self.parts).strip())
+        self.current = None
+        self.parts = []
+
+    def was_streamed(self, content: str) -> bool:
+        """True (una sola vez) si el mensaje completo ya se mostró token a token."""
+        content = content.strip()
+        if content in self.streamed:
+            self.streamed.discard(content)
+            return True
+        return False
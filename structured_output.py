@@ -0,0 +1,413 @@
+"""
+Salida estructurada (JSON) del LLM.
+
+- Pide JSON a Ollama con `format` (modo "json" o un JSON schema como restricción).
+- Parser incremental y tolerante: ignora texto o vallas markdown alrededor del objeto,
+  sigue la profundidad de llaves y corchetes mientras llegan los tokens y detecta el
+  cierre del objeto para cortar la generación en ese momento.
+- Validación y normalización del intent contra INTENT_SCHEMA.
+"""
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import json
+import logging
+import re
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks.manager import adispatch_custom_event, dispatch_custom_event
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+logger = logging.getLogger(__name__)
+
+
+# Campos lista del intent estructurado
+INTENT_LIST_FIELDS = ["temporal_filters", "demographic_filters", "spatial_filters", "required_columns"]
+
+# Esquema del intent (Ollama lo usa como restricción de formato)
+INTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "string"},
+        **{name: {"type": "array", "items": {"type": "string"}} for name in INTENT_LIST_FIELDS},
+        "aggregation_type": {"type": "string"},
+    },
+    "required": ["topic", *INTENT_LIST_FIELDS, "aggregation_type"],
+}
+
+# Esquema de una actualización parcial del intent (solo los campos que cambian)
+INTENT_DELTA_SCHEMA = {
+    "type": "object",
+    "properties": INTENT_SCHEMA["properties"],
+}
+
+# Máximo de texto previo al "{" que se tolera antes de abandonar la generación
+MAX_PREAMBLE_CHARS = 2000
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_PYTHON_LITERAL_RE = re.compile(r"\b(None|True|False)\b")
+_PARTIAL_ESCAPE_RE = re.compile(r"(\\+)(u[0-9a-fA-F]{0,3})?$")
+
+# Callback de IncrementalJSONParser.on_text: (fragmento de texto, campos de primer nivel ya cerrados)
+TextCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class IncrementalJSONParser:
+    """
+    Parser incremental del primer objeto JSON de una respuesta en streaming.
+
+    feed() recibe los fragmentos de texto según llegan y devuelve True en cuanto el
+    objeto se cierra (o cuando ya no tiene sentido seguir esperando), para que quien
+    consume el stream corte la generación. Los campos de primer nivel se parsean según
+    se cierran (fields) y los requeridos se comprueban al cerrarse el objeto. El texto de
+    un campo string de primer nivel (stream_field) se puede ir entregando según llega.
+    """
+
+    def __init__(self, max_preamble: int = MAX_PREAMBLE_CHARS, required: Sequence[str] = (),
+                 stream_field: Optional[str] = None, on_text: Optional[TextCallback] = None):
+        """
+        Args:
+            max_preamble: Texto máximo antes del "{" antes de abandonar
+            required: Campos de primer nivel obligatorios (sin ellos result() devuelve None)
+            stream_field: Campo string de primer nivel cuyo texto se entrega según llega
+            on_text: Callback (fragmento de texto ya decodificado, fields cerrados hasta ahora)
+        """
+        self.max_preamble = max_preamble
+        self.required = tuple(required)
+        self.stream_field = stream_field
+        self.on_text = on_text
+        self.buffer: List[str] = []
+        self.preamble = 0  # Caracteres descartados antes del "{"
+        self.closers: List[str] = []  # Cierres pendientes ("}" / "]")
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.done = False
+        self.aborted = False
+        self.fields: Dict[str, Any] = {}  # Campos de primer nivel ya cerrados
+        self.missing: List[str] = []  # Campos requeridos ausentes al cerrarse el objeto
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None  # Posición en buffer de la clave que se está leyendo
+        self._value_start: Optional[int] = None  # Posición en buffer del valor que se está leyendo
+        self._stream_start: Optional[int] = None  # Inicio del contenido de stream_field en buffer
+        self._stream_end: Optional[int] = None
+        self._streamed = ""  # Texto de stream_field ya entregado
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Procesa un fragmento del stream.
+
+        Returns:
+            True si el objeto ya está cerrado (o se abandona) y no hace falta más texto
+        """
+        for ch in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if ch == "{":
+                    self.started = self._expect_key = True
+                    self.closers.append("}")
+                    self.buffer.append(ch)
+                else:
+                    self.preamble += 1
+                    if self.preamble > self.max_preamble:
+                        self.aborted = self.done = True
+                continue
+
+            self.buffer.append(ch)
+            pos = len(self.buffer) - 1
+            top_level = len(self.closers) == 1
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if top_level and self._key_start is not None:
+                        self._key = _loads_tolerant(self.text[self._key_start:])
+                        self._key_start = None
+                    elif top_level and self._stream_start is not None:
+                        self._stream_end = pos
+            elif ch == '"':
+                self.in_string = True
+                if top_level and self._expect_key:
+                    self._expect_key = False
+                    self._key_start = pos
+                elif top_level and self._value_start is None:
+                    self._value_start = pos
+                    if self.on_text is not None and self._key == self.stream_field and not self._streamed:
+                        self._stream_start = pos + 1
+            elif ch in "{[":
+                if top_level and self._value_start is None:
+                    self._value_start = pos
+                self.closers.append("}" if ch == "{" else "]")
+            elif ch in "}]" and self.closers:
+                if top_level:
+                    self._close_field(pos)
+                self.closers.pop()
+                if not self.closers:
+                    self.done = True
+                    self.missing = [key for key in self.required if key not in self.fields]
+            elif top_level:
+                if ch == ",":
+                    self._close_field(pos)
+                    self._expect_key = True
+                elif not ch.isspace() and ch != ":" and self._value_start is None and not self._expect_key:
+                    # Números, true / false / null
+                    self._value_start = pos
+        if self._stream_start is not None:
+            self._emit_stream()
+        return self.done
+
+    def _emit_stream(self):
+        end = self._stream_end if self._stream_end is not None else len(self.buffer)
+        raw = "".join(self.buffer[self._stream_start:end])
+        # Un escape a medio llegar ("\\", "\\u00") se entrega con el siguiente fragmento
+        partial = _PARTIAL_ESCAPE_RE.search(raw)
+        if partial and len(partial.group(1)) % 2:
+            raw = raw[:partial.end(1) - 1]
+        try:
+            decoded = json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            return
+        if decoded and "\ud800" <= decoded[-1] <= "\udbff":
+            # Primera mitad de un par sustituto: se espera a la segunda
+            decoded = decoded[:-1]
+        if self._stream_end is not None:
+            self._stream_start = None
+        if len(decoded) > len(self._streamed):
+            text, self._streamed = decoded[len(self._streamed):], decoded
+            self.on_text(text, self.fields)
+
+    def _close_field(self, end: int):
+        # Un campo de primer nivel termina con "," o con el cierre del objeto
+        if isinstance(self._key, str) and self._value_start is not None:
+            self.fields[self._key] = _loads_tolerant("".join(self.buffer[self._value_start:end]))
+        self._key = self._value_start = None
+
+    @property
+    def text(self) -> str:
+        """Texto del objeto JSON recibido hasta ahora."""
+        return "".join(self.buffer)
+
+    def result(self) -> Optional[Any]:
+        """
+        Objeto parseado, o None si el stream terminó sin cerrarlo (respuesta truncada) o si
+        faltan campos requeridos. Se toleran comas finales y literales de Python.
+        """
+        if not self.done or self.aborted or self.missing:
+            return None
+        return _loads_tolerant(self.text)
+
+
+def _loads_tolerant(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    repaired = _TRAILING_COMMA_RE.sub(r"\1", text)
+    repaired = _PYTHON_LITERAL_RE.sub(lambda m: _PYTHON_LITERALS[m.group(1)], repaired)
+    try:
+        return json.loads(repaired)
+    except ValueError:
+        return None
+
+
+def parse_json_object(text: str) -> Optional[Any]:
+    """Extrae y parsea el primer objeto JSON de un texto (con o sin markdown alrededor)."""
+    parser = IncrementalJSONParser(max_preamble=len(text or ""))
+    parser.feed(text or "")
+    return parser.result()
+
+
+def validate_intent(obj: Any) -> Optional[Dict[str, Any]]:
+    """
+    Valida y normaliza un intent contra INTENT_SCHEMA.
+
+    Returns:
+        Intent normalizado (listas de str, aggregation_type por defecto) o None si no
+        tiene un topic válido
+    """
+    if not isinstance(obj, dict):
+        return None
+    topic = obj.get("topic")
+    if not isinstance(topic, str) or not topic.strip():
+        return None
+
+    intent = dict(obj)
+    intent["topic"] = topic.strip()
+    for name in INTENT_LIST_FIELDS:
+        value = intent.get(name) or []
+        if not isinstance(value, list):
+            value = [value]
+        # Los filtros pueden venir como texto o ya normalizados (dict)
+        intent[name] = [v if isinstance(v, (str, dict)) else str(v) for v in value if v not in (None, "")]
+    if not isinstance(intent.get("aggregation_type"), str) or not intent["aggregation_type"]:
+        intent["aggregation_type"] = "statistics"
+    return intent
+
+
+def merge_intent_delta(intent: Dict[str, Any], delta: Any) -> Optional[Dict[str, Any]]:
+    """
+    Aplica una actualización parcial (INTENT_DELTA_SCHEMA) sobre un intent.
+
+    - topic / aggregation_type: se sustituyen si vienen con valor
+    - Filtros: una lista con valores sustituye a la anterior (el usuario la concreta o corrige)
+    - required_columns: se añaden a las anteriores, salvo si cambia el topic (se sustituyen)
+    - Una lista vacía explícita ([]) borra el campo
+    - Los campos ausentes o nulos se conservan
+
+    Returns:
+        Intent resultante validado o None si la actualización no es un objeto
+    """
+    if not isinstance(delta, dict):
+        return None
+    merged = dict(intent)
+    topic = delta.get("topic")
+    topic_changed = isinstance(topic, str) and bool(topic.strip()) \
+        and topic.strip().lower() != str(intent.get("topic") or "").strip().lower()
+    for name in ("topic", "aggregation_type"):
+        value = delta.get(name)
+        if isinstance(value, str) and value.strip():
+            merged[name] = value.strip()
+    if topic_changed:
+        # Las columnas del topic anterior ya no aplican
+        merged["required_columns"] = []
+    for name in INTENT_LIST_FIELDS:
+        if name not in delta or delta[name] is None or delta[name] == "":
+            continue
+        value = delta[name] if isinstance(delta[name], list) else [delta[name]]
+        if name == "required_columns" and value:
+            current = merged.get(name) or []
+            value = list(current) + [v for v in value if v not in current]
+        merged[name] = value
+    return validate_intent(merged)
+
+
+def _chunk_text(content: Union[str, list]) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+def _cache_for(llm: Any) -> Optional[BaseCache]:
+    cache = getattr(llm, "cache", None)
+    return cache if isinstance(cache, BaseCache) else None
+
+
+def _cache_keys(llm: Any, prompt: Any, fmt: Any) -> Tuple[str, str]:
+    # Mismas claves que usa BaseChatModel._generate_with_cache en llm.invoke(prompt, format=fmt)
+    return dumps(llm._convert_input(prompt).to_messages()), llm._get_llm_string(format=fmt)
+
+
+# Evento que se emite al responder desde la caché sin llamar al LLM (lo cuenta metrics.py)
+CACHE_HIT_EVENT = "llm_cache_hit"
+
+
+def _report_cache_hit():
+    # Fuera de un nodo del grafo no hay ejecución padre a la que notificar
+    try:
+        dispatch_custom_event(CACHE_HIT_EVENT, {})
+    except RuntimeError:
+        pass
+
+
+async def _areport_cache_hit():
+    try:
+        await adispatch_custom_event(CACHE_HIT_EVENT, {})
+    except RuntimeError:
+        pass
+
+
+def _finish(parser: IncrementalJSONParser) -> Optional[Any]:
+    result = parser.result()
+    if result is None and parser.started and not parser.aborted:
+        if not parser.done:
+            logger.warning("❌ JSON sin cerrar (respuesta truncada): %s", parser.text[:300])
+        elif parser.missing:
+            logger.warning("❌ JSON sin los campos requeridos %s: %s", parser.missing, parser.text[:300])
+    return result
+
+
+def _generation(parser: IncrementalJSONParser) -> list:
+    return [ChatGeneration(message=AIMessage(content=parser.text))]
+
+
+def stream_json(llm: Any, prompt: Any, schema: Optional[Dict[str, Any]] = None,
+                stream_field: Optional[str] = None, on_text: Optional[TextCallback] = None) -> Optional[Any]:
+    """
+    Genera un objeto JSON en streaming y corta la generación en cuanto el objeto se cierra.
+
+    Ollama recibe `format` (el JSON schema o "json"); otros modelos lo ignoran y el parser
+    tolerante extrae el objeto del texto. Si el LLM tiene caché (Context.llm_cache) se
+    consulta y actualiza con la misma clave que llm.invoke.
+
+    Args:
+        llm: Modelo de chat
+        prompt: Prompt (texto o mensajes)
+        schema: JSON schema de la respuesta (None = modo JSON libre)
+        stream_field: Campo string de primer nivel cuyo texto se entrega a on_text según se genera
+        on_text: Callback del texto de stream_field (no se llama si la respuesta sale de la caché)
+
+    Returns:
+        Objeto parseado o None si la respuesta no contiene un objeto JSON válido
+    """
+    fmt = schema or "json"
+    cache = _cache_for(llm)
+    if cache is not None:
+        cache_prompt, llm_string = _cache_keys(llm, prompt, fmt)
+        cached = cache.lookup(cache_prompt, llm_string)
+        if cached:
+            _report_cache_hit()
+            return parse_json_object(cached[0].text)
+
+    parser = IncrementalJSONParser(required=(schema or {}).get("required", ()),
+                                   stream_field=stream_field, on_text=on_text)
+    stream: Iterator = llm.stream(prompt, format=fmt)
+    try:
+        for chunk in stream:
+            if parser.feed(_chunk_text(chunk.content)):
+                break
+    finally:
+        # Cerrar el generador corta la petición en curso al servidor
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    result = _finish(parser)
+    if cache is not None and result is not None:
+        cache.update(cache_prompt, llm_string, _generation(parser))
+    return result
+
+
+async def astream_json(llm: Any, prompt: Any, schema: Optional[Dict[str, Any]] = None,
+                       stream_field: Optional[str] = None, on_text: Optional[TextCallback] = None) -> Optional[Any]:
+    """Versión asíncrona de stream_json (usa llm.astream)."""
+    fmt = schema or "json"
+    cache = _cache_for(llm)
+    if cache is not None:
+        cache_prompt, llm_string = _cache_keys(llm, prompt, fmt)
+        cached = await cache.alookup(cache_prompt, llm_string)
+        if cached:
+            await _areport_cache_hit()
+            return parse_json_object(cached[0].text)
+
+    parser = IncrementalJSONParser(required=(schema or {}).get("required", ()),
+                                   stream_field=stream_field, on_text=on_text)
+    stream: AsyncIterator = llm.astream(prompt, format=fmt)
+    try:
+        async for chunk in stream:
+            if parser.feed(_chunk_text(chunk.content)):
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            await aclose()
+
+    result = _finish(parser)
+    if cache is not None and result is not None:
+        await cache.aupdate(cache_prompt, llm_string, _generation(parser))
+    return result
@@ -0,0 +1,146 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from search import catalog
+from search.index import build_catalog_index
+from search.joiners import rank_datasets
+from search.loader import iter_catalog_summaries
+from search.schema_matcher import SchemaMatcher
+from search.snapshot import SnapshotIndex, SnapshotOverlay
+from search.text_index import BM25Index, PatchedBM25Index
+
+AIR = [
+    {"dataset_id": "a", "nombre": "Calidad del aire", "topic": "air quality",
+     "descripcion": "Estaciones de medición", "columnas": [
+         {"nombre": "timestamp", "descripcion": "Fecha de la medición"},
+         {"nombre": "no2", "descripcion": "Dióxido de nitrógeno"}]},
+    {"dataset_id": "b", "nombre": "Ruido urbano", "topic": "noise",
+     "descripcion": "Niveles de ruido por estación", "columnas": [{"nombre": "db"}]},
+]
+HEALTH = [
+    {"dataset_id": "c", "nombre": "Registro de pacientes", "topic": "patient records",
+     "descripcion": "Historias clínicas", "columnas": [
+         {"nombre": "age_group", "descripcion": "Grupo de edad"},
+         {"nombre": "gender", "descripcion": "Sexo del paciente"}]},
+    {"dataset_id": "d", "nombre": "Costes de tratamientos", "topic": "treatment costs",
+     "descripcion": "Coste por paciente y hospital", "columnas": [{"nombre": "coste"}]},
+]
+QUERIES = ["pacientes edad", "calidad aire", "coste hospital", "ruido", "vacunas", "nada que ver"]
+INTENTS = [
+    {},
+    {"required_columns": ["fecha", "edad"]},
+    {"required_columns": ["coste"], "spatial_filters": ["Madrid"], "demographic_filters": ["mujeres"]},
+    {"required_columns": ["columna inexistente"]},
+]
+
+
+def _write(sources, name, datasets):
+    path = sources / name
+    path.write_text(json.dumps(datasets), encoding="utf-8")
+    # Cambia el mtime aunque el sistema de ficheros tenga poca resolución
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _assert_same_catalog(index, sources):
+    expected = build_catalog_index([ds for path in sorted(sources.glob("*.json"))
+                                    for ds in iter_catalog_summaries(path)])
+    assert [ds["dataset_id"] for ds in index.datasets] == [ds["dataset_id"] for ds in expected.datasets]
+    assert sorted(index.by_id) == sorted(expected.by_id)
+    assert {k: [d["dataset_id"] for d in v] for k, v in index.by_topic.items()} == \
+        {k: [d["dataset_id"] for d in v] for k, v in expected.by_topic.items()}
+    assert index.topics == expected.topics
+    rebuilt = BM25Index(expected.datasets)
+    for query in QUERIES:
+        assert np.allclose(catalog.get_text_index(index).score(query), rebuilt.score(query))
+    profiles = SchemaMatcher(expected.datasets).profiles
+    assert {k: catalog.get_schema_matcher(index).profiles[k] for k in profiles} == profiles
+    assert sorted(catalog.get_schema_matcher(index).profiles) == sorted(profiles)
+    assert catalog.get_column_counts(index).tolist() == [len(ds["columnas"]) for ds in expected.datasets]
+    for intent in INTENTS:
+        assert np.allclose(catalog.score_catalog_schemas(intent, index),
+                           SchemaMatcher(expected.datasets).score(expected.datasets, intent))
+
+
+@pytest.fixture(params=[True, False], ids=["snapshot", "memory"])
+def sources(request, tmp_path, monkeypatch):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    _write(sources, "air.json", AIR)
+    _write(sources, "health.json", HEALTH)
+    monkeypatch.setattr(catalog, "SOURCES_DIR", sources)
+    monkeypatch.setattr(catalog, "SNAPSHOT_PATH", tmp_path / "catalog.snapshot")
+    monkeypatch.setattr(catalog, "USE_SNAPSHOT", request.param)
+    catalog.reload_catalogs()
+    yield sources
+    catalog.reload_catalogs()
+
+
+def test_patched_bm25_matches_rebuild():
+    datasets = AIR + HEALTH
+    patched = BM25Index(datasets).patch([1], HEALTH[:1])
+    current = [datasets[0], datasets[2], datasets[3], HEALTH[0]]
+    for query in QUERIES:
+        assert np.allclose(patched.score(query), BM25Index(current).score(query))
+
+    # Una segunda recarga se aplica sobre el mismo índice base
+    again = patched.patch([0, 3], AIR[1:])
+    assert isinstance(again, PatchedBM25Index) and again.base is patched.base
+    current = [datasets[2], datasets[3], AIR[1]]
+    for query in QUERIES:
+        assert np.allclose(again.score(query), BM25Index(current).score(query))
+    assert again.top_k("ruido", 1)[0][0] == 2
+
+
+def test_patched_profiles_only_build_added():
+    matcher = SchemaMatcher(AIR + HEALTH).patch(["a"], [dict(AIR[0], columnas=[{"nombre": "pm10"}])])
+    assert matcher.profiles["a"].column_terms == frozenset({"pm10"})
+    assert matcher.profiles["c"] == SchemaMatcher(HEALTH).profiles["c"]
+    removed = matcher.patch(["a"], [])
+    assert "a" not in removed.profiles and len(removed.profiles) == 3
+
+
+def test_reload_modified_and_removed_files(sources):
+    index = catalog.get_catalog_index()
+    _write(sources, "health.json", HEALTH[:1] + [{"dataset_id": "e", "nombre": "Vacunas", "topic": "vaccines",
+                                                  "columnas": [{"nombre": "dosis"}]}])
+    assert catalog.refresh_catalogs()
+    patched = catalog.get_catalog_index()
+    assert patched is not index
+    assert catalog.get_dataset_by_id("e")["nombre"] == "Vacunas"
+    assert catalog.get_dataset_by_id("d") is None
+    _assert_same_catalog(patched, sources)
+
+    (sources / "air.json").unlink()
+    assert catalog.refresh_catalogs()
+    _assert_same_catalog(catalog.get_catalog_index(), sources)
+    assert catalog.search_datasets("vacunas", 1)[0]["dataset_id"] == "e"
+
+
+def test_reload_does_not_decode_the_snapshot(sources, monkeypatch):
+    if not catalog.USE_SNAPSHOT:
+        pytest.skip("solo con snapshot")
+    assert isinstance(catalog.get_catalog_index(), SnapshotIndex)
+    decoded = []
+    original = SnapshotIndex.dataset
+    monkeypatch.setattr(SnapshotIndex, "dataset", lambda self, o: decoded.append(o) or original(self, o))
+    _write(sources, "health.json", HEALTH[1:])
+    assert catalog.refresh_catalogs()
+    assert isinstance(catalog.get_catalog_index(), SnapshotOverlay)
+    assert decoded == []
+
+
+def test_fallback_ranking_decodes_only_top_k(sources, monkeypatch):
+    if not catalog.USE_SNAPSHOT:
+        pytest.skip("solo con snapshot")
+    index = catalog.get_catalog_index()
+    decoded = []
+    original = SnapshotIndex.dataset
+    monkeypatch.setattr(SnapshotIndex, "dataset", lambda self, o: decoded.append(o) or original(self, o))
+    top = rank_datasets(index.datasets, k=1, coverage=catalog.score_catalog_schemas({"required_columns": ["edad"]}, index),
+                        completeness=catalog.get_column_counts(index))
+    assert [ds["dataset_id"] for ds in top] == ["c"]
+    assert len(decoded) == 1
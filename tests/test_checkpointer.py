@@ -0,0 +1,62 @@
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.types import Command
+
+from app import Context, build_graph, new_session_state
+from checkpointer import MESSAGES_CHANNEL, SQLiteCheckpointer
+from fake_llm import StubChatModel
+
+CONFIG = {"configurable": {"thread_id": "s1"}}
+
+
+def _run_session(saver):
+    graph = build_graph().compile(checkpointer=saver)
+    ctx = Context(llm=StubChatModel())
+    state = new_session_state()
+    state["messages"].append(HumanMessage(content="busca datos de calidad del aire en Madrid en 2024"))
+    graph.invoke(state, context=ctx, config=CONFIG)
+    graph.invoke(Command(resume="sí"), context=ctx, config=CONFIG)
+    graph.invoke({"messages": [HumanMessage(content="hola")]}, context=ctx, config=CONFIG)
+    return graph
+
+
+def _message_blob_types(saver):
+    return [row[0] for row in saver._db.execute("SELECT type FROM blobs WHERE channel = ?", (MESSAGES_CHANNEL,))]
+
+
+def test_messages_are_stored_as_deltas_and_survive_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteCheckpointer(path, keep_last=None)
+    messages = _run_session(saver).get_state(CONFIG).values["messages"]
+    assert any(t.startswith("delta:") for t in _message_blob_types(saver))
+    saver.close()
+
+    # Otro proceso (sin la caché en memoria) reconstruye la lista desde los deltas
+    reopened = SQLiteCheckpointer(path)
+    graph = build_graph().compile(checkpointer=reopened)
+    assert [m.content for m in graph.get_state(CONFIG).values["messages"]] == [m.content for m in messages]
+    reopened.close()
+
+
+def test_compaction_keeps_last_checkpoints(tmp_path):
+    saver = SQLiteCheckpointer(str(tmp_path / "checkpoints.sqlite"), keep_last=2)
+    graph = _run_session(saver)
+    before = graph.get_state(CONFIG).values["messages"]
+    removed = saver.compact()
+    assert removed["checkpoints"] > 0 and removed["blobs"] > 0
+    assert len(list(saver.list(CONFIG))) == 2
+    assert graph.get_state(CONFIG).values["messages"] == before
+    saver.close()
+
+
+def test_expired_threads_are_deleted(tmp_path):
+    saver = SQLiteCheckpointer(str(tmp_path / "checkpoints.sqlite"), ttl=0.0)
+    _run_session(saver)
+    assert saver.compact()["threads"] == 1
+    assert saver.get_tuple(CONFIG) is None
+    saver.close()
+
+
+def test_keep_last_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        SQLiteCheckpointer(str(tmp_path / "checkpoints.sqlite"), keep_last=0)
@@ -0,0 +1,89 @@
+import pytest
+
+from compute.engine import compute_aggregates
+from compute.plan import build_plan
+from compute.readers import ScanStats, iter_csv_chunks
+from filter_normalizer import normalize_intent
+from search.catalog import get_dataset_by_id
+
+DS3_ROWS = 588
+
+
+@pytest.fixture(scope="module")
+def ds3():
+    return get_dataset_by_id("ds3")
+
+
+def _ds3_result(ds3, intent):
+    aggregates, query_plan = compute_aggregates([ds3], normalize_intent(intent))
+    return aggregates["ds3"], query_plan
+
+
+@pytest.mark.parametrize("intent", [
+    {"aggregation_type": "count"},
+    {"aggregation_type": "count", "spatial_filters": ["España"]},
+    {"aggregation_type": "count", "demographic_filters": ["toda la población"]},
+    {"aggregation_type": "count", "required_columns": ["columna inexistente"]},
+])
+def test_count_without_columns_counts_every_row(ds3, intent):
+    result, query_plan = _ds3_result(ds3, intent)
+    assert result["status"] == "ok"
+    assert result["rows_scanned"] == result["rows_matched"] == DS3_ROWS
+    assert query_plan.startswith('SELECT COUNT(*) FROM "ds3"')
+
+
+def test_count_with_spatial_filter(ds3):
+    result, query_plan = _ds3_result(ds3, {"aggregation_type": "count", "spatial_filters": ["en Madrid"]})
+    assert result["rows_scanned"] == DS3_ROWS
+    assert 0 < result["rows_matched"] < DS3_ROWS
+    assert "madrid" in query_plan
+
+
+def test_statistics_on_value_column(ds3):
+    result, _ = _ds3_result(ds3, {"aggregation_type": "statistics", "required_columns": ["no2"]})
+    stats = result["columns"]["no2"]
+    assert stats["count"] == DS3_ROWS
+    assert stats["min"] <= stats["mean"] <= stats["max"]
+
+
+def test_chunked_execution_matches_single_chunk(ds3):
+    intent = normalize_intent({"aggregation_type": "average", "required_columns": ["pm25"],
+                               "spatial_filters": ["en Valencia"]})
+    whole, _ = compute_aggregates([ds3], intent)
+    chunked, _ = compute_aggregates([ds3], intent, chunk_rows=50)
+    assert chunked["ds3"]["chunks"] > whole["ds3"]["chunks"] == 1
+    assert chunked["ds3"]["columns"]["pm25"]["mean"] == pytest.approx(whole["ds3"]["columns"]["pm25"]["mean"])
+
+
+def test_plan_reads_only_needed_columns(ds3):
+    intent = normalize_intent({"aggregation_type": "average", "required_columns": ["pm25"],
+                               "spatial_filters": ["en Valencia"]})
+    plan = build_plan(ds3, intent)
+    assert "pm25" in plan.columns
+    assert "o3" not in plan.columns
+
+
+def test_csv_reader_without_columns_reads_first_column(tmp_path):
+    path = tmp_path / "t.csv"
+    path.write_text("a;b\n1;2\n3;4\n5;6\n", encoding="utf-8")
+    stats = ScanStats()
+    chunks = list(iter_csv_chunks(path, [], chunk_rows=2, stats=stats))
+    assert [list(c) for c in chunks] == [["a"], ["a"]]
+    assert stats.rows == 3 and stats.chunks == 2
+
+
+@pytest.mark.parametrize("place, station", [
+    ("Cataluña", "Barcelona"),
+    ("Comunitat Valenciana", "Valencia"),
+    ("provincia de Sevilla", "Sevilla"),
+])
+def test_region_matches_the_places_it_contains(ds3, place, station):
+    intent = {"aggregation_type": "row_level", "spatial_filters": [place], "required_columns": ["station_name"]}
+    result, _ = _ds3_result(ds3, intent)
+    assert result["rows_matched"] > 0
+    assert all(station in row["station_name"] for row in result["rows"])
+
+
+def test_region_without_stations_matches_nothing(ds3):
+    result, _ = _ds3_result(ds3, {"aggregation_type": "count", "spatial_filters": ["Bizkaia"]})
+    assert result["rows_matched"] == 0
@@ -0,0 +1,33 @@
+import pytest
+
+from confirmation_classifier import AFFIRMATIVE, NEGATIVE, classify_confirmation
+
+
+@pytest.mark.parametrize("reply", ["sí", "Sí.", "vale, adelante", "sí, es correcto", "sí, por favor, adelante"])
+def test_closed_affirmative(reply):
+    assert classify_confirmation(reply)[0] == AFFIRMATIVE
+
+
+@pytest.mark.parametrize("reply", ["no", "No.", "para nada", "no, gracias"])
+def test_closed_negative(reply):
+    assert classify_confirmation(reply)[0] == NEGATIVE
+
+
+@pytest.mark.parametrize("reply", [
+    "sí, busca en Valencia",
+    "sí, y añade Barcelona",
+    "adelante con Madrid y Sevilla",
+    "vale, pero solo en 2023",
+    "no, mejor 2023",
+])
+def test_replies_with_extra_information_go_to_llm(reply):
+    assert classify_confirmation(reply)[0] is None
+
+
+@pytest.mark.parametrize("reply", ["no, está bien así", "claro que no"])
+def test_mixed_polarity_goes_to_llm(reply):
+    assert classify_confirmation(reply)[0] is None
+
+
+def test_empty_reply():
+    assert classify_confirmation("  ") == (None, 0.0)
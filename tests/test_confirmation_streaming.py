@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from app import Context, build_graph, new_session_state
+from fake_llm import StubChatModel
+from structured_output import IncrementalJSONParser
+
+MESSAGE = "busca datos de calidad del aire en Madrid en 2024"
+
+
+def test_parser_streams_field_across_chunks():
+    parts = []
+    parser = IncrementalJSONParser(stream_field="confirmation", on_text=lambda text, fields: parts.append(text))
+    raw = '{"intent": {"confirmation": "no"}, "confirmation": "En resumen, \\"aire\\" en A Coru\\u00f1a\\n. \\ud83d\\ude00"}'
+    for i in range(0, len(raw), 3):
+        parser.feed(raw[i:i + 3])
+    assert "".join(parts) == parser.result()["confirmation"]
+    assert len(parts) > 1
+
+
+def _input():
+    state = new_session_state()
+    state["messages"].append(HumanMessage(content=MESSAGE))
+    return state
+
+
+def _last_ai(state):
+    return [m for m in state["messages"] if isinstance(m, AIMessage)][-1].content
+
+
+def test_combined_confirmation_is_streamed():
+    graph = build_graph().compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "stream"}}
+    tokens, state = [], None
+    for mode, data in graph.stream(_input(), context=Context(llm=StubChatModel()), config=config,
+                                   stream_mode=["custom", "values"]):
+        if mode == "custom":
+            assert data["node"] == "analyze_intent"
+            tokens.append(data["content"])
+        elif "messages" in data:
+            state = data
+    assert len(tokens) > 1
+    assert "".join(tokens).strip() == _last_ai(state)
+
+
+def test_clarification_does_not_stream_confirmation():
+    graph = build_graph(async_mode=True).compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "clarify"}}
+
+    async def run():
+        return [data async for mode, data in graph.astream(
+            _input(), context=Context(llm=StubChatModel(clarification_rounds=1)), config=config,
+            stream_mode=["custom"])]
+    assert asyncio.run(run()) == []
@@ -0,0 +1,42 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from context_window import (MAX_SUMMARY_CHARS, bounded_context, estimate_tokens, fit_messages,
+                            message_tokens, search_summaries, summarize_search)
+
+
+def _session(searches, turns=3):
+    messages, boundaries = [], []
+    for i in range(searches):
+        for j in range(turns):
+            messages.append(HumanMessage(content=f"búsqueda {i} turno {j} " + "x" * 200))
+            messages.append(AIMessage(content=f"respuesta {i} {j}"))
+        boundaries.append(len(messages))
+    return messages, boundaries
+
+
+def test_fit_messages_keeps_recent_and_first():
+    messages, _ = _session(1, turns=20)
+    kept = fit_messages(messages, 200)
+    assert kept == messages[-len(kept):]
+    assert sum(message_tokens(m) for m in kept) <= 200
+    assert fit_messages(messages, 200, keep_first=True)[0] is messages[0]
+    # Siempre se conserva al menos el último mensaje
+    assert fit_messages(messages, 0) == [messages[-1]]
+
+
+def test_summaries_reuse_stored_and_fill_missing():
+    messages, boundaries = _session(3)
+    summaries = search_summaries(messages, boundaries, ["guardado"])
+    assert summaries[0] == "guardado" and len(summaries) == 3
+    assert summaries[1].startswith("Búsqueda: búsqueda 1")
+    assert len(summarize_search("x" * 1000, [{"nombre": "aire"}])) == MAX_SUMMARY_CHARS
+
+
+def test_bounded_context_stays_within_budget_as_session_grows():
+    for searches in (1, 10, 100):
+        messages, boundaries = _session(searches)
+        state = {"messages": messages + [HumanMessage(content="nueva")], "search_boundaries": boundaries}
+        summaries, recent = bounded_context(state, 512)
+        used = sum(estimate_tokens(s) + 1 for s in summaries) + sum(message_tokens(m) for m in recent)
+        assert used <= 512
+        assert recent == [state["messages"][-1]]
@@ -0,0 +1,100 @@
+from typing import List
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command
+
+from app import Context, build_graph, new_session_state
+from fake_llm import StubChatModel
+from fast_router import RouterStats, classify_turn, is_closed_answer, normalize_text, topic_words
+
+TOPICS = topic_words(["air quality", "patient records", "treatment costs"])
+
+
+def test_normalize_text_strips_accents_and_keeps_enye():
+    assert normalize_text("¿Cuántos AÑOS?") == "cuantos años"
+
+
+@pytest.mark.parametrize("message", ["hola", "Muchas gracias!", "¿qué puedes hacer?"])
+def test_chat_turns(message):
+    assert classify_turn(message, TOPICS) == "chatbot"
+
+
+@pytest.mark.parametrize("message", [
+    "busca datos de empleo en Madrid",
+    "necesito estadísticas de paro",
+    "datos de contaminación en Madrid",
+    "dame los costes de treatment",
+])
+def test_clear_search_turns(message):
+    assert classify_turn(message, TOPICS) == "confirm_search"
+
+
+@pytest.mark.parametrize("message", [
+    "dame un chiste",
+    "Dame un ejemplo de lo que puedes hacer",
+    "consulta: ¿cómo funciona la licencia?",
+    "explícame la evolución de la app",
+])
+def test_verb_without_data_noun_goes_to_llm(message):
+    assert classify_turn(message, TOPICS) is None
+
+
+def test_open_question_from_assistant_skips_fast_path():
+    message = "busca datos de empleo"
+    assert classify_turn(message, TOPICS, previous_ai="¿Quieres buscar otra cosa?") is None
+    assert classify_turn(message, TOPICS, previous_ai="Estos son los datasets encontrados.") == "confirm_search"
+
+
+@pytest.mark.parametrize("text", [
+    "¿En qué puedo ayudarte?",
+    "Hola, soy el asistente de búsqueda de datos. ¿Qué datos necesitas?",
+    "Estos son los datasets encontrados. ¿Necesitas algo más?",
+    "¿Hay algo más en lo que pueda ayudarte?",
+])
+def test_closing_questions_are_not_open(text):
+    assert is_closed_answer(text)
+    assert classify_turn("gracias", TOPICS, previous_ai=text) == "chatbot"
+
+
+@pytest.mark.parametrize("text", [
+    "En resumen, busco datos de empleo. ¿Es correcto?",
+    "¿Quieres algo más específico sobre empleo?",
+    "¿Es correcto? ¿En qué más puedo ayudarte?",
+])
+def test_real_questions_stay_open(text):
+    assert not is_closed_answer(text)
+
+
+class RouterCountingModel(StubChatModel):
+    router_prompts: List[str] = []
+
+    def respond(self, prompt: str) -> str:
+        if "decide el siguiente nodo" in prompt:
+            self.router_prompts.append(prompt)
+        return super().respond(prompt)
+
+
+def test_thanks_after_finished_search_skips_llm_router():
+    graph = build_graph().compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "thanks"}}
+    ctx = Context(llm=RouterCountingModel(router_prompts=[]))
+    state = new_session_state()
+    state["messages"].append(HumanMessage(content="busca datos de calidad del aire en Madrid en 2024"))
+    graph.invoke(state, context=ctx, config=config)
+    # La confirmación ("¿Es correcto?") queda antes del boundary de la búsqueda terminada
+    final = graph.invoke(Command(resume="sí"), context=ctx, config=config)
+    assert len(final["search_boundaries"]) == 1
+
+    final = graph.invoke({"messages": [HumanMessage(content="gracias")]}, context=ctx, config=config)
+    assert ctx.llm.router_prompts == []
+    assert isinstance(final["messages"][-1], AIMessage)
+
+
+def test_router_stats_share():
+    stats = RouterStats()
+    stats.record("chatbot")
+    stats.record(None)
+    report = stats.report()
+    assert report["turns"] == 2 and report["fast_path_share"] == 0.5
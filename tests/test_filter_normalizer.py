@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+from filter_normalizer import contained_names, local_ambiguity, normalize_filter, normalize_intent
+
+TODAY = date(2025, 6, 1)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024", {"type": "year", "year": 2024}),
+    ("2020-2023", {"type": "range", "start": 2020, "end": 2023}),
+    ("últimos 3 años", {"type": "last_n_years", "n": 3}),
+])
+def test_temporal(value, expected):
+    result = normalize_filter("temporal_filters", value, TODAY)
+    assert not result.vague
+    assert result.normalized and expected.items() <= result.normalized[0].items()
+
+
+def test_temporal_vague():
+    assert normalize_filter("temporal_filters", "últimos años", TODAY).vague
+
+
+def test_place_aliases_and_levels():
+    result = normalize_filter("spatial_filters", "en Vizcaya", TODAY)
+    place = result.normalized[0]["places"][0]
+    assert place["name"] == "Bizkaia" and place["level"] == "province"
+    assert "vizcaya" in place["names"]
+
+
+def test_community_contains_its_provinces_and_cities():
+    place = normalize_filter("spatial_filters", "Cataluña", TODAY).normalized[0]["places"][0]
+    names = contained_names(place)
+    assert place["level"] == "community"
+    assert {"Barcelona", "Girona", "Badalona"} <= set(names)
+    assert "Madrid" not in names
+
+
+def test_province_contains_its_cities_and_city_contains_nothing():
+    province = normalize_filter("spatial_filters", "provincia de Madrid", TODAY).normalized[0]["places"][0]
+    assert "Móstoles" in contained_names(province)
+    city = normalize_filter("spatial_filters", "Getafe", TODAY).normalized[0]["places"][0]
+    assert contained_names(city) == []
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("mayores de 65", {"type": "age_range", "min": 66, "max": None}),
+    ("mujeres", {"type": "sex", "value": "female"}),
+    ("toda la población", {"type": "all"}),
+])
+def test_demographic(value, expected):
+    assert normalize_filter("demographic_filters", value, TODAY).normalized[0] == expected
+
+
+def test_unknown_value_stays_as_text():
+    result = normalize_filter("demographic_filters", "extranjeros", TODAY)
+    assert not result.normalized
+
+
+def test_local_ambiguity_decides_clear_intents():
+    intent = normalize_intent({
+        "topic": "empleo",
+        "temporal_filters": ["2024"],
+        "spatial_filters": ["en Madrid"],
+        "demographic_filters": [],
+    }, TODAY)
+    decided, question = local_ambiguity(intent)
+    assert decided and question is None
+
+
+def test_local_ambiguity_asks_about_vague_values():
+    intent = normalize_intent({"topic": "empleo", "temporal_filters": ["últimos años"]}, TODAY)
+    decided, question = local_ambiguity(intent)
+    assert decided and question
@@ -0,0 +1,72 @@
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from llm_cache import LLMResponseCache, cache_key
+from structured_output import INTENT_SCHEMA, stream_json
+
+PROMPT = "divide su intención: busca datos de calidad del aire"
+
+
+class CountingChatModel(FakeListChatModel):
+    """Modelo falso que cuenta las llamadas reales (las que no sirve la caché)."""
+    calls: int = 0
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        self.calls += 1
+        yield from super()._stream(*args, **kwargs)
+
+
+def _model(cache):
+    return CountingChatModel(responses=["uno", "dos"], cache=cache)
+
+
+def test_invoke_is_served_from_memory():
+    cache = LLMResponseCache()
+    llm = _model(cache)
+    first = llm.invoke("hola").content
+    assert llm.invoke("hola").content == first
+    assert llm.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_stream_json_uses_the_same_cache_as_invoke():
+    cache = LLMResponseCache()
+    llm = CountingChatModel(responses=['{"topic": "calidad del aire", "temporal_filters": [], '
+                                       '"spatial_filters": [], "demographic_filters": [], '
+                                       '"required_columns": [], "aggregation_type": "average"}'], cache=cache)
+    first = stream_json(llm, PROMPT, INTENT_SCHEMA)
+    assert first["topic"] == "calidad del aire"
+    assert stream_json(llm, PROMPT, INTENT_SCHEMA) == first
+    assert llm.invoke(PROMPT, format=INTENT_SCHEMA).content
+    assert llm.calls == 1
+
+
+def test_disk_level_survives_restart(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    _model(LLMResponseCache(sqlite_path=path)).invoke("hola")
+    cache = LLMResponseCache(sqlite_path=path)
+    llm = _model(cache)
+    llm.invoke("hola")
+    assert llm.calls == 0
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_expired_entries_are_not_used():
+    cache = LLMResponseCache(ttl=-1.0)
+    llm = _model(cache)
+    llm.invoke("hola")
+    llm.invoke("hola")
+    assert llm.calls == 2
+
+
+def test_key_ignores_volatile_message_fields():
+    def serialized(message_id):
+        return json.dumps([{"lc": 1, "type": "constructor", "id": ["HumanMessage"],
+                            "kwargs": {"content": "hola", "id": message_id, "response_metadata": {"t": message_id}}}])
+    assert cache_key(serialized("a"), "llm") == cache_key(serialized("b"), "llm")
+    assert cache_key(serialized("a"), "llm") != cache_key(serialized("a"), "other-llm")
@@ -0,0 +1,43 @@
+import json
+
+from search.loader import SOURCE_KEY, iter_catalog_file, iter_catalog_summaries, load_full_dataset
+
+DATASETS = [
+    {"dataset_id": "a", "titulo": "Calidad del aire {con llaves}",
+     "columnas": [{"nombre": "no2", "ejemplo": [1, 2]}]},
+    {"dataset_id": "b", "titulo": "Empleo \"2024\"", "columnas": [{"nombre": "paro", "ejemplo": ["ñ"]}]},
+]
+
+
+def _write(tmp_path, payload):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def test_offsets_point_at_each_dataset(tmp_path):
+    path = _write(tmp_path, DATASETS)
+    raw = path.read_bytes()
+    # Bloques pequeños para forzar objetos partidos entre lecturas
+    entries = list(iter_catalog_file(path, chunk_size=16))
+    assert [ds for _, _, ds in entries] == DATASETS
+    for offset, length, ds in entries:
+        assert json.loads(raw[offset:offset + length].decode("utf-8")) == ds
+
+
+def test_single_dataset_file(tmp_path):
+    path = _write(tmp_path, DATASETS[0])
+    assert [ds for _, _, ds in iter_catalog_file(path)] == [DATASETS[0]]
+
+
+def test_summaries_drop_examples_and_load_back(tmp_path):
+    path = _write(tmp_path, DATASETS)
+    summaries = list(iter_catalog_summaries(path, chunk_size=16))
+    assert all("ejemplo" not in col for s in summaries for col in s["columnas"])
+    assert [load_full_dataset(s) for s in summaries] == DATASETS
+
+
+def test_missing_source_falls_back_to_summary(tmp_path):
+    summary = {"dataset_id": "x", "columnas": [], SOURCE_KEY: (str(tmp_path / "missing.json"), 0, 10)}
+    assert load_full_dataset(summary) is summary
+    assert load_full_dataset(DATASETS[0]) is DATASETS[0]
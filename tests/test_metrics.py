@@ -0,0 +1,80 @@
+import re
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from app import Context, build_graph, turn_input
+from fake_llm import StubChatModel
+from llm_cache import LLMResponseCache
+from metrics import ROUTER_NODE, MetricsCollector, MetricsRegistry
+
+# aclaración → confirmación → búsqueda
+TURNS = ("busca datos de calidad del aire", "Madrid en 2024", "sí")
+
+# Línea de muestra del formato de texto de Prometheus: nombre{etiquetas} valor
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{((?:[a-zA-Z_]\w*="(?:[^"\\]|\\.)*",?)*)\})? (\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_]\w*)="((?:[^"\\]|\\.)*)"')
+
+
+def _run_sessions(*thread_ids):
+    registry = MetricsRegistry()
+    collector = MetricsCollector(registry)
+    graph = build_graph().compile(checkpointer=MemorySaver())
+    ctx = Context(llm=StubChatModel(clarification_rounds=1), llm_cache=LLMResponseCache())
+    for thread_id in thread_ids:
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": [collector]}
+        for message in TURNS:
+            graph.invoke(turn_input(graph.get_state(config), message), context=ctx, config=config)
+        assert len(graph.get_state(config).values["search_boundaries"]) == 1
+    return registry
+
+
+def _parse_prometheus(text):
+    """Muestras {(nombre, etiquetas): valor}; falla si alguna línea no es válida."""
+    samples, declared = {}, set()
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            parts = line.split(" ", 3)
+            assert len(parts) == 4, line
+            if parts[1] == "TYPE":
+                assert parts[3] in ("counter", "gauge"), line
+                declared.add(parts[2])
+            continue
+        match = SAMPLE_RE.match(line)
+        assert match, f"línea no válida: {line!r}"
+        name, labels, value = match.groups()
+        assert name in declared, f"muestra sin # TYPE: {name}"
+        samples[(name, tuple(LABEL_RE.findall(labels or "")))] = float(value)
+    return samples
+
+
+def test_session_metrics_through_clarification_and_search():
+    registry = _run_sessions("primera", "repetida")
+    first = registry.snapshot("primera")
+    runs = {node: stats["calls"] for node, stats in first["nodes"].items()}
+    assert runs[ROUTER_NODE] == 1
+    # Dos análisis: el mensaje inicial y la respuesta a la aclaración
+    assert runs["analyze_intent"] == 2
+    assert runs["ask_clarification"] == 2  # pausa + reanudación
+    assert runs["search"] == runs["dashboard"] == 1
+    assert first["clarification_rounds"] == 1
+    assert first["llm_calls"] == 2 and first["cache_hits"] == 0
+    assert first["prompt_tokens"] > 0 and first["completion_tokens"] > 0
+
+    # La misma conversación en otra sesión se sirve entera desde la caché del LLM
+    repeated = registry.snapshot("repetida")
+    assert repeated["nodes"].keys() == first["nodes"].keys()
+    assert repeated["llm_calls"] == repeated["cache_hits"] == 2
+    assert repeated["clarification_rounds"] == 1
+
+    totals = registry.snapshot()["totals"]
+    assert totals["llm_calls"] == 4 and totals["cache_hits"] == 2
+    assert totals["clarification_rounds"] == 2
+
+
+def test_prometheus_export_parses():
+    registry = _run_sessions("a", 'con "comillas"')
+    samples = _parse_prometheus(registry.to_prometheus())
+    assert samples[("agent_node_runs_total", (("thread_id", "a"), ("node", "search")))] == 1
+    assert samples[("agent_llm_cache_hits_total", (("thread_id", 'con \\"comillas\\"'),))] == 2
+    assert samples[("agent_clarification_rounds_total", (("thread_id", "a"),))] == 1
+    assert samples[("agent_tracked_threads", ())] == 2
@@ -0,0 +1,78 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import app
+import result_cache
+from compute.engine import DATA_FILE_KEY
+from result_cache import ResultCache, canonical_intent
+
+INTENT = {"topic": "Calidad del Aire", "spatial_filters": ["Madrid", "2024"], "aggregation_type": "average"}
+OK = {"ds": {"status": "ok", "rows_matched": 3}}
+
+
+@pytest.fixture
+def version(monkeypatch):
+    current = [1]
+    monkeypatch.setattr(result_cache, "get_catalog_version", lambda: current[0])
+    return current
+
+
+def test_canonical_intent_ignores_case_accents_and_order():
+    same = {"topic": "calidad del aíre", "spatial_filters": ["2024", "madrid", "Madrid"],
+            "temporal_filters": [], "aggregation_type": "AVERAGE"}
+    assert canonical_intent(INTENT) == canonical_intent(same)
+    assert canonical_intent(INTENT) != canonical_intent(dict(INTENT, spatial_filters=["Sevilla"]))
+
+
+def test_search_hit_and_lru_eviction(version):
+    cache = ResultCache(max_entries=1)
+    cache.put_search(INTENT, [{"dataset_id": "a"}], [{"name": "a"}])
+    assert cache.get_search(dict(INTENT, topic="calidad del aire")) == ([{"dataset_id": "a"}], [{"name": "a"}])
+    cache.put_search({"topic": "empleo"}, [{"dataset_id": "b"}], [{"name": "b"}])
+    assert cache.get_search(INTENT) is None
+    assert cache.stats()["hits"]["search"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_catalog_reload_invalidates(version):
+    cache = ResultCache()
+    cache.put_search(INTENT, [{"dataset_id": "a"}], [{"name": "a"}])
+    version[0] += 1
+    assert cache.get_search(INTENT) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_aggregates_follow_local_tables(version, tmp_path):
+    table = tmp_path / "ds.csv"
+    table.write_text("fecha,no2\n2024-01-01,3\n", encoding="utf-8")
+    datasets = [{"dataset_id": "ds", DATA_FILE_KEY: str(table)}]
+    cache = ResultCache()
+    cache.put_aggregates(INTENT, datasets, OK, "SELECT 1")
+    aggregates, query_plan = cache.get_aggregates(INTENT, datasets)
+    assert (aggregates, query_plan) == (OK, "SELECT 1")
+    aggregates["ds"]["rows_matched"] = 0
+    assert cache.get_aggregates(INTENT, datasets)[0] == OK
+
+    stat = table.stat()
+    os.utime(table, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get_aggregates(INTENT, datasets) is None
+
+
+def test_incomplete_aggregates_are_not_stored(version):
+    cache = ResultCache()
+    cache.put_aggregates(INTENT, [], {"ds": {"status": "cancelled"}}, None)
+    assert cache.get_aggregates(INTENT, []) is None
+
+
+def test_search_hit_reuses_cached_schemas(version, monkeypatch):
+    found = ([{"dataset_id": "a"}], [{"name": "a", "columns": []}], False)
+    searches = []
+    monkeypatch.setattr(app, "search_catalog", lambda intent: searches.append(intent) or found)
+    monkeypatch.setattr(app, "extract_schemas", lambda datasets: pytest.fail("extract_schemas en un acierto"))
+    runtime = SimpleNamespace(context=SimpleNamespace(result_cache=ResultCache(), speculative_search=None))
+    state = {"user_search_intent": "calidad del aire", "user_search_intent_structured": INTENT, "iterations": 0}
+    first = app.node_search(state, runtime)
+    second = app.node_search(state, runtime)
+    assert len(searches) == 1
+    assert (second["useful_data"], second["schemas"]) == (first["useful_data"], first["schemas"]) == found[:2]
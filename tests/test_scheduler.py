@@ -0,0 +1,56 @@
+import pytest
+
+from compute.engine import DATA_FILE_KEY, PartialAggregate, compute_aggregates, plan_datasets, resolve_data_file
+from compute.scheduler import CANCELLED, DONE, ResultBoard, _run_task, compute_parallel, shutdown_pool
+from filter_normalizer import normalize_intent
+from search.catalog import get_dataset_by_id
+
+INTENT = normalize_intent({"aggregation_type": "statistics", "required_columns": ["no2", "pm25"],
+                           "spatial_filters": ["en Madrid"]})
+
+
+@pytest.fixture(scope="module")
+def datasets():
+    # Varias copias de ds3 (la única tabla local del repositorio) con IDs distintos
+    ds3 = get_dataset_by_id("ds3")
+    path = str(resolve_data_file(ds3).resolve())
+    yield [dict(ds3, dataset_id=f"ds3_{i}", **{DATA_FILE_KEY: path}) for i in range(3)]
+    shutdown_pool()
+
+
+def _without_timing(aggregates):
+    return {k: {f: v for f, v in r.items() if "ms" not in f and "seconds" not in f} for k, r in aggregates.items()}
+
+
+def test_parallel_matches_sequential(datasets):
+    sequential, sequential_sql = compute_aggregates(datasets, INTENT, chunk_rows=100)
+    parallel, parallel_sql = compute_parallel(datasets, INTENT, chunk_rows=100, max_workers=2,
+                                              min_answers=len(datasets))
+    assert parallel_sql == sequential_sql
+    assert _without_timing(parallel) == _without_timing(sequential)
+    assert all(r["status"] == "ok" for r in parallel.values())
+
+
+def test_result_board_round_trip(datasets):
+    plan = plan_datasets(datasets[:1], INTENT)[0]
+    expected, _ = compute_aggregates(datasets[:1], INTENT, chunk_rows=100, plans=[plan])
+    board = ResultBoard(2, len(plan.value_columns))
+    try:
+        _run_task(plan, 100, board.name, 2, len(plan.value_columns), 1)
+        assert board.state(1) == DONE and board.state(0) == 0
+        read = PartialAggregate(plan.dataset_id)
+        board.read(1, read, plan.value_columns)
+        assert _without_timing({"x": read.result(plan)}) == _without_timing({"x": expected[plan.dataset_id]})
+    finally:
+        board.close()
+
+
+def test_cancel_flag_stops_task_before_reading(datasets):
+    plan = plan_datasets(datasets[:1], INTENT)[0]
+    board = ResultBoard(1, len(plan.value_columns))
+    try:
+        board.cancel[0] = 1
+        assert _run_task(plan, 100, board.name, 1, len(plan.value_columns), 0) == ([], [], True)
+        assert board.state(0) == CANCELLED
+    finally:
+        board.close()
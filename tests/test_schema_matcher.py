@@ -0,0 +1,37 @@
+from search.schema_matcher import SchemaMatcher
+
+PATIENTS = {"dataset_id": "p", "columnas": [{"nombre": "gender"}, {"nombre": "admission_date"},
+                                            {"nombre": "city"}]}
+AIR = {"dataset_id": "a", "columnas": [{"nombre": "timestamp"}, {"nombre": "no2"},
+                                       {"nombre": "station_name"}]}
+
+
+def _scores(intent):
+    return list(SchemaMatcher([PATIENTS, AIR]).score([PATIENTS, AIR], intent))
+
+
+def test_required_column_needs_term_or_synonym():
+    # "edad" no se satisface con "gender" aunque sean de la misma dimensión
+    assert _scores({"required_columns": ["edad"]}) == [0.0, 0.0]
+    assert _scores({"required_columns": ["sexo"]}) == [1.0, 0.0]
+
+
+def test_required_column_synonym():
+    assert _scores({"required_columns": ["fecha"]}) == [1.0, 1.0]
+    assert _scores({"required_columns": ["ciudad"]}) == [1.0, 0.0]
+
+
+def test_filters_use_dimension_fallback():
+    assert _scores({"spatial_filters": ["Madrid"], "demographic_filters": ["mujeres"]}) == [1.0, 0.5]
+
+
+def test_prune_drops_unusable_datasets():
+    matcher = SchemaMatcher([PATIENTS, AIR])
+    kept = matcher.prune([PATIENTS, AIR], {"required_columns": ["no2", "fecha"]})
+    assert [i for i, _ in kept] == [0, 1]
+    kept = matcher.prune([PATIENTS, AIR], {"required_columns": ["no2", "pm10", "station"]})
+    assert [i for i, _ in kept] == [1]
+
+
+def test_empty_intent_keeps_everything():
+    assert _scores(None) == [1.0, 1.0]
@@ -0,0 +1,20 @@
+from app import search_catalog
+
+
+def test_matching_topic_is_not_a_fallback():
+    useful, schemas, fallback = search_catalog({"topic": "pacientes", "required_columns": ["edad"]})
+    assert not fallback
+    assert useful and len(schemas) == len(useful)
+
+
+def test_no_bm25_match_falls_back_to_whole_catalog():
+    useful, schemas, fallback = search_catalog({"topic": "astrofísica cuántica"})
+    assert fallback
+    assert useful and len(schemas) == len(useful)
+
+
+def test_empty_intent_falls_back_to_whole_catalog():
+    useful, _, fallback = search_catalog({})
+    assert fallback
+    assert useful
+
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+from app import Context
+from fake_llm import StubChatModel
+from server import GraphServer, HTTPError
+
+MESSAGE = "busca datos de calidad del aire en Madrid en 2024"
+
+
+def _server(latency: float = 0.0, **limits) -> GraphServer:
+    return GraphServer(Context(llm=StubChatModel(latency=latency)), **limits)
+
+
+async def _turn(server: GraphServer, thread_id: str, message: str):
+    events = []
+
+    async def emit(event):
+        events.append(event)
+    await server.run_turn(thread_id, message, emit)
+    return events
+
+
+async def _post(port: int, thread_id: str, message: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps({"message": message}).encode("utf-8")
+    writer.write(b"POST /sessions/%s/messages HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s"
+                 % (thread_id.encode(), len(body), body))
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    if headers.get("Transfer-Encoding") == "chunked":
+        chunks = bytearray()
+        while True:
+            size, _, payload = payload.partition(b"\r\n")
+            if int(size, 16) == 0:
+                break
+            chunks += payload[:int(size, 16)]
+            payload = payload[int(size, 16) + 2:]
+        payload = bytes(chunks)
+    return int(lines[0].split()[1]), headers, payload
+
+
+def test_global_limit_answers_503():
+    async def run():
+        server = _server(latency=0.3, max_concurrent_turns=1, queue_timeout=0.05)
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        async with tcp:
+            busy = asyncio.create_task(_turn(server, "a", MESSAGE))
+            await asyncio.sleep(0.05)
+            status, headers, payload = await _post(port, "b", MESSAGE)
+            await busy
+        return server, status, headers, payload
+    server, status, headers, payload = asyncio.run(run())
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+    assert "error" in json.loads(payload)
+    assert server.stats["rejected_busy"] == 1
+
+
+def test_session_pending_limit_answers_429():
+    async def run():
+        server = _server(latency=0.2, max_pending_per_session=1)
+        first = asyncio.create_task(_turn(server, "s", MESSAGE))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(_turn(server, "s", "sí"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPError) as rejected:
+            await _turn(server, "s", "otra")
+        await first
+        await queued
+        return server, rejected.value
+    server, rejected = asyncio.run(run())
+    assert rejected.status == 429
+    assert server.stats["rejected_session"] == 1
+    assert server.sessions["s"].turns == 2
+
+
+def test_confirmation_is_resumed_with_command():
+    async def run():
+        server = _server()
+        first = await _turn(server, "r", MESSAGE)
+        second = await _turn(server, "r", "sí")
+        state = await server.graph.aget_state({"configurable": {"thread_id": "r"}})
+        return first, second, state
+    first, second, state = asyncio.run(run())
+    assert first[-1] == {"type": "done", "awaiting_input": True}
+    assert second[-1] == {"type": "done", "awaiting_input": False}
+    # La respuesta reanuda la confirmación: la búsqueda termina en vez de empezar un turno nuevo
+    assert len(state.values["search_boundaries"]) == 1
+    assert not state.next
+
+
+def test_ndjson_event_order():
+    async def run():
+        server = _server()
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        async with tcp:
+            return await _post(tcp.sockets[0].getsockname()[1], "n", MESSAGE)
+    status, headers, payload = asyncio.run(run())
+    assert status == 200 and headers["Content-Type"] == "application/x-ndjson"
+    events = [json.loads(line) for line in payload.decode("utf-8").splitlines()]
+    types = [e["type"] for e in events]
+    assert types[-2:] == ["interrupt", "done"]
+    # Los tokens de la confirmación llegan antes que el mensaje completo del mismo nodo
+    message = next(e for e in events if e["type"] == "message")
+    tokens = [e for e in events[:events.index(message)] if e["type"] == "token"]
+    assert tokens and all(e["node"] == message["node"] for e in tokens)
+    assert "".join(e["content"] for e in tokens).strip() == message["content"]
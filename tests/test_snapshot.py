@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+from search.index import build_catalog_index
+from search.loader import iter_catalog_summaries
+from search.schema_matcher import SchemaMatcher
+from search.snapshot import SnapshotIndex, build_snapshot, open_snapshot
+from search.text_index import BM25Index
+
+CATALOG = [
+    {"dataset_id": "a", "nombre": "Calidad del aire", "topic": "air quality",
+     "descripcion": "Estaciones de medición", "columnas": [
+         {"nombre": "timestamp", "descripcion": "Fecha de la medición"},
+         {"nombre": "station_name", "descripcion": "Nombre de la estación"},
+         {"nombre": "no2", "descripcion": "Dióxido de nitrógeno"}]},
+    {"dataset_id": "b", "nombre": "Registro de pacientes", "topic": "patient records",
+     "descripcion": "Historias clínicas", "columnas": [
+         {"nombre": "age_group", "descripcion": "Grupo de edad"},
+         {"nombre": "gender", "descripcion": "Sexo del paciente"}]},
+    {"dataset_id": "c", "nombre": "Costes de tratamientos", "topic": "treatment costs",
+     "descripcion": "Coste por paciente y hospital", "columnas": [{"nombre": "coste"}]},
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    (sources / "catalog.json").write_text(json.dumps(CATALOG), encoding="utf-8")
+    snap = open_snapshot(tmp_path / "catalog.snapshot", sources)
+    yield snap, sources
+    snap.close()
+
+
+def test_snapshot_exposes_catalog_index_interface(snapshot):
+    snap, sources = snapshot
+    memory = build_catalog_index(list(iter_catalog_summaries(sources / "catalog.json")))
+    assert len(snap.datasets) == 3
+    assert snap.by_id["b"]["nombre"] == "Registro de pacientes"
+    assert [d["dataset_id"] for d in snap.by_topic["air quality"]] == ["a"]
+    assert snap.topics == memory.topics
+
+
+def test_bm25_is_mapped_not_rebuilt(snapshot):
+    snap, _ = snapshot
+    index = snap.text_index
+    assert isinstance(index, BM25Index)
+    assert not index.doc_ids.flags.owndata and not index.doc_ids.flags.writeable
+    rebuilt = BM25Index(list(snap.datasets))
+    for query in ["pacientes edad", "calidad aire", "coste hospital", "nada que ver"]:
+        assert np.allclose(index.score(query), rebuilt.score(query))
+    assert index.top_k("pacientes", 3)[0][0] in (1, 2)
+
+
+def test_schema_profiles_are_mapped(snapshot):
+    snap, _ = snapshot
+    rebuilt = SchemaMatcher(list(snap.datasets))
+    for ds_id in ("a", "b", "c"):
+        assert snap.schema_matcher.profiles[ds_id] == rebuilt.profiles[ds_id]
+    assert "z" not in snap.schema_matcher.profiles
+
+
+def test_stale_snapshot_is_rebuilt(snapshot, tmp_path):
+    snap, sources = snapshot
+    (sources / "catalog.json").write_text(json.dumps(CATALOG[:1]), encoding="utf-8")
+    reopened = open_snapshot(tmp_path / "catalog.snapshot", sources)
+    assert len(reopened.datasets) == 1
+    assert len(reopened.text_index.doc_lengths) == 1
+    reopened.close()
+
+
+def test_close_with_arrays_in_use(tmp_path):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    (sources / "catalog.json").write_text(json.dumps(CATALOG), encoding="utf-8")
+    path = build_snapshot(sources, tmp_path / "catalog.snapshot")
+    snap = SnapshotIndex(path, sources)
+    in_use = snap.text_index
+    snap.close()
+    assert in_use.top_k("aire", 1)
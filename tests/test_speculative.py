@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+import speculative
+from speculative import SpeculativeSearch
+
+INTENT = {"topic": "Calidad del Aire", "spatial_filters": ["Madrid"]}
+RESULT = ([{"dataset_id": "ds3"}], [], False)
+
+
+@pytest.fixture
+def version(monkeypatch):
+    current = [1]
+    monkeypatch.setattr(speculative, "get_catalog_version", lambda: current[0])
+    return current
+
+
+@pytest.fixture
+def searches():
+    calls = []
+    spec = SpeculativeSearch(lambda intent: calls.append(intent) or RESULT)
+    yield spec, calls
+    spec.shutdown()
+
+
+def test_confirmed_intent_uses_speculative_result(version, searches):
+    spec, calls = searches
+    spec.start("s1", INTENT)
+    spec.start("s1", dict(INTENT, topic="calidad del aire"))  # Re-ejecución del nodo: no relanza
+    assert spec.take("s1", INTENT) == RESULT
+    assert len(calls) == 1
+    assert spec.stats()["started"] == 1 and spec.stats()["used"] == 1
+    assert spec.take("s1", INTENT) is None
+
+
+def test_changed_intent_discards(version, searches):
+    spec, _ = searches
+    spec.start("s1", INTENT)
+    assert spec.take("s1", dict(INTENT, topic="empleo")) is None
+    assert spec.stats()["discarded"] == 1
+
+
+def test_catalog_reload_discards(version, searches):
+    spec, _ = searches
+    spec.start("s1", INTENT)
+    version[0] += 1
+    assert spec.take("s1", INTENT) is None
+
+
+def test_failed_search_falls_back(version):
+    def fail(intent):
+        raise RuntimeError("boom")
+    spec = SpeculativeSearch(fail)
+    try:
+        spec.start("s1", INTENT)
+        assert spec.take("s1", INTENT) is None
+        assert spec.stats()["failed"] == 1
+    finally:
+        spec.shutdown()
+
+
+def test_oldest_sessions_are_evicted(version):
+    release = threading.Event()
+    spec = SpeculativeSearch(lambda intent: release.wait() and RESULT, max_sessions=1)
+    try:
+        spec.start("s1", INTENT)
+        spec.start("s2", INTENT)
+        assert spec.stats()["pending"] == 1
+        release.set()
+        assert spec.take("s1", INTENT) is None
+        assert spec.take("s2", INTENT) == RESULT
+    finally:
+        release.set()
+        spec.shutdown()
@@ -0,0 +1,77 @@
+from structured_output import IncrementalJSONParser, merge_intent_delta, parse_json_object, validate_intent
+
+INTENT = validate_intent({
+    "topic": "calidad del aire",
+    "temporal_filters": ["2024"],
+    "spatial_filters": ["Madrid"],
+    "demographic_filters": [],
+    "required_columns": ["fecha", "no2"],
+    "aggregation_type": "average",
+})
+
+
+def test_validate_intent_requires_topic():
+    assert validate_intent({"topic": "  "}) is None
+    assert validate_intent("no es un objeto") is None
+    assert validate_intent({"topic": "empleo"})["aggregation_type"] == "statistics"
+
+
+def test_missing_fields_are_kept():
+    merged = merge_intent_delta(INTENT, {"temporal_filters": ["2023"]})
+    assert merged["temporal_filters"] == ["2023"]
+    assert merged["spatial_filters"] == ["Madrid"]
+    assert merged["required_columns"] == ["fecha", "no2"]
+
+
+def test_null_fields_are_kept():
+    merged = merge_intent_delta(INTENT, {"spatial_filters": None})
+    assert merged["spatial_filters"] == ["Madrid"]
+
+
+def test_explicit_empty_list_clears():
+    merged = merge_intent_delta(INTENT, {"spatial_filters": [], "required_columns": []})
+    assert merged["spatial_filters"] == []
+    assert merged["required_columns"] == []
+
+
+def test_required_columns_accumulate_on_same_topic():
+    merged = merge_intent_delta(INTENT, {"topic": "Calidad del aire", "required_columns": ["pm25", "no2"]})
+    assert merged["required_columns"] == ["fecha", "no2", "pm25"]
+
+
+def test_topic_change_replaces_required_columns():
+    merged = merge_intent_delta(INTENT, {"topic": "pacientes", "required_columns": ["edad"]})
+    assert merged["topic"] == "pacientes"
+    assert merged["required_columns"] == ["edad"]
+    merged = merge_intent_delta(INTENT, {"topic": "pacientes"})
+    assert merged["required_columns"] == []
+
+
+def test_invalid_delta():
+    assert merge_intent_delta(INTENT, ["no", "es", "un", "objeto"]) is None
+
+
+def test_parser_skips_preamble_and_stops_at_close():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('```json\n{"topic": "empleo", "years": [20')
+    assert parser.feed('22, 2023]}\n``` y más texto')
+    assert parser.result() == {"topic": "empleo", "years": [2022, 2023]}
+    assert parser.fields == {"topic": "empleo", "years": [2022, 2023]}
+
+
+def test_truncated_object_is_rejected():
+    parser = IncrementalJSONParser()
+    parser.feed('{"topic": "empleo", "spatial_filters": ["Madr')
+    assert parser.result() is None
+    assert parse_json_object('{"topic": "empleo"') is None
+
+
+def test_required_keys_checked_when_object_closes():
+    parser = IncrementalJSONParser(required=("intent", "confirmation"))
+    assert parser.feed('{"intent": {"topic": "empleo"}, "clarification": null}')
+    assert parser.missing == ["confirmation"]
+    assert parser.result() is None
+
+
+def test_tolerant_repairs_on_closed_object():
+    assert parse_json_object('{"a": None, "b": [1, 2,],}') == {"a": None, "b": [1, 2]}
@@ -0,0 +1,53 @@
+import pytest
+
+from search.text_index import BM25Index, tokenize
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("pacientes", "paciente"),
+    ("costes", "coste"),
+    ("estaciones", "estacion"),
+    ("ciudades", "ciudad"),
+    ("valores", "valor"),
+    ("mujeres", "mujer"),
+    ("hombres", "hombre"),
+    ("records", "record"),
+])
+def test_plural_and_singular_share_term(plural, singular):
+    assert tokenize(plural) == tokenize(singular) == [singular]
+
+
+def test_tokenize_normalizes_and_drops_stopwords():
+    assert tokenize("Calidad del AIRE en Madrid") == ["calidad", "aire", "madrid"]
+    assert tokenize("fecha_nacimiento") == ["fecha", "nacimiento"]
+    assert tokenize(None) == []
+
+
+DATASETS = [
+    {"topic": "salud", "nombre": "Registro de pacientes", "descripcion": "Historias clínicas",
+     "columnas": [{"nombre": "edad"}, {"nombre": "sexo"}]},
+    {"topic": "medio ambiente", "nombre": "Calidad del aire", "descripcion": "Estaciones de medición",
+     "columnas": [{"nombre": "no2"}, {"nombre": "estacion"}]},
+    {"topic": "economia", "nombre": "Costes sanitarios", "descripcion": "Gasto por paciente",
+     "columnas": [{"nombre": "coste"}]},
+]
+
+
+def test_bm25_matches_plural_query_against_singular_text():
+    index = BM25Index(DATASETS)
+    ranked = index.top_k("pacientes edad", k=3)
+    assert ranked[0][0] == 0
+    assert {doc for doc, _ in ranked} == {0, 2}
+
+
+def test_bm25_scores_zero_without_shared_terms():
+    index = BM25Index(DATASETS)
+    assert index.top_k("contaminacion acustica", k=3) == []
+    assert index.score("").sum() == 0
+
+
+def test_bm25_top_k_is_bounded_and_sorted():
+    index = BM25Index(DATASETS)
+    ranked = index.top_k("estacion coste paciente", k=2)
+    assert len(ranked) == 2
+    assert ranked[0][1] >= ranked[1][1]
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command
+
+from app import Context, awaiting_input, build_graph, new_session_state, turn_input
+from fake_llm import StubChatModel
+
+
+def test_session_stopped_at_confirmation_is_resumed():
+    graph = build_graph().compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "resume"}}
+    state = new_session_state()
+    state["messages"].append(HumanMessage(content="busca datos de calidad del aire en Madrid en 2024"))
+    graph.invoke(state, context=Context(llm=StubChatModel()), config=config)
+    snapshot = graph.get_state(config)
+    assert awaiting_input(snapshot)
+    assert isinstance(turn_input(snapshot, "sí"), Command)
+
+
+def test_crashed_run_is_not_resumed():
+    # Ejecución cortada a mitad de nodo: hay next pero ningún interrupt pendiente
+    snapshot = SimpleNamespace(next=("search",), tasks=(SimpleNamespace(interrupts=()),),
+                               values={"messages": [HumanMessage(content="hola")]})
+    assert not awaiting_input(snapshot)
+    assert turn_input(snapshot, "sí") == {"messages": [HumanMessage(content="sí")]}
+
+
+def test_new_and_running_sessions():
+    empty = SimpleNamespace(next=(), tasks=(), values={})
+    state = turn_input(empty, "hola")
+    assert state["messages"] == [HumanMessage(content="hola")] and "search_boundaries" in state
+    running = SimpleNamespace(next=(), tasks=(), values={"messages": [HumanMessage(content="hola")]})
+    assert turn_input(running, "gracias") == {"messages": [HumanMessage(content="gracias")]}